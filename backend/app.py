@@ -1,31 +1,384 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from transformers import pipeline
+from werkzeug.middleware.proxy_fix import ProxyFix
 from supabase import create_client, Client
 from dotenv import load_dotenv
 import os
 import json
-from datetime import datetime, timedelta
+import atexit
+from datetime import date, datetime, timedelta, timezone
+import time
 import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from model import mood_analyzer
+from batching import QueueFullError
+from cascade import SentimentCascade
+from bulk_import import MoodLogImport, iter_ndjson_lines, to_ndjson
+from chatbot import CHATBOT_MAX_NEW_TOKENS, chatbot
+from mood_aggregates import analytics_summary
+from mood_rollups import RollupRefresher, summarize_rollups, user_today
+from pagination import PaginationError, keyset_page, parse_fields, parse_limit
+from conversation import ConversationMemory, SessionAccessError, SupabaseChatStore
+from write_behind import WriteBehindBuffer
+from crisis import CrisisRecorder, crisis_response, detect_crisis
+from fair_queue import FairChatQueue, QuotaExceededError, parse_weights
+from hedged_chat import BudgetedChat
+from simple_chatbot import chatbot as rule_based_chatbot
 from auth import (
     register_user, login_user, verify_email_token, request_password_reset, 
-    reset_password, change_password, logout_user, require_auth, require_admin
+    reset_password, change_password, logout_user, require_auth, require_admin,
+    get_current_user, AuthError
 )
 
 load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
+# Reverse proxies in front of the app whose X-Forwarded-For is trusted; request.remote_addr is then the
+# client address rather than the proxy's. Off by default, since a client reaching the app directly could
+# otherwise pick its own address; set to 1 behind nginx.conf when the backend port is not exposed
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+
 # Supabase client
 supabase: Client = create_client(
     os.getenv("SUPABASE_URL"), 
     os.getenv("SUPABASE_KEY")
 )
 
-# Initialize sentiment analysis pipeline
-print("Loading sentiment analysis model...")
-analyzer = pipeline("sentiment-analysis", model="distilbert-base-uncased-finetuned-sst-2-english")
-print("Model loaded successfully!")
+# Service role client for work across every user's rows (platform analytics, rollup repairs), which the
+# anon key may not do; falls back to SUPABASE_KEY for deployments that already set it to the service role key
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+supabase_admin: Client = create_client(
+    os.getenv("SUPABASE_URL"),
+    SUPABASE_SERVICE_ROLE_KEY
+) if SUPABASE_SERVICE_ROLE_KEY else supabase
+
+# Upper bound on texts accepted by a single /analyze/batch request
+MAX_BATCH_TEXTS = int(os.getenv("SENTIMENT_MAX_BATCH_TEXTS", "100"))
+
+# Seconds a /analyze request waits for its micro-batched result
+ANALYZE_TIMEOUT = float(os.getenv("SENTIMENT_ANALYZE_TIMEOUT", "30"))
+
+# Retry-After sent while the sentiment model is still loading
+MODEL_RETRY_AFTER = int(os.getenv("SENTIMENT_RETRY_AFTER", "5"))
+
+# Lexicon-first cascade; texts below the confidence threshold go to the model
+sentiment_cascade = SentimentCascade(
+    mood_analyzer,
+    threshold=float(os.getenv("SENTIMENT_CASCADE_THRESHOLD", "0.8")),
+    enabled=os.getenv("SENTIMENT_CASCADE", "true").lower() == "true"
+)
+
+# Bulk NDJSON import: entries analyzed per batch, rows per insert, longest accepted line
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "64"))
+IMPORT_INSERT_CHUNK = int(os.getenv("IMPORT_INSERT_CHUNK", "500"))
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", "65536"))
+
+# Fair sharing of the chat model: replies generating at once in total and per user, generated
+# tokens per user per window (times the class weight), and requests waiting before a 429
+chat_queue = FairChatQueue(
+    max_in_flight=int(os.getenv("CHAT_MAX_IN_FLIGHT", os.getenv("CHATBOT_MAX_BATCH", "8"))),
+    per_user_in_flight=int(os.getenv("CHAT_USER_IN_FLIGHT", "2")),
+    tokens_per_window=int(os.getenv("CHAT_USER_TOKENS", "4000")),
+    window_seconds=float(os.getenv("CHAT_USER_WINDOW_SECONDS", "60")),
+    max_user_queue=int(os.getenv("CHAT_USER_QUEUE", "4")),
+    max_queue=int(os.getenv("CHAT_WAIT_QUEUE", "64")),
+    weights=parse_weights(os.getenv("CHAT_CLASS_WEIGHTS", "patient:1,therapist:2,admin:2"))
+)
+
+# Latency budget for /chat replies, and the most a client may ask for with budget_ms;
+# the rule-based chatbot answers when the LLM misses it
+chat_budget = BudgetedChat(
+    chatbot,
+    rule_based_chatbot,
+    budget_seconds=float(os.getenv("CHAT_LATENCY_BUDGET", "8")),
+    max_budget_seconds=float(os.getenv("CHAT_MAX_LATENCY_BUDGET", "30")),
+    admission=chat_queue,
+    cost_tokens=CHATBOT_MAX_NEW_TOKENS
+)
+
+# Admin analytics: days in the per-day breakdown when no start is given, and the most it may cover
+ADMIN_ANALYTICS_DEFAULT_DAYS = int(os.getenv("ADMIN_ANALYTICS_DEFAULT_DAYS", "30"))
+ADMIN_ANALYTICS_MAX_DAYS = int(os.getenv("ADMIN_ANALYTICS_MAX_DAYS", "366"))
+
+# List endpoints: rows per page when no limit is given, and the largest limit accepted
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "50"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "200"))
+
+# Columns list endpoints may return through fields=
+USER_FIELDS = (
+    "id", "email", "name", "user_type", "bio", "avatar_url", "date_of_birth", "gender", "timezone",
+    "language", "created_at", "updated_at", "last_login", "is_active", "email_verified"
+)
+NOTIFICATION_FIELDS = (
+    "id", "user_id", "title", "message", "type", "priority", "read", "action_url", "metadata", "created_at", "read_at"
+)
+
+# Days of daily rollups read for /insights, and the longest range /analytics/<user_id>/daily returns
+INSIGHTS_DAYS = int(os.getenv("INSIGHTS_DAYS", "30"))
+DAILY_ANALYTICS_MAX_DAYS = int(os.getenv("DAILY_ANALYTICS_MAX_DAYS", "366"))
+
+# Catch-up job recomputing the last ROLLUP_REFRESH_DAYS days of mood_daily_rollups every
+# ROLLUP_REFRESH_INTERVAL seconds; 0 disables it
+rollup_refresher = RollupRefresher(
+    supabase_admin,
+    interval=float(os.getenv("ROLLUP_REFRESH_INTERVAL", "3600")),
+    days=int(os.getenv("ROLLUP_REFRESH_DAYS", "2"))
+)
+
+# Chat messages are written behind the request: bulk inserts of up to CHAT_WRITE_BATCH rows at
+# least every CHAT_WRITE_INTERVAL seconds, spooled to CHAT_SPOOL_DIR until stored so a crashed
+# worker's messages are inserted by the next one to start; more than CHAT_WRITE_PENDING are written inline.
+# A row still rejected after CHAT_WRITE_ATTEMPTS tries is moved to a dead-letter file in the spool directory
+CHAT_WRITE_INTERVAL = float(os.getenv("CHAT_WRITE_INTERVAL", "1.0"))
+chat_store = SupabaseChatStore(supabase)
+chat_writer = WriteBehindBuffer(
+    chat_store.insert_messages,
+    spool_dir=os.getenv("CHAT_SPOOL_DIR", os.path.join(os.path.expanduser("~"), ".cache", "moodmate", "chat-spool")),
+    max_batch=int(os.getenv("CHAT_WRITE_BATCH", "100")),
+    flush_interval=CHAT_WRITE_INTERVAL,
+    max_pending=int(os.getenv("CHAT_WRITE_PENDING", "10000")),
+    fsync=os.getenv("CHAT_SPOOL_FSYNC", "false").lower() == "true",
+    max_attempts=int(os.getenv("CHAT_WRITE_ATTEMPTS", "5"))
+)
+chat_store.writer = chat_writer
+atexit.register(chat_writer.shutdown)
+
+# Seconds history reloads look back past the newest cached message, so messages other workers
+# buffered for up to CHAT_WRITE_INTERVAL (plus retries and clock skew) are still picked up
+CHAT_HISTORY_LOOKBACK = max(float(os.getenv("CHAT_HISTORY_LOOKBACK", "10")), CHAT_WRITE_INTERVAL)
+
+# Server-side chat history: prompt context budget in tokens, part of it kept for the summary of older turns
+conversation_memory = ConversationMemory(
+    chat_store,
+    chatbot.tokenize,
+    chatbot.detokenize,
+    token_budget=int(os.getenv("CHATBOT_CONTEXT_TOKENS", "512")),
+    summary_tokens=int(os.getenv("CHATBOT_SUMMARY_TOKENS", "128")),
+    history_limit=int(os.getenv("CHAT_HISTORY_LIMIT", "50")),
+    max_sessions=int(os.getenv("CHAT_MEMORY_SESSIONS", "1000")),
+    lookback_seconds=CHAT_HISTORY_LOOKBACK
+)
+
+def model_not_ready():
+    """Fast 503 response for sentiment routes until the model is ready"""
+    readiness = mood_analyzer.readiness()
+    response = jsonify({
+        "error": "Sentiment model is not ready",
+        "status": readiness["status"]
+    })
+    response.headers["Retry-After"] = str(MODEL_RETRY_AFTER)
+    return response, 503
+
+def chatbot_not_ready():
+    """503 response for chat routes until the chat model is loaded; the first request starts loading it"""
+    chatbot.load_in_background()
+    readiness = chatbot.readiness()
+    response = jsonify({
+        "error": "Chat model is not ready",
+        "status": readiness["status"]
+    })
+    response.headers["Retry-After"] = str(MODEL_RETRY_AFTER)
+    return response, 503
+
+def chat_quota_exceeded(error):
+    """429 response for chat requests shed by the fair queue"""
+    response = jsonify({"error": str(error)})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 429
+
+def invalid_chat_ids(data):
+    """
+    Check the ids a chat request will store messages under before anything is queued
+    
+    Returns:
+        tuple: 400 response naming the first field that is not a UUID, or None if both are absent or valid
+    """
+    for field in ("session_id", "user_id"):
+        value = data.get(field)
+        if value is None:
+            continue
+        try:
+            uuid.UUID(str(value))
+        except ValueError:
+            return jsonify({"error": f"{field} must be a UUID"}), 400
+    return None
+
+def chat_requester():
+    """
+    Who a chat request is charged to in the fair queue
+    
+    Returns:
+        tuple: (user key, user class); both come from a verified token or, for anonymous requests, the
+        client address, never the request body, so a client cannot get a fresh quota by changing a field
+    """
+    try:
+        user = get_current_user()
+        return user["user_id"], user.get("user_type", "patient")
+    except AuthError:
+        return f"ip:{request.remote_addr}", "patient"
+
+def chat_owner(data):
+    """
+    The user whose stored chat history a request may read and write
+    
+    Sessions are only for signed-in users, and only ever the token's user;
+    the session_id and user_id in the body are requests, not proof.
+    
+    Returns:
+        str: user_id from a verified token, or None for an anonymous request that names no session or user
+    
+    Raises:
+        AuthError: If an anonymous request names a session or user
+        SessionAccessError: If the body's user_id is not the signed-in user
+    """
+    try:
+        user_id = get_current_user()["user_id"]
+    except AuthError:
+        if data.get("session_id") is not None or data.get("user_id"):
+            raise AuthError("Sign in to use chat sessions")
+        return None
+    if data.get("user_id") and str(data["user_id"]) != str(user_id):
+        raise SessionAccessError("user_id is not the signed-in user")
+    return user_id
+
+def chat_access_denied(error):
+    """401 response for anonymous requests for a chat session, 403 for another user's session"""
+    return jsonify({"error": str(error)}), 401 if isinstance(error, AuthError) else 403
+
+def save_crisis_event(event):
+    """Store a crisis event in crisis_interventions and, for session chats, in the chat history"""
+    supabase.table("crisis_interventions").insert({
+        "user_id": event["user_id"],
+        "trigger_type": "keywords",
+        "trigger_data": event["detection"],
+        "intervention_type": "resource",
+        "action_taken": "Crisis response and emergency resources shown in chat"
+    }).execute()
+    if event["session_id"] is not None:
+        try:
+            conversation_memory.record_turn(event["session_id"], event["user_id"], event["message"], event["response"])
+        except SessionAccessError as e:
+            print(f"Crisis turn not added to chat session {event['session_id']}: {e}")
+
+# Crisis events are written off the request path so the crisis reply is never delayed
+crisis_recorder = CrisisRecorder(save_crisis_event)
+
+def crisis_reply(data, user_message):
+    """
+    Answer a crisis message without running the chat model
+    
+    Returns:
+        dict: Response body with the crisis reply and emergency resources, or None if no risk phrase is present
+    """
+    detection = detect_crisis(user_message)
+    if detection is None:
+        return None
+    
+    reply = crisis_response()
+    session_id = data.get("session_id")
+    # The reply never waits on authentication; only a signed-in user's events are recorded
+    try:
+        owner = chat_owner(data)
+    except (AuthError, SessionAccessError):
+        owner = None
+    if owner is not None:
+        crisis_recorder.record({
+            "user_id": owner,
+            "session_id": session_id,
+            "detection": detection,
+            "message": user_message,
+            "response": reply["response"]
+        })
+    return dict(reply, session_id=session_id, crisis=True, status="success")
+
+def chat_context(data, owner, history=True):
+    """
+    Resolve the chat session and prompt context for a chat request
+    
+    Args:
+        data (dict): Request body
+        owner (str): Signed-in user from chat_owner, or None for an anonymous request
+        history (bool): Build the context; False while the chat tokenizer is not loaded, giving an empty one
+    
+    Returns:
+        tuple: (session_id, context); session_id is None for requests without history
+    
+    Raises:
+        SessionAccessError: If the session is missing or owned by another user
+    """
+    session_id = data.get("session_id") if owner is not None else None
+    if session_id is None and owner is not None and data.get("user_id"):
+        session_id = conversation_memory.start_session(owner)
+    elif session_id is not None:
+        conversation_memory.authorize(session_id, owner)
+    if not history:
+        return session_id, ""
+    if session_id is not None:
+        context, _ = conversation_memory.build_context(session_id, owner)
+        return session_id, context
+    # Free-form client context is still held to the token budget
+    return None, conversation_memory.clip(data.get("context", ""))
+
+def parse_timestamp(value, end=False):
+    """Parse an ISO date or datetime query parameter as UTC; a date-only end covers that whole day"""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.astimezone(timezone.utc)
+
+def analytics_range(args, daily=False):
+    """
+    Read the start (inclusive) and end (exclusive) of an analytics query
+    
+    A per-day breakdown defaults to the last ADMIN_ANALYTICS_DEFAULT_DAYS days
+    and may cover at most ADMIN_ANALYTICS_MAX_DAYS.
+    
+    Returns:
+        tuple: (start, end) datetimes, either may be None
+    
+    Raises:
+        ValueError: Malformed dates, an empty range or too long a breakdown
+    """
+    start = parse_timestamp(args["start"]) if args.get("start") else None
+    end = parse_timestamp(args["end"], end=True) if args.get("end") else None
+    if start and end and start >= end:
+        raise ValueError("start must be before end")
+    
+    if daily:
+        end = end or datetime.now(timezone.utc)
+        start = start or end - timedelta(days=ADMIN_ANALYTICS_DEFAULT_DAYS)
+        if end - start > timedelta(days=ADMIN_ANALYTICS_MAX_DAYS):
+            raise ValueError(f"A daily breakdown can cover at most {ADMIN_ANALYTICS_MAX_DAYS} days")
+    return start, end
+
+def list_page(table, key, allowed_fields, filters=None):
+    """Respond with one keyset page of table, reading limit, cursor, fields and include_total from the query string"""
+    try:
+        page = keyset_page(
+            supabase,
+            table,
+            columns=parse_fields(request.args.get("fields"), allowed_fields),
+            filters=filters,
+            cursor=request.args.get("cursor"),
+            limit=parse_limit(request.args.get("limit"), PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT),
+            include_total=request.args.get("include_total", "false").lower() == "true"
+        )
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    response = {key: page["rows"], "next_cursor": page["next_cursor"]}
+    if "total" in page:
+        response["total"] = page["total"]
+    return jsonify(response)
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 @app.route("/analyze", methods=["POST"])
 def analyze():
@@ -37,15 +390,64 @@ def analyze():
         if not text:
             return jsonify({"error": "No text provided"}), 400
         
-        # Analyze sentiment
-        result = analyzer(text)[0]
-        sentiment = result["label"].lower()
-        score = round(result["score"], 2)
+        # Confident keyword matches are answered without touching the model
+        result = sentiment_cascade.classify_fast(text)
+        
+        if result is None:
+            if not mood_analyzer.is_ready:
+                return model_not_ready()
+            
+            # Analyze sentiment, coalesced with concurrent requests
+            result = sentiment_cascade.escalate_async(text).result(timeout=ANALYZE_TIMEOUT)
         
         return jsonify({
-            "sentiment": sentiment,
-            "score": score
+            "sentiment": result["sentiment"],
+            "score": result["score"],
+            "tier": result["tier"]
         })
+    except QueueFullError as e:
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = "1"
+        return response, 503
+    except FutureTimeoutError:
+        return jsonify({"error": "Sentiment analysis timed out"}), 504
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/analyze/batch", methods=["POST"])
+def analyze_batch():
+    """Analyze sentiment of a list of texts with batched forward passes"""
+    try:
+        data = request.get_json()
+        texts = data.get("texts")
+        
+        if not isinstance(texts, list) or not texts:
+            return jsonify({"error": "No texts provided"}), 400
+        
+        if len(texts) > MAX_BATCH_TEXTS:
+            return jsonify({"error": f"At most {MAX_BATCH_TEXTS} texts can be analyzed per request"}), 400
+        
+        batch_size = data.get("batch_size")
+        if batch_size is not None and (not isinstance(batch_size, int) or batch_size < 1):
+            return jsonify({"error": "batch_size must be a positive integer"}), 400
+        
+        # Results come back in input order, with per-item errors; while the model loads,
+        # the lexicon still answers and only the texts that need the model are turned away
+        ready = mood_analyzer.is_ready
+        results = sentiment_cascade.analyze_many(texts, batch_size=batch_size, escalate=ready)
+        not_ready = sum(1 for result in results if result.get("escalated"))
+        if not_ready and not any("error" not in result for result in results):
+            return model_not_ready()
+        
+        response = jsonify({
+            "results": results,
+            "count": len(results),
+            "errors": sum(1 for result in results if "error" in result),
+            "not_ready": not_ready
+        })
+        if not_ready:
+            response.headers["Retry-After"] = str(MODEL_RETRY_AFTER)
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -74,6 +476,198 @@ def save():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def insert_mood_logs(rows):
+    """Bulk insert mood log rows in one request"""
+    return supabase.table("mood_logs").insert(rows).execute()
+
+@app.route("/import/<user_id>", methods=["POST"])
+def import_mood_logs(user_id):
+    """Import NDJSON journal entries, streaming per-line results and progress back"""
+    try:
+        if not mood_analyzer.is_ready:
+            return model_not_ready()
+        
+        # Lines are read from the request body as the response streams
+        importer = MoodLogImport(
+            user_id,
+            sentiment_cascade.analyze_many,
+            insert_mood_logs,
+            batch_size=IMPORT_BATCH_SIZE,
+            insert_chunk_size=IMPORT_INSERT_CHUNK
+        )
+        lines = iter_ndjson_lines(request.stream, IMPORT_MAX_LINE_BYTES)
+        return Response(stream_with_context(to_ndjson(importer.run(lines))), mimetype="application/x-ndjson")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/analyze/stats", methods=["GET"])
+def analyze_stats():
+    """Get sentiment inference settings and counters"""
+    try:
+        return jsonify({
+            "batcher": mood_analyzer.batcher.stats(),
+            "cache": mood_analyzer.cache.stats(),
+            "cascade": sentiment_cascade.stats()
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Chatbot Endpoints
+@app.route("/chat", methods=["POST"])
+def chat():
+    """Chat with the mental health chatbot"""
+    started = time.monotonic()
+    try:
+        data = request.get_json()
+        user_message = data.get("message", "")
+        
+        if not user_message:
+            return jsonify({"error": "No message provided"}), 400
+        
+        invalid = invalid_chat_ids(data)
+        if invalid is not None:
+            return invalid
+        
+        # Crisis messages skip generation, and are answered even while the model loads
+        crisis = crisis_reply(data, user_message)
+        if crisis is not None:
+            return jsonify(crisis)
+        
+        # While the model loads, the rule-based chatbot answers; the first request starts loading it
+        ready = chatbot.is_ready
+        if not ready:
+            chatbot.load_in_background()
+        
+        try:
+            budget = chat_budget.budget_for(data.get("budget_ms"))
+        except (TypeError, ValueError):
+            return jsonify({"error": "budget_ms must be a number"}), 400
+        
+        try:
+            owner = chat_owner(data)
+            session_id, context = chat_context(data, owner, history=ready)
+        except (AuthError, SessionAccessError) as e:
+            return chat_access_denied(e)
+        user_id, user_class = chat_requester()
+        # Time spent loading the history counts against the budget
+        try:
+            reply = chat_budget.respond(
+                user_message, context, budget_seconds=max(0.0, budget - (time.monotonic() - started)),
+                user_id=user_id, user_class=user_class
+            )
+        except QuotaExceededError as e:
+            return chat_quota_exceeded(e)
+        if session_id is not None:
+            conversation_memory.record_turn(session_id, owner, user_message, reply["response"], cache=ready)
+        
+        return jsonify({
+            "response": reply["response"],
+            "engine": reply["engine"],
+            "fallback_reason": reply["fallback_reason"],
+            "queue_wait_ms": reply["queue_wait_ms"],
+            "session_id": session_id,
+            "status": "success"
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """Stream a chatbot reply as Server-Sent Events while it is generated"""
+    try:
+        data = request.get_json()
+        user_message = data.get("message", "")
+        
+        if not user_message:
+            return jsonify({"error": "No message provided"}), 400
+        
+        invalid = invalid_chat_ids(data)
+        if invalid is not None:
+            return invalid
+        
+        crisis = crisis_reply(data, user_message)
+        if crisis is not None:
+            return Response(
+                sse_event("done", crisis),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        
+        if not chatbot.is_ready:
+            return chatbot_not_ready()
+        
+        try:
+            owner = chat_owner(data)
+        except (AuthError, SessionAccessError) as e:
+            return chat_access_denied(e)
+        
+        # Streams wait for a fair share slot up to the latency budget, then are shed
+        user_id, user_class = chat_requester()
+        try:
+            slot = chat_queue.acquire(user_id, user_class, cost=CHATBOT_MAX_NEW_TOKENS, timeout=chat_budget.budget_seconds)
+        except FutureTimeoutError:
+            return chat_quota_exceeded(QuotaExceededError("Chat is busy, please retry", MODEL_RETRY_AFTER))
+        except QuotaExceededError as e:
+            return chat_quota_exceeded(e)
+        
+        try:
+            session_id, context = chat_context(data, owner)
+        except SessionAccessError as e:
+            slot.release()
+            return chat_access_denied(e)
+        except Exception:
+            slot.release()
+            raise
+        
+        def generate():
+            stream = chatbot.stream_response(user_message, context)
+            parts = []
+            try:
+                for piece in stream:
+                    parts.append(piece)
+                    yield sse_event("token", {"text": piece})
+                response = "".join(parts)
+                if session_id is None:
+                    yield sse_event("done", {"response": response})
+                else:
+                    yield sse_event("done", {"response": response, "session_id": session_id})
+                    # Only completed replies become part of the session history
+                    conversation_memory.record_turn(session_id, owner, user_message, response)
+            except Exception as e:
+                print(f"Error streaming chat response: {e}")
+                yield sse_event("error", {"error": str(e)})
+            finally:
+                # Also runs when the client disconnects, which cancels generation
+                stream.close()
+                slot.release(len(chatbot.tokenize("".join(parts))) if parts else None)
+        
+        response = Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        # Frees the slot even if the client leaves before the stream starts
+        response.call_on_close(slot.release)
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/chat/stats", methods=["GET"])
+def chat_stats():
+    """Get chat model loading state and generation scheduler counters"""
+    try:
+        return jsonify({
+            "model": chatbot.readiness(),
+            "scheduler": chatbot.scheduler.stats() if chatbot.scheduler is not None else None,
+            "latency_budget": chat_budget.stats(),
+            "fair_queue": chat_queue.stats(),
+            "memory": conversation_memory.stats(),
+            "writer": chat_writer.stats(),
+            "crisis": crisis_recorder.stats()
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # User Management Endpoints
 @app.route("/users", methods=["POST"])
 def create_user():
@@ -121,58 +715,44 @@ def update_user(user_id):
 def get_user_analytics(user_id):
     """Get user analytics and insights"""
     try:
-        # Get mood logs for the user
-        mood_logs = supabase.table("mood_logs").select("*").eq("user_id", user_id).execute()
+        # One row kept current by the mood_logs triggers, however many logs the user has
+        result = supabase.table("mood_aggregates").select("*").eq("user_id", user_id).limit(1).execute()
+        return jsonify({"analytics": analytics_summary(result.data[0] if result.data else None)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/analytics/<user_id>/daily", methods=["GET"])
+def get_daily_analytics(user_id):
+    """Get per-day mood summaries from the daily rollups, for the last `days` days up to `end` (local dates)"""
+    try:
+        try:
+            end = date.fromisoformat(request.args["end"]) if request.args.get("end") else None
+            days = int(request.args.get("days", "30"))
+        except ValueError:
+            return jsonify({"error": "end must be a date and days an integer"}), 400
+        if not 1 <= days <= DAILY_ANALYTICS_MAX_DAYS:
+            return jsonify({"error": f"days must be between 1 and {DAILY_ANALYTICS_MAX_DAYS}"}), 400
         
-        if not mood_logs.data:
-            return jsonify({"analytics": {
-                "total_entries": 0,
-                "average_score": 0,
-                "positive_days": 0,
-                "negative_days": 0,
-                "neutral_days": 0,
-                "streak": 0,
-                "trend": "neutral"
-            }})
-        
-        # Calculate analytics
-        total_entries = len(mood_logs.data)
-        scores = [log["score"] for log in mood_logs.data]
-        average_score = sum(scores) / len(scores) if scores else 0
-        
-        sentiments = [log["sentiment"] for log in mood_logs.data]
-        positive_days = sentiments.count("positive")
-        negative_days = sentiments.count("negative")
-        neutral_days = sentiments.count("neutral")
-        
-        # Calculate streak (simplified)
-        streak = 1
-        for i in range(1, len(mood_logs.data)):
-            prev_date = datetime.fromisoformat(mood_logs.data[i-1]["created_at"].replace('Z', '+00:00'))
-            curr_date = datetime.fromisoformat(mood_logs.data[i]["created_at"].replace('Z', '+00:00'))
-            if (prev_date - curr_date).days == 1:
-                streak += 1
-            else:
-                break
-        
-        # Determine trend
-        recent_scores = scores[-7:] if len(scores) >= 7 else scores
-        if len(recent_scores) >= 2:
-            trend = "positive" if recent_scores[-1] > recent_scores[0] else "negative"
-        else:
-            trend = "neutral"
-        
-        analytics = {
-            "total_entries": total_entries,
-            "average_score": round(average_score, 2),
-            "positive_days": positive_days,
-            "negative_days": negative_days,
-            "neutral_days": neutral_days,
-            "streak": streak,
-            "trend": trend
-        }
+        end = end or user_today(supabase, user_id)
+        start = end - timedelta(days=days - 1)
+        result = supabase.table("mood_daily_rollups").select("*").eq("user_id", user_id).gte(
+            "local_date", start.isoformat()
+        ).lte("local_date", end.isoformat()).order("local_date").execute()
         
-        return jsonify({"analytics": analytics})
+        daily = [
+            {
+                "date": str(row["local_date"]),
+                "entries": row["entries"],
+                "average_score": round(float(row["score_sum"]) / row["entries"], 2) if row["entries"] else 0,
+                "min_score": float(row["score_min"]) if row.get("score_min") is not None else None,
+                "max_score": float(row["score_max"]) if row.get("score_max") is not None else None,
+                "positive": row["positive_count"],
+                "negative": row["negative_count"],
+                "neutral": row["neutral_count"]
+            }
+            for row in result.data or []
+        ]
+        return jsonify({"daily": daily, "start": start.isoformat(), "end": end.isoformat()})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -181,32 +761,31 @@ def get_user_analytics(user_id):
 def get_ai_insights(user_id):
     """Get AI-generated insights for user"""
     try:
-        # Get recent mood logs
-        mood_logs = supabase.table("mood_logs").select("*").eq("user_id", user_id).order("created_at", desc=True).limit(30).execute()
+        # One rollup row per day instead of the raw logs; local_date is in the user's time zone, and so is today
+        today = user_today(supabase, user_id)
+        since = today - timedelta(days=INSIGHTS_DAYS)
+        rollups = supabase.table("mood_daily_rollups").select(
+            "local_date, entries, score_sum, positive_count, negative_count, neutral_count"
+        ).eq("user_id", user_id).gte("local_date", since.isoformat()).execute()
         
-        if not mood_logs.data:
+        if not rollups.data:
             return jsonify({"insights": []})
         
         insights = []
+        summary = summarize_rollups(rollups.data, as_of=today)
+        entries = summary["entries"]
         
-        # Analyze patterns
-        sentiments = [log["sentiment"] for log in mood_logs.data]
-        scores = [log["score"] for log in mood_logs.data]
-        
-        # Positive trend insight
-        if len(scores) >= 7:
-            recent_avg = sum(scores[:7]) / 7
-            older_avg = sum(scores[7:14]) / 7 if len(scores) >= 14 else recent_avg
-            if recent_avg > older_avg + 0.1:
-                insights.append({
-                    "type": "positive_trend",
-                    "title": "Improving Mood",
-                    "message": "Your mood has been trending positive over the last week!",
-                    "confidence": 0.8
-                })
+        # Positive trend insight: this week's average clearly above last week's
+        if summary["week_delta"] is not None and summary["week_delta"] > 0.1:
+            insights.append({
+                "type": "positive_trend",
+                "title": "Improving Mood",
+                "message": "Your mood has been trending positive over the last week!",
+                "confidence": 0.8
+            })
         
         # Consistency insight
-        if len(mood_logs.data) >= 7:
+        if entries >= 7:
             insights.append({
                 "type": "consistency",
                 "title": "Great Consistency",
@@ -215,8 +794,8 @@ def get_ai_insights(user_id):
             })
         
         # Pattern insights
-        positive_count = sentiments.count("positive")
-        if positive_count > len(sentiments) * 0.7:
+        positive_count = summary["positive"]
+        if positive_count > entries * 0.7:
             insights.append({
                 "type": "pattern",
                 "title": "Positive Pattern",
@@ -231,10 +810,9 @@ def get_ai_insights(user_id):
 # Notifications Endpoints
 @app.route("/notifications/<user_id>", methods=["GET"])
 def get_notifications(user_id):
-    """Get user notifications"""
+    """Get user notifications, newest first, one page at a time"""
     try:
-        result = supabase.table("notifications").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
-        return jsonify({"notifications": result.data})
+        return list_page("notifications", "notifications", NOTIFICATION_FIELDS, filters={"user_id": user_id})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -293,38 +871,50 @@ def export_user_data(user_id):
 # Admin Endpoints
 @app.route("/admin/users", methods=["GET"])
 def get_all_users():
-    """Get all users (admin only)"""
+    """Get all users (admin only), newest first, one page at a time"""
     try:
-        result = supabase.table("users").select("*").execute()
-        return jsonify({"users": result.data})
+        return list_page("users", "users", USER_FIELDS)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/admin/analytics", methods=["GET"])
-def get_admin_analytics():
-    """Get platform analytics (admin only)"""
+@require_admin
+def get_admin_analytics(user):
+    """Get platform analytics (admin only), optionally for a date range and broken down per UTC day"""
     try:
-        # Get platform statistics
-        users = supabase.table("users").select("*").execute()
-        mood_logs = supabase.table("mood_logs").select("*").execute()
+        daily = request.args.get("daily", "false").lower() == "true"
+        try:
+            start, end = analytics_range(request.args, daily=daily)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        total_users = len(users.data)
-        total_mood_logs = len(mood_logs.data)
-        
-        # Calculate average mood score
-        if mood_logs.data:
-            avg_score = sum(log["score"] for log in mood_logs.data) / len(mood_logs.data)
-        else:
-            avg_score = 0
+        # Counted by the database in one pass over the range instead of downloading every row
+        # admin_mood_analytics may only be executed by the service role
+        result = supabase_admin.rpc("admin_mood_analytics", {
+            "start_at": start.isoformat() if start else None,
+            "end_at": end.isoformat() if end else None,
+            "include_daily": daily
+        }).execute()
+        analytics = result.data or {}
         
-        analytics = {
-            "total_users": total_users,
-            "total_mood_logs": total_mood_logs,
-            "average_mood_score": round(avg_score, 2),
-            "active_users": len(set(log["user_id"] for log in mood_logs.data))
+        response = {
+            "analytics": {
+                "total_users": analytics.get("total_users", 0),
+                "total_mood_logs": analytics.get("total_mood_logs", 0),
+                "average_mood_score": float(analytics.get("average_mood_score") or 0),
+                "active_users": analytics.get("active_users", 0),
+                "positive_logs": analytics.get("positive_logs", 0),
+                "negative_logs": analytics.get("negative_logs", 0),
+                "neutral_logs": analytics.get("neutral_logs", 0)
+            },
+            "range": {
+                "start": start.isoformat() if start else None,
+                "end": end.isoformat() if end else None
+            }
         }
-        
-        return jsonify({"analytics": analytics})
+        if daily:
+            response["daily"] = analytics.get("daily") or []
+        return jsonify(response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -473,6 +1063,15 @@ def health():
     """Health check endpoint"""
     return jsonify({"status": "healthy", "message": "MoodMate AI Backend is running"})
 
+@app.route("/ready", methods=["GET"])
+def ready():
+    """Readiness check reporting whether the sentiment model is loading, ready or failed"""
+    readiness = mood_analyzer.readiness()
+    status_code = 200 if readiness["status"] == "ready" else 503
+    return jsonify(readiness), status_code
+
 if __name__ == "__main__":
+    rollup_refresher.start()
+    chat_writer.start()
     port = int(os.getenv("PORT", 5000))
     app.run(host="0.0.0.0", port=port, debug=True)
@@ -0,0 +1,149 @@
+"""
+Request-coalescing micro-batcher for model inference
+Queues items from concurrent requests and runs them through the model together
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+class QueueFullError(Exception):
+    """Raised when the micro-batcher queue is at capacity"""
+    pass
+
+class MicroBatcher:
+    """
+    Coalesces single-item calls into batched calls on a background thread
+    
+    Callers get a Future from submit(). The worker flushes a batch as soon as
+    it holds max_batch_size items, or once the oldest queued item has waited
+    max_wait_ms, whichever comes first. batch_fn receives a list of items and
+    must return a list of results in the same order; a result that is an
+    Exception instance is raised to that item's caller instead.
+    """
+    
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=5.0, max_queue_size=256, name="micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.max_queue_size = max(1, max_queue_size)
+        self.name = name
+        
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._worker = None
+        self._running = True
+        
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "batches": 0,
+            "largest_batch": 0,
+            "total_wait_ms": 0.0,
+            "max_wait_ms_seen": 0.0
+        }
+    
+    def submit(self, item):
+        """Queue an item for the next batch and return a Future for its result"""
+        future = Future()
+        with self._condition:
+            if not self._running:
+                raise RuntimeError(f"{self.name} is shut down")
+            if len(self._queue) >= self.max_queue_size:
+                self._stats["rejected"] += 1
+                raise QueueFullError(f"{self.name} queue is full ({self.max_queue_size} pending)")
+            
+            # Start the worker lazily so it is created after any pre-fork in gunicorn
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+            
+            self._queue.append((item, future, time.monotonic()))
+            self._stats["submitted"] += 1
+            self._condition.notify()
+        return future
+    
+    def _next_batch(self):
+        """Block until a batch is due, then pop and return it"""
+        with self._condition:
+            while self._running and not self._queue:
+                self._condition.wait()
+            if not self._queue:
+                return []
+            
+            deadline = self._queue[0][2] + self.max_wait_ms / 1000.0
+            while self._running and len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            
+            size = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(size)]
+    
+    def _run(self):
+        """Worker loop that flushes batches until shutdown"""
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            
+            flushed_at = time.monotonic()
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"batch function returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                print(f"Error running {self.name} batch: {e}")
+                results = [e] * len(items)
+            
+            failed = 0
+            for (_, future, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                    failed += 1
+                else:
+                    future.set_result(result)
+            
+            with self._condition:
+                waits = [(flushed_at - queued_at) * 1000 for _, _, queued_at in batch]
+                self._stats["batches"] += 1
+                self._stats["completed"] += len(batch) - failed
+                self._stats["failed"] += failed
+                self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+                self._stats["total_wait_ms"] += sum(waits)
+                self._stats["max_wait_ms_seen"] = max(self._stats["max_wait_ms_seen"], max(waits))
+    
+    def stats(self):
+        """Return settings and counters for monitoring"""
+        with self._condition:
+            stats = dict(self._stats)
+            queue_depth = len(self._queue)
+        processed = stats["completed"] + stats["failed"]
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "max_queue_size": self.max_queue_size,
+            "queue_depth": queue_depth,
+            "submitted": stats["submitted"],
+            "completed": stats["completed"],
+            "failed": stats["failed"],
+            "rejected": stats["rejected"],
+            "batches": stats["batches"],
+            "largest_batch": stats["largest_batch"],
+            "average_batch_size": round(processed / stats["batches"], 2) if stats["batches"] else 0,
+            "average_wait_ms": round(stats["total_wait_ms"] / processed, 3) if processed else 0,
+            "max_wait_ms_seen": round(stats["max_wait_ms_seen"], 3)
+        }
+    
+    def shutdown(self, wait=True):
+        """Stop accepting work, flush what is queued and stop the worker"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if wait and self._worker is not None:
+            self._worker.join()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Compare sentiment inference latency and throughput between the PyTorch and ONNX Runtime backends
+
+Usage:
+    python benchmarks/compare_backends.py [--model PATH_OR_NAME] [--repeats N] [--batch-size N]
+
+Prints a JSON report. Point --model at a local snapshot to run offline.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Load the analyzers synchronously and keep the benchmark free of cache hits
+os.environ.setdefault("SENTIMENT_BACKGROUND_LOAD", "false")
+os.environ["SENTIMENT_CACHE_SIZE"] = "0"
+
+SAMPLE_TEXTS = [
+    "Feeling good today",
+    "Tired and stressed about work, the deadline keeps moving and I can't sleep",
+    "Had a lovely walk by the river with my sister, the weather was perfect and we laughed a lot",
+    "I don't know why but everything feels heavy lately. " * 6,
+]
+
+def measure(analyzer, texts, repeats, batch_size):
+    """Time single-text latency and batched throughput for one analyzer"""
+    latencies = []
+    for _ in range(repeats):
+        for text in texts:
+            started = time.perf_counter()
+            analyzer.analyze(text)
+            latencies.append((time.perf_counter() - started) * 1000)
+    
+    corpus = texts * max(1, repeats)
+    started = time.perf_counter()
+    analyzer.analyze_many(corpus, batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+    
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+        "batched_texts_per_second": round(len(corpus) / elapsed, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default=os.getenv("SENTIMENT_MODEL"), help="model name or local snapshot path")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+    
+    if args.model:
+        os.environ["SENTIMENT_MODEL"] = args.model
+    
+    from model import MoodAnalyzer
+    
+    report = {"model": args.model, "texts": len(SAMPLE_TEXTS), "repeats": args.repeats, "backends": {}}
+    for backend in ["pytorch", "onnx"]:
+        analyzer = MoodAnalyzer(backend=backend)
+        report["backends"][backend] = measure(analyzer, SAMPLE_TEXTS, args.repeats, args.batch_size)
+    
+    pytorch, onnx = report["backends"]["pytorch"], report["backends"]["onnx"]
+    report["onnx_speedup"] = {
+        "p50_latency": round(pytorch["p50_ms"] / onnx["p50_ms"], 2),
+        "batched_throughput": round(onnx["batched_texts_per_second"] / pytorch["batched_texts_per_second"], 2)
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
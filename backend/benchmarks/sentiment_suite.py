@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Benchmark the sentiment hot path: MoodAnalyzer, the keyword lexicon and the Flask /analyze route
+
+Usage:
+    python benchmarks/sentiment_suite.py --model ./models/sst2 [--texts N] [--seed N] [--output FILE]
+    python benchmarks/sentiment_suite.py --target keyword
+
+Every target runs in its own subprocess so its peak RSS is measured in
+isolation. The JSON report records the git commit, so reports saved from
+different commits can be diffed directly.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add the backend directory to the path
+sys.path.insert(0, BACKEND_DIR)
+
+# Load the model synchronously and keep the benchmark free of cache hits
+os.environ.setdefault("SENTIMENT_BACKGROUND_LOAD", "false")
+os.environ["SENTIMENT_CACHE_SIZE"] = "0"
+
+TARGETS = ["keyword", "model", "route"]
+
+# Word counts per corpus bucket; long entries exceed one 512-token model window
+BUCKETS = {
+    "short": (3, 12),
+    "medium": (25, 60),
+    "long": (250, 600)
+}
+
+OPENERS = ["Today", "This morning", "Tonight", "Lately", "At work", "After the gym", "This week"]
+FEELINGS = [
+    "I felt happy and grateful", "I was anxious about the meeting", "everything felt heavy",
+    "I had a wonderful time with friends", "I was frustrated with myself", "I felt calm",
+    "my mood was up and down", "I was exhausted but content", "I felt lonely and sad",
+    "things were pretty good", "I was stressed about money", "I felt proud of my progress"
+]
+DETAILS = [
+    "the weather was grey", "I skipped lunch again", "my sister called", "the deadline moved",
+    "I slept badly", "I went for a long walk", "the train was late", "I finished the report",
+    "I cooked dinner for the first time in weeks", "my manager gave feedback", "I meditated for ten minutes"
+]
+
+def build_corpus(size, seed):
+    """Generate a deterministic mix of short, medium and long journal entries"""
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(size):
+        bucket = list(BUCKETS)[index % len(BUCKETS)]
+        low, high = BUCKETS[bucket]
+        target_words = rng.randint(low, high)
+        words = []
+        while len(words) < target_words:
+            sentence = f"{rng.choice(OPENERS)} {rng.choice(FEELINGS)} because {rng.choice(DETAILS)}."
+            words.extend(sentence.split())
+        corpus.append((bucket, " ".join(words[:target_words])))
+    return corpus
+
+def summarize(latencies_ms, elapsed_seconds=None):
+    """Percentiles and throughput for a list of per-text latencies"""
+    if not latencies_ms:
+        return {"count": 0}
+    ordered = sorted(latencies_ms)
+    
+    def percentile(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+    
+    elapsed_seconds = elapsed_seconds or sum(latencies_ms) / 1000
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "texts_per_second": round(len(ordered) / elapsed_seconds, 1) if elapsed_seconds else None
+    }
+
+def time_each(corpus, call, warmup):
+    """Run call on every text sequentially, returning overall and per-bucket stats"""
+    for _, text in corpus[:warmup]:
+        call(text)
+    
+    latencies = {bucket: [] for bucket in BUCKETS}
+    started = time.perf_counter()
+    for bucket, text in corpus:
+        call_started = time.perf_counter()
+        call(text)
+        latencies[bucket].append((time.perf_counter() - call_started) * 1000)
+    elapsed = time.perf_counter() - started
+    
+    return {
+        "overall": summarize([value for values in latencies.values() for value in values], elapsed),
+        "buckets": {bucket: summarize(values) for bucket, values in latencies.items()}
+    }
+
+def time_batch(texts, call):
+    """Time one call that processes every text, returning throughput"""
+    started = time.perf_counter()
+    call(texts)
+    elapsed = time.perf_counter() - started
+    return {"count": len(texts), "seconds": round(elapsed, 3), "texts_per_second": round(len(texts) / elapsed, 1)}
+
+def bench_keyword(corpus, args):
+    """Keyword lexicon used by simple_app's /analyze"""
+    import lexicon
+    texts = [text for _, text in corpus]
+    return {
+        "sequential": time_each(corpus, lexicon.classify, args.warmup),
+        "batched": time_batch(texts, lexicon.classify_many)
+    }
+
+def bench_model(corpus, args):
+    """MoodAnalyzer.analyze and analyze_many, bypassing the cache"""
+    from model import MoodAnalyzer
+    load_started = time.perf_counter()
+    analyzer = MoodAnalyzer()
+    load_seconds = time.perf_counter() - load_started
+    if not analyzer.is_ready:
+        raise RuntimeError(f"Sentiment model failed to load: {analyzer.load_error}")
+    
+    texts = [text for _, text in corpus]
+    result = {
+        "model_version": analyzer.model_version,
+        "backend": analyzer.backend,
+        "load_seconds": round(load_seconds, 3),
+        "sequential": time_each(corpus, analyzer.analyze, args.warmup),
+        "batched": time_batch(texts, lambda batch: analyzer.analyze_many(batch, batch_size=args.batch_size))
+    }
+    analyzer.batcher.shutdown()
+    return result
+
+def bench_route(corpus, args):
+    """Full POST /analyze and /analyze/batch requests through the Flask test client"""
+    # The sentiment routes never touch the database, but app.py needs a client at import
+    os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+    os.environ.setdefault("SUPABASE_KEY", "benchmark")
+    from app import app, mood_analyzer
+    if not mood_analyzer.wait_until_ready():
+        raise RuntimeError(f"Sentiment model failed to load: {mood_analyzer.load_error}")
+    client = app.test_client()
+    
+    def post_single(text):
+        response = client.post("/analyze", json={"text": text})
+        if response.status_code != 200:
+            raise RuntimeError(f"/analyze returned {response.status_code}: {response.get_data(as_text=True)}")
+    
+    def post_batches(texts):
+        for start in range(0, len(texts), args.batch_size):
+            response = client.post("/analyze/batch", json={"texts": texts[start:start + args.batch_size]})
+            if response.status_code != 200:
+                raise RuntimeError(f"/analyze/batch returned {response.status_code}")
+    
+    texts = [text for _, text in corpus]
+    sequential = time_each(corpus, post_single, args.warmup)
+    return {
+        "sequential": sequential,
+        "batched": time_batch(texts, post_batches),
+        "stats": client.get("/analyze/stats").get_json()
+    }
+
+BENCHMARKS = {
+    "keyword": bench_keyword,
+    "model": bench_model,
+    "route": bench_route
+}
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+def run_target(target, args):
+    """Run one benchmark in this process and return its results"""
+    corpus = build_corpus(args.texts, args.seed)
+    result = BENCHMARKS[target](corpus, args)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", default=os.getenv("SENTIMENT_MODEL"), help="model name or local snapshot path")
+    parser.add_argument("--target", choices=TARGETS, action="append", help="benchmark to run (repeatable, default: all)")
+    parser.add_argument("--texts", type=int, default=300, help="corpus size, split evenly across short/medium/long")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--in-process", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.model:
+        os.environ["SENTIMENT_MODEL"] = args.model
+        if os.path.isdir(args.model):
+            os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    targets = args.target or TARGETS
+    
+    if args.in_process:
+        print(json.dumps(run_target(targets[0], args)))
+        return
+    
+    report = {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "model": args.model,
+        "corpus": {"texts": args.texts, "seed": args.seed, "buckets": {name: list(words) for name, words in BUCKETS.items()}},
+        "batch_size": args.batch_size,
+        "targets": {}
+    }
+    for target in targets:
+        command = [
+            sys.executable, os.path.abspath(__file__), "--in-process", "--target", target,
+            "--texts", str(args.texts), "--seed", str(args.seed),
+            "--warmup", str(args.warmup), "--batch-size", str(args.batch_size)
+        ]
+        if args.model:
+            command += ["--model", args.model]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            stderr = completed.stderr.strip().splitlines()
+            report["targets"][target] = {"error": stderr[-1] if stderr else f"exit code {completed.returncode}"}
+            continue
+        # Model loading may print progress; the result is the last line
+        report["targets"][target] = json.loads(completed.stdout.strip().splitlines()[-1])
+    
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Streaming NDJSON import of historical journal entries
+Scores entries in batches and bulk-inserts them into mood_logs in chunks, yielding results as it goes
+"""
+
+import json
+from datetime import datetime
+
+def iter_ndjson_lines(stream, max_line_bytes=65536):
+    """
+    Yield (line_number, raw_line) pairs from a file-like stream, one line at a time
+    
+    Lines longer than max_line_bytes are drained without being buffered and
+    yielded as None, so a single huge line cannot exhaust memory.
+    """
+    line_number = 0
+    while True:
+        raw = stream.readline(max_line_bytes + 1)
+        if not raw:
+            return
+        line_number += 1
+        if len(raw) > max_line_bytes and not raw.endswith(b"\n"):
+            while raw and not raw.endswith(b"\n"):
+                raw = stream.readline(max_line_bytes + 1)
+            yield line_number, None
+            continue
+        yield line_number, raw
+
+def parse_entry(raw):
+    """
+    Parse one NDJSON line into an entry
+    
+    Returns:
+        tuple: (entry, None) with text and optional created_at, or (None, error message)
+    """
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return None, "Invalid JSON"
+    if not isinstance(data, dict):
+        return None, "Entry must be a JSON object"
+    
+    text = data.get("text")
+    if not isinstance(text, str) or not text.strip():
+        return None, "No text provided"
+    
+    entry = {"text": text}
+    created_at = data.get("created_at")
+    if created_at is not None:
+        try:
+            datetime.fromisoformat(str(created_at).replace("Z", "+00:00"))
+        except ValueError:
+            return None, "created_at must be an ISO 8601 timestamp"
+        entry["created_at"] = created_at
+    return entry, None
+
+class MoodLogImport:
+    """
+    One streaming import run for a user
+    
+    run() consumes (line_number, raw_line) pairs and yields events: a result
+    or error per line, a progress event after every inserted chunk and a
+    final summary. At most batch_size entries and insert_chunk_size rows are
+    held at once, so memory stays flat however large the upload is.
+    """
+    
+    def __init__(self, user_id, analyze_many, insert_rows, batch_size=64, insert_chunk_size=500):
+        self.user_id = user_id
+        self.analyze_many = analyze_many
+        self.insert_rows = insert_rows
+        self.batch_size = max(1, batch_size)
+        self.insert_chunk_size = max(1, insert_chunk_size)
+        self.summary = {"lines": 0, "analyzed": 0, "saved": 0, "failed": 0}
+        self._pending = []
+        self._rows = []
+        self._row_lines = []
+    
+    def run(self, lines):
+        """Import every line, yielding event dicts"""
+        for line_number, raw in lines:
+            if raw is not None and not raw.strip():
+                continue
+            self.summary["lines"] += 1
+            
+            if raw is None:
+                entry, error = None, "Line is too long"
+            else:
+                entry, error = parse_entry(raw)
+            if error:
+                self.summary["failed"] += 1
+                yield {"line": line_number, "error": error}
+                continue
+            
+            self._pending.append((line_number, entry))
+            if len(self._pending) >= self.batch_size:
+                yield from self._score_pending()
+            if len(self._rows) >= self.insert_chunk_size:
+                yield from self._save_rows()
+        
+        yield from self._score_pending()
+        yield from self._save_rows()
+        yield dict(self.summary, done=True)
+    
+    def _score_pending(self):
+        """Analyze the pending entries in one batched call and queue rows for insert"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            results = self.analyze_many([entry["text"] for _, entry in pending], batch_size=self.batch_size)
+        except Exception as e:
+            results = [{"error": str(e)}] * len(pending)
+        
+        for (line_number, entry), result in zip(pending, results):
+            if "error" in result:
+                self.summary["failed"] += 1
+                yield {"line": line_number, "error": result["error"]}
+                continue
+            
+            self.summary["analyzed"] += 1
+            row = {
+                "user_id": self.user_id,
+                "text": entry["text"],
+                "sentiment": result["sentiment"],
+                "score": result["score"]
+            }
+            if "created_at" in entry:
+                row["created_at"] = entry["created_at"]
+            self._rows.append(row)
+            self._row_lines.append(line_number)
+            yield {"line": line_number, "sentiment": result["sentiment"], "score": result["score"]}
+    
+    def _save_rows(self):
+        """Bulk-insert the queued rows and report progress"""
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        row_lines, self._row_lines = self._row_lines, []
+        try:
+            self.insert_rows(rows)
+            self.summary["saved"] += len(rows)
+        except Exception as e:
+            print(f"Error saving imported mood logs: {e}")
+            self.summary["failed"] += len(rows)
+            yield {"error": f"Failed to save lines {row_lines[0]}-{row_lines[-1]}: {e}", "lines": row_lines}
+        yield {"progress": dict(self.summary)}
+
+def to_ndjson(events):
+    """Serialize events as newline-delimited JSON"""
+    for event in events:
+        yield json.dumps(event) + "\n"
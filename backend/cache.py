@@ -0,0 +1,149 @@
+"""
+Content-addressed cache for sentiment results
+Bounded in-memory LRU tier with TTL, plus an optional Redis tier shared by all workers
+"""
+
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Bump when the cached result shape changes so old entries are ignored
+CACHE_FORMAT_VERSION = "1"
+
+def normalize_text(text: str, lowercase: bool = False) -> str:
+    """Normalize text so trivially different inputs share a cache entry"""
+    text = unicodedata.normalize("NFC", text)
+    text = " ".join(text.split())
+    return text.lower() if lowercase else text
+
+def make_cache_key(text: str, model_name: str, model_version: str, lowercase: bool = False) -> str:
+    """Hash normalized text together with the model identity"""
+    material = "\0".join([CACHE_FORMAT_VERSION, model_name, model_version, normalize_text(text, lowercase)])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+class SentimentCache:
+    """
+    Two-tier result cache keyed by make_cache_key()
+    
+    The local tier is a per-process LRU bounded by max_entries, where entries
+    expire after ttl_seconds. If a Redis URL (or client) is given, misses fall
+    through to Redis and local writes are copied there, so gunicorn workers
+    share hits. Shared-tier failures are counted but never raised.
+    """
+    
+    def __init__(self, max_entries=10000, ttl_seconds=86400, shared_url=None, shared_client=None, namespace="sentiment"):
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._shared = shared_client
+        
+        if self._shared is None and shared_url:
+            if redis is None:
+                print("redis package not installed, shared sentiment cache disabled")
+            else:
+                try:
+                    self._shared = redis.Redis.from_url(shared_url, socket_timeout=0.05)
+                except Exception as e:
+                    print(f"Shared sentiment cache unavailable: {e}")
+        
+        self._stats = {
+            "local_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "shared_errors": 0
+        }
+    
+    def _shared_key(self, key):
+        return f"{self.namespace}:{key}"
+    
+    def get(self, key):
+        """Return a copy of the cached result, or None on a miss"""
+        if self.max_entries:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    expires_at, value = entry
+                    if expires_at > time.monotonic():
+                        self._entries.move_to_end(key)
+                        self._stats["local_hits"] += 1
+                        return dict(value)
+                    del self._entries[key]
+                    self._stats["expirations"] += 1
+        
+        if self._shared is not None:
+            try:
+                raw = self._shared.get(self._shared_key(key))
+                if raw is not None:
+                    value = json.loads(raw)
+                    self._set_local(key, value)
+                    with self._lock:
+                        self._stats["shared_hits"] += 1
+                    return dict(value)
+            except Exception as e:
+                print(f"Shared sentiment cache read failed: {e}")
+                with self._lock:
+                    self._stats["shared_errors"] += 1
+        
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+    
+    def _set_local(self, key, value):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, dict(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+    
+    def set(self, key, value):
+        """Store a result in every tier"""
+        self._set_local(key, value)
+        if self._shared is not None:
+            try:
+                self._shared.set(self._shared_key(key), json.dumps(value), ex=int(self.ttl_seconds))
+            except Exception as e:
+                print(f"Shared sentiment cache write failed: {e}")
+                with self._lock:
+                    self._stats["shared_errors"] += 1
+    
+    def clear(self):
+        """Drop every local entry; shared entries age out through their TTL"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        """Return size, settings and hit/miss counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            size = len(self._entries)
+        hits = stats["local_hits"] + stats["shared_hits"]
+        lookups = hits + stats["misses"]
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "shared_enabled": self._shared is not None,
+            "hits": hits,
+            "misses": stats["misses"],
+            "hit_rate": round(hits / lookups, 4) if lookups else 0,
+            "local_hits": stats["local_hits"],
+            "shared_hits": stats["shared_hits"],
+            "evictions": stats["evictions"],
+            "expirations": stats["expirations"],
+            "shared_errors": stats["shared_errors"]
+        }
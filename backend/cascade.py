@@ -0,0 +1,132 @@
+"""
+Tiered sentiment cascade
+Answers from the keyword lexicon when it is confident and escalates to the transformer model otherwise
+"""
+
+import threading
+from concurrent.futures import Future
+import lexicon
+
+class SentimentCascade:
+    """
+    Two-tier sentiment analyzer in front of a MoodAnalyzer
+    
+    The lexicon tier answers when it found keywords of only one polarity and
+    its score reaches threshold. Neutral, conflicting or weak lexicon results
+    are escalated to the model. Every result records the tier that produced
+    it, and per-tier counters show how much model compute the cascade saves.
+    """
+    
+    def __init__(self, model_analyzer, threshold=0.8, enabled=True):
+        self.model_analyzer = model_analyzer
+        self.threshold = threshold
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {
+            "lexicon": 0,
+            "model": 0,
+            "escalated": 0,
+            "model_errors": 0
+        }
+    
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._stats[counter] += amount
+    
+    def classify_fast(self, text):
+        """
+        Try the lexicon tier on its own
+        
+        Returns:
+            dict: Result with tier "lexicon", or None if the text must be escalated
+        """
+        if self.enabled:
+            result = lexicon.classify(text)
+            if result["sentiment"] != "neutral" and not result["conflicting"] and result["score"] >= self.threshold:
+                self._count("lexicon")
+                return {"sentiment": result["sentiment"], "score": result["score"], "tier": "lexicon"}
+        self._count("escalated")
+        return None
+    
+    def _model_result(self, result):
+        """Tag a model result with its tier and count it"""
+        if "error" in result:
+            self._count("model_errors")
+            return result
+        self._count("model")
+        return dict(result, tier="model")
+    
+    def escalate_async(self, text):
+        """Run text through the model tier via the micro-batcher, returning a Future"""
+        tagged = Future()
+        
+        def on_done(future):
+            try:
+                tagged.set_result(self._model_result(future.result()))
+            except Exception as e:
+                self._count("model_errors")
+                tagged.set_exception(e)
+        
+        self.model_analyzer.analyze_async(text).add_done_callback(on_done)
+        return tagged
+    
+    def analyze(self, text):
+        """Analyze one text through the cascade"""
+        result = self.classify_fast(text)
+        if result is not None:
+            return result
+        try:
+            return self._model_result(self.model_analyzer.analyze(text))
+        except Exception:
+            self._count("model_errors")
+            raise
+    
+    def analyze_many(self, texts, batch_size=None, escalate=True):
+        """
+        Analyze several texts, sending only the uncertain ones to the model in one batched call
+        
+        Args:
+            texts (list): Texts to analyze
+            batch_size (int): Model batch size
+            escalate (bool): Send uncertain texts to the model; when False, for
+                example while it loads, they get an error with "escalated": True
+        
+        Returns:
+            list: One result per input in order, each tagged with its tier,
+            or carrying an "error" key like MoodAnalyzer.analyze_many
+        """
+        results = [None] * len(texts)
+        escalated = []
+        for index, text in enumerate(texts):
+            if not (isinstance(text, str) and text.strip()):
+                results[index] = {"error": "No text provided"}
+                continue
+            result = self.classify_fast(text)
+            if result is None:
+                escalated.append(index)
+            else:
+                results[index] = result
+        
+        if escalated and not escalate:
+            for index in escalated:
+                results[index] = {"error": "Sentiment model is not ready", "escalated": True}
+        elif escalated:
+            model_results = self.model_analyzer.analyze_many([texts[index] for index in escalated], batch_size=batch_size)
+            for index, result in zip(escalated, model_results):
+                results[index] = self._model_result(result)
+        return results
+    
+    def stats(self):
+        """Return the threshold and per-tier counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        answered = stats["lexicon"] + stats["model"]
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "lexicon": stats["lexicon"],
+            "model": stats["model"],
+            "escalated": stats["escalated"],
+            "model_errors": stats["model_errors"],
+            "lexicon_share": round(stats["lexicon"] / answered, 4) if answered else 0
+        }
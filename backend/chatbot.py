@@ -2,19 +2,342 @@
 Mental Health Chatbot using Hugging Face Llama 2
 """
 
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+from dotenv import load_dotenv
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from batching import QueueFullError
+from generation import GenerationScheduler
+from speculative import SpeculativeScheduler, compatible_tokenizers
+from crisis import crisis_response, detect_crisis
+from quantized_weights import load_quantized_model
+import threading
+import time
 import torch
+import copy
+import os
 import re
 
+load_dotenv()
+
+# Chat model; the fallback is tried if it cannot be loaded
+CHATBOT_MODEL = os.getenv("CHATBOT_MODEL", "meta-llama/Llama-2-7b-chat-hf")
+
+# "auto" loads CHATBOT_MODEL in float16 from the Hugging Face cache or hub; "quantized" loads
+# the int8 model prepared by quantized_weights.py in CHATBOT_QUANTIZED_DIR, memory-mapped so
+# workers share its pages, checked against its checksums and never touching the network
+CHATBOT_LOAD_MODE = os.getenv("CHATBOT_LOAD_MODE", "auto").lower()
+CHATBOT_QUANTIZED_DIR = os.getenv("CHATBOT_QUANTIZED_DIR", os.path.join(os.path.expanduser("~"), ".cache", "moodmate", "chatbot-int8"))
+# "true" hashes only files changed since they last matched SHA256SUMS, "full" hashes every file on every load
+CHATBOT_VERIFY_CHECKSUMS = os.getenv("CHATBOT_VERIFY_CHECKSUMS", "true").lower()
+
+# Load the chat model in the background at import instead of on the first chat request
+CHATBOT_PRELOAD = os.getenv("CHATBOT_PRELOAD", "false").lower() == "true"
+
+# New tokens generated per reply
+CHATBOT_MAX_NEW_TOKENS = int(os.getenv("CHATBOT_MAX_NEW_TOKENS", "150"))
+
+# Seconds a streaming reply waits for the next token before giving up
+CHATBOT_STREAM_TIMEOUT = float(os.getenv("CHATBOT_STREAM_TIMEOUT", "60"))
+
+# Keep the key/value cache of the fixed system prompt and prefill only the rest of each prompt
+CHATBOT_PREFIX_CACHE = os.getenv("CHATBOT_PREFIX_CACHE", "true").lower() == "true"
+
+# Continuous batching of concurrent replies: most sequences per decode step, queued
+# requests beyond that, and seconds after which a reply stops with what it has
+CHATBOT_SCHEDULER = os.getenv("CHATBOT_SCHEDULER", "true").lower() == "true"
+CHATBOT_MAX_BATCH = int(os.getenv("CHATBOT_MAX_BATCH", "8"))
+CHATBOT_MAX_QUEUE = int(os.getenv("CHATBOT_MAX_QUEUE", "32"))
+CHATBOT_DEADLINE_SECONDS = float(os.getenv("CHATBOT_DEADLINE_SECONDS", "60"))
+
+# Speculative decoding: a small draft model with the same tokenizer as CHATBOT_MODEL (e.g.
+# TinyLlama/TinyLlama-1.1B-Chat-v1.0 for Llama 2) proposes CHATBOT_DRAFT_TOKENS tokens per
+# chat model forward pass. Replies are then decoded one at a time instead of batched; empty disables
+CHATBOT_DRAFT_MODEL = os.getenv("CHATBOT_DRAFT_MODEL", "")
+CHATBOT_DRAFT_TOKENS = int(os.getenv("CHATBOT_DRAFT_TOKENS", "4"))
+
+# Replies are cut at this many characters, as _clean_response does
+CHATBOT_MAX_RESPONSE_CHARS = 500
+
+UNAVAILABLE_MESSAGE = "I'm sorry, I'm having trouble connecting right now. Please try again later."
+
+class CancelledCriteria(StoppingCriteria):
+    """Stops generation once the given event is set"""
+    
+    def __init__(self, cancel_event):
+        self.cancel_event = cancel_event
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.cancel_event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+class StreamingResponseCleaner:
+    """
+    Applies the _clean_response rules to a reply as it streams in
+    
+    Leading whitespace is dropped, the reply ends before a "User:" turn
+    marker and is cut at max_chars with "...". Text that might be the start
+    of a marker, and trailing whitespace, is held back until the next chunk
+    shows whether it belongs in the reply. A generated "Assistant:" marker
+    also ends the reply, since earlier text cannot be withdrawn once sent.
+    """
+    
+    STOP_MARKERS = ("User:", "Assistant:")
+    
+    def __init__(self, max_chars=CHATBOT_MAX_RESPONSE_CHARS):
+        self.max_chars = max_chars
+        self.finished = False
+        self._pending = ""
+        self._emitted = 0
+        self._started = False
+    
+    def feed(self, text):
+        """Add generated text and return the part that is safe to send"""
+        if self.finished:
+            return ""
+        text = self._pending + text
+        self._pending = ""
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        
+        stops = [text.find(marker) for marker in self.STOP_MARKERS if marker in text]
+        if stops:
+            self.finished = True
+            return self._limit(text[:min(stops)].rstrip())
+        
+        held = self._marker_prefix_length(text)
+        safe = text[:len(text) - held]
+        ready = safe.rstrip()
+        self._pending = safe[len(ready):] + text[len(safe):]
+        return self._limit(ready)
+    
+    def flush(self):
+        """Return whatever is still held back once generation has ended"""
+        if self.finished:
+            return ""
+        self.finished = True
+        text = self._pending if self._started else self._pending.lstrip()
+        self._pending = ""
+        return self._limit(text.rstrip())
+    
+    def _marker_prefix_length(self, text):
+        """Length of the longest suffix of text that could grow into a stop marker"""
+        for length in range(min(len(text), max(len(marker) for marker in self.STOP_MARKERS) - 1), 0, -1):
+            suffix = text[-length:]
+            if any(marker.startswith(suffix) for marker in self.STOP_MARKERS):
+                return length
+        return 0
+    
+    def _limit(self, text):
+        """Enforce max_chars across everything sent so far"""
+        remaining = self.max_chars - self._emitted
+        if len(text) > remaining:
+            self.finished = True
+            self._emitted = self.max_chars
+            return text[:remaining] + "..."
+        self._emitted += len(text)
+        return text
+
 class MentalHealthChatbot:
-    def __init__(self):
-        self.model_name = "meta-llama/Llama-2-7b-chat-hf"
+    system_prompt = """You are a compassionate mental health support chatbot. You provide:
+            - Empathetic and supportive responses
+            - Gentle encouragement
+            - Mental health resources and coping strategies
+            - Crisis intervention guidance when needed
+            - Professional boundaries (not a replacement for therapy)
+            
+            Keep responses concise, warm, and helpful. If someone mentions self-harm or suicide, 
+            encourage them to contact emergency services or a mental health professional immediately."""
+    
+    def __init__(self, model_name=None, load=True, background=False, load_mode=None):
+        self.model_name = model_name or CHATBOT_MODEL
+        self.load_mode = load_mode or CHATBOT_LOAD_MODE
         self.tokenizer = None
         self.model = None
+        self.status = "idle"
+        self.load_error = None
+        self._load_lock = threading.Lock()
+        self._load_finished = threading.Event()
+        self.prefix_cache_enabled = CHATBOT_PREFIX_CACHE
+        self._prefix_ids = None
+        self._prefix_cache = None
+        self._prefix_stats = {"hits": 0, "misses": 0}
+        self._prefix_lock = threading.Lock()
+        self._prompt_segments = None
+        self.scheduler = None
+        self.draft_model_name = CHATBOT_DRAFT_MODEL
+        self.draft_model = None
+        if load:
+            if background:
+                self.load_in_background()
+            else:
+                self.load()
+    
+    @property
+    def is_ready(self):
+        """Whether a chat model is loaded"""
+        return self.status == "ready"
+    
+    def load(self):
+        """Load the model (or the fallback), recording the outcome in status"""
+        self.status = "loading"
+        self.load_error = None
+        self._load_finished.clear()
         self._load_model()
+        if self.model is None or self.tokenizer is None:
+            self.status = "failed"
+            self.load_error = "No chat model could be loaded"
+        else:
+            self._load_draft_model()
+            self.prepare_prefix_cache()
+            self.prepare_scheduler()
+            self.status = "ready"
+        self._load_finished.set()
+    
+    def load_in_background(self):
+        """Start load() on a daemon thread unless loading has already been started"""
+        with self._load_lock:
+            if self.status != "idle":
+                return None
+            self.status = "loading"
+        
+        thread = threading.Thread(target=self.load, name="chat-model-loader", daemon=True)
+        thread.start()
+        return thread
+    
+    def wait_until_ready(self, timeout=None):
+        """Block until loading finishes and return whether the model is ready"""
+        self._load_finished.wait(timeout)
+        return self.is_ready
+    
+    def readiness(self):
+        """Loading state for readiness responses"""
+        return {
+            "status": self.status,
+            "model": self.model_name,
+            "load_mode": self.load_mode,
+            "draft_model": self.draft_model_name if self.draft_model is not None else None,
+            "error": self.load_error,
+            "prefix_cache": self.prefix_cache_stats()
+        }
+    
+    def prepare_prefix_cache(self):
+        """
+        Encode the system prompt once and keep its key/value cache
+        
+        Every prompt starts with the system prompt, so requests can start
+        from this cache and prefill only the context and user message.
+        Returns whether the cache is available.
+        """
+        self._prefix_ids = None
+        self._prefix_cache = None
+        if not self.prefix_cache_enabled or not self.model or not self.tokenizer:
+            return False
+        
+        try:
+            prefix_ids = torch.tensor([self._prompt_segment_ids()[0]], dtype=torch.long)
+            with torch.no_grad():
+                outputs = self.model(prefix_ids, use_cache=True)
+            self._prefix_cache = outputs.past_key_values
+            self._prefix_ids = prefix_ids
+            print(f"Cached system prompt ({prefix_ids.shape[1]} tokens)")
+            return True
+        except Exception as e:
+            print(f"System prompt cache unavailable: {e}")
+            return False
+    
+    def prepare_scheduler(self):
+        """Create the scheduler that serves concurrent replies, speculative when a draft model is loaded"""
+        if self.scheduler is not None:
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
+        if not CHATBOT_SCHEDULER or not self.model or not self.tokenizer:
+            return False
+        
+        if self.draft_model is not None:
+            self.scheduler = SpeculativeScheduler(
+                self.model,
+                self.draft_model,
+                self.tokenizer.eos_token_id,
+                num_draft_tokens=CHATBOT_DRAFT_TOKENS,
+                max_queue_size=CHATBOT_MAX_QUEUE,
+                name="chat-scheduler",
+                **self._sampling_kwargs()
+            )
+            # Plain decoding speed on the system prompt, the baseline for the reported speedup
+            try:
+                self.scheduler.calibrate(torch.tensor([self._prompt_segment_ids()[0]], dtype=torch.long))
+            except Exception as e:
+                print(f"Speculative decoding baseline unavailable: {e}")
+            return True
+        
+        self.scheduler = GenerationScheduler(
+            self.model,
+            self.tokenizer.eos_token_id,
+            max_batch_size=CHATBOT_MAX_BATCH,
+            max_queue_size=CHATBOT_MAX_QUEUE,
+            name="chat-scheduler",
+            **self._sampling_kwargs()
+        )
+        return True
+    
+    def _submit(self, inputs, cancel_event=None, on_token=None):
+        """Queue a prompt on the scheduler, starting from the cached system prompt when possible"""
+        return self.scheduler.submit(
+            inputs,
+            CHATBOT_MAX_NEW_TOKENS,
+            timeout=CHATBOT_DEADLINE_SECONDS,
+            cancel_event=cancel_event,
+            on_token=on_token,
+            past_key_values=self._cached_prefix_for(inputs)
+        )
+    
+    def prefix_cache_stats(self):
+        """Return prefix cache size and hit/miss counters"""
+        with self._prefix_lock:
+            stats = dict(self._prefix_stats)
+        return {
+            "enabled": self._prefix_ids is not None,
+            "prefix_tokens": self._prefix_ids.shape[1] if self._prefix_ids is not None else 0,
+            "hits": stats["hits"],
+            "misses": stats["misses"]
+        }
+    
+    def _cached_prefix_for(self, inputs):
+        """Return a cache starting from the system prompt if inputs start with it, else None"""
+        prefix_ids = self._prefix_ids
+        if prefix_ids is None:
+            return None
         
+        length = prefix_ids.shape[1]
+        # Tokenization must agree at the boundary, and at least one token is left to prefill
+        matches = inputs.shape[1] > length and torch.equal(inputs[:, :length], prefix_ids)
+        with self._prefix_lock:
+            self._prefix_stats["hits" if matches else "misses"] += 1
+        
+        return self._shared_prefix_cache() if matches else None
+    
+    def _shared_prefix_cache(self):
+        """
+        Return a cache holding the system prompt without copying its tensors
+        
+        Each request gets its own cache and layer objects, but their keys and
+        values are the prefix tensors themselves. Appending or cropping a
+        layer replaces its tensors rather than writing into them, so the
+        prefix is only copied into a new tensor when a layer is extended,
+        and the shared cache is never modified.
+        """
+        cache = copy.copy(self._prefix_cache)
+        cache.layers = [copy.copy(layer) for layer in self._prefix_cache.layers]
+        return cache
+    
     def _load_model(self):
         """Load the Llama 2 model and tokenizer"""
+        if self.load_mode == "quantized":
+            self._load_quantized_model()
+            return
+        
         try:
             print("Loading Llama 2 model... This may take a few minutes.")
             self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
@@ -30,6 +353,41 @@ class MentalHealthChatbot:
             # Fallback to a smaller model if Llama 2 fails
             self._load_fallback_model()
     
+    def _load_quantized_model(self, model_dir=None):
+        """Load the prepared int8 model from local disk; there is no download fallback in this mode"""
+        model_dir = model_dir or CHATBOT_QUANTIZED_DIR
+        try:
+            print(f"Loading int8 chat model from {model_dir}...")
+            self.model, self.tokenizer, manifest = load_quantized_model(
+                model_dir,
+                verify=CHATBOT_VERIFY_CHECKSUMS in ("true", "full"),
+                full_verify=CHATBOT_VERIFY_CHECKSUMS == "full"
+            )
+            self.model_name = manifest.get("source_model", model_dir)
+            print("Quantized model loaded successfully!")
+        except Exception as e:
+            print(f"Error loading quantized model: {e}")
+            self.model = None
+            self.tokenizer = None
+    
+    def _load_draft_model(self):
+        """Load the CHATBOT_DRAFT_MODEL draft model, leaving it unset if missing or its tokenizer differs"""
+        if not self.draft_model_name or self.draft_model is not None:
+            return
+        
+        try:
+            print(f"Loading draft model {self.draft_model_name}...")
+            draft_tokenizer = AutoTokenizer.from_pretrained(self.draft_model_name)
+            if not compatible_tokenizers(self.tokenizer, draft_tokenizer):
+                print(f"Draft model {self.draft_model_name} does not share the tokenizer of {self.model_name}; speculative decoding disabled")
+                return
+            draft_model = AutoModelForCausalLM.from_pretrained(self.draft_model_name, torch_dtype=self.model.dtype)
+            self.draft_model = draft_model.to(self.model.device).eval()
+            print("Draft model loaded successfully!")
+        except Exception as e:
+            print(f"Error loading draft model: {e}")
+            self.draft_model = None
+    
     def _load_fallback_model(self):
         """Load a smaller fallback model"""
         try:
@@ -43,48 +401,123 @@ class MentalHealthChatbot:
             self.model = None
             self.tokenizer = None
     
-    def generate_response(self, user_input, context=""):
-        """Generate a response to user input"""
+    def tokenize(self, text):
+        """Token ids for text, without special tokens"""
+        return self.tokenizer.encode(text, add_special_tokens=False)
+    
+    def detokenize(self, token_ids):
+        """Text for token ids"""
+        return self.tokenizer.decode(token_ids, skip_special_tokens=True)
+    
+    def _build_prompt(self, user_input, context=""):
+        """Format the conversation as a mental health focused prompt"""
+        if context:
+            return f"{self.system_prompt}\n\nContext: {context}\n\nUser: {user_input}\n\nAssistant:"
+        return f"{self.system_prompt}\n\nUser: {user_input}\n\nAssistant:"
+    
+    def _prompt_segment_ids(self):
+        """Token ids of the system prompt and of the context heading, encoded once per tokenizer"""
+        segments = self._prompt_segments
+        if segments is None or segments[0] is not self.tokenizer:
+            segments = (self.tokenizer, self.tokenizer.encode(self.system_prompt), self.tokenize("\n\nContext: "))
+            self._prompt_segments = segments
+        return segments[1], segments[2]
+    
+    def _prompt_ids(self, user_input, context=""):
+        """
+        Token ids of the _build_prompt layout, as a [1, length] tensor
+        
+        Only new text is tokenized: the system prompt's ids are cached, and a
+        context carrying token_ids (a TokenizedContext from the conversation
+        memory) contributes those, so a turn with session history tokenizes
+        just the user message.
+        """
+        system_ids, context_heading = self._prompt_segment_ids()
+        ids = list(system_ids)
+        context_ids = getattr(context, "token_ids", None)
+        if context and context_ids is not None:
+            # The cached ids end each history line with a newline
+            ids.extend(context_heading)
+            ids.extend(context_ids)
+            ids.extend(self.tokenize(f"\nUser: {user_input}\n\nAssistant:"))
+        elif context:
+            ids.extend(self.tokenize(f"\n\nContext: {context}\n\nUser: {user_input}\n\nAssistant:"))
+        else:
+            ids.extend(self.tokenize(f"\n\nUser: {user_input}\n\nAssistant:"))
+        return torch.tensor([ids], dtype=torch.long)
+    
+    def _sampling_kwargs(self):
+        """Sampling settings shared by model.generate and the scheduler"""
+        return {
+            "temperature": 0.7,
+            "do_sample": True,
+            "top_p": 0.9,
+            "top_k": 50
+        }
+    
+    def _generation_kwargs(self, inputs):
+        """model.generate settings shared by blocking and streaming generation"""
+        return dict(
+            self._sampling_kwargs(),
+            max_length=inputs.shape[1] + CHATBOT_MAX_NEW_TOKENS,
+            num_return_sequences=1,
+            pad_token_id=self.tokenizer.eos_token_id,
+            eos_token_id=self.tokenizer.eos_token_id
+        )
+    
+    def _generate(self, inputs, **kwargs):
+        """Run model.generate with the shared sampling settings, reusing the prefix cache when it applies"""
+        generation = dict(self._generation_kwargs(inputs), **kwargs)
+        past_key_values = self._cached_prefix_for(inputs)
+        if past_key_values is not None:
+            generation["past_key_values"] = past_key_values
+        with torch.no_grad():
+            return self.model.generate(inputs, **generation)
+    
+    def generate_response(self, user_input, context="", timeout=None):
+        """
+        Generate a response to user input
+        
+        Args:
+            user_input (str): Message from the user
+            context (str): Optional conversation context
+            timeout (float): Seconds to wait for the reply; on expiry generation is
+                cancelled and concurrent.futures.TimeoutError is raised
+        
+        Returns:
+            str: The cleaned reply
+        """
+        # Crisis messages get the curated reply at once instead of waiting on generation
+        if detect_crisis(user_input):
+            return crisis_response()["response"]
+        
         if not self.model or not self.tokenizer:
-            return "I'm sorry, I'm having trouble connecting right now. Please try again later."
+            return UNAVAILABLE_MESSAGE
         
         try:
-            # Create a mental health focused prompt
-            system_prompt = """You are a compassionate mental health support chatbot. You provide:
-            - Empathetic and supportive responses
-            - Gentle encouragement
-            - Mental health resources and coping strategies
-            - Crisis intervention guidance when needed
-            - Professional boundaries (not a replacement for therapy)
-            
-            Keep responses concise, warm, and helpful. If someone mentions self-harm or suicide, 
-            encourage them to contact emergency services or a mental health professional immediately."""
-            
-            # Format the conversation
-            if context:
-                prompt = f"{system_prompt}\n\nContext: {context}\n\nUser: {user_input}\n\nAssistant:"
-            else:
-                prompt = f"{system_prompt}\n\nUser: {user_input}\n\nAssistant:"
-            
             # Tokenize input
-            inputs = self.tokenizer.encode(prompt, return_tensors="pt")
-            
-            # Generate response
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    inputs,
-                    max_length=inputs.shape[1] + 150,
-                    num_return_sequences=1,
-                    temperature=0.7,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                    eos_token_id=self.tokenizer.eos_token_id,
-                    top_p=0.9,
-                    top_k=50
-                )
+            inputs = self._prompt_ids(user_input, context)
             
-            # Decode response
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+            # Generate response, batched with concurrent replies when the scheduler is running
+            if self.scheduler is not None:
+                cancel_event = threading.Event()
+                future = self._submit(inputs, cancel_event=cancel_event)
+                try:
+                    result = future.result(timeout=timeout)
+                except FutureTimeoutError:
+                    # Free the batch slot at the next token instead of finishing a reply nobody reads
+                    cancel_event.set()
+                    raise
+                # Only the new tokens come back, so the prompt is not decoded again
+                response = self.tokenizer.decode(result["tokens"], skip_special_tokens=True)
+            else:
+                started = time.monotonic()
+                outputs = self._generate(inputs, max_time=timeout) if timeout is not None else self._generate(inputs)
+                if timeout is not None and time.monotonic() - started >= timeout:
+                    raise FutureTimeoutError()
+                
+                # Decode response
+                response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
             
             # Extract just the assistant's response
             if "Assistant:" in response:
@@ -95,10 +528,75 @@ class MentalHealthChatbot:
             
             return response
             
+        except (QueueFullError, FutureTimeoutError):
+            raise
         except Exception as e:
             print(f"Error generating response: {e}")
             return "I'm here to listen and support you. Could you tell me more about how you're feeling?"
     
+    def stream_response(self, user_input, context="", cancel_event=None):
+        """
+        Generate a response, yielding cleaned text as tokens are produced
+        
+        Generation runs on a worker thread and stops at the next token once
+        cancel_event is set. The event is also set when the reply hits a stop
+        marker or the length limit, or when the caller closes this generator
+        (for example because the client disconnected).
+        
+        Args:
+            user_input (str): Message from the user
+            context (str): Optional conversation context
+            cancel_event (threading.Event): Optional event to cancel generation from outside
+        
+        Yields:
+            str: Pieces of the reply, in order
+        """
+        if detect_crisis(user_input):
+            yield crisis_response()["response"]
+            return
+        
+        if not self.model or not self.tokenizer:
+            yield UNAVAILABLE_MESSAGE
+            return
+        
+        cancel_event = cancel_event or threading.Event()
+        inputs = self._prompt_ids(user_input, context)
+        cleaner = StreamingResponseCleaner()
+        
+        if self.scheduler is not None:
+            # The scheduler delivers only new tokens, so nothing is skipped
+            streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=False, skip_special_tokens=True, timeout=CHATBOT_STREAM_TIMEOUT)
+            future = self._submit(inputs, cancel_event=cancel_event, on_token=lambda token: streamer.put(torch.tensor([token])))
+            future.add_done_callback(lambda done: streamer.end())
+        else:
+            streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=CHATBOT_STREAM_TIMEOUT)
+            
+            def run():
+                try:
+                    self._generate(
+                        inputs,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([CancelledCriteria(cancel_event)])
+                    )
+                except Exception as e:
+                    print(f"Error generating response: {e}")
+                    streamer.end()
+            
+            threading.Thread(target=run, name="chat-generation", daemon=True).start()
+        
+        try:
+            for text in streamer:
+                piece = cleaner.feed(text)
+                if piece:
+                    yield piece
+                if cleaner.finished:
+                    break
+            piece = cleaner.flush()
+            if piece:
+                yield piece
+        finally:
+            cancel_event.set()
+    
     def _clean_response(self, response):
         """Clean up the generated response"""
         # Remove any remaining prompt text
@@ -130,5 +628,5 @@ class MentalHealthChatbot:
         ]
         return tips
 
-# Global chatbot instance
-chatbot = MentalHealthChatbot()
+# Global chatbot instance; loads in the background on import or on first use
+chatbot = MentalHealthChatbot(load=CHATBOT_PRELOAD, background=True)
@@ -0,0 +1,333 @@
+"""
+Token-budgeted conversation memory for the chatbot
+Builds prompt context from chat_sessions/chat_messages, keeping recent turns verbatim and older turns as a compact summary
+"""
+
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+SPEAKER_LABELS = {"user": "User", "ai": "Assistant"}
+
+class SessionAccessError(Exception):
+    """Raised when a chat session does not exist or belongs to another user"""
+    pass
+
+class SupabaseChatStore:
+    """
+    Reads and writes chat history in the chat_sessions and chat_messages tables
+    
+    With a writer (a WriteBehindBuffer over insert_messages), messages are
+    queued for a bulk insert instead of being written on the request path.
+    Rows get their id and created_at here, so they can be cached, ordered
+    and replayed before they reach the database. A buffered row is stored
+    up to the writer's flush interval after its created_at, so readers
+    polling for new rows must look back at least that far.
+    """
+    
+    def __init__(self, client, writer=None):
+        self.client = client
+        self.writer = writer
+    
+    def create_session(self, user_id, session_name=None):
+        result = self.client.table("chat_sessions").insert({
+            "user_id": user_id,
+            "session_name": session_name
+        }).execute()
+        return result.data[0]
+    
+    def session_owner(self, session_id):
+        """Return the user_id of a chat session, or None if there is no such session"""
+        result = self.client.table("chat_sessions").select("user_id").eq("id", session_id).limit(1).execute()
+        return result.data[0]["user_id"] if result.data else None
+    
+    def load_messages(self, session_id, limit, since=None):
+        """Return up to limit of the newest messages, oldest first, optionally only those created at or after a datetime"""
+        query = self.client.table("chat_messages").select("id, sender, message, created_at").eq("session_id", session_id)
+        if since:
+            query = query.gte("created_at", since.isoformat())
+        result = query.order("created_at", desc=True).limit(limit).execute()
+        return list(reversed(result.data or []))
+    
+    def append_messages(self, session_id, user_id, messages):
+        """Store (sender, text) pairs in order, through the writer when it has room, and return the rows"""
+        # Rows inserted together must still sort in order, so each gets its own timestamp
+        now = datetime.now(timezone.utc)
+        rows = [
+            {
+                "id": str(uuid.uuid4()),
+                "session_id": session_id,
+                "user_id": user_id,
+                "sender": sender,
+                "message": text,
+                "created_at": (now + timedelta(microseconds=index)).isoformat()
+            }
+            for index, (sender, text) in enumerate(messages)
+        ]
+        if self.writer is None or not self.writer.append(rows):
+            self.insert_messages(rows)
+        return rows
+    
+    def insert_messages(self, rows):
+        """Bulk insert message rows, skipping ids that are already stored so replays are harmless"""
+        self.client.table("chat_messages").upsert(rows, on_conflict="id", ignore_duplicates=True).execute()
+
+def parse_created_at(value):
+    """Aware UTC datetime for a created_at value, which PostgREST returns as an ISO string"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+class TokenizedContext(str):
+    """
+    Context text that also carries its token ids
+    
+    Behaves as the plain string everywhere, so it can be passed to any
+    chatbot; a chatbot that knows token_ids builds its prompt from them
+    instead of tokenizing the text again.
+    """
+    
+    def __new__(cls, text, token_ids):
+        context = super().__new__(cls, text)
+        context.token_ids = token_ids
+        return context
+
+class SessionHistory:
+    """Cached state of one chat session: its owner, recent lines with their token ids and the summary of older ones"""
+    
+    def __init__(self, owner=None):
+        self.owner = owner
+        self.lines = []
+        self.message_ids = set()
+        self.last_created_at = None
+        self.summary_items = []
+        self.summary = ""
+        self.summary_ids = []
+        self.lock = threading.Lock()
+
+class ConversationMemory:
+    """
+    Server-side chat context that fits a token budget
+    
+    Each message is formatted as a "User: ..." or "Assistant: ..." line and
+    tokenized once, when it first enters the per-process session cache, and
+    its token ids are kept with it so the context's ids are a concatenation
+    of cached ids rather than a fresh tokenization of the history. The
+    context for a turn is the newest lines that fit token_budget minus the
+    space reserved for the summary. Lines that fall out of that window are
+    compacted into a summary of their first sentences, capped at
+    summary_tokens and updated incrementally, and then dropped from the
+    cache. Messages written by other workers are picked up with a query for
+    rows created since lookback_seconds before the newest one seen, so rows
+    that reach the database late through a write-behind buffer are not
+    skipped; rows already cached are recognized by id.
+    
+    Every read and write names the user it is for. The session's owner is
+    loaded from chat_sessions when the session enters the cache, and a
+    session that is missing or owned by someone else raises
+    SessionAccessError before any of its messages are read or written.
+    """
+    
+    def __init__(self, store, tokenize, detokenize, token_budget=512, summary_tokens=128,
+                 history_limit=50, max_sessions=1000, lookback_seconds=0.0):
+        self.store = store
+        self.tokenize = tokenize
+        self.detokenize = detokenize
+        self.token_budget = token_budget
+        self.summary_budget = min(summary_tokens, token_budget // 2)
+        self.history_limit = history_limit
+        self.max_sessions = max_sessions
+        self.lookback = timedelta(seconds=max(0.0, lookback_seconds))
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "sessions_loaded": 0,
+            "messages_tokenized": 0,
+            "messages_compacted": 0,
+            "contexts_built": 0
+        }
+    
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._stats[counter] += amount
+    
+    def start_session(self, user_id, session_name=None):
+        """Create a chat session and return its id"""
+        session = self.store.create_session(user_id, session_name)
+        with self._lock:
+            self._remember(session["id"], SessionHistory(owner=user_id))
+        return session["id"]
+    
+    def _remember(self, session_id, history):
+        """Add a session to the LRU cache; the caller holds self._lock"""
+        self._sessions[session_id] = history
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+    
+    def _session(self, session_id):
+        """Return the cached history for a session, loading it on first use"""
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is not None:
+                self._sessions.move_to_end(session_id)
+                return history, False
+            history = SessionHistory()
+            self._remember(session_id, history)
+        self._count("sessions_loaded")
+        return history, True
+    
+    def _owned_session(self, session_id, user_id):
+        """Return the cached history for a session after checking that user_id owns it"""
+        history, fresh = self._session(session_id)
+        with history.lock:
+            if history.owner is None:
+                history.owner = self.store.session_owner(session_id)
+            owner = history.owner
+        if owner is None:
+            # Unknown ids are not kept, so probing for sessions cannot fill the cache
+            with self._lock:
+                if self._sessions.get(session_id) is history:
+                    del self._sessions[session_id]
+            raise SessionAccessError("Chat session not found")
+        if user_id is None or str(owner) != str(user_id):
+            raise SessionAccessError("Chat session belongs to another user")
+        return history, fresh
+    
+    def authorize(self, session_id, user_id):
+        """
+        Check that a chat session exists and belongs to user_id
+        
+        Raises:
+            SessionAccessError: If the session is missing or owned by another user
+        """
+        self._owned_session(session_id, user_id)
+    
+    def _add_rows(self, history, rows):
+        """Tokenize and append stored message rows not seen before"""
+        for row in rows:
+            if row.get("id") in history.message_ids:
+                continue
+            label = SPEAKER_LABELS.get(row.get("sender"))
+            if label is not None:
+                line = f"{label}: {' '.join(str(row.get('message', '')).split())}"
+                history.lines.append((line, list(self.tokenize(line + "\n"))))
+                self._count("messages_tokenized")
+            if row.get("id") is not None:
+                history.message_ids.add(row["id"])
+            if row.get("created_at"):
+                created_at = parse_created_at(row["created_at"])
+                if history.last_created_at is None or created_at > history.last_created_at:
+                    history.last_created_at = created_at
+    
+    def build_context(self, session_id, user_id):
+        """
+        Context for the next turn of a session
+        
+        Args:
+            session_id (str): Chat session id
+            user_id (str): Authenticated user asking; must own the session
+        
+        Returns:
+            tuple: (context, info) where context is a TokenizedContext whose token_ids
+            are those of the text with a newline after each line, and info reports the
+            turns kept, tokens used and whether a summary is included
+        
+        Raises:
+            SessionAccessError: If the session is missing or owned by another user
+        """
+        history, fresh = self._owned_session(session_id, user_id)
+        with history.lock:
+            since = None
+            if not fresh and history.last_created_at is not None:
+                since = history.last_created_at - self.lookback
+            rows = self.store.load_messages(session_id, self.history_limit, since=since)
+            self._add_rows(history, rows)
+            self._count("contexts_built")
+            
+            # Reserve room for a summary only when older lines exist or are about to be compacted
+            total = sum(len(ids) for _, ids in history.lines)
+            budget = self.token_budget
+            if history.summary or total > budget:
+                budget -= self.summary_budget
+            
+            kept, used = 0, 0
+            for _, ids in reversed(history.lines):
+                if used + len(ids) > budget:
+                    break
+                used += len(ids)
+                kept += 1
+            
+            compacted = history.lines[:len(history.lines) - kept]
+            if compacted:
+                self._compact(history, [line for line, _ in compacted])
+                history.lines = history.lines[len(compacted):]
+            
+            parts = [history.summary] if history.summary else []
+            parts.extend(line for line, _ in history.lines)
+            token_ids = list(history.summary_ids)
+            for _, ids in history.lines:
+                token_ids.extend(ids)
+            return TokenizedContext("\n".join(parts), token_ids), {
+                "turns": len(history.lines),
+                "tokens": used + len(history.summary_ids),
+                "summarized": bool(history.summary)
+            }
+    
+    def _compact(self, history, lines):
+        """Fold lines that left the window into the session summary"""
+        for line in lines:
+            label, _, text = line.partition(": ")
+            sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+            if len(sentence) > 100:
+                sentence = sentence[:100].rsplit(" ", 1)[0] + "..."
+            history.summary_items.append(f"{label.lower()}: {sentence}")
+        self._count("messages_compacted", len(lines))
+        
+        # Keep the most recent items that fit the summary budget
+        while history.summary_items:
+            summary = "Earlier in this conversation: " + "; ".join(history.summary_items)
+            ids = list(self.tokenize(summary + "\n"))
+            if len(ids) <= self.summary_budget:
+                history.summary, history.summary_ids = summary, ids
+                return
+            history.summary_items.pop(0)
+        history.summary, history.summary_ids = "", []
+    
+    def record_turn(self, session_id, user_id, user_message, reply, cache=True):
+        """
+        Store the user message and the reply, and add them to the cached history
+        
+        With cache=False, for when the tokenizer is not loaded, the rows are
+        only stored; the next build_context reads them back from the store.
+        Raises SessionAccessError, storing nothing, unless user_id owns the session.
+        """
+        history, _ = self._owned_session(session_id, user_id)
+        rows = self.store.append_messages(session_id, user_id, [("user", user_message), ("ai", reply)])
+        if not cache:
+            return
+        with history.lock:
+            self._add_rows(history, rows)
+    
+    def clip(self, text):
+        """Keep only the last token_budget tokens of free-form client context"""
+        if not text:
+            return text
+        tokens = self.tokenize(text)
+        if len(tokens) <= self.token_budget:
+            return text
+        return self.detokenize(tokens[-self.token_budget:])
+    
+    def stats(self):
+        """Return settings and counters for monitoring"""
+        with self._lock:
+            stats = dict(self._stats)
+            sessions = len(self._sessions)
+        return dict(
+            stats,
+            token_budget=self.token_budget,
+            summary_tokens=self.summary_budget,
+            cached_sessions=sessions
+        )
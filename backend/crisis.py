@@ -0,0 +1,141 @@
+"""
+Crisis and risk detection shared by the rule-based and LLM chatbots
+Runs before any generation so crisis messages are answered immediately, and records them off the request path
+"""
+
+import random
+import threading
+from collections import deque
+from lexicon import KeywordMatcher
+
+# Risk phrases by category, matched on whole words in this priority order
+CRISIS_KEYWORDS = {
+    'suicidal': ['suicide', 'suicidal', 'kill myself', 'end it all', 'end my life', 'not worth living', 'want to die', 'better off dead'],
+    'self_harm': ['hurt myself', 'harm myself', 'cut myself', 'self harm', 'cutting myself']
+}
+
+CRISIS_RESPONSES = [
+    "I'm concerned about your safety. If you're having thoughts of self-harm, please reach out to a mental health professional or emergency services immediately.",
+    "Your safety is the most important thing. Please contact a crisis helpline or emergency services if you're in immediate danger.",
+    "If you're in crisis, please call your local emergency number or a mental health crisis line. You deserve support and care."
+]
+
+EMERGENCY_RESOURCES = {
+    "crisis_helpline": "988 (Suicide & Crisis Lifeline)",
+    "text_line": "Text HOME to 741741 (Crisis Text Line)",
+    "emergency": "911 (Emergency Services)",
+    "message": "If you're in immediate danger, please call emergency services or go to your nearest emergency room."
+}
+
+CRISIS_MATCHER = KeywordMatcher(CRISIS_KEYWORDS)
+
+def detect_crisis(text):
+    """
+    Check a message for crisis or self-harm language
+    
+    Args:
+        text (str): Message to check
+    
+    Returns:
+        dict: category and matched keywords, or None when no risk phrase is present
+    """
+    found = CRISIS_MATCHER.match(text)
+    for category in CRISIS_MATCHER.categories:
+        if found[category]:
+            keywords = sorted(keyword for matched in found.values() for keyword in matched)
+            return {"category": category, "keywords": keywords}
+    return None
+
+def crisis_response():
+    """Curated reply and emergency resources for a crisis message"""
+    return {
+        "response": random.choice(CRISIS_RESPONSES),
+        "resources": dict(EMERGENCY_RESOURCES)
+    }
+
+class CrisisRecorder:
+    """
+    Records crisis events on a background thread
+    
+    record() only appends to a bounded in-memory queue, so the crisis reply
+    is never held up by a database write. save_fn is called with each event
+    dict on the worker thread; failures are logged and counted, and events
+    beyond max_pending are dropped rather than blocking the request.
+    """
+    
+    def __init__(self, save_fn, max_pending=1000, name="crisis-recorder"):
+        self.save_fn = save_fn
+        self.max_pending = max(1, max_pending)
+        self.name = name
+        
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._worker = None
+        self._running = True
+        self._busy = False
+        
+        self._stats = {
+            "detected": 0,
+            "saved": 0,
+            "failed": 0,
+            "dropped": 0
+        }
+    
+    def record(self, event):
+        """Queue an event for saving; returns False if it had to be dropped"""
+        with self._condition:
+            self._stats["detected"] += 1
+            if not self._running or len(self._queue) >= self.max_pending:
+                self._stats["dropped"] += 1
+                print(f"Dropped crisis event for user {event.get('user_id')}: {self.name} is unavailable or full")
+                return False
+            
+            # Start the worker lazily so it is created after any pre-fork in gunicorn
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+            
+            self._queue.append(event)
+            self._condition.notify_all()
+        return True
+    
+    def _run(self):
+        """Worker loop: save queued events one at a time"""
+        while True:
+            with self._condition:
+                while self._running and not self._queue:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                event = self._queue.popleft()
+                self._busy = True
+            
+            try:
+                self.save_fn(event)
+                outcome = "saved"
+            except Exception as e:
+                print(f"Error recording crisis event: {e}")
+                outcome = "failed"
+            
+            with self._condition:
+                self._stats[outcome] += 1
+                self._busy = False
+                self._condition.notify_all()
+    
+    def flush(self, timeout=None):
+        """Wait until every queued event has been handled; returns False on timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queue and not self._busy, timeout)
+    
+    def stats(self):
+        """Return counters and queue depth for monitoring"""
+        with self._condition:
+            return dict(self._stats, pending=len(self._queue))
+    
+    def shutdown(self, timeout=5.0):
+        """Save what is queued, then stop the worker"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout)
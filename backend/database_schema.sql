@@ -63,6 +63,36 @@ CREATE TABLE IF NOT EXISTS mood_logs (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Per-user mood analytics, maintained by the mood_logs triggers below
+CREATE TABLE IF NOT EXISTS mood_aggregates (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    total_entries INTEGER NOT NULL DEFAULT 0,
+    score_sum DECIMAL(12,2) NOT NULL DEFAULT 0,
+    positive_count INTEGER NOT NULL DEFAULT 0,
+    negative_count INTEGER NOT NULL DEFAULT 0,
+    neutral_count INTEGER NOT NULL DEFAULT 0,
+    last_entry_at TIMESTAMP WITH TIME ZONE,
+    last_entry_date DATE, -- UTC day of the latest entry
+    current_streak INTEGER NOT NULL DEFAULT 0, -- Consecutive UTC days with an entry, ending on last_entry_date
+    recent_scores DECIMAL(3,2)[] NOT NULL DEFAULT '{}', -- Last 7 scores, oldest first
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Per-user, per-local-day mood summaries, maintained by the mood_logs triggers below
+CREATE TABLE IF NOT EXISTS mood_daily_rollups (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    local_date DATE NOT NULL, -- Calendar day in the user's time zone
+    entries INTEGER NOT NULL DEFAULT 0,
+    score_sum DECIMAL(12,2) NOT NULL DEFAULT 0,
+    score_min DECIMAL(3,2),
+    score_max DECIMAL(3,2),
+    positive_count INTEGER NOT NULL DEFAULT 0,
+    negative_count INTEGER NOT NULL DEFAULT 0,
+    neutral_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (user_id, local_date)
+);
+
 -- Achievements table
 CREATE TABLE IF NOT EXISTS achievements (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -208,11 +238,15 @@ CREATE TABLE IF NOT EXISTS analytics_events (
 
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_mood_logs_user_id ON mood_logs(user_id);
+CREATE INDEX IF NOT EXISTS idx_mood_logs_user_id_created_at ON mood_logs(user_id, created_at);
 CREATE INDEX IF NOT EXISTS idx_mood_logs_created_at ON mood_logs(created_at);
 CREATE INDEX IF NOT EXISTS idx_mood_logs_sentiment ON mood_logs(sentiment);
 CREATE INDEX IF NOT EXISTS idx_notifications_user_id ON notifications(user_id);
 CREATE INDEX IF NOT EXISTS idx_notifications_read ON notifications(read);
 CREATE INDEX IF NOT EXISTS idx_notifications_created_at ON notifications(created_at);
+-- Keyset pagination orders by (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_notifications_user_id_created_at_id ON notifications(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_users_created_at_id ON users(created_at, id);
 CREATE INDEX IF NOT EXISTS idx_user_achievements_user_id ON user_achievements(user_id);
 CREATE INDEX IF NOT EXISTS idx_goals_user_id ON goals(user_id);
 CREATE INDEX IF NOT EXISTS idx_ai_insights_user_id ON ai_insights(user_id);
@@ -238,6 +272,246 @@ CREATE TRIGGER update_user_settings_updated_at BEFORE UPDATE ON user_settings
 CREATE TRIGGER update_mood_logs_updated_at BEFORE UPDATE ON mood_logs
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+-- Recompute one user's mood aggregate from all of their mood logs
+CREATE OR REPLACE FUNCTION rebuild_mood_aggregate(target_user UUID)
+RETURNS VOID AS $$
+DECLARE
+    latest_day DATE;
+BEGIN
+    SELECT (MAX(created_at) AT TIME ZONE 'UTC')::date INTO latest_day FROM mood_logs WHERE user_id = target_user;
+    IF latest_day IS NULL THEN
+        DELETE FROM mood_aggregates WHERE user_id = target_user;
+        RETURN;
+    END IF;
+    
+    INSERT INTO mood_aggregates (
+        user_id, total_entries, score_sum, positive_count, negative_count, neutral_count,
+        last_entry_at, last_entry_date, current_streak, recent_scores, updated_at
+    )
+    SELECT
+        target_user,
+        COUNT(*),
+        SUM(score),
+        COUNT(*) FILTER (WHERE sentiment = 'positive'),
+        COUNT(*) FILTER (WHERE sentiment = 'negative'),
+        COUNT(*) FILTER (WHERE sentiment = 'neutral'),
+        MAX(created_at),
+        latest_day,
+        -- Days that sit exactly n days before latest_day for the n-th newest day form the streak
+        (SELECT COUNT(*) FROM (
+            SELECT day, ROW_NUMBER() OVER (ORDER BY day DESC) - 1 AS position
+            FROM (SELECT DISTINCT (created_at AT TIME ZONE 'UTC')::date AS day FROM mood_logs WHERE user_id = target_user) days
+        ) ranked WHERE ranked.day = latest_day - ranked.position::int),
+        ARRAY(
+            SELECT score FROM (
+                SELECT score, created_at, id FROM mood_logs WHERE user_id = target_user
+                ORDER BY created_at DESC, id DESC LIMIT 7
+            ) recent ORDER BY created_at, id
+        ),
+        NOW()
+    FROM mood_logs WHERE user_id = target_user
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_entries = EXCLUDED.total_entries,
+        score_sum = EXCLUDED.score_sum,
+        positive_count = EXCLUDED.positive_count,
+        negative_count = EXCLUDED.negative_count,
+        neutral_count = EXCLUDED.neutral_count,
+        last_entry_at = EXCLUDED.last_entry_at,
+        last_entry_date = EXCLUDED.last_entry_date,
+        current_streak = EXCLUDED.current_streak,
+        recent_scores = EXCLUDED.recent_scores,
+        updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Fold the logs an INSERT statement added into their users' aggregates, in the inserting transaction.
+-- Runs once per statement, so a bulk import of any size costs at most one rebuild per user and chunk
+CREATE OR REPLACE FUNCTION apply_mood_logs_to_aggregates()
+RETURNS TRIGGER AS $$
+DECLARE
+    batch RECORD;
+    current mood_aggregates%ROWTYPE;
+    entry_day DATE;
+BEGIN
+    -- Users in a fixed order, so concurrent statements take the aggregate row locks in the same order
+    FOR batch IN
+        SELECT user_id, COUNT(*) AS entries, MIN(created_at) AS created_at, MIN(score) AS score, MIN(sentiment) AS sentiment
+        FROM new_logs GROUP BY user_id ORDER BY user_id
+    LOOP
+        INSERT INTO mood_aggregates (user_id) VALUES (batch.user_id) ON CONFLICT (user_id) DO NOTHING;
+        -- The row lock serializes concurrent inserts for the same user
+        SELECT * INTO current FROM mood_aggregates WHERE user_id = batch.user_id FOR UPDATE;
+        
+        -- Several logs at once, or a backdated one, can change the streak and recent scores in ways
+        -- one step cannot follow, so the user is recomputed, once for the whole statement
+        IF batch.entries > 1 OR (current.last_entry_at IS NOT NULL AND batch.created_at < current.last_entry_at) THEN
+            PERFORM rebuild_mood_aggregate(batch.user_id);
+            CONTINUE;
+        END IF;
+        
+        -- A single log: its values are the group's MIN()s
+        entry_day := (batch.created_at AT TIME ZONE 'UTC')::date;
+        UPDATE mood_aggregates SET
+            total_entries = current.total_entries + 1,
+            score_sum = current.score_sum + batch.score,
+            positive_count = current.positive_count + (batch.sentiment = 'positive')::int,
+            negative_count = current.negative_count + (batch.sentiment = 'negative')::int,
+            neutral_count = current.neutral_count + (batch.sentiment = 'neutral')::int,
+            last_entry_at = batch.created_at,
+            last_entry_date = entry_day,
+            current_streak = CASE
+                WHEN current.last_entry_date = entry_day THEN current.current_streak
+                WHEN current.last_entry_date = entry_day - 1 THEN current.current_streak + 1
+                ELSE 1
+            END,
+            recent_scores = (current.recent_scores || batch.score)[GREATEST(1, COALESCE(array_length(current.recent_scores, 1), 0) - 5):],
+            updated_at = NOW()
+        WHERE user_id = batch.user_id;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Edited or deleted logs are rare, so their users' aggregates are recomputed
+CREATE OR REPLACE FUNCTION refresh_mood_aggregate()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM rebuild_mood_aggregate(OLD.user_id);
+    IF TG_OP = 'UPDATE' AND NEW.user_id IS DISTINCT FROM OLD.user_id THEN
+        PERFORM rebuild_mood_aggregate(NEW.user_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Databases created with the earlier per-row trigger
+DROP TRIGGER IF EXISTS mood_logs_apply_aggregate ON mood_logs;
+DROP FUNCTION IF EXISTS apply_mood_log_to_aggregate();
+
+CREATE TRIGGER mood_logs_apply_aggregate AFTER INSERT ON mood_logs
+    REFERENCING NEW TABLE AS new_logs
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_mood_logs_to_aggregates();
+
+CREATE TRIGGER mood_logs_refresh_aggregate AFTER UPDATE OF user_id, sentiment, score, created_at OR DELETE ON mood_logs
+    FOR EACH ROW EXECUTE FUNCTION refresh_mood_aggregate();
+
+-- A user's time zone for local dates, UTC when unset or not a zone Postgres knows
+CREATE OR REPLACE FUNCTION mood_timezone(target_user UUID)
+RETURNS TEXT AS $$
+DECLARE
+    zone TEXT;
+BEGIN
+    SELECT NULLIF(timezone, '') INTO zone FROM users WHERE id = target_user;
+    PERFORM NOW() AT TIME ZONE COALESCE(zone, 'UTC');
+    RETURN COALESCE(zone, 'UTC');
+EXCEPTION WHEN invalid_parameter_value THEN
+    RETURN 'UTC';
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER;
+
+-- Recompute one user's rollup for one local day from their mood logs
+CREATE OR REPLACE FUNCTION rebuild_mood_daily_rollup(target_user UUID, target_date DATE)
+RETURNS VOID AS $$
+DECLARE
+    zone TEXT := mood_timezone(target_user);
+BEGIN
+    DELETE FROM mood_daily_rollups WHERE user_id = target_user AND local_date = target_date;
+    INSERT INTO mood_daily_rollups (
+        user_id, local_date, entries, score_sum, score_min, score_max,
+        positive_count, negative_count, neutral_count, updated_at
+    )
+    SELECT
+        target_user, target_date, COUNT(*), SUM(score), MIN(score), MAX(score),
+        COUNT(*) FILTER (WHERE sentiment = 'positive'),
+        COUNT(*) FILTER (WHERE sentiment = 'negative'),
+        COUNT(*) FILTER (WHERE sentiment = 'neutral'),
+        NOW()
+    FROM mood_logs
+    WHERE user_id = target_user
+      AND created_at >= (target_date::TIMESTAMP AT TIME ZONE zone)
+      AND created_at < ((target_date + 1)::TIMESTAMP AT TIME ZONE zone)
+    HAVING COUNT(*) > 0;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Recompute every rollup of one user, e.g. after their time zone changes
+CREATE OR REPLACE FUNCTION rebuild_mood_daily_rollups(target_user UUID)
+RETURNS VOID AS $$
+DECLARE
+    zone TEXT := mood_timezone(target_user);
+BEGIN
+    DELETE FROM mood_daily_rollups WHERE user_id = target_user;
+    INSERT INTO mood_daily_rollups (
+        user_id, local_date, entries, score_sum, score_min, score_max,
+        positive_count, negative_count, neutral_count, updated_at
+    )
+    SELECT
+        target_user, (created_at AT TIME ZONE zone)::DATE, COUNT(*), SUM(score), MIN(score), MAX(score),
+        COUNT(*) FILTER (WHERE sentiment = 'positive'),
+        COUNT(*) FILTER (WHERE sentiment = 'negative'),
+        COUNT(*) FILTER (WHERE sentiment = 'neutral'),
+        NOW()
+    FROM mood_logs
+    WHERE user_id = target_user
+    GROUP BY 2;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Fold a new mood log into its day's rollup; the upsert serializes concurrent inserts for the same day
+CREATE OR REPLACE FUNCTION apply_mood_log_to_rollup()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO mood_daily_rollups (
+        user_id, local_date, entries, score_sum, score_min, score_max,
+        positive_count, negative_count, neutral_count, updated_at
+    )
+    VALUES (
+        NEW.user_id, (NEW.created_at AT TIME ZONE mood_timezone(NEW.user_id))::DATE, 1, NEW.score, NEW.score, NEW.score,
+        (NEW.sentiment = 'positive')::INTEGER, (NEW.sentiment = 'negative')::INTEGER, (NEW.sentiment = 'neutral')::INTEGER,
+        NOW()
+    )
+    ON CONFLICT (user_id, local_date) DO UPDATE SET
+        entries = mood_daily_rollups.entries + 1,
+        score_sum = mood_daily_rollups.score_sum + EXCLUDED.score_sum,
+        score_min = LEAST(mood_daily_rollups.score_min, EXCLUDED.score_min),
+        score_max = GREATEST(mood_daily_rollups.score_max, EXCLUDED.score_max),
+        positive_count = mood_daily_rollups.positive_count + EXCLUDED.positive_count,
+        negative_count = mood_daily_rollups.negative_count + EXCLUDED.negative_count,
+        neutral_count = mood_daily_rollups.neutral_count + EXCLUDED.neutral_count,
+        updated_at = NOW();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Min and max cannot be taken back, so the days of edited or deleted logs are recomputed
+CREATE OR REPLACE FUNCTION refresh_mood_log_rollup()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM rebuild_mood_daily_rollup(OLD.user_id, (OLD.created_at AT TIME ZONE mood_timezone(OLD.user_id))::DATE);
+    IF TG_OP = 'UPDATE' THEN
+        PERFORM rebuild_mood_daily_rollup(NEW.user_id, (NEW.created_at AT TIME ZONE mood_timezone(NEW.user_id))::DATE);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION refresh_user_rollups()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM rebuild_mood_daily_rollups(NEW.id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE TRIGGER mood_logs_apply_rollup AFTER INSERT ON mood_logs
+    FOR EACH ROW EXECUTE FUNCTION apply_mood_log_to_rollup();
+
+CREATE TRIGGER mood_logs_refresh_rollup AFTER UPDATE OF user_id, sentiment, score, created_at OR DELETE ON mood_logs
+    FOR EACH ROW EXECUTE FUNCTION refresh_mood_log_rollup();
+
+CREATE TRIGGER users_refresh_rollups AFTER UPDATE OF timezone ON users
+    FOR EACH ROW WHEN (OLD.timezone IS DISTINCT FROM NEW.timezone) EXECUTE FUNCTION refresh_user_rollups();
+
 CREATE TRIGGER update_goals_updated_at BEFORE UPDATE ON goals
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
@@ -293,6 +567,62 @@ SELECT
 FROM user_achievements ua
 JOIN achievements a ON ua.achievement_id = a.id;
 
+-- Platform-wide mood statistics for the admin dashboard, aggregated in the database
+-- start_at is inclusive and end_at exclusive, and either may be NULL; the per-day breakdown
+-- covers UTC days and is only built when include_daily is set
+CREATE OR REPLACE FUNCTION admin_mood_analytics(
+    start_at TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    end_at TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    include_daily BOOLEAN DEFAULT false
+)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'total_users', (SELECT COUNT(*) FROM users),
+        'total_mood_logs', totals.entries,
+        'average_mood_score', COALESCE(totals.average_score, 0),
+        'active_users', totals.active_users,
+        'positive_logs', totals.positive,
+        'negative_logs', totals.negative,
+        'neutral_logs', totals.neutral,
+        'daily', CASE WHEN include_daily THEN (
+            SELECT COALESCE(jsonb_agg(to_jsonb(days) ORDER BY days.day), '[]'::jsonb)
+            FROM (
+                SELECT
+                    (created_at AT TIME ZONE 'UTC')::DATE AS day,
+                    COUNT(*) AS entries,
+                    ROUND(AVG(score)::NUMERIC, 2) AS average_score,
+                    COUNT(DISTINCT user_id) AS active_users,
+                    COUNT(*) FILTER (WHERE sentiment = 'positive') AS positive,
+                    COUNT(*) FILTER (WHERE sentiment = 'negative') AS negative,
+                    COUNT(*) FILTER (WHERE sentiment = 'neutral') AS neutral
+                FROM mood_logs
+                WHERE (start_at IS NULL OR created_at >= start_at)
+                  AND (end_at IS NULL OR created_at < end_at)
+                GROUP BY 1
+            ) days
+        ) END
+    )
+    FROM (
+        SELECT
+            COUNT(*) AS entries,
+            ROUND(AVG(score)::NUMERIC, 2) AS average_score,
+            COUNT(DISTINCT user_id) AS active_users,
+            COUNT(*) FILTER (WHERE sentiment = 'positive') AS positive,
+            COUNT(*) FILTER (WHERE sentiment = 'negative') AS negative,
+            COUNT(*) FILTER (WHERE sentiment = 'neutral') AS neutral
+        FROM mood_logs
+        WHERE (start_at IS NULL OR created_at >= start_at)
+          AND (end_at IS NULL OR created_at < end_at)
+    ) totals;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+-- SECURITY DEFINER functions act for any user id; only the app's database role should call them
+REVOKE EXECUTE ON FUNCTION rebuild_mood_aggregate(UUID) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION mood_timezone(UUID) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION rebuild_mood_daily_rollup(UUID, DATE) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION rebuild_mood_daily_rollups(UUID) FROM PUBLIC;
+
 -- Grant permissions (adjust as needed for your setup)
 -- GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA public TO your_app_user;
 -- GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO your_app_user;
+-- GRANT EXECUTE ON ALL FUNCTIONS IN SCHEMA public TO your_app_user;
@@ -0,0 +1,303 @@
+"""
+Weighted fair admission for chat generation
+Limits each user's concurrent replies and tokens per window, and orders waiting requests by weighted fair queuing
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+USER_CLASSES = ("patient", "therapist", "admin")
+
+class QuotaExceededError(Exception):
+    """Raised when a chat request is shed because the wait queues are full"""
+    
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def parse_weights(value, default=1.0):
+    """Parse "patient:1,therapist:2" into {class: weight}, giving unlisted classes the default"""
+    weights = {user_class: default for user_class in USER_CLASSES}
+    for item in (value or "").split(","):
+        if ":" in item:
+            user_class, weight = item.split(":", 1)
+            weights[user_class.strip()] = max(float(weight), 0.01)
+    return weights
+
+class _UserState:
+    """In-flight count, token window and fair queuing tag for one user"""
+    
+    def __init__(self, user_class):
+        self.user_class = user_class
+        self.in_flight = 0
+        self.waiting = 0
+        self.usage = deque()
+        self.last_finish = 0.0
+
+class _Waiter:
+    """A request waiting for a generation slot"""
+    
+    def __init__(self, user_id, user_class, cost, finish):
+        self.user_id = user_id
+        self.user_class = user_class
+        self.cost = cost
+        self.finish = finish
+        self.queued_at = time.monotonic()
+
+class ChatSlot:
+    """An admitted request; release it when generation ends, with the tokens it actually used"""
+    
+    def __init__(self, queue, user_id, user_class, usage, wait_ms):
+        self.queue = queue
+        self.user_id = user_id
+        self.user_class = user_class
+        self.wait_ms = wait_ms
+        self._usage = usage
+        self._started = time.monotonic()
+        self._released = False
+    
+    def release(self, tokens=None):
+        """Free the slot, replacing the reserved token cost with tokens when given"""
+        if not self._released:
+            self._released = True
+            self.queue._release(self, tokens)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+class FairChatQueue:
+    """
+    Admits chat requests to the generation model fairly across users
+    
+    At most max_in_flight requests generate at once, and each user at most
+    per_user_in_flight of them. A user may spend tokens_per_window tokens
+    (scaled by their class weight) per window_seconds; admission reserves
+    the request's estimated cost, which is corrected when the slot is
+    released. Requests that cannot start wait in a queue ordered by
+    self-clocked weighted fair queuing: each gets a finish tag of
+    max(virtual time, the user's previous tag) + cost / weight, and the
+    eligible waiter with the smallest tag goes next, so a user who sends
+    many requests falls behind users who send few. A request is shed with
+    QuotaExceededError once its user already has max_user_queue requests
+    waiting or max_queue requests are waiting in total, and a waiter whose
+    timeout passes gets FutureTimeoutError.
+    """
+    
+    def __init__(self, max_in_flight=8, per_user_in_flight=2, tokens_per_window=4000, window_seconds=60.0,
+                 max_user_queue=4, max_queue=64, weights=None, window=1000):
+        self.max_in_flight = max(1, max_in_flight)
+        self.per_user_in_flight = max(1, per_user_in_flight)
+        self.tokens_per_window = max(1, tokens_per_window)
+        self.window_seconds = max(0.001, window_seconds)
+        self.max_user_queue = max(0, max_user_queue)
+        self.max_queue = max(0, max_queue)
+        self.weights = dict(parse_weights(""), **(weights or {}))
+        
+        self._condition = threading.Condition()
+        self._users = {}
+        self._waiting = []
+        self._in_flight = 0
+        self._virtual_time = 0.0
+        self._service_seconds = None
+        self._last_sweep = time.monotonic()
+        self._classes = {
+            user_class: {"admitted": 0, "queued": 0, "shed": 0, "timed_out": 0, "waits": deque(maxlen=window)}
+            for user_class in self.weights
+        }
+    
+    def acquire(self, user_id, user_class="patient", cost=1, timeout=None):
+        """
+        Wait for a generation slot
+        
+        Args:
+            user_id (str): Who the request is charged to
+            user_class (str): patient, therapist or admin; sets the weight
+            cost (int): Estimated tokens the request will use
+            timeout (float): Seconds to wait in the queue before giving up
+        
+        Returns:
+            ChatSlot: The admitted slot, to be released when generation ends
+        
+        Raises:
+            QuotaExceededError: The user's or the shared wait queue is full
+            FutureTimeoutError: No slot became available within timeout
+        """
+        user_class = user_class if user_class in self.weights else "patient"
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._condition:
+            self._sweep()
+            user = self._users.setdefault(user_id, _UserState(user_class))
+            user.user_class = user_class
+            self._expire(user, time.monotonic())
+            waiter = _Waiter(user_id, user_class, cost, self._finish_tag(user, user_class, cost))
+            
+            if not self._waiting and self._eligible(waiter):
+                return self._admit(waiter)
+            
+            if user.waiting >= self.max_user_queue or len(self._waiting) >= self.max_queue:
+                self._classes[user_class]["shed"] += 1
+                retry_after = self._retry_after(user, cost)
+                self._forget(user_id)
+                scope = "your" if user.waiting >= self.max_user_queue else "the"
+                raise QuotaExceededError(f"Too many chat requests waiting in {scope} queue", retry_after)
+            
+            user.last_finish = waiter.finish
+            user.waiting += 1
+            self._waiting.append(waiter)
+            self._classes[user_class]["queued"] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._next_waiter(now) is waiter:
+                        self._waiting.remove(waiter)
+                        user.waiting -= 1
+                        return self._admit(waiter)
+                    if deadline is not None and now >= deadline:
+                        self._classes[user_class]["timed_out"] += 1
+                        raise FutureTimeoutError()
+                    # Wake for releases, and on our own when the token window frees up
+                    wait = self._budget_wait(user, cost, now) or None
+                    if deadline is not None:
+                        wait = min(wait or deadline - now, deadline - now)
+                    self._condition.wait(wait)
+            finally:
+                if waiter in self._waiting:
+                    self._waiting.remove(waiter)
+                    user.waiting -= 1
+                    self._forget(user_id)
+                    self._condition.notify_all()
+    
+    def _finish_tag(self, user, user_class, cost):
+        """Self-clocked fair queuing finish tag for a new request"""
+        return max(self._virtual_time, user.last_finish) + cost / self.weights[user_class]
+    
+    def _limit(self, user_class):
+        """Tokens a user of this class may use per window"""
+        return self.tokens_per_window * self.weights[user_class]
+    
+    def _expire(self, user, now):
+        """Drop token usage older than the window"""
+        while user.usage and user.usage[0][0] <= now - self.window_seconds:
+            user.usage.popleft()
+    
+    def _budget_wait(self, user, cost, now):
+        """Seconds until enough of the user's window expires for cost more tokens, 0 if it fits now"""
+        used = sum(entry[1] for entry in user.usage)
+        limit = self._limit(user.user_class)
+        if used == 0 or used + cost <= limit:
+            return 0.0
+        for timestamp, tokens in user.usage:
+            used -= tokens
+            if used == 0 or used + cost <= limit:
+                return max(0.0, timestamp + self.window_seconds - now)
+        return 0.0
+    
+    def _eligible(self, waiter):
+        """Whether a request could start now"""
+        user = self._users[waiter.user_id]
+        self._expire(user, time.monotonic())
+        return (
+            self._in_flight < self.max_in_flight
+            and user.in_flight < self.per_user_in_flight
+            and self._budget_wait(user, waiter.cost, time.monotonic()) == 0
+        )
+    
+    def _next_waiter(self, now):
+        """The eligible waiter with the smallest finish tag, or None"""
+        eligible = [waiter for waiter in self._waiting if self._eligible(waiter)]
+        return min(eligible, key=lambda waiter: (waiter.finish, waiter.queued_at)) if eligible else None
+    
+    def _admit(self, waiter):
+        """Start a request: take the slot, reserve its tokens and advance virtual time"""
+        now = time.monotonic()
+        user = self._users[waiter.user_id]
+        user.in_flight += 1
+        user.last_finish = max(user.last_finish, waiter.finish)
+        usage = [now, waiter.cost]
+        user.usage.append(usage)
+        self._in_flight += 1
+        self._virtual_time = max(self._virtual_time, waiter.finish)
+        
+        wait_ms = (now - waiter.queued_at) * 1000
+        stats = self._classes[waiter.user_class]
+        stats["admitted"] += 1
+        stats["waits"].append(wait_ms)
+        return ChatSlot(self, waiter.user_id, waiter.user_class, usage, wait_ms)
+    
+    def _release(self, slot, tokens):
+        """Return a slot and settle its token charge"""
+        with self._condition:
+            if tokens is not None:
+                slot._usage[1] = max(0, tokens)
+            user = self._users.get(slot.user_id)
+            if user is not None:
+                user.in_flight -= 1
+            self._in_flight -= 1
+            elapsed = time.monotonic() - slot._started
+            self._service_seconds = elapsed if self._service_seconds is None else 0.8 * self._service_seconds + 0.2 * elapsed
+            self._forget(slot.user_id)
+            self._condition.notify_all()
+    
+    def _forget(self, user_id):
+        """Drop a user's state once nothing about them is still in play"""
+        user = self._users.get(user_id)
+        if user is None:
+            return
+        self._expire(user, time.monotonic())
+        if not user.in_flight and not user.waiting and not user.usage and user.last_finish <= self._virtual_time:
+            del self._users[user_id]
+    
+    def _sweep(self):
+        """Forget idle users at most once per window so state stays bounded by recent users"""
+        now = time.monotonic()
+        if now - self._last_sweep < self.window_seconds:
+            return
+        self._last_sweep = now
+        for user_id in list(self._users):
+            self._forget(user_id)
+    
+    def _retry_after(self, user, cost):
+        """Whole seconds a shed client should wait before retrying"""
+        service = self._service_seconds or 1.0
+        queued = service * (len(self._waiting) + 1) / self.max_in_flight
+        return max(1, math.ceil(max(self._budget_wait(user, cost, time.monotonic()), queued)))
+    
+    def stats(self):
+        """Return limits, current load and per-class queue wait metrics"""
+        with self._condition:
+            classes = {
+                user_class: dict(
+                    {key: value for key, value in counters.items() if key != "waits"},
+                    waiting=sum(1 for waiter in self._waiting if waiter.user_class == user_class),
+                    waits=sorted(counters["waits"])
+                )
+                for user_class, counters in self._classes.items()
+            }
+            in_flight = self._in_flight
+            waiting = len(self._waiting)
+            users = len(self._users)
+        
+        for counters in classes.values():
+            waits = counters.pop("waits")
+            counters["average_wait_ms"] = round(sum(waits) / len(waits), 1) if waits else 0
+            counters["p95_wait_ms"] = round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 1) if waits else None
+            counters["max_wait_ms"] = round(waits[-1], 1) if waits else None
+        
+        return {
+            "max_in_flight": self.max_in_flight,
+            "per_user_in_flight": self.per_user_in_flight,
+            "tokens_per_window": self.tokens_per_window,
+            "window_seconds": self.window_seconds,
+            "weights": self.weights,
+            "in_flight": in_flight,
+            "waiting": waiting,
+            "tracked_users": users,
+            "classes": classes
+        }
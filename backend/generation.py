@@ -0,0 +1,350 @@
+"""
+Continuous-batching generation scheduler for the chat model
+Runs every active reply through one batched decode step per token, admitting and retiring sequences between steps
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import torch
+from transformers import DynamicCache
+from batching import QueueFullError
+
+class GenerationRequest:
+    """One sequence waiting for or taking part in the decode batch"""
+    
+    def __init__(self, input_ids, max_new_tokens, deadline, cancel_event, on_token, past_key_values):
+        self.input_ids = input_ids
+        self.max_new_tokens = max_new_tokens
+        self.deadline = deadline
+        self.cancel_event = cancel_event
+        self.on_token = on_token
+        self.past_key_values = past_key_values
+        self.future = Future()
+        self.tokens = []
+        self.queued_at = time.monotonic()
+        self.first_token_at = None
+        self.length = 0
+        self.next_token = None
+
+def warped_probabilities(logits, temperature=0.7, top_k=50, top_p=0.9):
+    """Sampling distribution for rows of logits [batch, vocab] after temperature, top-k and top-p"""
+    logits = logits / max(temperature, 1e-5)
+    if top_k:
+        kth = torch.topk(logits, min(top_k, logits.shape[-1]), dim=-1).values[:, -1:]
+        logits = logits.masked_fill(logits < kth, float("-inf"))
+    if top_p < 1.0:
+        sorted_logits, order = torch.sort(logits, descending=True, dim=-1)
+        cumulative = torch.softmax(sorted_logits, dim=-1).cumsum(dim=-1)
+        # Drop tokens once the mass before them already reaches top_p, always keeping the best one
+        remove = cumulative - torch.softmax(sorted_logits, dim=-1) >= top_p
+        logits = logits.masked_fill(remove.scatter(-1, order, remove), float("-inf"))
+    return torch.softmax(logits, dim=-1)
+
+def _pad_left(tensor, length, dim):
+    """Left-pad tensor with zeros along dim up to length"""
+    missing = length - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+class GenerationScheduler:
+    """
+    Serves concurrent generate calls from one shared decode batch
+    
+    A worker thread keeps a batch of active sequences whose key/value caches
+    are left-padded to a common length. Before each decode step it prefills
+    newly admitted requests (up to max_batch_size in total) and merges them
+    in; after the step it retires sequences that produced an end-of-sequence
+    token, reached their max_new_tokens, passed their deadline or were
+    cancelled. Each step produces one token for every active sequence, so
+    aggregate tokens per second grows with the number of concurrent users.
+    """
+    
+    def __init__(self, model, eos_token_id, max_batch_size=8, max_queue_size=64,
+                 do_sample=True, temperature=0.7, top_k=50, top_p=0.9, name="generation-scheduler"):
+        self.model = model
+        self.eos_token_id = eos_token_id
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_queue_size = max(1, max_queue_size)
+        self.do_sample = do_sample
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.name = name
+        
+        self._waiting = deque()
+        self._condition = threading.Condition()
+        self._worker = None
+        self._running = True
+        
+        # Batch state, only touched by the worker thread
+        self._active = []
+        self._cache = None
+        self._attention_mask = None
+        
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "rejected": 0,
+            "deadline_exceeded": 0,
+            "cancelled": 0,
+            "failed": 0,
+            "steps": 0,
+            "step_rows": 0,
+            "tokens": 0,
+            "largest_batch": 0,
+            "busy_seconds": 0.0
+        }
+    
+    def submit(self, input_ids, max_new_tokens, timeout=None, cancel_event=None, on_token=None, past_key_values=None):
+        """
+        Queue a prompt for generation
+        
+        Args:
+            input_ids (torch.Tensor): Prompt token ids, shape [1, length]
+            max_new_tokens (int): Most tokens to generate for this request
+            timeout (float): Seconds from now after which generation stops with the tokens so far
+            cancel_event (threading.Event): Stops generation at the next token boundary once set
+            on_token (callable): Called with each new token id from the worker thread
+            past_key_values: Optional cache covering a prefix of input_ids, consumed by this request
+        
+        Returns:
+            Future: Resolves to {"tokens": [...], "finish_reason": "eos" | "length" | "deadline" | "cancelled"}
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        request = GenerationRequest(
+            input_ids, max(1, max_new_tokens), deadline,
+            cancel_event or threading.Event(), on_token, past_key_values
+        )
+        with self._condition:
+            if not self._running:
+                raise RuntimeError(f"{self.name} is shut down")
+            if len(self._waiting) >= self.max_queue_size:
+                self._stats["rejected"] += 1
+                raise QueueFullError(f"{self.name} queue is full ({self.max_queue_size} pending)")
+            
+            # Start the worker lazily so it is created after any pre-fork in gunicorn
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+            
+            self._waiting.append(request)
+            self._stats["submitted"] += 1
+            self._condition.notify()
+        return request.future
+    
+    def _run(self):
+        """Worker loop: admit, decode one token for every active sequence, retire"""
+        while True:
+            with self._condition:
+                while self._running and not self._waiting and not self._active:
+                    self._condition.wait()
+                if not self._running:
+                    break
+                admitted = []
+                while self._waiting and len(self._active) + len(admitted) < self.max_batch_size:
+                    admitted.append(self._waiting.popleft())
+            
+            started = time.monotonic()
+            for request in admitted:
+                try:
+                    self._admit(request)
+                except Exception as e:
+                    print(f"Error prefilling in {self.name}: {e}")
+                    self._fail(request, e)
+            try:
+                if self._active:
+                    self._step()
+            except Exception as e:
+                print(f"Error in {self.name}: {e}")
+                for request in self._active:
+                    self._fail(request, e)
+                self._active, self._cache, self._attention_mask = [], None, None
+            with self._condition:
+                self._stats["busy_seconds"] += time.monotonic() - started
+        
+        error = RuntimeError(f"{self.name} is shut down")
+        for request in self._active + list(self._waiting):
+            self._fail(request, error)
+    
+    def _sample(self, logits):
+        """Pick the next token for each row of logits [batch, vocab]"""
+        if not self.do_sample:
+            return logits.argmax(dim=-1)
+        probabilities = warped_probabilities(logits, self.temperature, self.top_k, self.top_p)
+        return torch.multinomial(probabilities, num_samples=1).squeeze(-1)
+    
+    def _admit(self, request):
+        """Prefill one request on its own and merge its cache into the batch"""
+        reason = self._finish_reason(request)
+        if reason is not None:
+            self._complete(request, reason)
+            return
+        
+        cache = request.past_key_values
+        request.past_key_values = None
+        cached_length = cache.get_seq_length() if cache is not None else 0
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=request.input_ids[:, cached_length:],
+                past_key_values=cache if cache is not None else DynamicCache(),
+                use_cache=True
+            )
+        request.length = request.input_ids.shape[1]
+        token = int(self._sample(outputs.logits[:, -1, :])[0])
+        if self._record_token(request, token):
+            return
+        self._merge(request, outputs.past_key_values)
+    
+    def _merge(self, request, cache):
+        """Add a prefilled sequence to the batch, left-padding caches to a common length"""
+        layers = [(layer.keys, layer.values) for layer in cache.layers]
+        mask = torch.ones((1, request.length), dtype=torch.long)
+        if not self._active:
+            self._cache, self._attention_mask, self._active = DynamicCache(layers), mask, [request]
+            return
+        
+        length = max(self._attention_mask.shape[1], request.length)
+        merged = []
+        for (batch_keys, batch_values), (keys, values) in zip(
+            [(layer.keys, layer.values) for layer in self._cache.layers], layers
+        ):
+            merged.append((
+                torch.cat([_pad_left(batch_keys, length, 2), _pad_left(keys, length, 2)], dim=0),
+                torch.cat([_pad_left(batch_values, length, 2), _pad_left(values, length, 2)], dim=0)
+            ))
+        self._cache = DynamicCache(merged)
+        self._attention_mask = torch.cat([_pad_left(self._attention_mask, length, 1), _pad_left(mask, length, 1)], dim=0)
+        self._active.append(request)
+    
+    def _step(self):
+        """Decode one token for every active sequence and retire the finished ones"""
+        batch_size = len(self._active)
+        input_ids = torch.tensor([[request.next_token] for request in self._active])
+        position_ids = torch.tensor([[request.length] for request in self._active])
+        attention_mask = torch.cat([self._attention_mask, torch.ones((batch_size, 1), dtype=torch.long)], dim=1)
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_values=self._cache,
+                use_cache=True
+            )
+        self._cache = outputs.past_key_values
+        self._attention_mask = attention_mask
+        tokens = self._sample(outputs.logits[:, -1, :]).tolist()
+        
+        with self._condition:
+            self._stats["steps"] += 1
+            self._stats["step_rows"] += batch_size
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], batch_size)
+        
+        keep = []
+        for index, (request, token) in enumerate(zip(self._active, tokens)):
+            request.length += 1
+            if not self._record_token(request, token):
+                keep.append(index)
+        if len(keep) < batch_size:
+            self._retire(keep)
+    
+    def _retire(self, keep):
+        """Drop finished rows from the batch and trim padding no remaining row needs"""
+        self._active = [self._active[index] for index in keep]
+        if not self._active:
+            self._cache, self._attention_mask = None, None
+            return
+        
+        indices = torch.tensor(keep)
+        mask = self._attention_mask.index_select(0, indices)
+        start = int((mask.sum(dim=0) > 0).nonzero()[0])
+        self._attention_mask = mask[:, start:]
+        self._cache = DynamicCache([
+            (layer.keys.index_select(0, indices)[:, :, start:], layer.values.index_select(0, indices)[:, :, start:])
+            for layer in self._cache.layers
+        ])
+    
+    def _record_token(self, request, token):
+        """Deliver a sampled token and return whether the request has finished"""
+        if request.first_token_at is None:
+            request.first_token_at = time.monotonic()
+        
+        if token == self.eos_token_id:
+            self._complete(request, "eos")
+            return True
+        
+        request.tokens.append(token)
+        request.next_token = token
+        with self._condition:
+            self._stats["tokens"] += 1
+        if request.on_token is not None:
+            try:
+                request.on_token(token)
+            except Exception as e:
+                print(f"Error delivering token from {self.name}: {e}")
+                request.cancel_event.set()
+        
+        reason = "length" if len(request.tokens) >= request.max_new_tokens else self._finish_reason(request)
+        if reason is not None:
+            self._complete(request, reason)
+            return True
+        return False
+    
+    def _finish_reason(self, request):
+        """Reason to stop a request early, or None"""
+        if request.cancel_event.is_set():
+            return "cancelled"
+        if request.deadline is not None and time.monotonic() >= request.deadline:
+            return "deadline"
+        return None
+    
+    def _complete(self, request, reason):
+        with self._condition:
+            self._stats["completed"] += 1
+            if reason == "deadline":
+                self._stats["deadline_exceeded"] += 1
+            elif reason == "cancelled":
+                self._stats["cancelled"] += 1
+        ttft = (request.first_token_at - request.queued_at) * 1000 if request.first_token_at else None
+        request.future.set_result({"tokens": request.tokens, "finish_reason": reason, "time_to_first_token_ms": ttft})
+    
+    def _fail(self, request, error):
+        with self._condition:
+            self._stats["failed"] += 1
+        if not request.future.done():
+            request.future.set_exception(error)
+    
+    def stats(self):
+        """Return settings and counters for monitoring"""
+        with self._condition:
+            stats = dict(self._stats)
+            queued = len(self._waiting)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_queue_size": self.max_queue_size,
+            "queued": queued,
+            "active": len(self._active),
+            "submitted": stats["submitted"],
+            "completed": stats["completed"],
+            "rejected": stats["rejected"],
+            "deadline_exceeded": stats["deadline_exceeded"],
+            "cancelled": stats["cancelled"],
+            "failed": stats["failed"],
+            "steps": stats["steps"],
+            "largest_batch": stats["largest_batch"],
+            "average_batch_size": round(stats["step_rows"] / stats["steps"], 2) if stats["steps"] else 0,
+            "tokens": stats["tokens"],
+            "tokens_per_second": round(stats["tokens"] / stats["busy_seconds"], 1) if stats["busy_seconds"] else 0
+        }
+    
+    def shutdown(self, wait=True):
+        """Stop the worker and fail whatever is still queued or active"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if wait and self._worker is not None:
+            self._worker.join()
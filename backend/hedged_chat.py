@@ -0,0 +1,142 @@
+"""
+Latency-budgeted chat replies
+Gives the LLM chatbot a deadline and answers from the rule-based chatbot when it misses it
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from batching import QueueFullError
+
+class BudgetedChat:
+    """
+    Answers chat messages within a latency budget
+    
+    The LLM chatbot is asked for a reply with the budget as its timeout. If
+    it misses the deadline (its request is then cancelled and leaves the
+    batch at the next token), its queue is full, it returns an empty reply,
+    or it is still loading, the rule-based chatbot answers instead. That bot replies in
+    microseconds, so it is only consulted after a miss rather than raced
+    alongside the LLM.
+    
+    With an admission queue (a FairChatQueue), the LLM call first waits for
+    a fair share slot charged cost_tokens, and the wait counts against the
+    budget. A request shed by the queue raises QuotaExceededError to the
+    caller instead of falling back.
+    """
+    
+    def __init__(self, llm, fallback, budget_seconds=8.0, max_budget_seconds=30.0, window=1000,
+                 admission=None, cost_tokens=150):
+        self.llm = llm
+        self.fallback = fallback
+        self.admission = admission
+        self.cost_tokens = cost_tokens
+        self.budget_seconds = budget_seconds
+        self.max_budget_seconds = max(budget_seconds, max_budget_seconds)
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "llm": 0,
+            "rule_based": 0,
+            "budget_missed": 0,
+            "overloaded": 0,
+            "empty_reply": 0,
+            "loading": 0
+        }
+    
+    def budget_for(self, requested_ms=None):
+        """Budget in seconds for a request, honouring a client value up to max_budget_seconds"""
+        if requested_ms is None:
+            return self.budget_seconds
+        return min(max(float(requested_ms) / 1000.0, 0.0), self.max_budget_seconds)
+    
+    def respond(self, user_input, context="", budget_seconds=None, user_id=None, user_class="patient"):
+        """
+        Reply to a message within the budget
+        
+        Args:
+            user_input (str): Message from the user
+            context (str): Optional conversation context
+            budget_seconds (float): Deadline for this request; defaults to budget_seconds
+            user_id (str): Who the request is charged to in the admission queue
+            user_class (str): patient, therapist or admin, for the admission queue weight
+        
+        Returns:
+            dict: response, engine ("llm" or "rule_based"), fallback_reason or None, latency_ms and queue_wait_ms
+        """
+        budget = self.budget_seconds if budget_seconds is None else budget_seconds
+        started = time.monotonic()
+        reason = None
+        response = None
+        slot = None
+        try:
+            # A model that is not loaded yet would only fail, so it is not charged a slot either
+            if not getattr(self.llm, "is_ready", True):
+                reason = "loading"
+            elif self.admission is not None:
+                slot = self.admission.acquire(user_id, user_class, cost=self.cost_tokens, timeout=budget)
+                # Time spent waiting for the slot counts against the budget
+                budget = max(0.0, budget - (time.monotonic() - started))
+            if reason is None:
+                response = self.llm.generate_response(user_input, context, timeout=budget)
+                if not response or not response.strip():
+                    reason = "empty_reply"
+        except FutureTimeoutError:
+            reason = "budget_missed"
+        except QueueFullError:
+            reason = "overloaded"
+        finally:
+            if slot is not None:
+                slot.release(self._token_count(response))
+        
+        if reason is not None:
+            response = self.fallback.generate_response(user_input, context)
+        latency_ms = (time.monotonic() - started) * 1000
+        engine = "llm" if reason is None else "rule_based"
+        
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats[engine] += 1
+            if reason is not None:
+                self._stats[reason] += 1
+            self._latencies.append(latency_ms)
+        
+        return {
+            "response": response,
+            "engine": engine,
+            "fallback_reason": reason,
+            "latency_ms": round(latency_ms, 1),
+            "queue_wait_ms": round(slot.wait_ms, 1) if slot is not None else 0
+        }
+    
+    def _token_count(self, response):
+        """Tokens in an LLM reply, or None to keep the admission estimate"""
+        tokenize = getattr(self.llm, "tokenize", None)
+        if not response or tokenize is None:
+            return None
+        try:
+            return len(tokenize(response))
+        except Exception:
+            return None
+    
+    def stats(self):
+        """Return the budget, engine and miss counters, and recent latency percentiles"""
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+        
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))], 1)
+        
+        return dict(
+            stats,
+            budget_seconds=self.budget_seconds,
+            fallback_rate=round(stats["rule_based"] / stats["requests"], 4) if stats["requests"] else 0,
+            p50_ms=percentile(0.50),
+            p95_ms=percentile(0.95),
+            p99_ms=percentile(0.99)
+        )
@@ -0,0 +1,145 @@
+"""
+Keyword lexicon sentiment classifier
+Cheap rule-based scoring shared by the simple app and the sentiment cascade
+"""
+
+import re
+
+# Words, with inner apostrophes kept ("don't"), so keywords only match whole tokens
+TOKEN_PATTERN = re.compile(r"\w+(?:'\w+)*")
+
+POSITIVE_WORDS = ['good', 'great', 'happy', 'joy', 'love', 'amazing', 'wonderful', 'excellent', 'fantastic', 'awesome', 'beautiful', 'perfect', 'wonderful', 'delighted', 'pleased', 'content', 'satisfied', 'grateful', 'blessed', 'lucky', 'fortunate']
+NEGATIVE_WORDS = ['bad', 'terrible', 'awful', 'horrible', 'sad', 'angry', 'frustrated', 'disappointed', 'upset', 'worried', 'anxious', 'stressed', 'depressed', 'miserable', 'unhappy', 'annoyed', 'irritated', 'furious', 'devastated', 'heartbroken']
+
+# Words that negate a keyword up to NEGATION_WINDOW tokens after them ("not happy", "never felt so good");
+# any contraction ending in n't negates too
+NEGATORS = {'not', 'no', 'never', 'nothing', 'nobody', 'none', 'neither', 'nor', 'without', 'hardly', 'barely', 'cannot', 'cant', 'dont', 'isnt', 'wasnt', 'didnt', 'doesnt', 'wont', 'aint'}
+NEGATION_WINDOW = 3
+
+def tokenize(text: str) -> list:
+    """Lowercase text and split it into word tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class KeywordMatcher:
+    """
+    Precompiled word-boundary keyword matcher
+    
+    Keywords (single words or multi-word phrases) are grouped by category and
+    indexed once by their first token. match() tokenizes the text and makes a
+    single pass over it with one hash lookup per token, so the cost grows
+    with the text rather than with the number of keywords, and "sad" no
+    longer matches inside "crusade".
+    """
+    
+    def __init__(self, categories: dict):
+        self.categories = list(categories)
+        self._index = {}
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                phrase = tuple(tokenize(keyword))
+                if phrase:
+                    self._index.setdefault(phrase[0], []).append((phrase, category, keyword))
+    
+    def match(self, text: str) -> dict:
+        """
+        Find the keywords present in text
+        
+        Args:
+            text (str): Text to scan
+        
+        Returns:
+            dict: Category name to the set of distinct keywords found
+        """
+        found = {category: set() for category in self.categories}
+        for _, category, keyword in self.find(tokenize(text)):
+            found[category].add(keyword)
+        return found
+    
+    def find(self, tokens: list):
+        """Yield (position, category, keyword) for every keyword occurrence in a list of tokens"""
+        for position, token in enumerate(tokens):
+            for phrase, category, keyword in self._index.get(token, ()):
+                if len(phrase) == 1 or tuple(tokens[position:position + len(phrase)]) == phrase:
+                    yield position, category, keyword
+    
+    def match_many(self, texts: list) -> list:
+        """Run match() over a batch of texts, returning one result per text in order"""
+        return [self.match(text) for text in texts]
+    
+    def first_category(self, text: str):
+        """Return the first category, in construction order, with any keyword in text, or None"""
+        found = self.match(text)
+        for category in self.categories:
+            if found[category]:
+                return category
+        return None
+
+SENTIMENT_MATCHER = KeywordMatcher({"positive": POSITIVE_WORDS, "negative": NEGATIVE_WORDS})
+
+def is_negator(token: str) -> bool:
+    """Whether a token negates the keywords after it"""
+    return token in NEGATORS or token.endswith("n't")
+
+def _sentiment_hits(text: str) -> tuple:
+    """
+    Sentiment keywords in text, split by whether a negator comes shortly before them
+    
+    Returns:
+        tuple: ({"positive": keywords, "negative": keywords} without negation, set of negated keywords)
+    """
+    found = {"positive": set(), "negative": set()}
+    negated = set()
+    tokens = tokenize(text)
+    for position, category, keyword in SENTIMENT_MATCHER.find(tokens):
+        if any(is_negator(token) for token in tokens[max(0, position - NEGATION_WINDOW):position]):
+            negated.add(keyword)
+        else:
+            found[category].add(keyword)
+    return found, negated
+
+def _score(found: dict, negated: set) -> dict:
+    """Turn matched sentiment keywords into a classify() result"""
+    positive_count = len(found["positive"])
+    negative_count = len(found["negative"])
+    
+    if positive_count > negative_count:
+        sentiment = "positive"
+        score = min(0.9, 0.5 + (positive_count * 0.1))
+    elif negative_count > positive_count:
+        sentiment = "negative"
+        score = min(0.9, 0.5 + (negative_count * 0.1))
+    else:
+        sentiment = "neutral"
+        score = 0.5
+    
+    return {
+        "sentiment": sentiment,
+        "score": round(score, 2),
+        "positive_hits": positive_count,
+        "negative_hits": negative_count,
+        "negated_hits": len(negated),
+        # A negated keyword ("not happy") is evidence against its own polarity, so it conflicts too
+        "conflicting": (positive_count > 0 and negative_count > 0) or bool(negated)
+    }
+
+def classify(text: str) -> dict:
+    """
+    Score text by counting positive and negative keywords
+    
+    Keywords with a negator shortly before them are not counted for their
+    polarity; they are reported as negated_hits and make the result
+    conflicting, since the lexicon cannot tell what "not happy" means.
+    
+    Args:
+        text (str): Text to analyze
+    
+    Returns:
+        dict: sentiment and score as returned by /analyze, plus the keyword
+        hit counts and whether the evidence conflicts (both polarities
+        present, or a negated keyword)
+    """
+    return _score(*_sentiment_hits(text))
+
+def classify_many(texts: list) -> list:
+    """Classify a batch of texts, returning one classify() result per text in order"""
+    return [classify(text) for text in texts]
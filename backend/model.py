@@ -3,29 +3,196 @@ Mood analysis models and utilities
 """
 
 from transformers import pipeline
+from dotenv import load_dotenv
+from batching import MicroBatcher
+from cache import SentimentCache, make_cache_key
+from onnx_backend import OnnxSentimentPipeline
+from concurrent.futures import Future
+import threading
+import time
 import torch
+import os
+
+load_dotenv()
+
+# Model identity; the resolved revision is part of every cache key
+SENTIMENT_MODEL = os.getenv("SENTIMENT_MODEL", "distilbert-base-uncased-finetuned-sst-2-english")
+SENTIMENT_MODEL_REVISION = os.getenv("SENTIMENT_MODEL_REVISION") or None
+
+# Inference backend: "pytorch" (transformers pipeline) or "onnx" (int8 ONNX Runtime, CPU only)
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "pytorch").lower()
+SENTIMENT_ONNX_DIR = os.getenv("SENTIMENT_ONNX_DIR", os.path.join(os.path.expanduser("~"), ".cache", "moodmate", "onnx"))
+SENTIMENT_ONNX_QUANTIZE = os.getenv("SENTIMENT_ONNX_QUANTIZE", "true").lower() == "true"
+SENTIMENT_ONNX_THREADS = int(os.getenv("SENTIMENT_ONNX_THREADS", "0"))
+
+# Load the model on a background thread so workers can serve /health at once
+SENTIMENT_BACKGROUND_LOAD = os.getenv("SENTIMENT_BACKGROUND_LOAD", "true").lower() == "true"
+
+# Texts per forward pass when analyzing several entries at once
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "16"))
+
+# Long entries are split into token windows of at most this many tokens,
+# overlapping by SENTIMENT_CHUNK_OVERLAP, and their scores combined
+SENTIMENT_CHUNK_TOKENS = int(os.getenv("SENTIMENT_CHUNK_TOKENS", "510"))
+SENTIMENT_CHUNK_OVERLAP = int(os.getenv("SENTIMENT_CHUNK_OVERLAP", "64"))
+
+# Micro-batching of concurrent single-text requests
+SENTIMENT_MICROBATCH_SIZE = int(os.getenv("SENTIMENT_MICROBATCH_SIZE", "16"))
+SENTIMENT_MICROBATCH_WAIT_MS = float(os.getenv("SENTIMENT_MICROBATCH_WAIT_MS", "5"))
+SENTIMENT_MICROBATCH_MAX_QUEUE = int(os.getenv("SENTIMENT_MICROBATCH_MAX_QUEUE", "256"))
+
+# Result cache; SENTIMENT_CACHE_SIZE=0 disables the local tier
+SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", "10000"))
+SENTIMENT_CACHE_TTL = int(os.getenv("SENTIMENT_CACHE_TTL", "86400"))
+SENTIMENT_CACHE_REDIS_URL = os.getenv("SENTIMENT_CACHE_REDIS_URL", "")
 
 class MoodAnalyzer:
     """Wrapper class for sentiment analysis model"""
     
-    def __init__(self):
-        self.model_name = "distilbert-base-uncased-finetuned-sst-2-english"
+    def __init__(self, background=False, backend=None):
+        self.model_name = SENTIMENT_MODEL
+        self.backend = backend or SENTIMENT_BACKEND
+        self.model_version = SENTIMENT_MODEL_REVISION or "unversioned"
         self.pipeline = None
-        self._load_model()
+        self.status = "loading"
+        self.load_error = None
+        self.load_seconds = None
+        self._load_finished = threading.Event()
+        self._lowercase = False
+        self._chunk_tokens = SENTIMENT_CHUNK_TOKENS
+        self.cache = SentimentCache(
+            max_entries=SENTIMENT_CACHE_SIZE,
+            ttl_seconds=SENTIMENT_CACHE_TTL,
+            shared_url=SENTIMENT_CACHE_REDIS_URL
+        )
+        self.batcher = MicroBatcher(
+            self._analyze_coalesced,
+            max_batch_size=SENTIMENT_MICROBATCH_SIZE,
+            max_wait_ms=SENTIMENT_MICROBATCH_WAIT_MS,
+            max_queue_size=SENTIMENT_MICROBATCH_MAX_QUEUE,
+            name="sentiment-batcher"
+        )
+        if background:
+            self.load_in_background()
+        else:
+            self.load()
+    
+    @property
+    def is_ready(self):
+        """Whether the model is loaded and warmed up"""
+        return self.status == "ready"
+    
+    def load(self):
+        """Load and warm up the model, recording progress in status"""
+        started = time.monotonic()
+        self.status = "loading"
+        self.load_error = None
+        self._load_finished.clear()
+        try:
+            self._load_model()
+            self._warm_up()
+        except Exception as e:
+            self.status = "failed"
+            self.load_error = str(e)
+            self._load_finished.set()
+            raise e
+        self.load_seconds = round(time.monotonic() - started, 2)
+        self.status = "ready"
+        self._load_finished.set()
+    
+    def wait_until_ready(self, timeout=None):
+        """Block until loading finishes and return whether the model is ready"""
+        self._load_finished.wait(timeout)
+        return self.is_ready
+    
+    def load_in_background(self):
+        """Start load() on a daemon thread and return the thread"""
+        def run():
+            try:
+                self.load()
+            except Exception:
+                # Already printed and recorded in status/load_error
+                pass
+        
+        thread = threading.Thread(target=run, name="sentiment-model-loader", daemon=True)
+        thread.start()
+        return thread
+    
+    def readiness(self):
+        """Loading state for the /ready endpoint"""
+        return {
+            "status": self.status,
+            "model": self.model_name,
+            "model_version": self.model_version,
+            "backend": self.backend,
+            "load_seconds": self.load_seconds,
+            "error": self.load_error
+        }
     
     def _load_model(self):
         """Load the sentiment analysis model"""
         try:
-            self.pipeline = pipeline(
-                "sentiment-analysis", 
-                model=self.model_name,
-                device=0 if torch.cuda.is_available() else -1
-            )
-            print(f"Model loaded successfully on {'GPU' if torch.cuda.is_available() else 'CPU'}")
+            if self.backend == "onnx":
+                self.pipeline = OnnxSentimentPipeline(
+                    self.model_name,
+                    cache_dir=SENTIMENT_ONNX_DIR,
+                    revision=SENTIMENT_MODEL_REVISION,
+                    quantize=SENTIMENT_ONNX_QUANTIZE,
+                    intra_op_threads=SENTIMENT_ONNX_THREADS
+                )
+                device = "CPU (ONNX Runtime, int8)" if SENTIMENT_ONNX_QUANTIZE else "CPU (ONNX Runtime)"
+            elif self.backend == "pytorch":
+                self.pipeline = pipeline(
+                    "sentiment-analysis", 
+                    model=self.model_name,
+                    revision=SENTIMENT_MODEL_REVISION,
+                    device=0 if torch.cuda.is_available() else -1
+                )
+                device = "GPU" if torch.cuda.is_available() else "CPU"
+            else:
+                raise ValueError(f"Unknown sentiment backend: {self.backend}")
+            self.model_version = self._resolve_model_version()
+            self._lowercase = getattr(self.pipeline.tokenizer, "do_lower_case", False) is True
+            self._chunk_tokens = self._resolve_chunk_tokens()
+            print(f"Model loaded successfully on {device}")
         except Exception as e:
             print(f"Error loading model: {e}")
             raise e
     
+    def _warm_up(self):
+        """Run a dummy batch so the first real request doesn't pay one-off setup costs"""
+        self.pipeline(["warming up", "model warmup inference"], batch_size=2, truncation=True)
+    
+    def _resolve_model_version(self):
+        """Identify the loaded weights so cached results never outlive a model change"""
+        model = getattr(self.pipeline, "model", None)
+        config = getattr(model, "config", None) or getattr(self.pipeline, "config", None)
+        commit_hash = getattr(config, "_commit_hash", None)
+        version = commit_hash if isinstance(commit_hash, str) and commit_hash else SENTIMENT_MODEL_REVISION or "unversioned"
+        # Quantized scores differ slightly, so they get their own cache entries
+        if self.backend == "onnx":
+            version += "+onnx-int8" if SENTIMENT_ONNX_QUANTIZE else "+onnx"
+        return version
+    
+    def _resolve_chunk_tokens(self):
+        """Chunk window that fits the model once special tokens are added"""
+        max_length = getattr(self.pipeline.tokenizer, "model_max_length", 512)
+        if not isinstance(max_length, int) or max_length > 100000:
+            # Tokenizers without a configured limit report a huge sentinel value
+            max_length = 512
+        return max(8, min(SENTIMENT_CHUNK_TOKENS, max_length - 2))
+    
+    def _cache_key(self, text):
+        """Cache key for text under the currently loaded model"""
+        return make_cache_key(text, self.model_name, self.model_version, self._lowercase)
+    
+    def _format_result(self, result):
+        """Convert a raw pipeline prediction into the API result shape"""
+        return {
+            "sentiment": result["label"].lower(),
+            "score": round(result["score"], 2)
+        }
+    
     def analyze(self, text: str):
         """
         Analyze sentiment of text
@@ -39,15 +206,197 @@ class MoodAnalyzer:
         if not self.pipeline:
             raise RuntimeError("Model not loaded")
         
+        key = self._cache_key(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        # A long entry may split into several chunks, which share one batch
+        result = self._predict_uncached([(key, text)], SENTIMENT_BATCH_SIZE)[key]
+        if "error" in result:
+            print(f"Error analyzing text: {result['error']}")
+            raise RuntimeError(result["error"])
+        return result
+    
+    def analyze_many(self, texts, batch_size=None):
+        """
+        Analyze sentiment of several texts using batched forward passes
+        
+        Cached results are reused and each distinct uncached text is run
+        through the pipeline ``batch_size`` chunks at a time, with batches
+        formed from chunks of similar token length to keep padding small.
+        
+        Args:
+            texts (list): Texts to analyze
+            batch_size (int): Texts per forward pass, defaults to SENTIMENT_BATCH_SIZE
+        
+        Returns:
+            list: One result per input text, in order. Texts that could not
+            be analyzed get a dict with an "error" key instead
+        """
+        if not self.pipeline:
+            raise RuntimeError("Model not loaded")
+        
+        batch_size = max(1, batch_size or SENTIMENT_BATCH_SIZE)
+        results = [None] * len(texts)
+        
+        # Reject empty or non-string items up front so they don't poison a batch,
+        # and group repeated texts under one cache key
+        misses = {}
+        for index, text in enumerate(texts):
+            if not (isinstance(text, str) and text.strip()):
+                results[index] = {"error": "No text provided"}
+                continue
+            key = self._cache_key(text)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[index] = cached
+            else:
+                misses.setdefault(key, []).append(index)
+        
+        predictions = self._predict_uncached([(key, texts[indices[0]]) for key, indices in misses.items()], batch_size)
+        for key, indices in misses.items():
+            for index in indices:
+                results[index] = dict(predictions[key])
+        
+        return results
+    
+    def _prepare_chunks(self, texts):
+        """
+        Split texts into token windows the model can take without truncation
+        
+        Returns:
+            list: (text index, chunk text, token count) for every chunk, in order
+        """
+        window = self._chunk_tokens
+        step = max(1, window - min(SENTIMENT_CHUNK_OVERLAP, window // 2))
         try:
-            result = self.pipeline(text)[0]
-            return {
-                "sentiment": result["label"].lower(),
-                "score": round(result["score"], 2)
-            }
+            encoded = self.pipeline.tokenizer(list(texts), add_special_tokens=False, return_offsets_mapping=True)
+            offsets = list(encoded["offset_mapping"])
+            if len(offsets) != len(texts):
+                raise ValueError(f"tokenizer returned {len(offsets)} offset lists for {len(texts)} texts")
         except Exception as e:
-            print(f"Error analyzing text: {e}")
-            raise e
+            # Slow tokenizers have no offsets; fall back to whole texts with truncation
+            print(f"Could not tokenize for chunking, analyzing whole texts: {e}")
+            return [(index, text, len(text.split())) for index, text in enumerate(texts)]
+        
+        chunks = []
+        for index, (text, text_offsets) in enumerate(zip(texts, offsets)):
+            if len(text_offsets) <= window:
+                chunks.append((index, text, len(text_offsets)))
+                continue
+            for start in range(0, len(text_offsets), step):
+                window_offsets = text_offsets[start:start + window]
+                chunk_text = text[window_offsets[0][0]:window_offsets[-1][1]]
+                chunks.append((index, chunk_text, len(window_offsets)))
+                if start + window >= len(text_offsets):
+                    break
+        return chunks
+    
+    def _combine_chunks(self, chunk_results):
+        """
+        Combine (prediction, token count) pairs for one text into a single prediction
+        
+        Each label's probability is the token-weighted mean over chunks, where
+        a chunk that predicted another label with score s contributes 1 - s.
+        This is exact for two-label models such as SST-2.
+        """
+        if len(chunk_results) == 1:
+            return chunk_results[0][0]
+        
+        total_weight = sum(weight for _, weight in chunk_results) or 1
+        labels = {prediction["label"] for prediction, _ in chunk_results}
+        probabilities = {
+            label: sum(
+                weight * (prediction["score"] if prediction["label"] == label else 1 - prediction["score"])
+                for prediction, weight in chunk_results
+            ) / total_weight
+            for label in labels
+        }
+        label = max(probabilities, key=probabilities.get)
+        return {"label": label, "score": probabilities[label]}
+    
+    def _predict_uncached(self, keyed_texts, batch_size):
+        """
+        Run (cache key, text) pairs through the pipeline in batches
+        
+        Texts are split into chunks first, and chunks are sorted by token
+        length so each batch is padded only to its own longest chunk.
+        Successful results are written to the cache. If a whole batch fails,
+        its chunks are retried one by one so a single bad entry doesn't fail
+        the rest.
+        
+        Returns:
+            dict: Result or {"error": ...} for each cache key
+        """
+        chunks = self._prepare_chunks([text for _, text in keyed_texts])
+        order = sorted(range(len(chunks)), key=lambda position: chunks[position][2])
+        outputs = [None] * len(chunks)
+        
+        for start in range(0, len(order), batch_size):
+            positions = order[start:start + batch_size]
+            batch = [chunks[position][1] for position in positions]
+            try:
+                batch_outputs = self.pipeline(batch, batch_size=len(batch), truncation=True)
+            except Exception as e:
+                print(f"Error analyzing batch, retrying texts individually: {e}")
+                batch_outputs = []
+                for text in batch:
+                    try:
+                        batch_outputs.append(self.pipeline(text, truncation=True)[0])
+                    except Exception as item_error:
+                        batch_outputs.append(item_error)
+            for position, output in zip(positions, batch_outputs):
+                outputs[position] = output
+        
+        # Regroup chunk outputs per text in their original order
+        per_text = [[] for _ in keyed_texts]
+        for (index, _, token_count), output in zip(chunks, outputs):
+            per_text[index].append((output, token_count))
+        
+        predictions = {}
+        for (key, _), chunk_results in zip(keyed_texts, per_text):
+            errors = [output for output, _ in chunk_results if isinstance(output, Exception)]
+            if errors:
+                predictions[key] = {"error": str(errors[0])}
+                continue
+            result = self._format_result(self._combine_chunks(chunk_results))
+            self.cache.set(key, result)
+            predictions[key] = result
+        return predictions
+    
+    def analyze_async(self, text: str):
+        """
+        Queue text for the micro-batcher instead of running it alone
+        
+        Concurrent callers are coalesced into one forward pass, trading up to
+        SENTIMENT_MICROBATCH_WAIT_MS of latency for throughput.
+        
+        Args:
+            text (str): Text to analyze
+        
+        Returns:
+            Future: Resolves to the same result as analyze(), or raises its error
+        """
+        if not self.pipeline:
+            raise RuntimeError("Model not loaded")
+        
+        # Cache hits skip the queue entirely
+        cached = self.cache.get(self._cache_key(text))
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+        
+        return self.batcher.submit(text)
+    
+    def _analyze_coalesced(self, texts):
+        """Batch function for the micro-batcher, turning per-item errors into exceptions"""
+        # Callers already missed the cache in analyze_async, so go straight to the model
+        keys = [self._cache_key(text) for text in texts]
+        predictions = self._predict_uncached(list(dict(zip(keys, texts)).items()), len(texts))
+        results = [dict(predictions[key]) for key in keys]
+        return [RuntimeError(result["error"]) if "error" in result else result for result in results]
 
 # Global analyzer instance
-mood_analyzer = MoodAnalyzer()
+mood_analyzer = MoodAnalyzer(background=SENTIMENT_BACKGROUND_LOAD)
@@ -0,0 +1,212 @@
+"""
+Per-user mood analytics aggregates
+The mood_aggregates row of each user is kept current by a trigger on mood_logs; this module reads it
+and can recompute every aggregate from scratch to verify (and repair) what the trigger maintained
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timezone
+from mood_series import NEGATIVE, NEUTRAL, POSITIVE, MoodSeries
+
+# Scores kept in recent_scores, oldest first; must match the trigger in the schema files
+RECENT_SCORES = 7
+
+AGGREGATE_FIELDS = (
+    "total_entries", "score_sum", "positive_count", "negative_count", "neutral_count",
+    "last_entry_at", "last_entry_date", "current_streak", "recent_scores"
+)
+
+def _timestamp(value):
+    """Parse a created_at value as an aware UTC datetime"""
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def _aggregates(series):
+    """mood_aggregates rows for every user in a MoodSeries"""
+    entries = series.entries()
+    score_sums = series.score_sums()
+    distribution = series.sentiment_distribution()
+    streaks = series.current_streaks()
+    recent = series.recent_scores(RECENT_SCORES)
+    last_entries = series.last_timestamps().astype(datetime)
+    
+    aggregates = {}
+    for index, user_id in enumerate(series.users):
+        last_entry_at = last_entries[index].replace(tzinfo=timezone.utc)
+        aggregates[user_id] = {
+            "user_id": user_id,
+            "total_entries": int(entries[index]),
+            "score_sum": round(float(score_sums[index]), 2),
+            "positive_count": int(distribution[index, POSITIVE]),
+            "negative_count": int(distribution[index, NEGATIVE]),
+            "neutral_count": int(distribution[index, NEUTRAL]),
+            "last_entry_at": last_entry_at.isoformat(),
+            "last_entry_date": last_entry_at.date().isoformat(),
+            "current_streak": int(streaks[index]),
+            "recent_scores": recent[index].tolist()
+        }
+    return aggregates
+
+def build_aggregates(logs):
+    """Compute the aggregates of every user in logs in one batch, as {user_id: mood_aggregates row}"""
+    return _aggregates(MoodSeries.from_logs(logs))
+
+def build_aggregate(user_id, logs):
+    """
+    Compute a user's aggregate from all of their mood logs
+    
+    Days are UTC calendar days. current_streak counts consecutive days with
+    an entry, ending on the day of the latest entry. recent_scores holds the
+    last RECENT_SCORES scores by created_at, then id.
+    
+    Returns:
+        dict: mood_aggregates row, or None if there are no logs
+    """
+    if not logs:
+        return None
+    return _aggregates(MoodSeries.from_logs(logs, user_id=user_id))[str(user_id)]
+
+def analytics_summary(aggregate):
+    """Dashboard analytics from a mood_aggregates row (or None for a user without logs)"""
+    if not aggregate or not aggregate.get("total_entries"):
+        return {
+            "total_entries": 0,
+            "average_score": 0,
+            "positive_days": 0,
+            "negative_days": 0,
+            "neutral_days": 0,
+            "streak": 0,
+            "trend": "neutral"
+        }
+    
+    recent_scores = [float(score) for score in aggregate.get("recent_scores") or []]
+    if len(recent_scores) >= 2:
+        trend = "positive" if recent_scores[-1] > recent_scores[0] else "negative"
+    else:
+        trend = "neutral"
+    
+    return {
+        "total_entries": aggregate["total_entries"],
+        "average_score": round(float(aggregate["score_sum"]) / aggregate["total_entries"], 2),
+        "positive_days": aggregate["positive_count"],
+        "negative_days": aggregate["negative_count"],
+        "neutral_days": aggregate["neutral_count"],
+        "streak": aggregate["current_streak"],
+        "trend": trend
+    }
+
+def aggregate_differences(expected, stored):
+    """Names of the fields where a stored aggregate disagrees with a recomputed one"""
+    if expected is None or stored is None:
+        return [] if expected is None and stored is None else ["missing" if stored is None else "orphaned"]
+    
+    differences = []
+    for field in AGGREGATE_FIELDS:
+        want, have = expected.get(field), stored.get(field)
+        if field == "score_sum":
+            same = have is not None and abs(float(want) - float(have)) < 0.005
+        elif field == "recent_scores":
+            same = [round(float(score), 2) for score in want] == [round(float(score), 2) for score in have or []]
+        elif field == "last_entry_at":
+            same = have is not None and _timestamp(want) == _timestamp(have)
+        else:
+            same = want == have
+        if not same:
+            differences.append(field)
+    return differences
+
+def _pages(query_fn, page_size):
+    """Yield rows from a query built by query_fn, page_size rows at a time"""
+    start = 0
+    while True:
+        rows = query_fn().range(start, start + page_size - 1).execute().data or []
+        yield from rows
+        if len(rows) < page_size:
+            return
+        start += page_size
+
+def rebuild_aggregates(client, user_id=None, fix=False, page_size=1000):
+    """
+    Recompute aggregates from mood_logs and compare them with mood_aggregates
+    
+    Args:
+        client: Supabase client
+        user_id (str): Only check this user
+        fix (bool): Overwrite wrong or missing aggregates, delete orphaned ones, then check them again
+        page_size (int): Rows fetched per request
+    
+    Returns:
+        dict: users checked, {user_id: differing fields} for mismatches, and whether the fixes verified
+    """
+    def logs_query():
+        query = client.table("mood_logs").select("id, user_id, sentiment, score, created_at")
+        if user_id:
+            query = query.eq("user_id", user_id)
+        return query.order("user_id").order("created_at").order("id")
+    
+    def aggregates_query():
+        query = client.table("mood_aggregates").select("*")
+        if user_id:
+            query = query.eq("user_id", user_id)
+        return query.order("user_id")
+    
+    expected = build_aggregates(list(_pages(logs_query, page_size)))
+    stored = {row["user_id"]: row for row in _pages(aggregates_query, page_size)}
+    users = sorted(set(expected) | set(stored))
+    mismatches = {}
+    for user in users:
+        differences = aggregate_differences(expected.get(user), stored.get(user))
+        if differences:
+            mismatches[user] = differences
+    
+    report = {"checked": len(users), "mismatched": mismatches, "fixed": False}
+    if not fix or not mismatches:
+        return report
+    
+    for user in mismatches:
+        if expected.get(user) is None:
+            client.table("mood_aggregates").delete().eq("user_id", user).execute()
+        else:
+            client.table("mood_aggregates").upsert(expected[user], on_conflict="user_id").execute()
+    
+    # Read the repaired rows back; logs written meanwhile are counted by the trigger, so recheck only these users
+    remaining = {}
+    for user in mismatches:
+        rows = client.table("mood_aggregates").select("*").eq("user_id", user).execute().data or []
+        differences = aggregate_differences(expected.get(user), rows[0] if rows else None)
+        if differences:
+            remaining[user] = differences
+    report["fixed"] = not remaining
+    report["remaining"] = remaining
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute per-user mood aggregates from mood_logs and verify them")
+    parser.add_argument("--user", help="only check this user id")
+    parser.add_argument("--fix", action="store_true", help="rewrite aggregates that do not match")
+    parser.add_argument("--page-size", type=int, default=1000, help="rows fetched per request")
+    args = parser.parse_args()
+    
+    from dotenv import load_dotenv
+    from supabase import create_client
+    load_dotenv()
+    client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY"))
+    
+    report = rebuild_aggregates(client, user_id=args.user, fix=args.fix, page_size=args.page_size)
+    for user, differences in report["mismatched"].items():
+        print(f"{user}: {', '.join(differences)}")
+    print(f"Checked {report['checked']} users, {len(report['mismatched'])} mismatched")
+    if args.fix and report["mismatched"]:
+        print("All mismatches repaired" if report["fixed"] else f"Still wrong after repair: {report['remaining']}")
+        return 0 if report["fixed"] else 1
+    return 1 if report["mismatched"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
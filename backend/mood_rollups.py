@@ -0,0 +1,290 @@
+"""
+Daily mood rollups
+mood_daily_rollups holds one row per user and local day, kept current by triggers on mood_logs; this module
+reads and summarizes rollups, and recomputes recent days from mood_logs to catch up anything the triggers missed
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+import numpy as np
+from mood_series import NEGATIVE, NEUTRAL, POSITIVE, MoodSeries, day_to_date, epoch_day, zone_info
+
+ROLLUP_FIELDS = (
+    "entries", "score_sum", "score_min", "score_max", "positive_count", "negative_count", "neutral_count"
+)
+
+# Users looked up per request when reading time zones
+USER_CHUNK = 200
+
+def build_rollups(logs, timezones=None):
+    """
+    Compute daily rollups from mood logs of any number of users
+    
+    Args:
+        logs (list): mood_logs rows with user_id, created_at, score and sentiment
+        timezones (dict): IANA zone name per user id; UTC for users not listed
+    
+    Returns:
+        dict: {(user_id, local_date ISO string): mood_daily_rollups row}
+    """
+    series = MoodSeries.from_logs(logs, timezones=timezones)
+    daily = series.daily()
+    rollups = {}
+    for row in range(len(daily["day"])):
+        user_id = series.users[daily["user_index"][row]]
+        local_date = day_to_date(daily["day"][row]).isoformat()
+        sentiments = daily["sentiments"][row]
+        rollups[(user_id, local_date)] = {
+            "user_id": user_id,
+            "local_date": local_date,
+            "entries": int(daily["entries"][row]),
+            "score_sum": round(float(daily["score_sum"][row]), 2),
+            "score_min": round(float(daily["min"][row]), 2),
+            "score_max": round(float(daily["max"][row]), 2),
+            "positive_count": int(sentiments[POSITIVE]),
+            "negative_count": int(sentiments[NEGATIVE]),
+            "neutral_count": int(sentiments[NEUTRAL])
+        }
+    return rollups
+
+def rollup_differences(expected, stored):
+    """Names of the fields where a stored rollup disagrees with a recomputed one"""
+    if expected is None or stored is None:
+        return [] if expected is None and stored is None else ["missing" if stored is None else "orphaned"]
+    differences = []
+    for field in ROLLUP_FIELDS:
+        want, have = expected.get(field), stored.get(field)
+        if have is None or abs(float(want) - float(have)) >= 0.005:
+            differences.append(field)
+    return differences
+
+def summarize_rollups(rollups, as_of=None):
+    """
+    Totals, streak and week-over-week averages from one user's daily rollups
+    
+    Args:
+        rollups (list): mood_daily_rollups rows of a single user, in any order
+        as_of (date): The user's today, as user_today gives; defaults to today
+            in UTC, which is a day off for much of the day far from UTC
+    
+    Returns:
+        dict: entries, days_logged, average_score, positive/negative/neutral
+        counts, streak (consecutive days ending today or yesterday, else 0),
+        and this_week, last_week and week_delta averages (None without logs)
+    """
+    today = epoch_day(as_of)
+    if not rollups:
+        return {
+            "entries": 0, "days_logged": 0, "average_score": 0, "positive": 0, "negative": 0, "neutral": 0,
+            "streak": 0, "this_week": None, "last_week": None, "week_delta": None
+        }
+    
+    days = np.array([epoch_day(date.fromisoformat(str(row["local_date"])[:10])) for row in rollups], dtype=np.int64)
+    entries = np.array([row["entries"] for row in rollups], dtype=np.int64)
+    sums = np.array([float(row["score_sum"]) for row in rollups])
+    counts = {
+        sentiment: int(sum(row[f"{sentiment}_count"] for row in rollups))
+        for sentiment in ("positive", "negative", "neutral")
+    }
+    
+    unique_days = np.unique(days)
+    streak = 0
+    if unique_days[-1] >= today - 1:
+        gaps = np.flatnonzero(np.diff(unique_days) != 1)
+        streak = len(unique_days) - (gaps[-1] + 1 if len(gaps) else 0)
+    
+    weeks = []
+    age = today - days
+    for week in (0, 1):
+        in_week = (age >= 7 * week) & (age < 7 * (week + 1))
+        weeks.append(float(sums[in_week].sum() / entries[in_week].sum()) if entries[in_week].sum() else None)
+    delta = round(weeks[0] - weeks[1], 2) if None not in weeks else None
+    weeks = [round(mean, 2) if mean is not None else None for mean in weeks]
+    
+    return dict(
+        counts,
+        entries=int(entries.sum()),
+        days_logged=len(unique_days),
+        average_score=round(float(sums.sum() / entries.sum()), 2),
+        streak=int(streak),
+        this_week=weeks[0],
+        last_week=weeks[1],
+        week_delta=delta
+    )
+
+def user_timezones(client, user_ids):
+    """IANA zone name per user id, read from users in chunks"""
+    user_ids = sorted(set(user_ids))
+    timezones = {}
+    for start in range(0, len(user_ids), USER_CHUNK):
+        result = client.table("users").select("id, timezone").in_("id", user_ids[start:start + USER_CHUNK]).execute()
+        timezones.update({row["id"]: row.get("timezone") or "UTC" for row in result.data or []})
+    return timezones
+
+def local_today(zone_name=None, now=None):
+    """Today's date in an IANA zone, UTC when the name is empty or unknown"""
+    return (now or datetime.now(timezone.utc)).astimezone(zone_info(zone_name)).date()
+
+def user_today(client, user_id, now=None):
+    """Today's date in the user's time zone, from users.timezone; rollup local_dates are in that zone"""
+    return local_today(user_timezones(client, [user_id]).get(user_id), now)
+
+def _pages(query_fn, page_size):
+    """Yield rows from a query built by query_fn, page_size rows at a time"""
+    start = 0
+    while True:
+        rows = query_fn().range(start, start + page_size - 1).execute().data or []
+        yield from rows
+        if len(rows) < page_size:
+            return
+        start += page_size
+
+def refresh_rollups(client, days=2, user_id=None, fix=True, page_size=1000, now=None):
+    """
+    Recompute recent rollups from mood_logs and repair the stored ones
+    
+    Args:
+        client: Supabase client
+        days (int): Local days to check, counting back from today; 0 checks all history
+        user_id (str): Only check this user
+        fix (bool): Rebuild wrong, missing and orphaned rollups in the database
+        page_size (int): Rows fetched per request
+        now (datetime): Current time, for tests
+    
+    Returns:
+        dict: rollups checked, {"user_id/local_date": differing fields} for mismatches, and rows fixed
+    """
+    now = now or datetime.now(timezone.utc)
+    # Local days start up to 14 hours before UTC ones, so logs are read from a day earlier than the first checked date
+    first_date = (now.date() - timedelta(days=days)) if days else None
+    since = datetime.combine(first_date - timedelta(days=1), datetime.min.time(), timezone.utc) if days else None
+    
+    def logs_query():
+        query = client.table("mood_logs").select("id, user_id, sentiment, score, created_at")
+        if user_id:
+            query = query.eq("user_id", user_id)
+        if since:
+            query = query.gte("created_at", since.isoformat())
+        return query.order("user_id").order("created_at").order("id")
+    
+    def rollups_query():
+        query = client.table("mood_daily_rollups").select("*")
+        if user_id:
+            query = query.eq("user_id", user_id)
+        if first_date:
+            query = query.gte("local_date", first_date.isoformat())
+        return query.order("user_id").order("local_date")
+    
+    logs = list(_pages(logs_query, page_size))
+    timezones = user_timezones(client, [log["user_id"] for log in logs]) if logs else {}
+    expected = {
+        key: row for key, row in build_rollups(logs, timezones).items()
+        if first_date is None or key[1] >= first_date.isoformat()
+    }
+    stored = {(row["user_id"], str(row["local_date"])[:10]): row for row in _pages(rollups_query, page_size)}
+    
+    mismatches = {}
+    for key in sorted(set(expected) | set(stored)):
+        differences = rollup_differences(expected.get(key), stored.get(key))
+        if differences:
+            mismatches[key] = differences
+    
+    # The recompute happens in the database, in one statement against the current logs and the
+    # user's zone as Postgres reads it; a log written since the reads above is then counted, not lost
+    fixed = 0
+    if fix:
+        for owner, local_date in mismatches:
+            client.rpc("rebuild_mood_daily_rollup", {"target_user": owner, "target_date": local_date}).execute()
+            fixed += 1
+    
+    return {
+        "checked": len(set(expected) | set(stored)),
+        "mismatched": {f"{owner}/{local_date}": differences for (owner, local_date), differences in mismatches.items()},
+        "fixed": fixed
+    }
+
+class RollupRefresher:
+    """
+    Runs refresh_rollups on a daemon thread every interval seconds
+    
+    The triggers keep rollups current on their own; this catches up days
+    they missed, such as logs written while the triggers were disabled or
+    before they existed. Several workers may each run one, since a refresh
+    only rewrites rows that differ.
+    """
+    
+    def __init__(self, client, interval=3600.0, days=2, name="rollup-refresher"):
+        self.client = client
+        self.interval = interval
+        self.days = days
+        self.name = name
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {"runs": 0, "failures": 0, "fixed": 0, "last_run_at": None, "last_error": None}
+    
+    def start(self):
+        """Start the refresh thread unless it is running or the interval is not positive"""
+        if self.interval <= 0 or self._thread is not None:
+            return None
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self._thread
+    
+    def run_once(self):
+        """Refresh once now and return the report, recording the outcome in stats"""
+        try:
+            report = refresh_rollups(self.client, days=self.days)
+        except Exception as e:
+            print(f"Error refreshing mood rollups: {e}")
+            self._stats["failures"] += 1
+            self._stats["last_error"] = str(e)
+            return None
+        self._stats["runs"] += 1
+        self._stats["fixed"] += report["fixed"]
+        self._stats["last_run_at"] = datetime.now(timezone.utc).isoformat()
+        if report["fixed"]:
+            print(f"Repaired {report['fixed']} mood rollups: {', '.join(report['mismatched'])}")
+        return report
+    
+    def _run(self):
+        """Refresh loop until stop()"""
+        while not self._stop.wait(self.interval):
+            self.run_once()
+    
+    def stop(self, timeout=None):
+        """Stop the refresh thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def stats(self):
+        """Return settings and run counters for monitoring"""
+        return dict(self._stats, interval=self.interval, days=self.days, running=self._thread is not None)
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute recent daily mood rollups from mood_logs and repair them")
+    parser.add_argument("--days", type=int, default=2, help="local days to check, 0 for all history")
+    parser.add_argument("--user", help="only check this user id")
+    parser.add_argument("--check", action="store_true", help="report mismatches without repairing them")
+    parser.add_argument("--page-size", type=int, default=1000, help="rows fetched per request")
+    args = parser.parse_args()
+    
+    from dotenv import load_dotenv
+    from supabase import create_client
+    load_dotenv()
+    client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY"))
+    
+    started = time.monotonic()
+    report = refresh_rollups(client, days=args.days, user_id=args.user, fix=not args.check, page_size=args.page_size)
+    for key, differences in report["mismatched"].items():
+        print(f"{key}: {', '.join(differences)}")
+    print(f"Checked {report['checked']} rollups in {time.monotonic() - started:.1f}s, "
+          f"{len(report['mismatched'])} mismatched, {report['fixed']} repaired")
+    return 1 if args.check and report["mismatched"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
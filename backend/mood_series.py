@@ -0,0 +1,268 @@
+"""
+Columnar mood time series
+Loads mood logs into NumPy arrays (user, UTC epoch day, score, sentiment code) and computes streaks,
+rolling averages, week-over-week deltas and sentiment distributions for many users at once
+"""
+
+from datetime import date, datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import numpy as np
+
+SENTIMENTS = ("negative", "neutral", "positive")
+NEGATIVE, NEUTRAL, POSITIVE = range(len(SENTIMENTS))
+
+def parse_timestamps(values):
+    """UTC datetime64[us] array from ISO created_at strings or datetimes"""
+    text = np.asarray(values).astype(str)
+    if not len(text):
+        return np.array([], dtype="datetime64[us]")
+    text = np.char.replace(np.char.replace(text, "Z", ""), "+00:00", "")
+    # PostgREST returns UTC; the rare value with another offset is converted on its own
+    offset = (np.char.rfind(text, "+") > 10) | (np.char.rfind(text, "-") > 10)
+    for index in np.flatnonzero(offset):
+        text[index] = datetime.fromisoformat(text[index]).astimezone(timezone.utc).replace(tzinfo=None).isoformat()
+    return text.astype("datetime64[us]")
+
+def zone_info(name):
+    """tzinfo for an IANA zone name, UTC when the name is empty or unknown"""
+    try:
+        return ZoneInfo(name) if name and name != "UTC" else timezone.utc
+    except (ZoneInfoNotFoundError, ValueError):
+        return timezone.utc
+
+def local_days(timestamps, zones):
+    """
+    Local calendar days since the epoch for UTC timestamps
+    
+    Args:
+        timestamps (numpy.ndarray): UTC datetime64 values
+        zones (numpy.ndarray): IANA zone name of each row
+    
+    Returns:
+        numpy.ndarray: Day numbers, as epoch_day gives for the local dates
+    """
+    minutes = timestamps.astype("datetime64[m]").astype(np.int64)
+    days = minutes // 1440
+    for name in np.unique(zones):
+        zone = zone_info(str(name))
+        if zone is timezone.utc:
+            continue
+        rows = np.flatnonzero(zones == name)
+        # UTC offsets only change on quarter hours, so each quarter hour is looked up once
+        quarters, inverse = np.unique(minutes[rows] // 15, return_inverse=True)
+        offsets = np.array([
+            datetime.fromtimestamp(int(quarter) * 900, timezone.utc).astimezone(zone).utcoffset().total_seconds() // 60
+            for quarter in quarters
+        ], dtype=np.int64)
+        days[rows] = (minutes[rows] + offsets[inverse]) // 1440
+    return days
+
+def epoch_day(value=None):
+    """Days since 1970-01-01 for a date or datetime, today in UTC when None"""
+    if value is None:
+        value = datetime.now(timezone.utc)
+    if isinstance(value, datetime):
+        value = value.astimezone(timezone.utc).date() if value.tzinfo else value.date()
+    return (value - date(1970, 1, 1)).days
+
+def day_to_date(day):
+    """Date for a number of days since 1970-01-01"""
+    return date.fromordinal(date(1970, 1, 1).toordinal() + int(day))
+
+class MoodSeries:
+    """
+    Mood logs of one or many users as parallel arrays
+    
+    Rows are sorted by user, then created_at, then id. users holds the user
+    ids, and user_index maps each row to its position in users; every
+    per-user result is an array indexed the same way. Days are days since
+    the epoch in each user's time zone (UTC unless given), and sentiments
+    are coded as positions in SENTIMENTS.
+    """
+    
+    def __init__(self, users, user_index, timestamps, scores, sentiments, days=None):
+        self.users = users
+        self.user_index = user_index
+        self.timestamps = timestamps
+        self.days = days if days is not None else timestamps.astype("datetime64[D]").astype(np.int64)
+        self.scores = scores
+        self.sentiments = sentiments
+        
+        positions = np.arange(len(users))
+        self.starts = np.searchsorted(user_index, positions, side="left")
+        self.ends = np.searchsorted(user_index, positions, side="right")
+    
+    @classmethod
+    def from_logs(cls, logs, user_id=None, timezones=None):
+        """
+        Load mood_logs rows
+        
+        Args:
+            logs (list): Rows with created_at, score and sentiment, plus user_id and id when present
+            user_id (str): Owner of every row, for logs of a single user
+            timezones (dict): IANA zone name per user id, for local days
+        
+        Returns:
+            MoodSeries: The logs in columnar form
+        """
+        if user_id is not None:
+            owners = np.full(len(logs), str(user_id))
+        else:
+            owners = np.asarray([str(log["user_id"]) for log in logs], dtype=str)
+        users, user_index = np.unique(owners, return_inverse=True)
+        
+        timestamps = parse_timestamps([log["created_at"] for log in logs])
+        scores = np.asarray([log["score"] for log in logs], dtype=np.float64)
+        labels = np.asarray([log["sentiment"] for log in logs], dtype=str)
+        sentiments = np.full(len(logs), NEUTRAL, dtype=np.int8)
+        sentiments[labels == "negative"] = NEGATIVE
+        sentiments[labels == "positive"] = POSITIVE
+        
+        # Ties on created_at are broken by id, numerically when every id is a number
+        ids = [log.get("id") for log in logs]
+        if all(isinstance(row_id, int) for row_id in ids):
+            ids = np.asarray(ids, dtype=np.int64)
+        else:
+            ids = np.asarray([str(row_id) for row_id in ids], dtype=str)
+        
+        order = np.lexsort((ids, timestamps, user_index)) if len(logs) else np.array([], dtype=np.int64)
+        user_index = user_index[order].astype(np.int64)
+        timestamps = timestamps[order]
+        days = None
+        if timezones:
+            zones = np.asarray([timezones.get(user) or "UTC" for user in users.tolist()] or ["UTC"], dtype=str)
+            days = local_days(timestamps, zones[user_index])
+        return cls(users.tolist(), user_index, timestamps, scores[order], sentiments[order], days=days)
+    
+    def __len__(self):
+        return len(self.scores)
+    
+    def entries(self):
+        """Number of logs per user"""
+        return np.bincount(self.user_index, minlength=len(self.users))
+    
+    def score_sums(self):
+        """Sum of scores per user"""
+        return np.bincount(self.user_index, weights=self.scores, minlength=len(self.users))
+    
+    def last_timestamps(self):
+        """Latest created_at per user; every user has at least one log"""
+        return self.timestamps[self.ends - 1]
+    
+    def sentiment_distribution(self):
+        """Log counts per user and sentiment, shaped [users, len(SENTIMENTS)]"""
+        keys = self.user_index * len(SENTIMENTS) + self.sentiments
+        return np.bincount(keys, minlength=len(self.users) * len(SENTIMENTS)).reshape(len(self.users), len(SENTIMENTS))
+    
+    def recent_scores(self, count):
+        """The last count scores of each user, oldest first, as one array per user"""
+        if not self.users:
+            return []
+        from_end = self.ends[self.user_index] - 1 - np.arange(len(self))
+        keep = from_end < count
+        return np.split(self.scores[keep], np.cumsum(np.minimum(self.entries(), count))[:-1])
+    
+    def daily(self):
+        """
+        Per-day summaries for every user
+        
+        Returns:
+            dict: Arrays with one element per (user, day) that has logs, in
+            user then day order: user_index, day, entries, score_sum, mean,
+            min, max, and sentiments shaped [rows, len(SENTIMENTS)]
+        """
+        if not len(self):
+            empty = np.array([], dtype=np.int64)
+            return {
+                "user_index": empty, "day": empty, "entries": empty, "score_sum": np.array([]), "mean": np.array([]),
+                "min": np.array([]), "max": np.array([]), "sentiments": np.zeros((0, len(SENTIMENTS)), dtype=np.int64)
+            }
+        
+        # Rows are sorted by user and time, so each (user, day) group is a contiguous run
+        new_group = np.ones(len(self), dtype=bool)
+        new_group[1:] = (self.user_index[1:] != self.user_index[:-1]) | (self.days[1:] != self.days[:-1])
+        starts = np.flatnonzero(new_group)
+        group = np.cumsum(new_group) - 1
+        
+        entries = np.diff(np.append(starts, len(self)))
+        score_sum = np.add.reduceat(self.scores, starts)
+        sentiments = np.zeros((len(starts), len(SENTIMENTS)), dtype=np.int64)
+        np.add.at(sentiments, (group, self.sentiments), 1)
+        return {
+            "user_index": self.user_index[starts],
+            "day": self.days[starts],
+            "entries": entries,
+            "score_sum": score_sum,
+            "mean": score_sum / entries,
+            "min": np.minimum.reduceat(self.scores, starts),
+            "max": np.maximum.reduceat(self.scores, starts),
+            "sentiments": sentiments
+        }
+    
+    def current_streaks(self, as_of=None):
+        """
+        Consecutive days with a log, per user, ending on the user's latest day
+        
+        Args:
+            as_of (date): When given, a streak whose last day is before the day
+                before as_of is broken and counts as 0
+        
+        Returns:
+            numpy.ndarray: Streak length per user
+        """
+        daily = self.daily()
+        users, days = daily["user_index"], daily["day"]
+        if not len(days):
+            return np.zeros(len(self.users), dtype=np.int64)
+        
+        run_start = np.ones(len(days), dtype=bool)
+        run_start[1:] = (users[1:] != users[:-1]) | (days[1:] - days[:-1] != 1)
+        run_starts = np.maximum.accumulate(np.where(run_start, np.arange(len(days)), 0))
+        
+        last = np.searchsorted(users, np.arange(len(self.users)), side="right") - 1
+        streaks = last - run_starts[last] + 1
+        if as_of is not None:
+            streaks[days[last] < epoch_day(as_of) - 1] = 0
+        return streaks
+    
+    def rolling_average(self, window=7):
+        """
+        Mean score of each user's logs over the window days ending on each day with logs
+        
+        Returns:
+            dict: user_index, day and average arrays, one element per (user, day) with logs
+        """
+        daily = self.daily()
+        users, days = daily["user_index"], daily["day"]
+        if not len(days):
+            return {"user_index": users, "day": days, "average": np.array([])}
+        
+        # Composite keys keep each user's days apart, so one searchsorted finds every window start
+        span = int(days.max() - days.min()) + window + 1
+        keys = users * span + (days - days.min())
+        first = np.searchsorted(keys, keys - window + 1, side="left")
+        sums = np.concatenate(([0.0], np.cumsum(daily["score_sum"])))
+        counts = np.concatenate(([0], np.cumsum(daily["entries"])))
+        positions = np.arange(len(days)) + 1
+        return {
+            "user_index": users,
+            "day": days,
+            "average": (sums[positions] - sums[first]) / (counts[positions] - counts[first])
+        }
+    
+    def week_over_week(self, as_of=None):
+        """
+        Mean score per user for the 7 days ending on as_of and the 7 days before
+        
+        Returns:
+            tuple: (this_week, last_week, delta) arrays per user; NaN where a week has no logs
+        """
+        today = epoch_day(as_of)
+        age = today - self.days
+        means = []
+        for week in (0, 1):
+            in_week = (age >= 7 * week) & (age < 7 * (week + 1))
+            sums = np.bincount(self.user_index[in_week], weights=self.scores[in_week], minlength=len(self.users))
+            counts = np.bincount(self.user_index[in_week], minlength=len(self.users))
+            means.append(np.where(counts > 0, sums / np.maximum(counts, 1), np.nan))
+        return means[0], means[1], means[0] - means[1]
@@ -6,7 +6,7 @@ Handles email notifications, push notifications, and real-time updates
 import os
 import smtplib
 import json
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
@@ -15,6 +15,7 @@ from supabase import create_client, Client
 from dotenv import load_dotenv
 import requests
 import uuid
+from mood_rollups import summarize_rollups, user_today
 
 load_dotenv()
 
@@ -445,22 +446,22 @@ class NotificationService:
             for user_setting in users_result.data:
                 user_id = user_setting["user_id"]
                 
-                # Get user's weekly data
-                week_ago = datetime.now() - timedelta(days=7)
-                mood_logs = supabase.table("mood_logs").select("*").eq("user_id", user_id).gte("created_at", week_ago.isoformat()).execute()
+                # Get user's weekly data: at most seven daily rollups, counted back from the user's local today
+                today = user_today(supabase, user_id)
+                week_start = today - timedelta(days=6)
+                rollups = supabase.table("mood_daily_rollups").select("*").eq("user_id", user_id).gte("local_date", week_start.isoformat()).execute()
                 
-                if mood_logs.data:
+                if rollups.data:
                     # Calculate weekly statistics
-                    scores = [log["score"] for log in mood_logs.data]
-                    sentiments = [log["sentiment"] for log in mood_logs.data]
+                    summary = summarize_rollups(rollups.data, as_of=today)
                     
                     weekly_data = {
-                        "total_entries": len(mood_logs.data),
-                        "average_score": sum(scores) / len(scores) if scores else 0,
-                        "positive_days": sentiments.count("positive"),
-                        "negative_days": sentiments.count("negative"),
-                        "neutral_days": sentiments.count("neutral"),
-                        "streak": self._calculate_streak(user_id)
+                        "total_entries": summary["entries"],
+                        "average_score": summary["average_score"],
+                        "positive_days": summary["positive"],
+                        "negative_days": summary["negative"],
+                        "neutral_days": summary["neutral"],
+                        "streak": self._calculate_streak(user_id, today)
                     }
                     
                     # Send weekly report
@@ -482,26 +483,17 @@ class NotificationService:
             print(f"Weekly report sending failed: {e}")
             return False
     
-    def _calculate_streak(self, user_id: str) -> int:
-        """Calculate user's current streak"""
+    def _calculate_streak(self, user_id: str, today: date = None) -> int:
+        """Calculate user's current streak, 0 unless they logged today or yesterday in their time zone"""
         try:
-            mood_logs = supabase.table("mood_logs").select("created_at").eq("user_id", user_id).order("created_at", desc=True).execute()
+            today = today or user_today(supabase, user_id)
             
-            if not mood_logs.data:
-                return 0
+            # One row per day logged rather than one per log
+            rollups = supabase.table("mood_daily_rollups").select(
+                "local_date, entries, score_sum, positive_count, negative_count, neutral_count"
+            ).eq("user_id", user_id).execute()
             
-            streak = 0
-            current_date = datetime.now().date()
-            
-            for log in mood_logs.data:
-                log_date = datetime.fromisoformat(log["created_at"].replace('Z', '+00:00')).date()
-                if log_date == current_date or log_date == current_date - timedelta(days=streak):
-                    streak += 1
-                    current_date = log_date
-                else:
-                    break
-            
-            return streak
+            return summarize_rollups(rollups.data or [], as_of=today)["streak"]
             
         except Exception as e:
             print(f"Streak calculation failed: {e}")
@@ -0,0 +1,112 @@
+"""
+ONNX Runtime inference backend for the sentiment model
+Exports the classifier to ONNX once, applies dynamic int8 quantization and serves it on CPU
+"""
+
+import os
+import re
+import numpy as np
+import torch
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification
+
+try:
+    import onnxruntime as ort
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+except ImportError:
+    ort = None
+
+class OnnxSentimentPipeline:
+    """
+    Callable stand-in for the transformers sentiment-analysis pipeline
+    
+    Accepts a string or a list of strings plus the batch_size/truncation
+    keywords MoodAnalyzer passes, and returns the same [{"label", "score"}]
+    predictions. The exported graph is cached on disk per model revision,
+    so only the first start pays for export and quantization.
+    """
+    
+    def __init__(self, model_name, cache_dir, revision=None, quantize=True, intra_op_threads=0):
+        if ort is None:
+            raise ImportError("onnxruntime is required for the onnx sentiment backend (pip install onnxruntime)")
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, revision=revision)
+        self.max_length = min(self.tokenizer.model_max_length, 512)
+        self.quantize = quantize
+        
+        model_path = self._prepare_model(model_name, cache_dir, revision)
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {session_input.name for session_input in self.session.get_inputs()}
+    
+    def _prepare_model(self, model_name, cache_dir, revision):
+        """Export (and quantize) the model unless a cached copy exists, returning its path"""
+        # Only the config (labels, commit hash) is kept; PyTorch weights are loaded just for export
+        self.config = AutoConfig.from_pretrained(model_name, revision=revision)
+        
+        version = getattr(self.config, "_commit_hash", None) or revision or "unversioned"
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{model_name}-{version}")
+        export_dir = os.path.join(cache_dir, safe_name)
+        fp32_path = os.path.join(export_dir, "model.onnx")
+        int8_path = os.path.join(export_dir, "model.int8.onnx")
+        target_path = int8_path if self.quantize else fp32_path
+        if os.path.exists(target_path):
+            return target_path
+        
+        os.makedirs(export_dir, exist_ok=True)
+        if not os.path.exists(fp32_path):
+            print(f"Exporting {model_name} to ONNX...")
+            model = AutoModelForSequenceClassification.from_pretrained(model_name, revision=revision)
+            model.eval()
+            sample = self.tokenizer(["warming up", "export sample"], padding=True, return_tensors="pt")
+            with torch.no_grad():
+                torch.onnx.export(
+                    model,
+                    (sample["input_ids"], sample["attention_mask"]),
+                    fp32_path,
+                    input_names=["input_ids", "attention_mask"],
+                    output_names=["logits"],
+                    dynamic_axes={
+                        "input_ids": {0: "batch", 1: "sequence"},
+                        "attention_mask": {0: "batch", 1: "sequence"},
+                        "logits": {0: "batch"}
+                    },
+                    opset_version=17,
+                    dynamo=False
+                )
+        
+        if self.quantize:
+            print("Quantizing ONNX model weights to int8...")
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        return target_path
+    
+    def __call__(self, inputs, batch_size=None, truncation=True, **kwargs):
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        batch_size = batch_size or len(texts) or 1
+        
+        predictions = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=truncation,
+                max_length=self.max_length if truncation else None,
+                return_tensors="np"
+            )
+            feed = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            logits = self.session.run(["logits"], feed)[0]
+            
+            # Softmax over labels, as the transformers pipeline does for single-label models
+            logits = logits - logits.max(axis=-1, keepdims=True)
+            probabilities = np.exp(logits)
+            probabilities /= probabilities.sum(axis=-1, keepdims=True)
+            for row in probabilities:
+                label_id = int(row.argmax())
+                predictions.append({
+                    "label": self.config.id2label[label_id],
+                    "score": float(row[label_id])
+                })
+        return predictions
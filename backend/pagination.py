@@ -0,0 +1,118 @@
+"""
+Keyset pagination and sparse fieldsets for list endpoints
+Pages are ordered newest first by (created_at, id) and continue from an opaque cursor, so every page costs the same
+"""
+
+import base64
+import json
+import re
+from datetime import datetime
+
+# Columns every page selects, since the cursor is built from them
+KEYSET_COLUMNS = ("created_at", "id")
+
+_COLUMN = re.compile(r"^[a-z_][a-z0-9_]*$")
+_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+class PaginationError(ValueError):
+    """Raised for a malformed cursor, limit or fields parameter"""
+
+def parse_limit(value, default=50, maximum=200):
+    """Page size from a limit parameter, capped at maximum"""
+    if value in (None, ""):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise PaginationError("limit must be a positive integer")
+    if limit < 1:
+        raise PaginationError("limit must be a positive integer")
+    return min(limit, maximum)
+
+def parse_fields(value, allowed):
+    """
+    Columns to select for a fields parameter such as "id,name,email"
+    
+    Args:
+        value (str): Comma-separated column names, or empty for every column
+        allowed (iterable): Columns the endpoint may return
+    
+    Returns:
+        str: A select string, always including the keyset columns
+    
+    Raises:
+        PaginationError: A column is unknown or not allowed
+    """
+    if not value:
+        return "*"
+    columns = []
+    for column in [column.strip() for column in value.split(",")] + list(KEYSET_COLUMNS):
+        if not column or column in columns:
+            continue
+        if not _COLUMN.match(column) or column not in allowed:
+            raise PaginationError(f"Unknown field: {column}")
+        columns.append(column)
+    return ",".join(columns)
+
+def encode_cursor(row):
+    """Opaque cursor pointing just past row"""
+    payload = json.dumps([row["created_at"], str(row["id"])], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor made by encode_cursor"""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        # Validated so the values are safe to place in a PostgREST filter
+        datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        if not _ID.match(row_id):
+            raise ValueError(row_id)
+    except (TypeError, ValueError, AttributeError):
+        raise PaginationError("Invalid cursor")
+    return created_at, row_id
+
+def keyset_page(client, table, columns="*", filters=None, cursor=None, limit=50, include_total=False):
+    """
+    Fetch one page of a table, newest first
+    
+    Rows come in (created_at, id) descending order. A cursor restricts the
+    query to rows strictly after the one it was made from, so the database
+    seeks on the (created_at, id) index instead of skipping an offset.
+    
+    Args:
+        client: Supabase client
+        table (str): Table name
+        columns (str): Select string from parse_fields
+        filters (dict): Equality filters, column to value
+        cursor (str): next_cursor of the previous page
+        limit (int): Rows per page
+        include_total (bool): Also count every row matching filters
+    
+    Returns:
+        dict: rows, next_cursor (None on the last page) and total when asked for
+    """
+    after = decode_cursor(cursor) if cursor else None
+    
+    # On the first page the count comes with the rows; later pages count without the cursor condition
+    query = client.table(table).select(columns, count="exact" if include_total and after is None else None)
+    for column, value in (filters or {}).items():
+        query = query.eq(column, value)
+    if after is not None:
+        created_at, row_id = after
+        query = query.or_(
+            f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{row_id}")'
+        )
+    # One extra row tells whether another page follows
+    result = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+    
+    rows = result.data or []
+    page = {"rows": rows[:limit], "next_cursor": encode_cursor(rows[limit - 1]) if len(rows) > limit else None}
+    if include_total:
+        if after is None:
+            page["total"] = result.count
+        else:
+            count_query = client.table(table).select("id", count="exact", head=True)
+            for column, value in (filters or {}).items():
+                count_query = count_query.eq(column, value)
+            page["total"] = count_query.execute().count
+    return page
@@ -0,0 +1,366 @@
+"""
+Int8 weight-only quantized chat model stored as memory-mapped safetensors
+Prepare a local model directory once; workers then load it offline, verify its checksums and share its pages
+
+Usage:
+    python quantized_weights.py meta-llama/Llama-2-7b-chat-hf ~/.cache/moodmate/chatbot-int8
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import torch
+import torch.nn.functional as F
+from torch import nn
+from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+
+WEIGHTS_FILE = "model.int8.safetensors"
+MANIFEST_FILE = "quantization.json"
+CHECKSUM_FILE = "SHA256SUMS"
+
+# Size and modification time of each file when it last matched SHA256SUMS, so a
+# restart does not hash gigabytes of unchanged weights again
+VERIFIED_FILE = ".sha256-verified.json"
+
+# Modules kept in full precision: the output projection is the most sensitive to rounding
+SKIP_MODULES = ("lm_head",)
+
+SAFETENSORS_DTYPES = {
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool
+}
+
+# Every tensor in the weights file starts on this byte boundary; the fused
+# int8 kernel reads with vector loads that fault on unaligned memory
+TENSOR_ALIGNMENT = 64
+PADDING_PREFIX = "__padding"
+
+# Fused int8 x float matmul on CPU where this torch build has it
+_int8_matmul = getattr(torch, "_weight_int8pack_mm", None)
+
+class ChecksumError(Exception):
+    """Raised when a prepared model directory is incomplete or does not match its checksums"""
+    pass
+
+class Int8Linear(nn.Module):
+    """
+    Linear layer with int8 weights and one float scale per output channel
+    
+    The weight and scale tensors are used as given, so when they are views
+    of a memory-mapped file nothing is copied into process memory.
+    """
+    
+    def __init__(self, weight, scale, bias=None):
+        super().__init__()
+        self.in_features = weight.shape[1]
+        self.out_features = weight.shape[0]
+        self.register_buffer("weight", weight)
+        self.register_buffer("weight_scale", scale)
+        self.register_buffer("bias", bias)
+        self._fused = (
+            _int8_matmul is not None
+            and weight.data_ptr() % TENSOR_ALIGNMENT == 0
+            and scale.data_ptr() % TENSOR_ALIGNMENT == 0
+        )
+    
+    def forward(self, x):
+        flat = x.reshape(-1, self.in_features)
+        if self._fused and flat.dtype == self.weight_scale.dtype:
+            output = _int8_matmul(flat.contiguous(), self.weight, self.weight_scale)
+        else:
+            output = F.linear(flat, self.weight.to(flat.dtype) * self.weight_scale.to(flat.dtype)[:, None])
+        output = output.reshape(*x.shape[:-1], self.out_features)
+        if self.bias is not None:
+            output = output + self.bias.to(output.dtype)
+        return output
+
+def quantize_weight(weight):
+    """Symmetric per-output-channel int8 quantization, returning (int8 weight, scale)"""
+    weight = weight.detach().float()
+    scale = weight.abs().amax(dim=1).clamp(min=1e-8) / 127.0
+    quantized = torch.round(weight / scale[:, None]).clamp(-127, 127).to(torch.int8)
+    return quantized, scale
+
+def _quantizable_modules(model):
+    """Names of the nn.Linear modules to store as int8"""
+    return [
+        name for name, module in model.named_modules()
+        if isinstance(module, nn.Linear) and name.split(".")[-1] not in SKIP_MODULES
+    ]
+
+def sha256_file(path, chunk_size=8 * 1024 * 1024):
+    """Hex SHA-256 digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_checksums(model_dir):
+    """Write SHA256SUMS, in sha256sum format, for every file in model_dir"""
+    names = sorted(
+        name for name in os.listdir(model_dir)
+        if name not in (CHECKSUM_FILE, VERIFIED_FILE) and os.path.isfile(os.path.join(model_dir, name))
+    )
+    with open(os.path.join(model_dir, CHECKSUM_FILE), "w") as f:
+        for name in names:
+            f.write(f"{sha256_file(os.path.join(model_dir, name))}  {name}\n")
+    return names
+
+def _file_stamp(path):
+    """(size, modification time in ns) of a file, which change whenever it is rewritten"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def _read_verified(model_dir, checksums_digest):
+    """Stamps of files that matched the current SHA256SUMS on an earlier run in this directory; empty if there are none"""
+    try:
+        with open(os.path.join(model_dir, VERIFIED_FILE)) as f:
+            verified = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # A copied directory keeps modification times, so its stamps only count where they were written
+    if not isinstance(verified, dict) or verified.get("checksums") != checksums_digest \
+            or verified.get("model_dir") != os.path.realpath(model_dir):
+        return {}
+    return verified.get("files") or {}
+
+def _write_verified(model_dir, checksums_digest, stamps):
+    """Record the stamps of verified files; a read-only directory just means hashing again next time"""
+    path = os.path.join(model_dir, VERIFIED_FILE)
+    try:
+        with open(f"{path}.{os.getpid()}.tmp", "w") as f:
+            json.dump({"model_dir": os.path.realpath(model_dir), "checksums": checksums_digest, "files": stamps}, f)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+    except OSError as e:
+        print(f"Could not record verified checksums in {model_dir}, they will be hashed again on the next load: {e}")
+
+def verify_checksums(model_dir, full=False):
+    """
+    Check every file listed in SHA256SUMS against its digest
+    
+    A file whose size and modification time are unchanged since it last
+    matched is not hashed again, so only the first load after preparing or
+    copying the directory reads the whole weights file.
+    
+    Args:
+        model_dir (str): Prepared model directory
+        full (bool): Hash every file even if it matched before
+    
+    Returns:
+        list: Verified file names
+    
+    Raises:
+        ChecksumError: If the checksum file, the weights or any listed file is missing or differs
+    """
+    checksum_path = os.path.join(model_dir, CHECKSUM_FILE)
+    if not os.path.exists(checksum_path):
+        raise ChecksumError(f"{checksum_path} not found; prepare the model directory first")
+    
+    expected = {}
+    with open(checksum_path) as f:
+        for line in f:
+            if line.strip():
+                digest, name = line.rstrip("\n").split(None, 1)
+                expected[name.lstrip("*")] = digest
+    for required in (WEIGHTS_FILE, MANIFEST_FILE):
+        if required not in expected:
+            raise ChecksumError(f"{CHECKSUM_FILE} does not list {required}")
+    
+    checksums_digest = sha256_file(checksum_path)
+    verified = {} if full else _read_verified(model_dir, checksums_digest)
+    stamps = {}
+    for name, digest in expected.items():
+        path = os.path.join(model_dir, name)
+        if not os.path.exists(path):
+            raise ChecksumError(f"{name} is missing from {model_dir}")
+        stamp = _file_stamp(path)
+        if verified.get(name) != stamp and sha256_file(path) != digest:
+            raise ChecksumError(f"Checksum mismatch for {name}")
+        stamps[name] = stamp
+    if stamps != verified:
+        _write_verified(model_dir, checksums_digest, stamps)
+    return sorted(expected)
+
+def save_aligned_safetensors(tensors, path):
+    """
+    Write tensors in the safetensors format with each one starting on a TENSOR_ALIGNMENT boundary
+    
+    The format has no holes between tensors, so the gaps are filled with
+    small uint8 padding tensors that mmap_safetensors skips.
+    """
+    dtype_names = {dtype: name for name, dtype in SAFETENSORS_DTYPES.items()}
+    header, chunks, offset = {}, [], 0
+    for index, (name, tensor) in enumerate(tensors.items()):
+        gap = -offset % TENSOR_ALIGNMENT
+        if gap:
+            header[f"{PADDING_PREFIX}_{index}"] = {"dtype": "U8", "shape": [gap], "data_offsets": [offset, offset + gap]}
+            chunks.append(bytes(gap))
+            offset += gap
+        raw = tensor.detach().contiguous().reshape(-1).view(torch.uint8).numpy()
+        header[name] = {"dtype": dtype_names[tensor.dtype], "shape": list(tensor.shape), "data_offsets": [offset, offset + raw.nbytes]}
+        chunks.append(raw)
+        offset += raw.nbytes
+    
+    # Pad the header with spaces so the data starts aligned as well
+    encoded = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    encoded += b" " * (-(8 + len(encoded)) % TENSOR_ALIGNMENT)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(encoded)))
+        f.write(encoded)
+        for chunk in chunks:
+            f.write(chunk)
+
+def mmap_safetensors(path):
+    """
+    Open a safetensors file as tensors backed by a private memory map
+    
+    Pages are read from the page cache on first use and shared by every
+    process that maps the same file, as long as the tensors are not written.
+    """
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    header.pop("__metadata__", None)
+    
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    data = torch.empty(0, dtype=torch.uint8).set_(storage)
+    start_of_data = 8 + header_size
+    
+    tensors = {}
+    for name, info in header.items():
+        if name.startswith(PADDING_PREFIX):
+            continue
+        start, end = info["data_offsets"]
+        raw = data[start_of_data + start:start_of_data + end]
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        if (start_of_data + start) % dtype.itemsize:
+            # Misaligned tensors cannot be viewed in place
+            raw = raw.clone()
+        tensors[name] = raw.view(dtype).reshape(info["shape"])
+    return tensors
+
+def prepare_quantized_model(model_name, output_dir, dtype=torch.bfloat16):
+    """
+    Quantize a causal LM and write it, with its tokenizer and checksums, to output_dir
+    
+    Run once per node or image build; it is the only step that may download.
+    Linear layers are stored as int8 with per-channel scales, every other
+    tensor in dtype.
+    
+    Returns:
+        str: Path of the written weights file
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+    model.eval()
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+    
+    quantized = _quantizable_modules(model)
+    tensors = {}
+    for name in quantized:
+        module = model.get_submodule(name)
+        weight, scale = quantize_weight(module.weight)
+        tensors[f"{name}.weight"] = weight
+        tensors[f"{name}.weight_scale"] = scale.to(dtype)
+        if module.bias is not None:
+            tensors[f"{name}.bias"] = module.bias.detach().to(dtype)
+    
+    # Tied parameters are stored once and re-tied on load
+    quantized_names = set(quantized)
+    seen = set()
+    for name, tensor in model.state_dict().items():
+        if name.rsplit(".", 1)[0] in quantized_names or tensor.data_ptr() in seen:
+            continue
+        seen.add(tensor.data_ptr())
+        tensors[name] = tensor.detach().to(dtype) if tensor.is_floating_point() else tensor.detach()
+    
+    weights_path = os.path.join(output_dir, WEIGHTS_FILE)
+    save_aligned_safetensors(tensors, weights_path)
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as f:
+        json.dump({
+            "source_model": model_name,
+            "format": "int8-weight-only",
+            "dtype": str(dtype).replace("torch.", ""),
+            "modules": quantized
+        }, f, indent=2)
+    write_checksums(output_dir)
+    return weights_path
+
+def load_quantized_model(model_dir, verify=True, full_verify=False):
+    """
+    Load a directory written by prepare_quantized_model without network access
+    
+    The model is built without initializing its weights, each listed linear
+    layer is swapped for an Int8Linear over the memory-mapped tensors, and
+    the remaining tensors are assigned in place from the same map.
+    
+    Args:
+        model_dir (str): Prepared model directory
+        verify (bool): Check SHA256SUMS before loading
+        full_verify (bool): Hash every file, even those unchanged since they last matched
+    
+    Returns:
+        tuple: (model, tokenizer, manifest)
+    """
+    try:
+        from transformers.initialization import no_init_weights
+    except ImportError:
+        from transformers.modeling_utils import no_init_weights
+    
+    if verify:
+        verify_checksums(model_dir, full=full_verify)
+    with open(os.path.join(model_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    dtype = getattr(torch, manifest["dtype"])
+    
+    tokenizer = AutoTokenizer.from_pretrained(model_dir, local_files_only=True)
+    config = AutoConfig.from_pretrained(model_dir, local_files_only=True)
+    with no_init_weights():
+        # Uninitialized full-precision weights are allocated but never touched, then replaced below
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=dtype)
+    
+    tensors = mmap_safetensors(os.path.join(model_dir, WEIGHTS_FILE))
+    for name in manifest["modules"]:
+        parent_name, _, child_name = name.rpartition(".")
+        parent = model.get_submodule(parent_name) if parent_name else model
+        setattr(parent, child_name, Int8Linear(
+            tensors.pop(f"{name}.weight"),
+            tensors.pop(f"{name}.weight_scale"),
+            tensors.pop(f"{name}.bias", None)
+        ))
+    
+    missing, unexpected = model.load_state_dict(tensors, strict=False, assign=True)
+    quantized = set(manifest["modules"])
+    missing = [name for name in missing if name.rsplit(".", 1)[0] not in quantized]
+    if getattr(config, "tie_word_embeddings", False):
+        model.tie_weights()
+        missing = [name for name in missing if not name.startswith(SKIP_MODULES)]
+    if missing or unexpected:
+        raise ChecksumError(f"Weights do not match the model: missing {missing[:5]}, unexpected {unexpected[:5]}")
+    
+    model.eval()
+    return model, tokenizer, manifest
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("model", help="model name or local path to quantize")
+    parser.add_argument("output_dir", help="directory to write the prepared model to")
+    parser.add_argument("--dtype", default="bfloat16", choices=["bfloat16", "float16", "float32"], help="dtype of the tensors that stay in floating point")
+    args = parser.parse_args()
+    
+    weights_path = prepare_quantized_model(args.model, args.output_dir, dtype=getattr(torch, args.dtype))
+    print(f"Wrote {weights_path} ({os.path.getsize(weights_path) / 1024 ** 2:.1f} MB) and {CHECKSUM_FILE}")
+
+if __name__ == "__main__":
+    main()
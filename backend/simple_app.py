@@ -2,6 +2,7 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
 from simple_chatbot import chatbot
+import lexicon
 
 app = Flask(__name__)
 CORS(app)
@@ -23,26 +24,11 @@ def analyze():
             return jsonify({"error": "No text provided"}), 400
         
         # Simple keyword-based sentiment analysis
-        positive_words = ['good', 'great', 'happy', 'joy', 'love', 'amazing', 'wonderful', 'excellent', 'fantastic', 'awesome', 'beautiful', 'perfect', 'wonderful', 'delighted', 'pleased', 'content', 'satisfied', 'grateful', 'blessed', 'lucky', 'fortunate']
-        negative_words = ['bad', 'terrible', 'awful', 'horrible', 'sad', 'angry', 'frustrated', 'disappointed', 'upset', 'worried', 'anxious', 'stressed', 'depressed', 'miserable', 'unhappy', 'annoyed', 'irritated', 'furious', 'devastated', 'heartbroken']
-        
-        text_lower = text.lower()
-        positive_count = sum(1 for word in positive_words if word in text_lower)
-        negative_count = sum(1 for word in negative_words if word in text_lower)
-        
-        if positive_count > negative_count:
-            sentiment = "positive"
-            score = min(0.9, 0.5 + (positive_count * 0.1))
-        elif negative_count > positive_count:
-            sentiment = "negative"
-            score = min(0.9, 0.5 + (negative_count * 0.1))
-        else:
-            sentiment = "neutral"
-            score = 0.5
+        result = lexicon.classify(text)
         
         return jsonify({
-            "sentiment": sentiment,
-            "score": round(score, 2)
+            "sentiment": result["sentiment"],
+            "score": result["score"]
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -4,7 +4,20 @@ This is a lightweight alternative to the heavy Llama 2 model
 """
 
 import random
-import re
+from lexicon import KeywordMatcher
+from crisis import CRISIS_KEYWORDS, CRISIS_RESPONSES, EMERGENCY_RESOURCES
+
+# Intent keywords in priority order: the first intent with a match picks the response
+INTENT_KEYWORDS = {
+    'crisis': [keyword for keywords in CRISIS_KEYWORDS.values() for keyword in keywords],
+    'greeting': ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening'],
+    'positive': ['good', 'great', 'happy', 'excited', 'wonderful', 'amazing', 'fantastic', 'joyful', 'content'],
+    'negative': ['bad', 'terrible', 'awful', 'horrible', 'sad', 'depressed', 'miserable', 'hopeless'],
+    'anxiety': ['anxious', 'anxiety', 'worried', 'nervous', 'panic', 'overwhelmed', 'stressed'],
+    'depression': ['depressed', 'depression', 'down', 'low', 'empty', 'numb', 'worthless'],
+    'stress': ['stress', 'stressed', 'pressure', 'overwhelmed', 'burnout', 'exhausted'],
+    'support': ['help', 'support', 'advice', 'guidance', 'counseling', 'therapy']
+}
 
 class SimpleMentalHealthChatbot:
     def __init__(self):
@@ -39,11 +52,7 @@ class SimpleMentalHealthChatbot:
                 "I understand stress can be overwhelming. What activities help you feel more relaxed?",
                 "Stress is a normal part of life, but it's important to manage it. What coping strategies work best for you?"
             ],
-            'crisis': [
-                "I'm concerned about your safety. If you're having thoughts of self-harm, please reach out to a mental health professional or emergency services immediately.",
-                "Your safety is the most important thing. Please contact a crisis helpline or emergency services if you're in immediate danger.",
-                "If you're in crisis, please call your local emergency number or a mental health crisis line. You deserve support and care."
-            ],
+            'crisis': CRISIS_RESPONSES,
             'support': [
                 "You're taking an important step by seeking support. That shows strength and self-awareness.",
                 "It's brave of you to reach out. Remember, seeking help is a sign of strength, not weakness.",
@@ -72,53 +81,20 @@ class SimpleMentalHealthChatbot:
             "Engage in activities you enjoy",
             "Practice relaxation techniques like progressive muscle relaxation"
         ]
+        
+        self.intent_matcher = KeywordMatcher(INTENT_KEYWORDS)
+    
+    def detect_intent(self, user_input):
+        """Return the highest-priority intent found in user_input, or 'default'"""
+        return self.intent_matcher.first_category(user_input) or 'default'
+    
+    def detect_intents(self, user_inputs):
+        """Detect the intent of each message in a batch"""
+        return [self.detect_intent(user_input) for user_input in user_inputs]
     
     def generate_response(self, user_input, context=""):
         """Generate a response based on user input"""
-        user_input_lower = user_input.lower()
-        
-        # Check for crisis keywords
-        crisis_keywords = ['suicide', 'kill myself', 'end it all', 'not worth living', 'want to die']
-        if any(keyword in user_input_lower for keyword in crisis_keywords):
-            return random.choice(self.responses['crisis'])
-        
-        # Check for greeting
-        greeting_keywords = ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening']
-        if any(keyword in user_input_lower for keyword in greeting_keywords):
-            return random.choice(self.responses['greeting'])
-        
-        # Check for positive emotions
-        positive_keywords = ['good', 'great', 'happy', 'excited', 'wonderful', 'amazing', 'fantastic', 'joyful', 'content']
-        if any(keyword in user_input_lower for keyword in positive_keywords):
-            return random.choice(self.responses['positive'])
-        
-        # Check for negative emotions
-        negative_keywords = ['bad', 'terrible', 'awful', 'horrible', 'sad', 'depressed', 'miserable', 'hopeless']
-        if any(keyword in user_input_lower for keyword in negative_keywords):
-            return random.choice(self.responses['negative'])
-        
-        # Check for anxiety
-        anxiety_keywords = ['anxious', 'anxiety', 'worried', 'nervous', 'panic', 'overwhelmed', 'stressed']
-        if any(keyword in user_input_lower for keyword in anxiety_keywords):
-            return random.choice(self.responses['anxiety'])
-        
-        # Check for depression
-        depression_keywords = ['depressed', 'depression', 'down', 'low', 'empty', 'numb', 'worthless']
-        if any(keyword in user_input_lower for keyword in depression_keywords):
-            return random.choice(self.responses['depression'])
-        
-        # Check for stress
-        stress_keywords = ['stress', 'stressed', 'pressure', 'overwhelmed', 'burnout', 'exhausted']
-        if any(keyword in user_input_lower for keyword in stress_keywords):
-            return random.choice(self.responses['stress'])
-        
-        # Check for support seeking
-        support_keywords = ['help', 'support', 'advice', 'guidance', 'counseling', 'therapy']
-        if any(keyword in user_input_lower for keyword in support_keywords):
-            return random.choice(self.responses['support'])
-        
-        # Default response
-        return random.choice(self.responses['default'])
+        return random.choice(self.responses[self.detect_intent(user_input)])
     
     def get_mental_health_tips(self):
         """Get mental health tips"""
@@ -126,12 +102,7 @@ class SimpleMentalHealthChatbot:
     
     def get_emergency_resources(self):
         """Get emergency mental health resources"""
-        return {
-            "crisis_helpline": "988 (Suicide & Crisis Lifeline)",
-            "text_line": "Text HOME to 741741 (Crisis Text Line)",
-            "emergency": "911 (Emergency Services)",
-            "message": "If you're in immediate danger, please call emergency services or go to your nearest emergency room."
-        }
+        return dict(EMERGENCY_RESOURCES)
 
 # Global chatbot instance
 chatbot = SimpleMentalHealthChatbot()
@@ -0,0 +1,220 @@
+"""
+Speculative decoding for the chat model
+A small draft model proposes a few tokens and the chat model checks them all in one forward pass
+"""
+
+import time
+import torch
+from transformers import DynamicCache
+from generation import GenerationScheduler, warped_probabilities
+
+def compatible_tokenizers(tokenizer, draft_tokenizer):
+    """Whether the draft model's token ids mean the same text as the chat model's"""
+    return tokenizer.get_vocab() == draft_tokenizer.get_vocab()
+
+def speculative_accept(target_probs, draft_probs, draft_tokens):
+    """
+    Decide how many drafted tokens to keep and pick the token that follows them
+    
+    Each drafted token d is kept with probability min(1, p(d) / q(d)). The
+    first rejected one is replaced by a sample from the leftover mass
+    max(0, p - q), and if every draft is kept a bonus token is sampled from
+    the last target distribution. Tokens produced this way follow the target
+    distribution exactly, whatever the draft proposes.
+    
+    Args:
+        target_probs (torch.Tensor): Target distributions [k + 1, vocab], one per draft plus the bonus position
+        draft_probs (torch.Tensor): Draft distributions [k, vocab] the drafts were sampled from
+        draft_tokens (list): The k drafted token ids
+    
+    Returns:
+        tuple: (number of drafts accepted, next token id)
+    """
+    for index, token in enumerate(draft_tokens):
+        p = target_probs[index, token].item()
+        q = draft_probs[index, token].item()
+        if q > 0 and torch.rand(1).item() < min(1.0, p / q):
+            continue
+        residual = (target_probs[index] - draft_probs[index]).clamp(min=0)
+        if residual.sum() <= 0:
+            residual = target_probs[index]
+        return index, int(torch.multinomial(residual / residual.sum(), num_samples=1)[0])
+    return len(draft_tokens), int(torch.multinomial(target_probs[-1], num_samples=1)[0])
+
+def _truncate_cache(cache, length):
+    """Cache holding only the first length positions of cache"""
+    return DynamicCache([(layer.keys[:, :, :length], layer.values[:, :, :length]) for layer in cache.layers])
+
+class SpeculativeScheduler(GenerationScheduler):
+    """
+    Serves generate calls one at a time with speculative decoding
+    
+    Each round the draft model proposes num_draft_tokens tokens, the chat
+    model scores the current token and all proposals in a single forward
+    pass, and speculative_accept keeps the agreeing prefix plus one token
+    of its own. A round therefore costs one chat model forward and yields
+    between 1 and num_draft_tokens + 1 tokens. Greedy decoding uses one-hot
+    distributions, so it returns exactly what plain greedy decoding would.
+    
+    Requests are decoded one after another rather than batched, so this
+    trades the aggregate throughput of GenerationScheduler for lower
+    per-token latency on a single stream. It has the same submit, stats and
+    shutdown interface.
+    """
+    
+    def __init__(self, model, draft_model, eos_token_id, num_draft_tokens=4, max_queue_size=64,
+                 do_sample=True, temperature=0.7, top_k=50, top_p=0.9, name="speculative-scheduler"):
+        super().__init__(
+            model, eos_token_id, max_batch_size=1, max_queue_size=max_queue_size,
+            do_sample=do_sample, temperature=temperature, top_k=top_k, top_p=top_p, name=name
+        )
+        self.draft_model = draft_model
+        self.num_draft_tokens = max(1, num_draft_tokens)
+        self.baseline_ms_per_token = None
+        self._stats.update({
+            "proposed": 0,
+            "accepted": 0,
+            "target_forwards": 0,
+            "draft_forwards": 0,
+            "decode_tokens": 0,
+            "decode_seconds": 0.0
+        })
+    
+    def calibrate(self, input_ids, steps=16):
+        """Measure plain one-token-per-forward decoding on the chat model as the speedup baseline"""
+        with torch.no_grad():
+            outputs = self.model(input_ids=input_ids, use_cache=True)
+            started = time.monotonic()
+            for _ in range(steps):
+                outputs = self.model(
+                    input_ids=outputs.logits[:, -1:, :].argmax(dim=-1),
+                    past_key_values=outputs.past_key_values,
+                    use_cache=True
+                )
+            self.baseline_ms_per_token = (time.monotonic() - started) * 1000 / steps
+        return self.baseline_ms_per_token
+    
+    def _run(self):
+        """Worker loop: decode queued requests one at a time"""
+        while True:
+            with self._condition:
+                while self._running and not self._waiting:
+                    self._condition.wait()
+                if not self._running:
+                    break
+                request = self._waiting.popleft()
+                self._active = [request]
+            
+            started = time.monotonic()
+            try:
+                with torch.no_grad():
+                    self._decode(request)
+            except Exception as e:
+                print(f"Error in {self.name}: {e}")
+                self._fail(request, e)
+            with self._condition:
+                self._active = []
+                self._stats["busy_seconds"] += time.monotonic() - started
+        
+        error = RuntimeError(f"{self.name} is shut down")
+        for request in list(self._waiting):
+            self._fail(request, error)
+    
+    def _distribution(self, logits):
+        """Token distributions for rows of logits, one-hot on the argmax when not sampling"""
+        if not self.do_sample:
+            return torch.nn.functional.one_hot(logits.argmax(dim=-1), logits.shape[-1]).float()
+        return warped_probabilities(logits.float(), self.temperature, self.top_k, self.top_p)
+    
+    def _decode(self, request):
+        """Prefill the chat model, then run draft-and-verify rounds until the request finishes"""
+        reason = self._finish_reason(request)
+        if reason is not None:
+            self._complete(request, reason)
+            return
+        
+        cache = request.past_key_values
+        request.past_key_values = None
+        cached_length = cache.get_seq_length() if cache is not None else 0
+        outputs = self.model(
+            input_ids=request.input_ids[:, cached_length:],
+            past_key_values=cache if cache is not None else DynamicCache(),
+            use_cache=True
+        )
+        target_cache = outputs.past_key_values
+        token = int(self._sample(outputs.logits[:, -1, :])[0])
+        with self._condition:
+            self._stats["target_forwards"] += 1
+        if self._record_token(request, token):
+            return
+        
+        # The chat model has seen all of sequence but its last token, the draft its first draft_length
+        sequence = request.input_ids[0].tolist() + [token]
+        draft_cache = DynamicCache()
+        draft_length = 0
+        while True:
+            started = time.monotonic()
+            count = min(self.num_draft_tokens, request.max_new_tokens - len(request.tokens))
+            pending = torch.tensor([sequence[draft_length:]])
+            drafts, draft_probs = [], []
+            for _ in range(count):
+                outputs = self.draft_model(input_ids=pending, past_key_values=draft_cache, use_cache=True)
+                draft_cache = outputs.past_key_values
+                probs = self._distribution(outputs.logits[:, -1, :])
+                drafts.append(int(torch.multinomial(probs, num_samples=1)[0]))
+                draft_probs.append(probs[0])
+                pending = torch.tensor([drafts[-1:]])
+            draft_length = len(sequence) + count - 1
+            
+            outputs = self.model(
+                input_ids=torch.tensor([sequence[-1:] + drafts]),
+                past_key_values=target_cache,
+                use_cache=True
+            )
+            accepted, token = speculative_accept(
+                self._distribution(outputs.logits[0]), torch.stack(draft_probs), drafts
+            )
+            new_tokens = drafts[:accepted] + [token]
+            sequence += new_tokens
+            
+            # Forget the rejected drafts in both caches
+            target_cache = _truncate_cache(outputs.past_key_values, len(sequence) - 1)
+            draft_length = min(draft_length, len(sequence) - 1)
+            draft_cache = _truncate_cache(draft_cache, draft_length)
+            
+            with self._condition:
+                self._stats["steps"] += 1
+                self._stats["step_rows"] += 1
+                self._stats["largest_batch"] = 1
+                self._stats["target_forwards"] += 1
+                self._stats["draft_forwards"] += count
+                self._stats["proposed"] += count
+                self._stats["accepted"] += accepted
+                self._stats["decode_tokens"] += len(new_tokens)
+                self._stats["decode_seconds"] += time.monotonic() - started
+            
+            for token in new_tokens:
+                if self._record_token(request, token):
+                    return
+    
+    def stats(self):
+        """Return the scheduler counters plus acceptance rate and measured speedup"""
+        stats = super().stats()
+        with self._condition:
+            counters = dict(self._stats)
+        ms_per_token = counters["decode_seconds"] * 1000 / counters["decode_tokens"] if counters["decode_tokens"] else None
+        speedup = self.baseline_ms_per_token / ms_per_token if ms_per_token and self.baseline_ms_per_token else None
+        stats.update({
+            "mode": "speculative",
+            "draft_tokens": self.num_draft_tokens,
+            "proposed": counters["proposed"],
+            "accepted": counters["accepted"],
+            "acceptance_rate": round(counters["accepted"] / counters["proposed"], 4) if counters["proposed"] else 0,
+            "target_forwards": counters["target_forwards"],
+            "draft_forwards": counters["draft_forwards"],
+            "tokens_per_target_forward": round(counters["decode_tokens"] / counters["steps"], 2) if counters["steps"] else 0,
+            "ms_per_token": round(ms_per_token, 2) if ms_per_token else None,
+            "baseline_ms_per_token": round(self.baseline_ms_per_token, 2) if self.baseline_ms_per_token else None,
+            "estimated_speedup": round(speedup, 2) if speedup else None
+        })
+        return stats
@@ -5,7 +5,7 @@ MoodMate AI Backend Startup Script
 
 import os
 import sys
-from app import app
+from app import app, chat_writer, rollup_refresher
 
 if __name__ == "__main__":
     # Check if .env file exists
@@ -26,11 +26,15 @@ if __name__ == "__main__":
     
     print("🚀 Starting MoodMate AI Backend...")
     print("✅ Environment variables loaded")
-    print("🧠 Loading AI model (this may take a moment)...")
+    print("🧠 AI model is loading in the background (poll /ready until it reports ready)...")
     
-    # Start the Flask app
+    # Start the Flask app, the daily rollup catch-up job and the chat writer, which replays
+    # transcripts a crashed process left spooled
+    rollup_refresher.start()
+    chat_writer.start()
     port = int(os.getenv("PORT", 5000))
     print(f"🌐 Server starting on http://localhost:{port}")
     print("📊 Health check: http://localhost:5000/health")
+    print("🚦 Readiness check: http://localhost:5000/ready")
     
     app.run(host="0.0.0.0", port=port, debug=True)
@@ -4,14 +4,25 @@ Test suite for MoodMate AI backend
 
 import unittest
 import json
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, ANY
 import sys
 import os
+from datetime import date, datetime, timedelta
 
 # Add the backend directory to the path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app import app
+from app import app, mood_analyzer, sentiment_cascade, save_crisis_event, chat_budget, chat_queue
+from batching import QueueFullError
+from fair_queue import QuotaExceededError
+from werkzeug.middleware.proxy_fix import ProxyFix
+from auth import generate_jwt_token
+from conversation import SessionAccessError
+
+USER_ID = "7b1f5c2e-4d3a-4c8b-9e21-5a6f0d9c3b10"
+SESSION_ID = "c3e8a4d2-9b17-4f6e-8a05-2d4b6e1f7a93"
+AUTH = {"Authorization": f"Bearer {generate_jwt_token(USER_ID)}"}
+ADMIN_AUTH = {"Authorization": f"Bearer {generate_jwt_token(USER_ID, 'admin')}"}
 
 class TestMoodMateAPI(unittest.TestCase):
     """Test cases for the MoodMate AI API"""
@@ -31,6 +42,8 @@ class TestMoodMateAPI(unittest.TestCase):
     @patch('app.supabase')
     def test_analyze_sentiment_success(self, mock_supabase):
         """Test sentiment analysis endpoint with valid input"""
+        # The model loads in the background; wait for it like a readiness probe would
+        self.assertTrue(mood_analyzer.wait_until_ready(timeout=600))
         test_data = {
             "text": "I'm feeling great today!"
         }
@@ -44,6 +57,119 @@ class TestMoodMateAPI(unittest.TestCase):
         self.assertIn('sentiment', data)
         self.assertIn('score', data)
         self.assertIsInstance(data['score'], float)
+        self.assertEqual(data['tier'], 'model')
+    
+    def test_analyze_confident_lexicon_skips_model(self):
+        """Test strongly worded entries are answered by the lexicon tier"""
+        test_data = {"text": "Such a wonderful, happy day, I feel so grateful"}
+        
+        with patch.object(sentiment_cascade, 'model_analyzer') as mock_analyzer:
+            response = self.app.post('/analyze',
+                                   data=json.dumps(test_data),
+                                   content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['sentiment'], 'positive')
+        self.assertEqual(data['tier'], 'lexicon')
+        mock_analyzer.analyze_async.assert_not_called()
+    
+    @patch('app.sentiment_cascade')
+    @patch('app.mood_analyzer')
+    def test_analyze_batch_success(self, mock_analyzer, mock_cascade):
+        """Test batch sentiment analysis returns results in input order"""
+        mock_analyzer.is_ready = True
+        mock_cascade.analyze_many.return_value = [
+            {"sentiment": "positive", "score": 0.98},
+            {"error": "No text provided"},
+            {"sentiment": "negative", "score": 0.91}
+        ]
+        test_data = {
+            "texts": ["Great day at the park", "", "Stressed about work"],
+            "batch_size": 2
+        }
+        
+        response = self.app.post('/analyze/batch',
+                               data=json.dumps(test_data),
+                               content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['errors'], 1)
+        self.assertEqual(data['results'][0]['sentiment'], 'positive')
+        self.assertIn('error', data['results'][1])
+        mock_cascade.analyze_many.assert_called_once_with(test_data['texts'], batch_size=2, escalate=True)
+    
+    @patch('app.mood_analyzer')
+    def test_analyze_batch_while_model_loading(self, mock_analyzer):
+        """Test lexicon-resolvable texts are answered while the model loads and only the rest are turned away"""
+        mock_analyzer.is_ready = False
+        mock_analyzer.readiness.return_value = {"status": "loading"}
+        
+        with patch.object(sentiment_cascade, 'model_analyzer') as model:
+            response = self.app.post('/analyze/batch',
+                                   data=json.dumps({"texts": ["happy, grateful and feeling great", "not happy, not good"]}),
+                                   content_type='application/json')
+            only_model = self.app.post('/analyze/batch',
+                                     data=json.dumps({"texts": ["meh"]}),
+                                     content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['results'][0]['tier'], 'lexicon')
+        self.assertTrue(data['results'][1]['escalated'])
+        self.assertEqual((data['errors'], data['not_ready']), (1, 1))
+        self.assertIn('Retry-After', response.headers)
+        self.assertEqual(only_model.status_code, 503)
+        model.analyze_many.assert_not_called()
+    
+    @patch('app.mood_analyzer')
+    def test_analyze_stats(self, mock_analyzer):
+        """Test sentiment stats endpoint exposes micro-batcher and cache counters"""
+        mock_analyzer.batcher.stats.return_value = {"max_batch_size": 16, "queue_depth": 0}
+        mock_analyzer.cache.stats.return_value = {"hits": 3, "misses": 1}
+        
+        response = self.app.get('/analyze/stats')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['batcher']['max_batch_size'], 16)
+        self.assertEqual(data['cache']['hits'], 3)
+    
+    def test_analyze_batch_no_texts(self):
+        """Test batch sentiment analysis with no texts provided"""
+        response = self.app.post('/analyze/batch',
+                               data=json.dumps({"texts": []}),
+                               content_type='application/json')
+        
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data)
+        self.assertIn('error', data)
+    
+    @patch('app.mood_analyzer')
+    def test_analyze_while_model_loading(self, mock_analyzer):
+        """Test sentiment analysis fails fast with Retry-After until the model is ready"""
+        mock_analyzer.is_ready = False
+        mock_analyzer.readiness.return_value = {"status": "loading"}
+        
+        response = self.app.post('/analyze',
+                               data=json.dumps({"text": "Feeling calm"}),
+                               content_type='application/json')
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+        self.assertEqual(json.loads(response.data)['status'], 'loading')
+        mock_analyzer.analyze_async.assert_not_called()
+    
+    @patch('app.mood_analyzer')
+    def test_ready_endpoint(self, mock_analyzer):
+        """Test readiness reflects the model loading state"""
+        for status, expected_code in [("loading", 503), ("failed", 503), ("ready", 200)]:
+            mock_analyzer.readiness.return_value = {"status": status, "error": None}
+            response = self.app.get('/ready')
+            self.assertEqual(response.status_code, expected_code)
+            self.assertEqual(json.loads(response.data)['status'], status)
     
     def test_analyze_sentiment_no_text(self):
         """Test sentiment analysis with no text provided"""
@@ -57,6 +183,350 @@ class TestMoodMateAPI(unittest.TestCase):
         data = json.loads(response.data)
         self.assertIn('error', data)
     
+    @patch('app.chatbot')
+    def test_chat_stream_sends_tokens_as_events(self, mock_chatbot):
+        """Test chat replies stream as SSE token events followed by a done event"""
+        stream = MagicMock()
+        stream.__iter__.return_value = iter(["Take a", " slow breath."])
+        mock_chatbot.stream_response.return_value = stream
+        
+        response = self.app.post('/chat/stream',
+                               data=json.dumps({"message": "I feel anxious"}),
+                               content_type='application/json')
+        body = response.get_data(as_text=True)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        events = [block.split("\n") for block in body.strip().split("\n\n")]
+        self.assertEqual([lines[0] for lines in events], ["event: token", "event: token", "event: done"])
+        self.assertEqual(json.loads(events[1][1][len("data: "):]), {"text": " slow breath."})
+        self.assertEqual(json.loads(events[2][1][len("data: "):]), {"response": "Take a slow breath."})
+        mock_chatbot.stream_response.assert_called_once_with("I feel anxious", "")
+        stream.close.assert_called_once()
+    
+    @patch('app.conversation_memory')
+    @patch('app.chatbot')
+    def test_chat_with_session_history(self, mock_chatbot, mock_memory):
+        """Test session chats build context from stored history and record the new turn"""
+        mock_memory.start_session.return_value = SESSION_ID
+        mock_memory.build_context.return_value = ("User: hi\nAssistant: hello", {"turns": 2})
+        mock_chatbot.is_ready = True
+        mock_chatbot.generate_response.return_value = "Breathe slowly."
+        
+        with patch.object(chat_budget, 'llm', mock_chatbot):
+            response = self.app.post('/chat',
+                                   data=json.dumps({"message": "I feel anxious", "user_id": USER_ID}),
+                                   content_type='application/json', headers=AUTH)
+        data = json.loads(response.data)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['session_id'], SESSION_ID)
+        self.assertEqual(data['engine'], "llm")
+        mock_memory.start_session.assert_called_once_with(USER_ID)
+        mock_chatbot.generate_response.assert_called_once_with("I feel anxious", "User: hi\nAssistant: hello", timeout=ANY)
+        mock_memory.record_turn.assert_called_once_with(SESSION_ID, USER_ID, "I feel anxious", "Breathe slowly.", cache=True)
+    
+    @patch('app.conversation_memory')
+    @patch('app.chatbot')
+    def test_chat_stream_records_completed_turn(self, mock_chatbot, mock_memory):
+        """Test a streamed reply is stored in the session once it completes"""
+        mock_memory.build_context.return_value = ("", {"turns": 0})
+        stream = MagicMock()
+        stream.__iter__.return_value = iter(["Take a", " slow breath."])
+        mock_chatbot.stream_response.return_value = stream
+        
+        response = self.app.post('/chat/stream',
+                               data=json.dumps({"message": "I feel anxious", "session_id": SESSION_ID, "user_id": USER_ID}),
+                               content_type='application/json', headers=AUTH)
+        body = response.get_data(as_text=True)
+        
+        self.assertIn(f'"session_id": "{SESSION_ID}"', body)
+        mock_memory.start_session.assert_not_called()
+        mock_memory.authorize.assert_called_once_with(SESSION_ID, USER_ID)
+        mock_memory.build_context.assert_called_once_with(SESSION_ID, USER_ID)
+        mock_memory.record_turn.assert_called_once_with(SESSION_ID, USER_ID, "I feel anxious", "Take a slow breath.")
+    
+    @patch('app.conversation_memory')
+    @patch('app.chatbot')
+    def test_chat_rejects_ids_that_are_not_uuids(self, mock_chatbot, mock_memory):
+        """Test a malformed session or user id is refused before anything is queued for the database"""
+        for route in ('/chat', '/chat/stream'):
+            for body, field in (({"session_id": "not-a-uuid"}, "session_id"), ({"user_id": "user-1"}, "user_id")):
+                response = self.app.post(route, data=json.dumps(dict(body, message="hello")), content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(json.loads(response.data)["error"], f"{field} must be a UUID")
+        mock_memory.record_turn.assert_not_called()
+        mock_chatbot.stream_response.assert_not_called()
+    
+    @patch('app.conversation_memory')
+    @patch('app.chatbot')
+    def test_chat_sessions_belong_to_the_signed_in_user(self, mock_chatbot, mock_memory):
+        """Test sessions are refused to anonymous callers and to users who do not own them"""
+        mock_memory.authorize.side_effect = SessionAccessError("Chat session belongs to another user")
+        other = {"Authorization": f"Bearer {generate_jwt_token('0f3e9a71-2c4d-4b8e-a6f5-91d2c7e4b385')}"}
+        cases = [
+            ({"session_id": SESSION_ID}, {}, 401),
+            ({"user_id": USER_ID}, {}, 401),
+            ({"session_id": SESSION_ID}, other, 403),
+            ({"user_id": USER_ID}, other, 403)
+        ]
+        with patch.object(chat_budget, 'llm', mock_chatbot):
+            for route in ('/chat', '/chat/stream'):
+                for body, headers, status in cases:
+                    response = self.app.post(route, data=json.dumps(dict(body, message="hello")),
+                                             content_type='application/json', headers=headers)
+                    self.assertEqual(response.status_code, status, (route, body))
+        mock_memory.build_context.assert_not_called()
+        mock_memory.start_session.assert_not_called()
+        mock_memory.record_turn.assert_not_called()
+        mock_chatbot.generate_response.assert_not_called()
+        mock_chatbot.stream_response.assert_not_called()
+    
+    @patch('app.conversation_memory')
+    @patch('app.chatbot')
+    def test_chat_clips_free_form_context(self, mock_chatbot, mock_memory):
+        """Test context sent by the client without a session is held to the token budget"""
+        mock_memory.clip.return_value = "clipped"
+        mock_chatbot.generate_response.return_value = "ok"
+        
+        with patch.object(chat_budget, 'llm', mock_chatbot):
+            self.app.post('/chat',
+                        data=json.dumps({"message": "hello", "context": "very long context"}),
+                        content_type='application/json')
+        
+        mock_memory.clip.assert_called_once_with("very long context")
+        mock_chatbot.generate_response.assert_called_once_with("hello", "clipped", timeout=ANY)
+        mock_memory.record_turn.assert_not_called()
+    
+    @patch('app.crisis_recorder')
+    @patch('app.chatbot')
+    def test_chat_crisis_skips_generation(self, mock_chatbot, mock_recorder):
+        """Test crisis messages get resources at once, even while the chat model loads"""
+        mock_chatbot.is_ready = False
+        
+        response = self.app.post('/chat',
+                               data=json.dumps({"message": "I want to kill myself", "user_id": USER_ID}),
+                               content_type='application/json', headers=AUTH)
+        data = json.loads(response.data)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(data['crisis'])
+        self.assertIn('crisis_helpline', data['resources'])
+        mock_chatbot.generate_response.assert_not_called()
+        mock_chatbot.load_in_background.assert_not_called()
+        event = mock_recorder.record.call_args[0][0]
+        self.assertEqual(event['user_id'], USER_ID)
+        self.assertEqual(event['detection'], {"category": "suicidal", "keywords": ["kill myself"]})
+    
+    @patch('app.crisis_recorder')
+    @patch('app.chatbot')
+    def test_chat_stream_crisis_single_event(self, mock_chatbot, mock_recorder):
+        """Test the streaming route answers crisis messages with one done event"""
+        response = self.app.post('/chat/stream',
+                               data=json.dumps({"message": "I want to die"}),
+                               content_type='application/json')
+        lines = response.get_data(as_text=True).strip().split("\n")
+        
+        self.assertEqual(lines[0], "event: done")
+        self.assertTrue(json.loads(lines[1][len("data: "):])['crisis'])
+        mock_chatbot.stream_response.assert_not_called()
+        # Anonymous messages have no user to record against
+        mock_recorder.record.assert_not_called()
+    
+    @patch('app.conversation_memory')
+    @patch('app.supabase')
+    def test_save_crisis_event(self, mock_supabase, mock_memory):
+        """Test recorded crisis events go to crisis_interventions and the session history"""
+        save_crisis_event({
+            "user_id": USER_ID,
+            "session_id": SESSION_ID,
+            "detection": {"category": "self_harm", "keywords": ["hurt myself"]},
+            "message": "I want to hurt myself",
+            "response": "Please reach out."
+        })
+        
+        mock_supabase.table.assert_called_with("crisis_interventions")
+        row = mock_supabase.table.return_value.insert.call_args[0][0]
+        self.assertEqual((row['trigger_type'], row['intervention_type']), ("keywords", "resource"))
+        self.assertEqual(row['trigger_data'], {"category": "self_harm", "keywords": ["hurt myself"]})
+        mock_memory.record_turn.assert_called_once_with(SESSION_ID, USER_ID, "I want to hurt myself", "Please reach out.")
+    
+    @patch('app.chatbot')
+    def test_chat_queue_full(self, mock_chatbot):
+        """Test a full generation queue is answered by the rule-based chatbot"""
+        mock_chatbot.generate_response.side_effect = QueueFullError("chat-scheduler queue is full (32 pending)")
+        
+        with patch.object(chat_budget, 'llm', mock_chatbot):
+            response = self.app.post('/chat',
+                                   data=json.dumps({"message": "hello"}),
+                                   content_type='application/json')
+        data = json.loads(response.data)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((data['engine'], data['fallback_reason']), ("rule_based", "overloaded"))
+        self.assertTrue(data['response'])
+    
+    @patch('app.chatbot')
+    def test_chat_budget_from_request(self, mock_chatbot):
+        """Test budget_ms is passed to generation, capped at the configured maximum"""
+        mock_chatbot.generate_response.return_value = "ok"
+        
+        with patch.object(chat_budget, 'llm', mock_chatbot):
+            self.app.post('/chat',
+                        data=json.dumps({"message": "hello", "budget_ms": 1500}),
+                        content_type='application/json')
+            self.app.post('/chat',
+                        data=json.dumps({"message": "hello", "budget_ms": 10 ** 9}),
+                        content_type='application/json')
+            invalid = self.app.post('/chat',
+                                  data=json.dumps({"message": "hello", "budget_ms": "soon"}),
+                                  content_type='application/json')
+        
+        timeouts = [call.kwargs['timeout'] for call in mock_chatbot.generate_response.call_args_list]
+        self.assertTrue(1.4 < timeouts[0] <= 1.5)
+        self.assertLessEqual(timeouts[1], chat_budget.max_budget_seconds)
+        self.assertEqual(invalid.status_code, 400)
+    
+    @patch('app.conversation_memory')
+    @patch('app.chatbot')
+    def test_chat_shed_by_fair_queue(self, mock_chatbot, mock_memory):
+        """Test requests shed by the fair queue get a 429 with Retry-After and never reach the model"""
+        mock_memory.start_session.return_value = SESSION_ID
+        mock_memory.build_context.return_value = ("", {})
+        with patch.object(chat_budget, 'llm', mock_chatbot), \
+             patch.object(chat_queue, 'acquire', side_effect=QuotaExceededError("Too many chat requests waiting in your queue", 7)):
+            for route in ['/chat', '/chat/stream']:
+                response = self.app.post(route,
+                                       data=json.dumps({"message": "hello", "user_id": USER_ID}),
+                                       content_type='application/json', headers=AUTH)
+                self.assertEqual(response.status_code, 429)
+                self.assertEqual(response.headers['Retry-After'], '7')
+                self.assertIn('error', json.loads(response.data))
+        mock_chatbot.generate_response.assert_not_called()
+        mock_chatbot.stream_response.assert_not_called()
+        mock_memory.record_turn.assert_not_called()
+    
+    def anonymous_chat_keys(self, requests):
+        """Fair-queue keys /chat charges a series of anonymous (body, headers) requests to"""
+        with patch.object(chat_budget, 'respond', return_value={
+            "response": "ok", "engine": "llm", "fallback_reason": None, "queue_wait_ms": 0
+        }) as respond:
+            for body, headers in requests:
+                self.app.post('/chat',
+                            data=json.dumps(dict(body, message="hello")),
+                            content_type='application/json',
+                            headers=headers,
+                            environ_base={"REMOTE_ADDR": "172.18.0.5"})
+        return [call.kwargs['user_id'] for call in respond.call_args_list]
+    
+    @patch('app.chatbot')
+    def test_anonymous_chats_are_charged_to_the_client_address(self, mock_chatbot):
+        """Test anonymous requests share the connecting address's quota, whatever the body or X-Forwarded-For say"""
+        keys = self.anonymous_chat_keys([
+            ({}, {"X-Forwarded-For": "203.0.113.7"}),
+            ({"budget_ms": 5000}, {"X-Forwarded-For": "198.51.100.2"})
+        ])
+        self.assertEqual(keys, ["ip:172.18.0.5", "ip:172.18.0.5"])
+    
+    @patch('app.chatbot')
+    def test_anonymous_chats_behind_a_trusted_proxy(self, mock_chatbot):
+        """Test with a proxy hop trusted, anonymous requests get one fair-queue key per forwarded client"""
+        with patch.object(app, 'wsgi_app', ProxyFix(app.wsgi_app, x_for=1, x_proto=1)):
+            keys = self.anonymous_chat_keys([
+                ({}, {"X-Forwarded-For": "203.0.113.7"}),
+                ({}, {"X-Forwarded-For": "198.51.100.2"})
+            ])
+        self.assertEqual(keys, ["ip:203.0.113.7", "ip:198.51.100.2"])
+    
+    @patch('app.chatbot')
+    def test_chat_crisis_bypasses_fair_queue(self, mock_chatbot):
+        """Test crisis messages are answered even when the fair queue sheds everything"""
+        with patch('app.crisis_recorder'), \
+             patch.object(chat_queue, 'acquire', side_effect=QuotaExceededError("full", 7)):
+            response = self.app.post('/chat',
+                                   data=json.dumps({"message": "I want to end my life"}),
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.data)['crisis'])
+    
+    @patch('app.chatbot')
+    def test_chat_stats(self, mock_chatbot):
+        """Test chat stats expose scheduler counters"""
+        mock_chatbot.readiness.return_value = {"status": "ready"}
+        mock_chatbot.scheduler.stats.return_value = {"active": 2, "tokens_per_second": 41.5}
+        
+        response = self.app.get('/chat/stats')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['scheduler']['active'], 2)
+        self.assertIn('patient', json.loads(response.data)['fair_queue']['classes'])
+    
+    @patch('app.conversation_memory')
+    @patch('app.chatbot')
+    def test_chat_while_model_loading(self, mock_chatbot, mock_memory):
+        """Test /chat answers from the rule-based bot while the chat model loads, and /chat/stream returns 503"""
+        mock_chatbot.is_ready = False
+        mock_chatbot.readiness.return_value = {"status": "loading"}
+        mock_memory.start_session.return_value = SESSION_ID
+        
+        with patch.object(chat_budget, 'llm', mock_chatbot):
+            response = self.app.post('/chat',
+                                   data=json.dumps({"message": "hello", "user_id": USER_ID}),
+                                   content_type='application/json', headers=AUTH)
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual((data['engine'], data['fallback_reason'], data['session_id']), ("rule_based", "loading", SESSION_ID))
+        self.assertTrue(data['response'])
+        mock_chatbot.generate_response.assert_not_called()
+        mock_memory.build_context.assert_not_called()
+        mock_memory.record_turn.assert_called_once_with(SESSION_ID, USER_ID, "hello", data['response'], cache=False)
+        
+        response = self.app.post('/chat/stream',
+                               data=json.dumps({"message": "hello"}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+        mock_chatbot.load_in_background.assert_called()
+        mock_chatbot.stream_response.assert_not_called()
+    
+    @patch('app.supabase')
+    @patch('app.sentiment_cascade')
+    @patch('app.mood_analyzer')
+    def test_import_mood_logs_streams_results(self, mock_analyzer, mock_cascade, mock_supabase):
+        """Test NDJSON import scores entries, bulk inserts them and streams results"""
+        mock_cascade.analyze_many.side_effect = lambda texts, batch_size=None: [
+            {"sentiment": "positive", "score": 0.9, "tier": "model"} for _ in texts
+        ]
+        body = "\n".join([
+            json.dumps({"text": "Lovely day", "created_at": "2021-03-04T09:00:00Z"}),
+            "not json",
+            "",
+            json.dumps({"text": "Slept well"})
+        ]) + "\n"
+        
+        response = self.app.post('/import/test-user', data=body, content_type='application/x-ndjson')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(events[0], {"line": 2, "error": "Invalid JSON"})
+        self.assertEqual(events[-1], {"lines": 3, "analyzed": 2, "saved": 2, "failed": 1, "done": True})
+        rows = mock_supabase.table.return_value.insert.call_args[0][0]
+        self.assertEqual([row["text"] for row in rows], ["Lovely day", "Slept well"])
+        self.assertEqual(rows[0]["created_at"], "2021-03-04T09:00:00Z")
+        self.assertNotIn("created_at", rows[1])
+    
+    @patch('app.mood_analyzer')
+    def test_import_while_model_loading(self, mock_analyzer):
+        """Test imports are refused until the sentiment model is ready"""
+        mock_analyzer.is_ready = False
+        mock_analyzer.readiness.return_value = {"status": "loading"}
+        
+        response = self.app.post('/import/test-user', data='{"text": "hi"}\n')
+        
+        self.assertEqual(response.status_code, 503)
+    
     @patch('app.supabase')
     def test_save_mood_log_success(self, mock_supabase):
         """Test saving mood log with valid data"""
@@ -96,12 +566,18 @@ class TestMoodMateAPI(unittest.TestCase):
     @patch('app.supabase')
     def test_get_user_analytics_success(self, mock_supabase):
         """Test getting user analytics with valid user"""
-        mock_mood_logs = [
-            {"sentiment": "positive", "score": 0.8, "created_at": "2024-01-01T00:00:00Z"},
-            {"sentiment": "positive", "score": 0.7, "created_at": "2024-01-02T00:00:00Z"},
-            {"sentiment": "negative", "score": 0.3, "created_at": "2024-01-03T00:00:00Z"}
-        ]
-        mock_supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = mock_mood_logs
+        mock_aggregate = {
+            "user_id": "test-user",
+            "total_entries": 3,
+            "score_sum": 1.8,
+            "positive_count": 2,
+            "negative_count": 1,
+            "neutral_count": 0,
+            "last_entry_date": "2024-01-03",
+            "current_streak": 3,
+            "recent_scores": [0.8, 0.7, 0.3]
+        }
+        mock_supabase.table.return_value.select.return_value.eq.return_value.limit.return_value.execute.return_value.data = [mock_aggregate]
         
         response = self.app.get('/analytics/test-user')
         
@@ -112,11 +588,14 @@ class TestMoodMateAPI(unittest.TestCase):
         self.assertEqual(analytics['total_entries'], 3)
         self.assertEqual(analytics['positive_days'], 2)
         self.assertEqual(analytics['negative_days'], 1)
+        self.assertEqual((analytics['average_score'], analytics['streak'], analytics['trend']), (0.6, 3, "negative"))
+        # The endpoint reads the aggregate row, not the user's mood logs
+        mock_supabase.table.assert_called_once_with("mood_aggregates")
     
     @patch('app.supabase')
     def test_get_user_analytics_no_data(self, mock_supabase):
         """Test getting user analytics with no mood logs"""
-        mock_supabase.table.return_value.select.return_value.eq.return_value.execute.return_value.data = []
+        mock_supabase.table.return_value.select.return_value.eq.return_value.limit.return_value.execute.return_value.data = []
         
         response = self.app.get('/analytics/test-user')
         
@@ -129,12 +608,11 @@ class TestMoodMateAPI(unittest.TestCase):
     @patch('app.supabase')
     def test_get_ai_insights_success(self, mock_supabase):
         """Test getting AI insights for user"""
-        mock_mood_logs = [
-            {"sentiment": "positive", "score": 0.8, "created_at": "2024-01-01T00:00:00Z"},
-            {"sentiment": "positive", "score": 0.9, "created_at": "2024-01-02T00:00:00Z"},
-            {"sentiment": "positive", "score": 0.85, "created_at": "2024-01-03T00:00:00Z"}
+        mock_rollups = [
+            {"local_date": "2024-01-01", "entries": 1, "score_sum": 0.8, "positive_count": 1, "negative_count": 0, "neutral_count": 0},
+            {"local_date": "2024-01-02", "entries": 2, "score_sum": 1.75, "positive_count": 2, "negative_count": 0, "neutral_count": 0}
         ]
-        mock_supabase.table.return_value.select.return_value.eq.return_value.order.return_value.limit.return_value.execute.return_value.data = mock_mood_logs
+        mock_supabase.table.return_value.select.return_value.eq.return_value.gte.return_value.execute.return_value.data = mock_rollups
         
         response = self.app.get('/insights/test-user')
         
@@ -142,6 +620,73 @@ class TestMoodMateAPI(unittest.TestCase):
         data = json.loads(response.data)
         self.assertIn('insights', data)
         self.assertIsInstance(data['insights'], list)
+        self.assertEqual([insight['type'] for insight in data['insights']], ["pattern"])
+        mock_supabase.table.assert_any_call("mood_daily_rollups")
+    
+    @patch('app.user_today', return_value=date(2024, 1, 10))
+    @patch('app.supabase')
+    def test_get_ai_insights_use_the_users_local_today(self, mock_supabase, mock_user_today):
+        """Test the rollup window and weeks are counted from the user's local date, not UTC's"""
+        query = mock_supabase.table.return_value.select.return_value.eq.return_value
+        query.gte.return_value.execute.return_value.data = [
+            {"local_date": "2024-01-10", "entries": 1, "score_sum": 0.9, "positive_count": 1, "negative_count": 0, "neutral_count": 0},
+            {"local_date": "2024-01-02", "entries": 1, "score_sum": 0.3, "positive_count": 0, "negative_count": 1, "neutral_count": 0}
+        ]
+        
+        response = self.app.get('/insights/test-user')
+        
+        types = [insight['type'] for insight in json.loads(response.data)['insights']]
+        self.assertEqual(types, ["positive_trend"])
+        query.gte.assert_called_once_with("local_date", (date(2024, 1, 10) - timedelta(days=30)).isoformat())
+        mock_user_today.assert_called_once_with(mock_supabase, "test-user")
+    
+    @patch('app.supabase')
+    def test_get_ai_insights_week_over_week(self, mock_supabase):
+        """Test the trend insight compares this week's average with last week's"""
+        today = datetime.utcnow().date()
+        mock_rollups = [
+            {"local_date": (today - timedelta(days=day)).isoformat(), "entries": 1, "score_sum": 0.9,
+             "positive_count": 1, "negative_count": 0, "neutral_count": 0}
+            for day in range(3)
+        ] + [
+            {"local_date": (today - timedelta(days=day)).isoformat(), "entries": 1, "score_sum": 0.3,
+             "positive_count": 0, "negative_count": 1, "neutral_count": 0}
+            for day in range(8, 12)
+        ]
+        mock_supabase.table.return_value.select.return_value.eq.return_value.gte.return_value.execute.return_value.data = mock_rollups
+        
+        response = self.app.get('/insights/test-user')
+        
+        self.assertEqual(response.status_code, 200)
+        types = [insight['type'] for insight in json.loads(response.data)['insights']]
+        self.assertEqual(types, ["positive_trend", "consistency"])
+    
+    @patch('app.supabase')
+    def test_get_daily_analytics(self, mock_supabase):
+        """Test per-day summaries come from the rollups for the requested local dates"""
+        query = mock_supabase.table.return_value.select.return_value.eq.return_value.gte.return_value.lte.return_value
+        query.order.return_value.execute.return_value.data = [
+            {"user_id": "test-user", "local_date": "2024-01-30", "entries": 2, "score_sum": "1.30", "score_min": "0.50",
+             "score_max": "0.80", "positive_count": 1, "negative_count": 0, "neutral_count": 1}
+        ]
+        
+        response = self.app.get('/analytics/test-user/daily?end=2024-01-31&days=7')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual((data['start'], data['end']), ("2024-01-25", "2024-01-31"))
+        self.assertEqual(data['daily'], [{
+            "date": "2024-01-30", "entries": 2, "average_score": 0.65, "min_score": 0.5, "max_score": 0.8,
+            "positive": 1, "negative": 0, "neutral": 1
+        }])
+        mock_supabase.table.return_value.select.return_value.eq.return_value.gte.assert_called_once_with("local_date", "2024-01-25")
+        
+        for query_string in ('days=0', 'days=1000', 'end=soon'):
+            self.assertEqual(self.app.get(f'/analytics/test-user/daily?{query_string}').status_code, 400)
+        
+        with patch('app.user_today', return_value=date(2024, 3, 1)):
+            data = json.loads(self.app.get('/analytics/test-user/daily?days=1').data)
+        self.assertEqual((data['start'], data['end']), ("2024-03-01", "2024-03-01"))
     
     @patch('app.supabase')
     def test_create_notification_success(self, mock_supabase):
@@ -192,7 +737,7 @@ class TestMoodMateAPI(unittest.TestCase):
             {"id": "user1", "name": "User 1", "email": "user1@example.com"},
             {"id": "user2", "name": "User 2", "email": "user2@example.com"}
         ]
-        mock_supabase.table.return_value.select.return_value.execute.return_value.data = mock_users
+        mock_supabase.table.return_value.select.return_value.order.return_value.order.return_value.limit.return_value.execute.return_value.data = mock_users
         
         response = self.app.get('/admin/users')
         
@@ -200,22 +745,69 @@ class TestMoodMateAPI(unittest.TestCase):
         data = json.loads(response.data)
         self.assertIn('users', data)
         self.assertEqual(len(data['users']), 2)
+        self.assertIsNone(data['next_cursor'])
+        self.assertNotIn('total', data)
+        mock_supabase.table.return_value.select.assert_called_once_with("*", count=None)
+        mock_supabase.table.return_value.select.return_value.order.return_value.order.return_value.limit.assert_called_once_with(51)
     
     @patch('app.supabase')
-    def test_admin_analytics(self, mock_supabase):
-        """Test admin analytics endpoint"""
-        mock_users = [{"id": "user1"}, {"id": "user2"}]
-        mock_mood_logs = [
-            {"user_id": "user1", "score": 0.8},
-            {"user_id": "user2", "score": 0.6}
+    def test_admin_users_page_with_fields(self, mock_supabase):
+        """Test fields, limit and include_total shape the users page"""
+        mock_users = [
+            {"id": "user3", "name": "User 3", "created_at": "2024-01-03T00:00:00+00:00"},
+            {"id": "user2", "name": "User 2", "created_at": "2024-01-02T00:00:00+00:00"},
+            {"id": "user1", "name": "User 1", "created_at": "2024-01-01T00:00:00+00:00"}
         ]
+        query = mock_supabase.table.return_value.select.return_value.order.return_value.order.return_value.limit.return_value
+        query.execute.return_value = MagicMock(data=mock_users, count=3)
         
-        mock_supabase.table.return_value.select.return_value.execute.side_effect = [
-            MagicMock(data=mock_users),
-            MagicMock(data=mock_mood_logs)
-        ]
+        response = self.app.get('/admin/users?fields=name&limit=2&include_total=true')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual([user['id'] for user in data['users']], ["user3", "user2"])
+        self.assertEqual(data['total'], 3)
+        self.assertIsNotNone(data['next_cursor'])
+        mock_supabase.table.return_value.select.assert_called_once_with("name,created_at,id", count="exact")
+    
+    @patch('app.supabase')
+    def test_list_endpoints_reject_bad_parameters(self, mock_supabase):
+        """Test unknown fields, bad limits and forged cursors get 400"""
+        for url in ('/admin/users?fields=password_hash', '/admin/users?limit=0', '/notifications/test-user?cursor=abc'):
+            response = self.app.get(url)
+            self.assertEqual(response.status_code, 400, url)
+        mock_supabase.table.assert_not_called()
+    
+    @patch('app.supabase')
+    def test_get_notifications_page(self, mock_supabase):
+        """Test notifications are paged per user"""
+        mock_notifications = [{"id": "notif1", "title": "Test", "created_at": "2024-01-01T00:00:00+00:00"}]
+        query = mock_supabase.table.return_value.select.return_value.eq.return_value
+        query.order.return_value.order.return_value.limit.return_value.execute.return_value.data = mock_notifications
         
-        response = self.app.get('/admin/analytics')
+        response = self.app.get('/notifications/test-user?limit=10')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['notifications'], mock_notifications)
+        mock_supabase.table.return_value.select.return_value.eq.assert_called_once_with("user_id", "test-user")
+        query.order.return_value.order.return_value.limit.assert_called_once_with(11)
+    
+    @patch('app.supabase_admin')
+    def test_admin_analytics(self, mock_supabase):
+        """Test admin analytics endpoint"""
+        mock_supabase.rpc.return_value.execute.return_value.data = {
+            "total_users": 2,
+            "total_mood_logs": 2,
+            "average_mood_score": 0.7,
+            "active_users": 2,
+            "positive_logs": 2,
+            "negative_logs": 0,
+            "neutral_logs": 0,
+            "daily": None
+        }
+        
+        response = self.app.get('/admin/analytics', headers=ADMIN_AUTH)
         
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.data)
@@ -224,6 +816,60 @@ class TestMoodMateAPI(unittest.TestCase):
         self.assertEqual(analytics['total_users'], 2)
         self.assertEqual(analytics['total_mood_logs'], 2)
         self.assertEqual(analytics['average_mood_score'], 0.7)
+        self.assertNotIn('daily', data)
+        # Aggregated by the database rather than by downloading the tables
+        mock_supabase.rpc.assert_called_once_with("admin_mood_analytics", {
+            "start_at": None, "end_at": None, "include_daily": False
+        })
+        mock_supabase.table.assert_not_called()
+    
+    @patch('app.supabase_admin')
+    def test_admin_analytics_date_range_and_daily(self, mock_supabase):
+        """Test a date-only end covers that whole day and the daily breakdown is returned"""
+        days = [{"day": "2024-01-01", "entries": 3, "average_score": 0.5, "active_users": 2,
+                 "positive": 1, "negative": 1, "neutral": 1}]
+        mock_supabase.rpc.return_value.execute.return_value.data = {
+            "total_users": 5, "total_mood_logs": 3, "average_mood_score": "0.50", "active_users": 2, "daily": days
+        }
+        
+        response = self.app.get('/admin/analytics?start=2024-01-01&end=2024-01-31&daily=true', headers=ADMIN_AUTH)
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['daily'], days)
+        self.assertEqual(data['analytics']['average_mood_score'], 0.5)
+        self.assertEqual(data['range'], {"start": "2024-01-01T00:00:00+00:00", "end": "2024-02-01T00:00:00+00:00"})
+        mock_supabase.rpc.assert_called_once_with("admin_mood_analytics", {
+            "start_at": "2024-01-01T00:00:00+00:00", "end_at": "2024-02-01T00:00:00+00:00", "include_daily": True
+        })
+    
+    @patch('app.supabase_admin')
+    def test_admin_analytics_daily_defaults_to_recent_days(self, mock_supabase):
+        """Test a breakdown without a start covers the default number of days"""
+        mock_supabase.rpc.return_value.execute.return_value.data = {}
+        
+        response = self.app.get('/admin/analytics?daily=true', headers=ADMIN_AUTH)
+        
+        self.assertEqual(response.status_code, 200)
+        params = mock_supabase.rpc.call_args[0][1]
+        span = datetime.fromisoformat(params["end_at"]) - datetime.fromisoformat(params["start_at"])
+        self.assertEqual(span, timedelta(days=30))
+        self.assertEqual(json.loads(response.data)['daily'], [])
+    
+    @patch('app.supabase_admin')
+    def test_admin_analytics_rejects_bad_ranges(self, mock_supabase):
+        """Test malformed, empty and over-long ranges are rejected before querying"""
+        for query in ('start=yesterday', 'start=2024-02-01&end=2024-01-01', 'start=2020-01-01&end=2024-01-01&daily=true'):
+            response = self.app.get(f'/admin/analytics?{query}', headers=ADMIN_AUTH)
+            self.assertEqual(response.status_code, 400, query)
+        mock_supabase.rpc.assert_not_called()
+    
+    @patch('app.supabase_admin')
+    def test_admin_analytics_requires_an_admin(self, mock_supabase):
+        """Test platform analytics are refused without a token and to non-admin users"""
+        self.assertEqual(self.app.get('/admin/analytics').status_code, 401)
+        self.assertEqual(self.app.get('/admin/analytics', headers=AUTH).status_code, 403)
+        mock_supabase.rpc.assert_not_called()
 
 class TestAuthentication(unittest.TestCase):
     """Test cases for authentication endpoints"""
@@ -0,0 +1,89 @@
+"""
+Test suite for the request-coalescing micro-batcher
+"""
+
+import unittest
+import threading
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import MicroBatcher, QueueFullError
+
+class TestMicroBatcher(unittest.TestCase):
+    """Test cases for MicroBatcher"""
+    
+    def setUp(self):
+        """Record every batch the batcher flushes"""
+        self.batches = []
+    
+    def double(self, items):
+        """Batch function that doubles numbers and fails on negatives"""
+        self.batches.append(list(items))
+        return [ValueError("negative") if item < 0 else item * 2 for item in items]
+    
+    def test_concurrent_submits_are_coalesced(self):
+        """Test items queued within the wait window share one batch"""
+        batcher = MicroBatcher(self.double, max_batch_size=8, max_wait_ms=200)
+        futures = []
+        threads = [threading.Thread(target=lambda i=i: futures.append(batcher.submit(i))) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        results = sorted(future.result(timeout=5) for future in futures)
+        self.assertEqual(results, [0, 2, 4, 6, 8, 10, 12, 14])
+        self.assertEqual(len(self.batches), 1)
+        
+        stats = batcher.stats()
+        self.assertEqual(stats["completed"], 8)
+        self.assertEqual(stats["largest_batch"], 8)
+        self.assertEqual(stats["queue_depth"], 0)
+        batcher.shutdown()
+    
+    def test_flushes_partial_batch_after_max_wait(self):
+        """Test a lone item is flushed once the deadline passes"""
+        batcher = MicroBatcher(self.double, max_batch_size=64, max_wait_ms=5)
+        self.assertEqual(batcher.submit(21).result(timeout=5), 42)
+        self.assertEqual(self.batches, [[21]])
+        batcher.shutdown()
+    
+    def test_item_errors_only_fail_their_own_future(self):
+        """Test an exception result is raised only to its caller"""
+        batcher = MicroBatcher(self.double, max_batch_size=2, max_wait_ms=200)
+        good = batcher.submit(3)
+        bad = batcher.submit(-1)
+        
+        self.assertEqual(good.result(timeout=5), 6)
+        with self.assertRaises(ValueError):
+            bad.result(timeout=5)
+        self.assertEqual(batcher.stats()["failed"], 1)
+        batcher.shutdown()
+    
+    def test_rejects_when_queue_is_full(self):
+        """Test submit raises once the queue is at capacity"""
+        release = threading.Event()
+        
+        def blocking(items):
+            release.wait(5)
+            return items
+        
+        batcher = MicroBatcher(blocking, max_batch_size=1, max_wait_ms=0, max_queue_size=1)
+        first = batcher.submit("a")
+        # Wait for the worker to pick up the first item so the queue is empty
+        while batcher.stats()["queue_depth"]:
+            pass
+        batcher.submit("b")
+        with self.assertRaises(QueueFullError):
+            batcher.submit("c")
+        
+        release.set()
+        self.assertEqual(first.result(timeout=5), "a")
+        self.assertEqual(batcher.stats()["rejected"], 1)
+        batcher.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Test suite for the streaming NDJSON mood log import
+"""
+
+import unittest
+import io
+import json
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_import import MoodLogImport, iter_ndjson_lines, parse_entry, to_ndjson
+
+def fake_analyze_many(texts, batch_size=None):
+    """Mark texts mentioning 'sad' negative and everything else positive"""
+    return [
+        {"sentiment": "negative" if "sad" in text else "positive", "score": 0.9}
+        for text in texts
+    ]
+
+def ndjson_stream(entries):
+    return io.BytesIO("".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8"))
+
+class TestNdjsonLines(unittest.TestCase):
+    """Test cases for reading and parsing NDJSON lines"""
+    
+    def test_lines_are_numbered(self):
+        """Test every physical line is yielded with its 1-based number"""
+        lines = list(iter_ndjson_lines(io.BytesIO(b'{"a": 1}\n\n{"b": 2}')))
+        self.assertEqual(lines, [(1, b'{"a": 1}\n'), (2, b'\n'), (3, b'{"b": 2}')])
+    
+    def test_overlong_line_is_skipped(self):
+        """Test a line over the limit is drained and reported as None"""
+        stream = io.BytesIO(b'x' * 100 + b'\n{"text": "ok"}\n')
+        lines = list(iter_ndjson_lines(stream, max_line_bytes=16))
+        self.assertEqual(lines, [(1, None), (2, b'{"text": "ok"}\n')])
+    
+    def test_parse_entry_validation(self):
+        """Test malformed entries produce an error message"""
+        self.assertEqual(parse_entry(b'[1]')[1], "Entry must be a JSON object")
+        self.assertEqual(parse_entry(b'{"text": "  "}')[1], "No text provided")
+        self.assertEqual(parse_entry(b'{"text": "ok", "created_at": "yesterday"}')[1], "created_at must be an ISO 8601 timestamp")
+        self.assertEqual(parse_entry(b'{"text": "ok", "created_at": "2020-01-01"}'), ({"text": "ok", "created_at": "2020-01-01"}, None))
+
+class TestMoodLogImport(unittest.TestCase):
+    """Test cases for MoodLogImport"""
+    
+    def setUp(self):
+        self.inserted = []
+        self.analyze_calls = []
+        
+        def analyze_many(texts, batch_size=None):
+            self.analyze_calls.append(len(texts))
+            return fake_analyze_many(texts)
+        
+        self.importer = MoodLogImport("user-1", analyze_many, self.inserted.append, batch_size=2, insert_chunk_size=3)
+    
+    def test_entries_are_batched_and_chunked(self):
+        """Test analysis runs in batches and rows are inserted in bounded chunks"""
+        entries = [{"text": f"entry {index}"} for index in range(7)]
+        events = list(self.importer.run(iter_ndjson_lines(ndjson_stream(entries))))
+        
+        self.assertEqual(self.analyze_calls, [2, 2, 2, 1])
+        self.assertEqual([len(chunk) for chunk in self.inserted], [4, 3])
+        self.assertEqual(self.inserted[0][0], {"user_id": "user-1", "text": "entry 0", "sentiment": "positive", "score": 0.9})
+        self.assertEqual([event["progress"]["saved"] for event in events if "progress" in event], [4, 7])
+        self.assertEqual(events[-1], {"lines": 7, "analyzed": 7, "saved": 7, "failed": 0, "done": True})
+    
+    def test_per_line_results_and_errors(self):
+        """Test each line gets a result or an error in the stream"""
+        entries = [{"text": "so sad"}, {"note": "no text"}, {"text": "fine"}]
+        events = list(self.importer.run(iter_ndjson_lines(ndjson_stream(entries))))
+        by_line = {event["line"]: event for event in events if "line" in event}
+        
+        self.assertEqual(by_line[1]["sentiment"], "negative")
+        self.assertEqual(by_line[2]["error"], "No text provided")
+        self.assertEqual(by_line[3]["sentiment"], "positive")
+        self.assertEqual(events[-1]["failed"], 1)
+    
+    def test_failed_insert_is_reported(self):
+        """Test a failed chunk insert marks its lines failed and the import continues"""
+        def failing_insert(rows):
+            raise RuntimeError("database unavailable")
+        
+        importer = MoodLogImport("user-1", fake_analyze_many, failing_insert, batch_size=2, insert_chunk_size=2)
+        events = list(importer.run(iter_ndjson_lines(ndjson_stream([{"text": "a"}, {"text": "b"}, {"text": "c"}]))))
+        errors = [event for event in events if "lines" in event and "error" in event]
+        
+        self.assertEqual([event["lines"] for event in errors], [[1, 2], [3]])
+        self.assertEqual(events[-1], {"lines": 3, "analyzed": 3, "saved": 0, "failed": 3, "done": True})
+    
+    def test_to_ndjson(self):
+        """Test events serialize one JSON object per line"""
+        self.assertEqual(list(to_ndjson([{"a": 1}, {"b": 2}])), ['{"a": 1}\n', '{"b": 2}\n'])
+
+if __name__ == '__main__':
+    unittest.main()
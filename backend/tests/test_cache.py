@@ -0,0 +1,79 @@
+"""
+Test suite for the sentiment result cache
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import SentimentCache, make_cache_key
+
+class FakeRedis:
+    """Minimal in-memory stand-in for a Redis client"""
+    
+    def __init__(self):
+        self.data = {}
+    
+    def get(self, key):
+        return self.data.get(key)
+    
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+class TestSentimentCache(unittest.TestCase):
+    """Test cases for SentimentCache"""
+    
+    def test_key_normalizes_text_and_includes_model(self):
+        """Test whitespace variants share a key but model versions don't"""
+        key = make_cache_key("feeling  good ", "model", "v1")
+        self.assertEqual(key, make_cache_key("feeling good", "model", "v1"))
+        self.assertNotEqual(key, make_cache_key("feeling good", "model", "v2"))
+        self.assertNotEqual(key, make_cache_key("feeling good", "other-model", "v1"))
+        self.assertEqual(make_cache_key("Tired", "model", "v1", lowercase=True),
+                         make_cache_key("tired", "model", "v1", lowercase=True))
+    
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted first"""
+        cache = SentimentCache(max_entries=2)
+        cache.set("a", {"score": 1})
+        cache.set("b", {"score": 2})
+        cache.get("a")
+        cache.set("c", {"score": 3})
+        
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), {"score": 1})
+        self.assertEqual(cache.stats()["evictions"], 1)
+    
+    def test_ttl_expiry(self):
+        """Test entries expire after the TTL"""
+        cache = SentimentCache(ttl_seconds=10)
+        with patch('cache.time.monotonic', return_value=100.0):
+            cache.set("a", {"score": 1})
+        with patch('cache.time.monotonic', return_value=105.0):
+            self.assertEqual(cache.get("a"), {"score": 1})
+        with patch('cache.time.monotonic', return_value=111.0):
+            self.assertIsNone(cache.get("a"))
+        
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["expirations"], 1)
+    
+    def test_shared_tier_hits_across_instances(self):
+        """Test a result written by one worker is served to another"""
+        shared = FakeRedis()
+        first = SentimentCache(shared_client=shared)
+        second = SentimentCache(shared_client=shared)
+        first.set("a", {"sentiment": "positive", "score": 0.9})
+        
+        self.assertEqual(second.get("a"), {"sentiment": "positive", "score": 0.9})
+        self.assertEqual(second.stats()["shared_hits"], 1)
+        # Promoted into the local tier on the way out
+        self.assertEqual(second.stats()["size"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
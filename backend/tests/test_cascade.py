@@ -0,0 +1,75 @@
+"""
+Test suite for the lexicon-first sentiment cascade
+"""
+
+import unittest
+from unittest.mock import MagicMock
+from concurrent.futures import Future
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cascade import SentimentCascade
+
+class TestSentimentCascade(unittest.TestCase):
+    """Test cases for SentimentCascade"""
+    
+    def setUp(self):
+        """Build a cascade around a fake model analyzer"""
+        self.model = MagicMock()
+        self.model.analyze.return_value = {"sentiment": "negative", "score": 0.97}
+        self.model.analyze_many.side_effect = lambda texts, batch_size=None: [
+            {"sentiment": "negative", "score": 0.97} for _ in texts
+        ]
+        self.cascade = SentimentCascade(self.model, threshold=0.8)
+    
+    def test_confident_lexicon_answers_without_model(self):
+        """Test three same-polarity keywords clear the default threshold"""
+        result = self.cascade.analyze("happy, grateful and feeling great")
+        
+        self.assertEqual(result, {"sentiment": "positive", "score": 0.8, "tier": "lexicon"})
+        self.model.analyze.assert_not_called()
+    
+    def test_weak_or_conflicting_lexicon_escalates(self):
+        """Test low-confidence and mixed-polarity texts go to the model"""
+        for text in ["a good day", "happy but worried and stressed and sad", "just a day", "not happy, not good, not great"]:
+            self.assertEqual(self.cascade.analyze(text)["tier"], "model")
+        self.assertEqual(self.model.analyze.call_count, 4)
+    
+    def test_threshold_is_configurable(self):
+        """Test a lower threshold lets single-keyword texts stay on the lexicon tier"""
+        cascade = SentimentCascade(self.model, threshold=0.6)
+        self.assertEqual(cascade.analyze("a good day")["tier"], "lexicon")
+    
+    def test_disabled_cascade_always_uses_model(self):
+        """Test the lexicon tier can be switched off"""
+        cascade = SentimentCascade(self.model, enabled=False)
+        self.assertEqual(cascade.analyze("happy, grateful and feeling great")["tier"], "model")
+    
+    def test_analyze_many_escalates_only_uncertain_texts(self):
+        """Test one batched model call covers just the escalated texts, in order"""
+        texts = ["happy, grateful and feeling great", "meh", "", "tired"]
+        results = self.cascade.analyze_many(texts, batch_size=8)
+        
+        self.assertEqual([r.get("tier") for r in results], ["lexicon", "model", None, "model"])
+        self.assertIn("error", results[2])
+        self.model.analyze_many.assert_called_once_with(["meh", "tired"], batch_size=8)
+        
+        stats = self.cascade.stats()
+        self.assertEqual(stats["lexicon"], 1)
+        self.assertEqual(stats["model"], 2)
+        self.assertEqual(stats["lexicon_share"], round(1 / 3, 4))
+    
+    def test_escalate_async_tags_model_results(self):
+        """Test the async model tier resolves to a tagged result"""
+        future = Future()
+        self.model.analyze_async.return_value = future
+        tagged = self.cascade.escalate_async("meh")
+        future.set_result({"sentiment": "positive", "score": 0.6})
+        
+        self.assertEqual(tagged.result(timeout=1), {"sentiment": "positive", "score": 0.6, "tier": "model"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+"""
+Test suite for the LLM mental health chatbot
+"""
+
+import unittest
+import threading
+import random
+import time
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from tokenizers import Tokenizer, models, trainers, pre_tokenizers, decoders
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+from chatbot import MentalHealthChatbot, StreamingResponseCleaner
+from conversation import TokenizedContext
+
+def build_tiny_chatbot(hidden_size=32, layers=2):
+    """Build a chatbot around a small random Llama model so tests run without network access"""
+    corpus = [
+        MentalHealthChatbot.system_prompt,
+        "User: I feel anxious about work and I cannot sleep\n\nAssistant: That sounds hard, breathing exercises can help.",
+        "Context: we talked about stress yesterday"
+    ] * 4
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=600, special_tokens=["<s>", "</s>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    )
+    tokenizer.train_from_iterator(corpus, trainer)
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>")
+    
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer), hidden_size=hidden_size, intermediate_size=hidden_size * 2,
+        num_hidden_layers=layers, num_attention_heads=2, num_key_value_heads=2,
+        max_position_embeddings=1024, bos_token_id=0, eos_token_id=1
+    )
+    model = LlamaForCausalLM(config)
+    model.eval()
+    
+    bot = MentalHealthChatbot(model_name="tiny-llama", load=False)
+    bot.tokenizer = tokenizer
+    bot.model = model
+    bot.status = "ready"
+    bot.prepare_prefix_cache()
+    bot.prepare_scheduler()
+    return bot
+
+class TestStreamingResponseCleaner(unittest.TestCase):
+    """Test cases for incremental response cleaning"""
+    
+    def stream(self, text, seed):
+        """Feed text in random-sized chunks and return what was sent"""
+        rng = random.Random(seed)
+        cleaner = StreamingResponseCleaner()
+        sent, position = [], 0
+        while position < len(text) and not cleaner.finished:
+            size = rng.randint(1, 7)
+            sent.append(cleaner.feed(text[position:position + size]))
+            position += size
+        sent.append(cleaner.flush())
+        return "".join(sent)
+    
+    def test_matches_clean_response(self):
+        """Test chunked cleaning gives the same reply as cleaning the whole text"""
+        bot = MentalHealthChatbot(load=False)
+        texts = [
+            "   Take a slow breath.  \n",
+            "I hear you. User: what about me?",
+            "Try a short walk.\nUse a timer. Usefully, User",
+            "word " * 150,
+            "word " * 99 + "end   ",
+            "\n\n"
+        ]
+        for text in texts:
+            for seed in range(5):
+                self.assertEqual(self.stream(text, seed), bot._clean_response(text), (text, seed))
+    
+    def test_assistant_marker_ends_reply(self):
+        """Test a generated assistant turn marker stops the reply"""
+        self.assertEqual(self.stream("Breathe slowly.\nAssistant: and then", 0), "Breathe slowly.")
+    
+    def test_finishes_on_marker(self):
+        """Test the cleaner reports it is finished so generation can stop"""
+        cleaner = StreamingResponseCleaner()
+        self.assertEqual(cleaner.feed("Hello Us"), "Hello")
+        self.assertFalse(cleaner.finished)
+        self.assertEqual(cleaner.feed("er: hi"), "")
+        self.assertTrue(cleaner.finished)
+
+class TestChatbotStreaming(unittest.TestCase):
+    """Test cases for token streaming with a tiny model"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.bot = build_tiny_chatbot()
+    
+    def test_stream_yields_several_pieces(self):
+        """Test the reply arrives incrementally and is cleaned"""
+        torch.manual_seed(1)
+        pieces = list(self.bot.stream_response("I feel anxious about work"))
+        reply = "".join(pieces)
+        
+        self.assertGreater(len(pieces), 1)
+        self.assertEqual(reply, reply.strip())
+        self.assertNotIn("User:", reply)
+        self.assertLessEqual(len(reply), 503)
+    
+    def test_cancel_event_stops_generation(self):
+        """Test a set cancel event stops generation by the first token"""
+        forward_calls = []
+        hook = self.bot.model.register_forward_hook(lambda *args: forward_calls.append(1))
+        try:
+            cancel = threading.Event()
+            cancel.set()
+            list(self.bot.stream_response("I cannot sleep", cancel_event=cancel))
+        finally:
+            hook.remove()
+        self.assertLessEqual(len(forward_calls), 1)
+    
+    def test_closing_stream_cancels_generation(self):
+        """Test closing the generator, as on client disconnect, sets the cancel event"""
+        cancel = threading.Event()
+        stream = self.bot.stream_response("I cannot sleep", cancel_event=cancel)
+        next(stream)
+        stream.close()
+        self.assertTrue(cancel.is_set())
+    
+    def test_unloaded_model_streams_apology(self):
+        """Test a chatbot without a model yields the fallback message"""
+        bot = MentalHealthChatbot(load=False)
+        self.assertEqual(list(bot.stream_response("hi")), ["I'm sorry, I'm having trouble connecting right now. Please try again later."])
+
+class TestSystemPromptCache(unittest.TestCase):
+    """Test cases for reusing the system prompt key/value cache"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.bot = build_tiny_chatbot()
+    
+    def setUp(self):
+        self.bot.prefix_cache_enabled = True
+        self.bot.prepare_prefix_cache()
+    
+    def greedy(self, prompt, cached):
+        """Greedy-decode prompt with or without the prefix cache"""
+        self.bot.prefix_cache_enabled = cached
+        self.bot.prepare_prefix_cache()
+        inputs = self.bot.tokenizer.encode(prompt, return_tensors="pt")
+        return self.bot._generate(inputs, do_sample=False, max_length=inputs.shape[1] + 20)
+    
+    def test_cached_output_matches_uncached(self):
+        """Test greedy output is identical with and without the cached prefix"""
+        for prompt in [
+            self.bot._build_prompt("I feel anxious about work"),
+            self.bot._build_prompt("I cannot sleep", context="we talked about stress yesterday")
+        ]:
+            self.assertTrue(torch.equal(self.greedy(prompt, True), self.greedy(prompt, False)))
+        self.assertGreater(self.bot.prefix_cache_stats()["hits"], 0)
+    
+    def test_only_suffix_is_prefilled(self):
+        """Test the first forward pass only encodes tokens after the system prompt"""
+        inputs = self.bot.tokenizer.encode(self.bot._build_prompt("I feel anxious about work"), return_tensors="pt")
+        prefill_lengths = []
+        hook = self.bot.model.register_forward_pre_hook(
+            lambda module, args, kwargs: prefill_lengths.append(kwargs["input_ids"].shape[1]),
+            with_kwargs=True
+        )
+        try:
+            self.bot._generate(inputs, do_sample=False, max_length=inputs.shape[1] + 1)
+        finally:
+            hook.remove()
+        
+        prefix_tokens = self.bot.prefix_cache_stats()["prefix_tokens"]
+        self.assertGreater(prefix_tokens, 0)
+        self.assertEqual(prefill_lengths[0], inputs.shape[1] - prefix_tokens)
+    
+    def test_other_prompts_skip_the_cache(self):
+        """Test prompts that do not start with the system prompt run a full prefill"""
+        inputs = self.bot.tokenizer.encode("User: hello\n\nAssistant:", return_tensors="pt")
+        self.assertIsNone(self.bot._cached_prefix_for(inputs))
+        self.assertGreater(self.bot.prefix_cache_stats()["misses"], 0)
+    
+    def test_cache_survives_requests(self):
+        """Test generation does not modify the shared cache"""
+        before = self.bot.prefix_cache_stats()["prefix_tokens"]
+        list(self.bot.stream_response("I feel anxious about work"))
+        self.assertEqual(self.bot._prefix_cache.get_seq_length(), before)
+
+    def test_requests_share_the_prefix_tensors(self):
+        """Test a request starts from the prefix tensors themselves, and extending its cache leaves them as they were"""
+        inputs = self.bot.tokenizer.encode(self.bot._build_prompt("I feel anxious about work"), return_tensors="pt")
+        prefix = self.bot._prefix_cache
+        cache = self.bot._cached_prefix_for(inputs)
+        self.assertIsNot(cache, prefix)
+        for layer, shared in zip(cache.layers, prefix.layers):
+            self.assertIsNot(layer, shared)
+            self.assertIs(layer.keys, shared.keys)
+            self.assertIs(layer.values, shared.values)
+        
+        saved = [(layer.keys.clone(), layer.values.clone()) for layer in prefix.layers]
+        self.bot._generate(inputs, do_sample=False, max_length=inputs.shape[1] + 5)
+        list(self.bot.stream_response("I cannot sleep"))
+        for (keys, values), layer in zip(saved, prefix.layers):
+            self.assertTrue(torch.equal(layer.keys, keys))
+            self.assertTrue(torch.equal(layer.values, values))
+    
+    def test_time_to_first_token(self):
+        """Report time to first token with and without the cached prefix on a wider model"""
+        bot = build_tiny_chatbot(hidden_size=512, layers=6)
+        inputs = bot.tokenizer.encode(bot._build_prompt("I feel anxious about work"), return_tensors="pt")
+        timings = {}
+        for cached in [False, True]:
+            bot.prefix_cache_enabled = cached
+            bot.prepare_prefix_cache()
+            samples = []
+            for _ in range(7):
+                started = time.perf_counter()
+                bot._generate(inputs, do_sample=False, max_length=inputs.shape[1] + 1)
+                samples.append(time.perf_counter() - started)
+            timings[cached] = sorted(samples)[len(samples) // 2] * 1000
+        print(f"\ntime to first token: {timings[False]:.2f} ms uncached, {timings[True]:.2f} ms with the cached system prompt")
+
+class TestPromptIds(unittest.TestCase):
+    """Test cases for assembling prompt ids from cached token ids"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.bot = build_tiny_chatbot()
+    
+    def test_prompt_text_matches_build_prompt(self):
+        """Test the assembled ids decode to the same prompt as _build_prompt"""
+        lines = ["User: we talked about stress yesterday", "Assistant: That sounds hard."]
+        context = TokenizedContext("\n".join(lines), [i for line in lines for i in self.bot.tokenize(line + "\n")])
+        for context in [context, "we talked about stress yesterday", ""]:
+            ids = self.bot._prompt_ids("I cannot sleep", context)
+            self.assertEqual(
+                self.bot.tokenizer.decode(ids[0], skip_special_tokens=True),
+                self.bot._build_prompt("I cannot sleep", str(context))
+            )
+    
+    def test_only_the_new_message_is_tokenized(self):
+        """Test a tokenized context and the system prompt are not tokenized again"""
+        context = TokenizedContext("User: hello", self.bot.tokenize("User: hello\n"))
+        self.bot._prompt_ids("warm up", context)
+        encoded = []
+        tokenize = self.bot.tokenize
+        self.bot.tokenize = lambda text: encoded.append(text) or tokenize(text)
+        try:
+            ids = self.bot._prompt_ids("I feel anxious about work", context)
+        finally:
+            del self.bot.tokenize
+        
+        self.assertEqual(encoded, ["\nUser: I feel anxious about work\n\nAssistant:"])
+        self.assertIsNotNone(self.bot._cached_prefix_for(ids))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+"""
+Test suite for token-budgeted conversation memory
+"""
+
+import unittest
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import timedelta
+from conversation import ConversationMemory, SessionAccessError, parse_created_at
+
+class FakeChatStore:
+    """In-memory stand-in for the chat_sessions/chat_messages tables"""
+    
+    def __init__(self):
+        self.messages = []
+        self.loads = []
+        self.owners = {"session-x": "user-1"}
+        self.owner_lookups = []
+    
+    def create_session(self, user_id, session_name=None):
+        self.owners[f"session-{user_id}"] = user_id
+        return {"id": f"session-{user_id}", "user_id": user_id}
+    
+    def session_owner(self, session_id):
+        self.owner_lookups.append(session_id)
+        return self.owners.get(session_id)
+    
+    def load_messages(self, session_id, limit, since=None):
+        self.loads.append(since)
+        rows = [row for row in self.messages if row["session_id"] == session_id]
+        if since:
+            rows = [row for row in rows if parse_created_at(row["created_at"]) >= since]
+        return sorted(rows, key=lambda row: row["created_at"])[-limit:]
+    
+    def append_messages(self, session_id, user_id, messages):
+        rows = []
+        for sender, text in messages:
+            rows.append({
+                "id": len(self.messages) + 1,
+                "session_id": session_id,
+                "sender": sender,
+                "message": text,
+                "created_at": f"2024-01-01T00:00:{len(self.messages):02d}"
+            })
+            self.messages.append(rows[-1])
+        return rows
+
+class CountingTokenizer:
+    """Whitespace tokenizer that records every text it tokenizes"""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def tokenize(self, text):
+        self.calls.append(text)
+        return text.split()
+    
+    def detokenize(self, tokens):
+        return " ".join(tokens)
+
+class TestConversationMemory(unittest.TestCase):
+    """Test cases for ConversationMemory"""
+    
+    def setUp(self):
+        self.store = FakeChatStore()
+        self.tokenizer = CountingTokenizer()
+        self.memory = ConversationMemory(
+            self.store, self.tokenizer.tokenize, self.tokenizer.detokenize,
+            token_budget=40, summary_tokens=16
+        )
+    
+    def test_short_history_is_kept_verbatim(self):
+        """Test a conversation within the budget is passed through unchanged"""
+        session_id = self.memory.start_session("user-1")
+        self.memory.record_turn(session_id, "user-1", "I feel   anxious", "That sounds hard.")
+        
+        context, info = self.memory.build_context(session_id, "user-1")
+        
+        self.assertEqual(context, "User: I feel anxious\nAssistant: That sounds hard.")
+        self.assertEqual(info, {"turns": 2, "tokens": 8, "summarized": False})
+    
+    def test_context_stays_within_budget(self):
+        """Test long conversations keep recent turns and summarize older ones"""
+        session_id = self.memory.start_session("user-1")
+        for turn in range(10):
+            self.memory.record_turn(session_id, "user-1", f"Message {turn} about my week. More detail here.", f"Reply {turn}.")
+            context, info = self.memory.build_context(session_id, "user-1")
+            self.assertLessEqual(len(context.split()), 40)
+            self.assertLessEqual(info["tokens"], 40)
+        
+        self.assertTrue(info["summarized"])
+        self.assertTrue(context.startswith("Earlier in this conversation: "))
+        self.assertTrue(context.endswith("Assistant: Reply 9."))
+        self.assertNotIn("More detail here", context.split("\n")[0])
+    
+    def test_each_message_is_tokenized_once(self):
+        """Test building context again does not re-tokenize cached messages"""
+        session_id = self.memory.start_session("user-1")
+        self.memory.record_turn(session_id, "user-1", "hello there", "hi")
+        self.memory.build_context(session_id, "user-1")
+        calls = len(self.tokenizer.calls)
+        
+        self.memory.build_context(session_id, "user-1")
+        self.memory.record_turn(session_id, "user-1", "one more", "sure")
+        self.memory.build_context(session_id, "user-1")
+        
+        self.assertEqual(len(self.tokenizer.calls), calls + 2)
+        self.assertEqual(self.memory.stats()["messages_tokenized"], 4)
+    
+    def test_new_process_loads_history_then_fetches_incrementally(self):
+        """Test an uncached session is loaded once, after which only newer rows are requested"""
+        self.store.append_messages("session-x", "user-1", [("user", "first"), ("ai", "second")])
+        
+        context, _ = self.memory.build_context("session-x", "user-1")
+        self.store.append_messages("session-x", "user-1", [("user", "third")])
+        context, _ = self.memory.build_context("session-x", "user-1")
+        
+        self.assertEqual(context, "User: first\nAssistant: second\nUser: third")
+        self.assertEqual(self.store.loads, [None, parse_created_at("2024-01-01T00:00:01")])
+        self.assertEqual(self.memory.stats()["sessions_loaded"], 1)
+    
+    def test_late_rows_are_picked_up_within_the_lookback(self):
+        """Test a row stored after newer ones were fetched is still loaded, and cached rows are not repeated"""
+        memory = ConversationMemory(
+            self.store, self.tokenizer.tokenize, self.tokenizer.detokenize, lookback_seconds=5
+        )
+        self.store.append_messages("session-x", "user-1", [("user", "first"), ("ai", "second")])
+        memory.build_context("session-x", "user-1")
+        
+        # Another worker's row, timestamped before "second" but flushed from its buffer only now
+        self.store.messages.append({
+            "id": "late", "session_id": "session-x", "sender": "user", "message": "late",
+            "created_at": "2024-01-01T00:00:00.500000"
+        })
+        context, _ = memory.build_context("session-x", "user-1")
+        
+        self.assertEqual(context, "User: first\nAssistant: second\nUser: late")
+        self.assertEqual(self.store.loads[-1], parse_created_at("2024-01-01T00:00:01") - timedelta(seconds=5))
+        self.assertEqual(memory.stats()["messages_tokenized"], 3)
+    
+    def test_sessions_are_only_served_to_their_owner(self):
+        """Test another user's or a missing session is refused before its messages are read or written"""
+        self.store.append_messages("session-x", "user-1", [("user", "private")])
+        
+        with self.assertRaises(SessionAccessError):
+            self.memory.build_context("session-x", "user-2")
+        with self.assertRaises(SessionAccessError):
+            self.memory.record_turn("session-x", "user-2", "hi", "hello")
+        with self.assertRaises(SessionAccessError):
+            self.memory.authorize("session-missing", "user-1")
+        
+        self.assertEqual(self.store.loads, [])
+        self.assertEqual(len(self.store.messages), 1)
+        self.assertEqual(self.memory.stats()["cached_sessions"], 1)
+        
+        # The owner is looked up once, when the session enters the cache
+        self.memory.build_context("session-x", "user-1")
+        self.memory.build_context("session-x", "user-1")
+        self.assertEqual(self.store.owner_lookups, ["session-x", "session-missing"])
+        self.assertEqual(self.memory.start_session("user-3"), "session-user-3")
+        self.memory.authorize("session-user-3", "user-3")
+        self.assertNotIn("session-user-3", self.store.owner_lookups)
+    
+    def test_session_cache_is_bounded(self):
+        """Test the least recently used sessions are evicted"""
+        memory = ConversationMemory(self.store, self.tokenizer.tokenize, self.tokenizer.detokenize, max_sessions=2)
+        for user in ["a", "b", "c"]:
+            memory.start_session(user)
+        self.assertEqual(memory.stats()["cached_sessions"], 2)
+    
+    def test_clip_keeps_latest_tokens(self):
+        """Test free-form context is cut to the last token_budget tokens"""
+        text = " ".join(str(number) for number in range(100))
+        
+        self.assertEqual(self.memory.clip(text), " ".join(str(number) for number in range(60, 100)))
+        self.assertEqual(self.memory.clip("short context"), "short context")
+        self.assertEqual(self.memory.clip(""), "")
+
+if __name__ == '__main__':
+    unittest.main()
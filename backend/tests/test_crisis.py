@@ -0,0 +1,119 @@
+"""
+Test suite for crisis detection and asynchronous crisis recording
+"""
+
+import unittest
+import threading
+import time
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crisis import CRISIS_RESPONSES, EMERGENCY_RESOURCES, CrisisRecorder, crisis_response, detect_crisis
+from chatbot import MentalHealthChatbot
+
+class TestDetectCrisis(unittest.TestCase):
+    """Test cases for detect_crisis"""
+    
+    def test_detects_risk_phrases(self):
+        """Test suicidal and self-harm language is detected with its category"""
+        self.assertEqual(detect_crisis("Some days I just want to die."), {"category": "suicidal", "keywords": ["want to die"]})
+        self.assertEqual(detect_crisis("I keep wanting to HURT MYSELF")["category"], "self_harm")
+    
+    def test_suicidal_takes_priority(self):
+        """Test the first category wins while every matched keyword is reported"""
+        detection = detect_crisis("I cut myself and I think about suicide")
+        self.assertEqual(detection, {"category": "suicidal", "keywords": ["cut myself", "suicide"]})
+    
+    def test_ignores_partial_words(self):
+        """Test ordinary messages and look-alike words are not flagged"""
+        for text in ["I had a great day", "I killed it at my presentation", "the end of it all went fine", ""]:
+            self.assertIsNone(detect_crisis(text), text)
+    
+    def test_detection_is_fast(self):
+        """Test detection runs well under a millisecond per message"""
+        text = "I have been feeling low this week and work has been stressful " * 4
+        started = time.perf_counter()
+        for _ in range(1000):
+            detect_crisis(text)
+        # 1000 calls in under a second
+        self.assertLess(time.perf_counter() - started, 1.0)
+    
+    def test_crisis_response(self):
+        """Test the reply is curated and comes with emergency resources"""
+        reply = crisis_response()
+        self.assertIn(reply["response"], CRISIS_RESPONSES)
+        self.assertEqual(reply["resources"], EMERGENCY_RESOURCES)
+
+class TestCrisisRecorder(unittest.TestCase):
+    """Test cases for CrisisRecorder"""
+    
+    def test_record_does_not_wait_for_save(self):
+        """Test record() returns while the save is still blocked"""
+        release = threading.Event()
+        saved = []
+        recorder = CrisisRecorder(lambda event: (release.wait(5), saved.append(event)))
+        
+        started = time.perf_counter()
+        self.assertTrue(recorder.record({"user_id": "user-1"}))
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(saved, [])
+        
+        release.set()
+        self.assertTrue(recorder.flush(timeout=5))
+        self.assertEqual(saved, [{"user_id": "user-1"}])
+        self.assertEqual(recorder.stats(), {"detected": 1, "saved": 1, "failed": 0, "dropped": 0, "pending": 0})
+        recorder.shutdown()
+    
+    def test_failures_are_counted(self):
+        """Test a failing save is logged and counted without stopping the worker"""
+        def save(event):
+            if event["fail"]:
+                raise RuntimeError("database unavailable")
+        recorder = CrisisRecorder(save)
+        recorder.record({"fail": True})
+        recorder.record({"fail": False})
+        recorder.flush(timeout=5)
+        
+        stats = recorder.stats()
+        self.assertEqual((stats["saved"], stats["failed"]), (1, 1))
+        recorder.shutdown()
+    
+    def test_drops_when_full(self):
+        """Test events beyond max_pending are dropped instead of blocking"""
+        release = threading.Event()
+        recorder = CrisisRecorder(lambda event: release.wait(5), max_pending=1)
+        recorder.record({"user_id": "a"})
+        # Times out while "a" is being saved, by which point it has left the queue
+        recorder.flush(timeout=0.1)
+        recorder.record({"user_id": "b"})
+        
+        self.assertFalse(recorder.record({"user_id": "c"}))
+        self.assertEqual(recorder.stats()["dropped"], 1)
+        release.set()
+        recorder.shutdown()
+    
+    def test_shutdown_saves_queued_events(self):
+        """Test shutdown drains the queue before the worker exits"""
+        saved = []
+        recorder = CrisisRecorder(lambda event: (time.sleep(0.01), saved.append(event)))
+        for number in range(3):
+            recorder.record({"number": number})
+        recorder.shutdown()
+        self.assertEqual(len(saved), 3)
+
+class TestChatbotCrisisShortCircuit(unittest.TestCase):
+    """Test cases for crisis handling in the LLM chatbot"""
+    
+    def test_crisis_reply_without_model(self):
+        """Test crisis messages are answered without a loaded model"""
+        bot = MentalHealthChatbot(load=False)
+        self.assertIn(bot.generate_response("I want to end my life"), CRISIS_RESPONSES)
+        pieces = list(bot.stream_response("I want to end my life"))
+        self.assertEqual(len(pieces), 1)
+        self.assertIn(pieces[0], CRISIS_RESPONSES)
+
+if __name__ == '__main__':
+    unittest.main()
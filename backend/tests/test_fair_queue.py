@@ -0,0 +1,136 @@
+"""
+Test suite for weighted fair admission to chat generation
+"""
+
+import unittest
+import threading
+import time
+import sys
+import os
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fair_queue import FairChatQueue, QuotaExceededError, parse_weights
+
+class TestFairChatQueue(unittest.TestCase):
+    """Test cases for FairChatQueue"""
+    
+    def queue_in_order(self, queue, requests):
+        """Queue (user_id, user_class) requests one after another and return the order they are admitted in"""
+        order = []
+        threads = []
+        for number, (user_id, user_class) in enumerate(requests):
+            def run(user_id=user_id, user_class=user_class, number=number):
+                with queue.acquire(user_id, user_class, cost=10, timeout=5):
+                    order.append(number)
+            thread = threading.Thread(target=run)
+            thread.start()
+            threads.append(thread)
+            # Wait until it is queued so tags are handed out in this order
+            while queue.stats()["waiting"] < number + 1:
+                time.sleep(0.001)
+        return order, threads
+    
+    def test_admits_immediately_when_idle(self):
+        """Test a request with free slots and budget starts without waiting"""
+        queue = FairChatQueue()
+        slot = queue.acquire("user-1", "patient", cost=10)
+        
+        self.assertEqual(queue.stats()["in_flight"], 1)
+        slot.release(tokens=4)
+        stats = queue.stats()
+        self.assertEqual((stats["in_flight"], stats["classes"]["patient"]["admitted"]), (0, 1))
+    
+    def test_per_user_in_flight_limit(self):
+        """Test a user at their concurrency limit waits while other users still get in"""
+        queue = FairChatQueue(max_in_flight=4, per_user_in_flight=2)
+        slots = [queue.acquire("heavy"), queue.acquire("heavy")]
+        
+        with self.assertRaises(FutureTimeoutError):
+            queue.acquire("heavy", timeout=0.05)
+        queue.acquire("light", timeout=0.05).release()
+        
+        slots[0].release()
+        queue.acquire("heavy", timeout=1).release()
+        self.assertEqual(queue.stats()["classes"]["patient"]["timed_out"], 1)
+        slots[1].release()
+    
+    def test_light_user_overtakes_heavy_backlog(self):
+        """Test a user with one request is served before another user's queued backlog"""
+        queue = FairChatQueue(max_in_flight=1, per_user_in_flight=1, max_user_queue=8)
+        holder = queue.acquire("holder", cost=10)
+        order, threads = self.queue_in_order(queue, [("heavy", "patient")] * 3 + [("light", "patient")])
+        holder.release()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(order, [0, 3, 1, 2])
+    
+    def test_weights_favour_higher_classes(self):
+        """Test a therapist (weight 2) gets two turns for each patient turn"""
+        queue = FairChatQueue(max_in_flight=1, per_user_in_flight=1, max_user_queue=8,
+                              weights={"patient": 1, "therapist": 2})
+        holder = queue.acquire("holder", cost=10)
+        order, threads = self.queue_in_order(queue, [("patient-1", "patient")] * 2 + [("therapist-1", "therapist")] * 2)
+        holder.release()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(order, [2, 0, 3, 1])
+    
+    def test_sheds_when_queues_are_full(self):
+        """Test requests beyond the user and shared queue limits raise QuotaExceededError with a retry time"""
+        queue = FairChatQueue(max_in_flight=1, max_user_queue=1, max_queue=2)
+        holder = queue.acquire("holder")
+        order, threads = self.queue_in_order(queue, [("user-1", "patient"), ("user-2", "patient")])
+        
+        with self.assertRaises(QuotaExceededError) as own:
+            queue.acquire("user-1")
+        with self.assertRaises(QuotaExceededError) as shared:
+            queue.acquire("user-3")
+        self.assertIn("your queue", str(own.exception))
+        self.assertIn("the queue", str(shared.exception))
+        self.assertGreaterEqual(shared.exception.retry_after, 1)
+        self.assertEqual(queue.stats()["classes"]["patient"]["shed"], 2)
+        
+        holder.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(order), [0, 1])
+    
+    def test_token_budget_queues_instead_of_rejecting(self):
+        """Test a user over their token budget waits for the window to roll over"""
+        queue = FairChatQueue(tokens_per_window=100, window_seconds=0.3)
+        queue.acquire("user-1", cost=50).release(tokens=90)
+        
+        started = time.monotonic()
+        slot = queue.acquire("user-1", cost=50, timeout=5)
+        waited = time.monotonic() - started
+        slot.release()
+        
+        self.assertGreater(waited, 0.15)
+        self.assertGreater(queue.stats()["classes"]["patient"]["max_wait_ms"], 150)
+        # Other users are not held back
+        started = time.monotonic()
+        queue.acquire("user-2", cost=50).release()
+        self.assertLess(time.monotonic() - started, 0.1)
+    
+    def test_forgets_idle_users(self):
+        """Test per-user state is dropped once a user's window is empty"""
+        queue = FairChatQueue(window_seconds=0.05)
+        for number in range(5):
+            queue.acquire(f"user-{number}").release()
+        time.sleep(0.1)
+        queue.acquire("user-5").release()
+        
+        self.assertLessEqual(queue.stats()["tracked_users"], 1)
+    
+    def test_parse_weights(self):
+        """Test class weights parse from the environment format"""
+        self.assertEqual(parse_weights("patient:1,therapist:2.5"), {"patient": 1.0, "therapist": 2.5, "admin": 1.0})
+        self.assertEqual(parse_weights(""), {"patient": 1.0, "therapist": 1.0, "admin": 1.0})
+
+if __name__ == '__main__':
+    unittest.main()
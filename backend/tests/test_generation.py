@@ -0,0 +1,147 @@
+"""
+Test suite for the continuous-batching generation scheduler
+"""
+
+import unittest
+import threading
+import time
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from batching import QueueFullError
+from generation import GenerationScheduler
+from test_chatbot import build_tiny_chatbot
+
+PROMPTS = [
+    "I feel anxious about work",
+    "I cannot sleep",
+    "hello",
+    "we talked about stress yesterday and it was hard"
+]
+
+class TestGenerationScheduler(unittest.TestCase):
+    """Test cases for GenerationScheduler"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.bot = build_tiny_chatbot()
+        cls.bot.scheduler.shutdown()
+        cls.inputs = [cls.bot.tokenizer.encode(cls.bot._build_prompt(prompt), return_tensors="pt") for prompt in PROMPTS]
+        cls.expected = []
+        for inputs in cls.inputs:
+            with torch.no_grad():
+                outputs = cls.bot.model.generate(inputs, do_sample=False, max_new_tokens=12, eos_token_id=1, pad_token_id=1)
+            cls.expected.append(outputs[0, inputs.shape[1]:].tolist())
+    
+    def setUp(self):
+        self.scheduler = GenerationScheduler(self.bot.model, eos_token_id=1, max_batch_size=4, do_sample=False)
+    
+    def tearDown(self):
+        self.scheduler.shutdown()
+    
+    def test_batched_output_matches_generate(self):
+        """Test sequences decoded together match decoding each one alone"""
+        futures = [self.scheduler.submit(inputs, 12) for inputs in self.inputs]
+        results = [future.result(timeout=30) for future in futures]
+        
+        self.assertEqual([result["tokens"] for result in results], self.expected)
+        self.assertEqual({result["finish_reason"] for result in results}, {"length"})
+        self.assertGreater(self.scheduler.stats()["average_batch_size"], 1)
+    
+    def test_admits_new_sequences_at_token_boundaries(self):
+        """Test requests joining a running batch still match, including with a cached prefix"""
+        futures = []
+        for inputs in self.inputs:
+            futures.append(self.scheduler.submit(inputs, 12, past_key_values=self.bot._cached_prefix_for(inputs)))
+            time.sleep(0.005)
+        
+        self.assertEqual([future.result(timeout=30)["tokens"] for future in futures], self.expected)
+    
+    def test_concurrency_shares_decode_steps(self):
+        """Test concurrent requests need about as many steps as the longest one, not their sum"""
+        futures = [self.scheduler.submit(inputs, 12) for inputs in self.inputs]
+        for future in futures:
+            future.result(timeout=30)
+        stats = self.scheduler.stats()
+        
+        self.assertEqual(stats["tokens"], 4 * 12)
+        self.assertLess(stats["steps"], 2 * 12)
+        self.assertEqual(stats["largest_batch"], 4)
+    
+    def test_per_request_limits(self):
+        """Test max_new_tokens and deadlines apply to each request separately"""
+        short = self.scheduler.submit(self.inputs[0], 3)
+        long = self.scheduler.submit(self.inputs[1], 12)
+        expired = self.scheduler.submit(self.inputs[2], 12, timeout=1e-9)
+        
+        self.assertEqual(short.result(timeout=30)["tokens"], self.expected[0][:3])
+        self.assertEqual(long.result(timeout=30)["tokens"], self.expected[1])
+        self.assertEqual(expired.result(timeout=30), {"tokens": [], "finish_reason": "deadline", "time_to_first_token_ms": None})
+        self.assertEqual(self.scheduler.stats()["deadline_exceeded"], 1)
+    
+    def test_cancel_and_token_callback(self):
+        """Test cancelling from the token callback stops the sequence at the next token"""
+        cancel = threading.Event()
+        seen = []
+        
+        def on_token(token):
+            seen.append(token)
+            if len(seen) == 2:
+                cancel.set()
+        
+        result = self.scheduler.submit(self.inputs[0], 12, cancel_event=cancel, on_token=on_token).result(timeout=30)
+        
+        self.assertEqual(result["finish_reason"], "cancelled")
+        self.assertEqual(result["tokens"], seen)
+        self.assertEqual(seen, self.expected[0][:2])
+    
+    def test_queue_limit(self):
+        """Test submissions beyond the queue size are rejected"""
+        scheduler = GenerationScheduler(self.bot.model, eos_token_id=1, max_queue_size=1)
+        # Pretend the worker is running so nothing drains the queue
+        scheduler._worker = threading.current_thread()
+        scheduler.submit(self.inputs[0], 4)
+        with self.assertRaises(QueueFullError):
+            scheduler.submit(self.inputs[1], 4)
+        self.assertEqual(scheduler.stats()["rejected"], 1)
+
+class TestChatbotScheduling(unittest.TestCase):
+    """Test cases for chatbot replies served through the scheduler"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.bot = build_tiny_chatbot()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.bot.scheduler.shutdown()
+    
+    def test_concurrent_replies_are_batched(self):
+        """Test replies requested from several threads share decode steps"""
+        replies = []
+        threads = [
+            threading.Thread(target=lambda prompt=prompt: replies.append(self.bot.generate_response(prompt)))
+            for prompt in PROMPTS
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+        
+        self.assertEqual(len(replies), len(PROMPTS))
+        self.assertGreater(self.bot.scheduler.stats()["largest_batch"], 1)
+    
+    def test_stream_through_scheduler(self):
+        """Test streamed replies are delivered token by token by the scheduler"""
+        before = self.bot.scheduler.stats()["submitted"]
+        pieces = list(self.bot.stream_response("I feel anxious about work"))
+        
+        self.assertTrue(pieces)
+        self.assertEqual(self.bot.scheduler.stats()["submitted"], before + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Test suite for latency-budgeted chat with rule-based fallback
+"""
+
+import unittest
+import time
+import sys
+import os
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batching import QueueFullError
+from hedged_chat import BudgetedChat
+from simple_chatbot import SimpleMentalHealthChatbot
+from test_chatbot import build_tiny_chatbot
+
+class FakeLLM:
+    """LLM stand-in that replies, raises or times out as told"""
+    
+    def __init__(self, reply="A slow breath can help.", error=None):
+        self.reply = reply
+        self.error = error
+        self.timeouts = []
+    
+    def generate_response(self, user_input, context="", timeout=None):
+        self.timeouts.append(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.reply
+
+class TestBudgetedChat(unittest.TestCase):
+    """Test cases for BudgetedChat"""
+    
+    def setUp(self):
+        self.fallback = SimpleMentalHealthChatbot()
+    
+    def test_llm_reply_within_budget(self):
+        """Test the LLM answers when it meets the budget"""
+        llm = FakeLLM()
+        chat = BudgetedChat(llm, self.fallback, budget_seconds=2.0)
+        
+        reply = chat.respond("I feel anxious")
+        
+        self.assertEqual((reply["response"], reply["engine"], reply["fallback_reason"]), ("A slow breath can help.", "llm", None))
+        self.assertEqual(llm.timeouts, [2.0])
+    
+    def test_fallback_reasons(self):
+        """Test deadline misses, overload and empty replies fall back to the rule-based bot"""
+        cases = [
+            (FakeLLM(error=FutureTimeoutError()), "budget_missed"),
+            (FakeLLM(error=QueueFullError("full")), "overloaded"),
+            (FakeLLM(reply="   "), "empty_reply")
+        ]
+        loading = FakeLLM()
+        loading.is_ready = False
+        cases.append((loading, "loading"))
+        for llm, reason in cases:
+            chat = BudgetedChat(llm, self.fallback)
+            reply = chat.respond("I feel anxious")
+            self.assertEqual((reply["engine"], reply["fallback_reason"]), ("rule_based", reason))
+            self.assertIn(reply["response"], self.fallback.responses["anxiety"])
+            self.assertEqual(chat.stats()[reason], 1)
+        self.assertEqual(loading.timeouts, [])
+    
+    def test_other_errors_are_not_hidden(self):
+        """Test unexpected errors still reach the caller"""
+        chat = BudgetedChat(FakeLLM(error=RuntimeError("boom")), self.fallback)
+        with self.assertRaises(RuntimeError):
+            chat.respond("hello")
+    
+    def test_budget_for_request(self):
+        """Test client budgets are converted to seconds and capped"""
+        chat = BudgetedChat(FakeLLM(), self.fallback, budget_seconds=8.0, max_budget_seconds=30.0)
+        
+        self.assertEqual(chat.budget_for(None), 8.0)
+        self.assertEqual(chat.budget_for(1500), 1.5)
+        self.assertEqual(chat.budget_for(10 ** 9), 30.0)
+        self.assertEqual(chat.budget_for(-5), 0.0)
+    
+    def test_stats(self):
+        """Test counters and latency percentiles are exported"""
+        chat = BudgetedChat(FakeLLM(), self.fallback)
+        for _ in range(3):
+            chat.respond("hello")
+        chat.llm = FakeLLM(error=FutureTimeoutError())
+        chat.respond("hello")
+        stats = chat.stats()
+        
+        self.assertEqual((stats["requests"], stats["llm"], stats["rule_based"], stats["budget_missed"]), (4, 3, 1, 1))
+        self.assertEqual(stats["fallback_rate"], 0.25)
+        self.assertIsNotNone(stats["p99_ms"])
+
+class TestChatbotDeadline(unittest.TestCase):
+    """Test cases for generation timeouts in the LLM chatbot"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.bot = build_tiny_chatbot()
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.bot.scheduler.shutdown()
+    
+    def wait_until_idle(self):
+        """Wait for requests abandoned by earlier tests to leave the scheduler"""
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            stats = self.bot.scheduler.stats()
+            if stats["completed"] + stats["failed"] == stats["submitted"]:
+                return stats
+            time.sleep(0.01)
+        self.fail("scheduler did not finish its requests")
+    
+    def test_missed_deadline_cancels_generation(self):
+        """Test a reply that misses its timeout raises and is cancelled in the scheduler"""
+        before = self.wait_until_idle()["cancelled"]
+        with self.assertRaises(FutureTimeoutError):
+            self.bot.generate_response("I feel anxious about work", timeout=0.0)
+        
+        self.assertEqual(self.wait_until_idle()["cancelled"], before + 1)
+    
+    def test_budgeted_chat_with_tiny_model(self):
+        """Test a generous budget is met and a zero budget is answered by the fallback"""
+        chat = BudgetedChat(self.bot, SimpleMentalHealthChatbot())
+        
+        # A random model can still produce an empty reply, which is a separate fallback
+        self.assertIn(chat.respond("I cannot sleep", budget_seconds=30.0)["fallback_reason"], [None, "empty_reply"])
+        reply = chat.respond("I cannot sleep", budget_seconds=0.0)
+        self.assertEqual((reply["engine"], reply["fallback_reason"]), ("rule_based", "budget_missed"))
+        self.assertLess(reply["latency_ms"], 1000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Test suite for the keyword lexicon and the rule-based chatbot intents
+"""
+
+import unittest
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lexicon
+from lexicon import KeywordMatcher
+from simple_chatbot import SimpleMentalHealthChatbot
+
+class TestKeywordMatcher(unittest.TestCase):
+    """Test cases for KeywordMatcher"""
+    
+    def setUp(self):
+        """Build a matcher with single-word and phrase keywords"""
+        self.matcher = KeywordMatcher({
+            "crisis": ["kill myself", "want to die"],
+            "sad": ["sad", "down"],
+            "greeting": ["hi", "good morning"]
+        })
+    
+    def test_matches_whole_words_only(self):
+        """Test keywords are not found inside longer words"""
+        found = self.matcher.match("This crusade went downhill")
+        self.assertEqual(found, {"crisis": set(), "sad": set(), "greeting": set()})
+    
+    def test_matches_phrases_and_punctuation(self):
+        """Test multi-word phrases match across tokens and ignore case and punctuation"""
+        found = self.matcher.match("Good morning! Honestly I feel SAD, like I want to die.")
+        self.assertEqual(found["crisis"], {"want to die"})
+        self.assertEqual(found["sad"], {"sad"})
+        self.assertEqual(found["greeting"], {"good morning"})
+    
+    def test_partial_phrase_does_not_match(self):
+        """Test a phrase needs all of its tokens in sequence"""
+        self.assertEqual(self.matcher.match("I want to dance")["crisis"], set())
+    
+    def test_first_category_follows_priority(self):
+        """Test the earliest category with a hit wins"""
+        self.assertEqual(self.matcher.first_category("hi, feeling down"), "sad")
+        self.assertEqual(self.matcher.first_category("hi there"), "greeting")
+        self.assertIsNone(self.matcher.first_category("nothing here"))
+    
+    def test_match_many_preserves_order(self):
+        """Test the batch API returns one result per text"""
+        results = self.matcher.match_many(["sad", "hi", ""])
+        self.assertEqual([r["sad"] for r in results], [{"sad"}, set(), set()])
+        self.assertEqual(results[1]["greeting"], {"hi"})
+
+class TestLexiconClassify(unittest.TestCase):
+    """Test cases for lexicon.classify"""
+    
+    def test_counts_distinct_keywords(self):
+        """Test each keyword counts once and substrings are ignored"""
+        result = lexicon.classify("Happy happy, grateful. The crusade was badly planned")
+        self.assertEqual(result["sentiment"], "positive")
+        self.assertEqual(result["positive_hits"], 2)
+        self.assertEqual(result["negative_hits"], 0)
+        self.assertEqual(result["score"], 0.7)
+    
+    def test_negated_keywords_conflict(self):
+        """Test keywords after a negator do not count for their polarity and mark the result conflicting"""
+        result = lexicon.classify("not happy, not good, not great")
+        self.assertEqual((result["sentiment"], result["positive_hits"], result["negated_hits"]), ("neutral", 0, 3))
+        self.assertTrue(result["conflicting"])
+        
+        result = lexicon.classify("I don't feel sad today, I'm happy")
+        self.assertEqual((result["sentiment"], result["negative_hits"], result["negated_hits"]), ("positive", 0, 1))
+        self.assertTrue(result["conflicting"])
+        
+        result = lexicon.classify("Not much happened, but I was happy and grateful")
+        self.assertEqual(result["negated_hits"], 0)
+        self.assertFalse(result["conflicting"])
+    
+    def test_classify_many_matches_classify(self):
+        """Test the batch API agrees with single classification"""
+        texts = ["so sad and upset", "good but worried", "just a day", "never happy"]
+        self.assertEqual(lexicon.classify_many(texts), [lexicon.classify(text) for text in texts])
+
+class TestChatbotIntents(unittest.TestCase):
+    """Test cases for SimpleMentalHealthChatbot intent detection"""
+    
+    def setUp(self):
+        self.chatbot = SimpleMentalHealthChatbot()
+    
+    def test_crisis_takes_priority(self):
+        """Test crisis phrases win over every other intent"""
+        self.assertEqual(self.chatbot.detect_intent("Hi, I want to die"), "crisis")
+    
+    def test_no_false_greeting_inside_words(self):
+        """Test "hi" inside "this" or "which" is not a greeting"""
+        self.assertEqual(self.chatbot.detect_intent("This week which I dreaded was stressful"), "default")
+        self.assertEqual(self.chatbot.detect_intent("This pressure is a lot"), "stress")
+    
+    def test_detect_intents_batch(self):
+        """Test batched intent detection keeps input order"""
+        intents = self.chatbot.detect_intents(["hello", "I feel hopeless", "I need some advice"])
+        self.assertEqual(intents, ["greeting", "negative", "support"])
+    
+    def test_response_uses_detected_intent(self):
+        """Test generated responses come from the detected intent's pool"""
+        response = self.chatbot.generate_response("I'm so anxious about tomorrow")
+        self.assertIn(response, self.chatbot.responses["anxiety"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+"""
+Test suite for the MoodMate AI sentiment model wrapper
+"""
+
+import unittest
+from unittest.mock import patch, MagicMock
+import re
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model import MoodAnalyzer
+
+def fake_pipeline(texts, **kwargs):
+    """Stand-in for the transformers pipeline that labels texts by keyword"""
+    if isinstance(texts, str):
+        texts = [texts]
+    results = []
+    for text in texts:
+        if "explode" in text:
+            raise ValueError("bad input")
+        label = "NEGATIVE" if "sad" in text else "POSITIVE"
+        results.append({"label": label, "score": 0.987})
+    return results
+
+class FakeTokenizer:
+    """Whitespace tokenizer with the offset mapping the chunker relies on"""
+    
+    model_max_length = 12
+    do_lower_case = True
+    
+    def __call__(self, texts, add_special_tokens=False, return_offsets_mapping=False):
+        return {"offset_mapping": [[match.span() for match in re.finditer(r"\S+", text)] for text in texts]}
+
+class TestMoodAnalyzer(unittest.TestCase):
+    """Test cases for MoodAnalyzer"""
+    
+    def setUp(self):
+        """Build an analyzer around a fake pipeline"""
+        self.pipeline = MagicMock(side_effect=fake_pipeline)
+        self.pipeline.tokenizer = FakeTokenizer()
+        with patch('model.pipeline', return_value=self.pipeline):
+            self.analyzer = MoodAnalyzer()
+        # Forget the warmup call so tests count only their own forward passes
+        self.pipeline.reset_mock()
+    
+    def test_load_warms_up_and_reports_ready(self):
+        """Test synchronous load runs a warmup inference and marks the model ready"""
+        pipe = MagicMock(side_effect=fake_pipeline)
+        with patch('model.pipeline', return_value=pipe):
+            analyzer = MoodAnalyzer()
+        
+        self.assertTrue(analyzer.is_ready)
+        self.assertEqual(analyzer.readiness()["status"], "ready")
+        pipe.assert_called_once()
+    
+    def test_background_load_failure_is_reported(self):
+        """Test a failed background load surfaces as status failed"""
+        with patch('model.pipeline', side_effect=OSError("no network")):
+            analyzer = MoodAnalyzer(background=True)
+            self.assertFalse(analyzer.wait_until_ready(timeout=5))
+        
+        readiness = analyzer.readiness()
+        self.assertEqual(readiness["status"], "failed")
+        self.assertIn("no network", readiness["error"])
+    
+    def test_analyze(self):
+        """Test single text analysis"""
+        result = self.analyzer.analyze("happy day")
+        self.assertEqual(result, {"sentiment": "positive", "score": 0.99})
+    
+    def test_analyze_many_batches_in_order(self):
+        """Test batch analysis keeps input order and honours batch size"""
+        texts = ["happy", "sad", "fine", "so sad", "great"]
+        results = self.analyzer.analyze_many(texts, batch_size=2)
+        
+        self.assertEqual([r["sentiment"] for r in results],
+                         ["positive", "negative", "positive", "negative", "positive"])
+        # Five texts in batches of two means three forward passes
+        self.assertEqual(self.pipeline.call_count, 3)
+        for call in self.pipeline.call_args_list:
+            self.assertLessEqual(len(call.args[0]), 2)
+            self.assertTrue(call.kwargs["truncation"])
+    
+    def test_analyze_many_reports_errors_per_item(self):
+        """Test a failing text doesn't fail the rest of its batch"""
+        results = self.analyzer.analyze_many(["happy", "explode", "", "sad"], batch_size=4)
+        
+        self.assertEqual(results[0]["sentiment"], "positive")
+        self.assertIn("error", results[1])
+        self.assertEqual(results[2], {"error": "No text provided"})
+        self.assertEqual(results[3]["sentiment"], "negative")
+
+    def test_repeated_texts_are_served_from_cache(self):
+        """Test repeats only reach the model once"""
+        self.analyzer.analyze("happy day")
+        results = self.analyzer.analyze_many(["happy day", "sad day", "sad day"])
+        
+        self.assertEqual([r["sentiment"] for r in results], ["positive", "negative", "negative"])
+        # One call for analyze(), one batch holding the single distinct miss
+        self.assertEqual(self.pipeline.call_count, 2)
+        self.assertEqual(self.pipeline.call_args_list[1].args[0], ["sad day"])
+        self.assertEqual(self.analyzer.cache.stats()["hits"], 1)
+    
+    def test_model_version_change_invalidates_cache(self):
+        """Test cached results are not reused across model versions"""
+        self.analyzer.analyze("happy day")
+        self.analyzer.model_version = "new-revision"
+        self.analyzer.analyze("happy day")
+        
+        self.assertEqual(self.pipeline.call_count, 2)
+
+    def test_long_entries_are_chunked_and_combined(self):
+        """Test entries over the token window are split and length-weighted"""
+        # Ten tokens fit the window of 12 - 2 special tokens; this has 25,
+        # giving four overlapping windows of which only the last contains "sad"
+        text = " ".join(["happy"] * 20 + ["sad"] * 5)
+        result = self.analyzer.analyze(text)
+        
+        self.pipeline.assert_called_once()
+        batch = self.pipeline.call_args.args[0]
+        self.assertEqual(len(batch), 4)
+        self.assertTrue(all(len(chunk.split()) == 10 for chunk in batch))
+        self.assertEqual(result, {"sentiment": "positive", "score": 0.74})
+    
+    def test_batches_are_bucketed_by_length(self):
+        """Test short texts are batched together rather than with long ones"""
+        texts = ["one two three four five six seven", "hi", "one two three four five six", "hey"]
+        self.analyzer.analyze_many(texts, batch_size=2)
+        
+        batches = [call.args[0] for call in self.pipeline.call_args_list]
+        self.assertEqual(batches[0], ["hi", "hey"])
+        self.assertEqual(len(batches[1]), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+"""
+Test suite for per-user mood aggregates and the rebuild command
+"""
+
+import unittest
+import sys
+import os
+from unittest.mock import MagicMock
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mood_aggregates import aggregate_differences, analytics_summary, build_aggregate, rebuild_aggregates
+
+def log(log_id, created_at, sentiment="positive", score=0.5, user_id="user-1"):
+    return {"id": log_id, "user_id": user_id, "created_at": created_at, "sentiment": sentiment, "score": score}
+
+class FakeQuery:
+    """Minimal Supabase query builder over in-memory rows"""
+    
+    def __init__(self, table):
+        self.table = table
+        self.filters = []
+        self.slice = None
+    
+    def select(self, columns):
+        return self
+    
+    def eq(self, column, value):
+        self.filters.append((column, value))
+        return self
+    
+    def order(self, column):
+        return self
+    
+    def range(self, start, end):
+        self.slice = (start, end + 1)
+        return self
+    
+    def upsert(self, row, on_conflict=None):
+        self.table.rows = [existing for existing in self.table.rows if existing["user_id"] != row["user_id"]] + [row]
+        return self
+    
+    def delete(self):
+        self.deleting = True
+        return self
+    
+    def execute(self):
+        rows = [row for row in self.table.rows if all(row.get(column) == value for column, value in self.filters)]
+        if getattr(self, "deleting", False):
+            self.table.rows = [row for row in self.table.rows if row not in rows]
+            rows = []
+        if self.slice is not None:
+            rows = rows[self.slice[0]:self.slice[1]]
+        return MagicMock(data=rows)
+
+class FakeTable:
+    def __init__(self, rows):
+        self.rows = rows
+
+class FakeClient:
+    def __init__(self, logs, aggregates):
+        self.tables = {"mood_logs": FakeTable(logs), "mood_aggregates": FakeTable(aggregates)}
+    
+    def table(self, name):
+        return FakeQuery(self.tables[name])
+
+class TestBuildAggregate(unittest.TestCase):
+    """Test cases for computing aggregates from logs"""
+    
+    def test_totals_and_counts(self):
+        """Test entry counts, score sum and sentiment counts"""
+        aggregate = build_aggregate("user-1", [
+            log(1, "2024-01-01T08:00:00Z", "positive", 0.8),
+            log(2, "2024-01-02T08:00:00Z", "negative", 0.3),
+            log(3, "2024-01-02T20:00:00Z", "neutral", 0.55)
+        ])
+        
+        self.assertEqual(
+            (aggregate["total_entries"], aggregate["score_sum"], aggregate["positive_count"],
+             aggregate["negative_count"], aggregate["neutral_count"]),
+            (3, 1.65, 1, 1, 1)
+        )
+        self.assertEqual(aggregate["last_entry_date"], "2024-01-02")
+        self.assertIsNone(build_aggregate("user-1", []))
+    
+    def test_streak_counts_consecutive_days_ending_at_last_entry(self):
+        """Test the streak ignores repeat entries on a day and stops at the first gap"""
+        aggregate = build_aggregate("user-1", [
+            log(1, "2024-01-01T08:00:00Z"),
+            log(2, "2024-01-03T08:00:00Z"),
+            log(3, "2024-01-04T08:00:00Z"),
+            log(4, "2024-01-04T09:00:00Z"),
+            log(5, "2024-01-05T23:30:00+00:00")
+        ])
+        self.assertEqual(aggregate["current_streak"], 3)
+    
+    def test_days_are_utc(self):
+        """Test entries are bucketed by their UTC day"""
+        aggregate = build_aggregate("user-1", [
+            log(1, "2024-01-01T23:00:00-05:00"),
+            log(2, "2024-01-02T12:00:00Z")
+        ])
+        self.assertEqual((aggregate["last_entry_date"], aggregate["current_streak"]), ("2024-01-02", 1))
+    
+    def test_recent_scores_are_the_latest_seven_in_time_order(self):
+        """Test recent_scores keeps the newest seven scores, oldest first, whatever the input order"""
+        logs = [log(day, f"2024-01-{day:02d}T08:00:00Z", score=day / 10) for day in range(1, 10)]
+        aggregate = build_aggregate("user-1", list(reversed(logs)))
+        self.assertEqual(aggregate["recent_scores"], [0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9])
+
+class TestAnalyticsSummary(unittest.TestCase):
+    """Test cases for the dashboard analytics read from an aggregate"""
+    
+    def test_summary_from_aggregate(self):
+        """Test the summary derives the average and trend from the stored row"""
+        aggregate = build_aggregate("user-1", [
+            log(1, "2024-01-01T00:00:00Z", "positive", 0.8),
+            log(2, "2024-01-02T00:00:00Z", "positive", 0.7),
+            log(3, "2024-01-03T00:00:00Z", "negative", 0.3)
+        ])
+        self.assertEqual(analytics_summary(aggregate), {
+            "total_entries": 3,
+            "average_score": 0.6,
+            "positive_days": 2,
+            "negative_days": 1,
+            "neutral_days": 0,
+            "streak": 3,
+            "trend": "negative"
+        })
+    
+    def test_summary_without_logs(self):
+        """Test users without an aggregate get zeros"""
+        summary = analytics_summary(None)
+        self.assertEqual((summary["total_entries"], summary["average_score"], summary["trend"]), (0, 0, "neutral"))
+
+class TestRebuildAggregates(unittest.TestCase):
+    """Test cases for the rebuild and verify command"""
+    
+    def setUp(self):
+        self.logs = [
+            log(1, "2024-01-01T08:00:00Z", user_id="user-1"),
+            log(2, "2024-01-02T08:00:00Z", user_id="user-1"),
+            log(3, "2024-01-02T08:00:00Z", "negative", 0.2, user_id="user-2")
+        ]
+    
+    def test_matching_aggregates_verify(self):
+        """Test aggregates equal to a recomputation report no mismatches, across pages"""
+        stored = [build_aggregate("user-1", self.logs[:2]), build_aggregate("user-2", self.logs[2:])]
+        # Values as PostgREST returns them
+        stored[0] = dict(stored[0], score_sum="1.00", last_entry_at="2024-01-02T08:00:00+00:00")
+        client = FakeClient(self.logs, stored)
+        
+        report = rebuild_aggregates(client, page_size=2)
+        self.assertEqual((report["checked"], report["mismatched"]), (2, {}))
+    
+    def test_mismatches_are_reported_and_fixed(self):
+        """Test wrong, missing and orphaned aggregates are found and repaired"""
+        wrong = dict(build_aggregate("user-1", self.logs[:2]), current_streak=1, total_entries=5)
+        orphan = dict(build_aggregate("user-2", self.logs[2:]), user_id="user-3")
+        client = FakeClient(self.logs, [wrong, orphan])
+        
+        report = rebuild_aggregates(client)
+        self.assertEqual(report["mismatched"], {
+            "user-1": ["total_entries", "current_streak"],
+            "user-2": ["missing"],
+            "user-3": ["orphaned"]
+        })
+        self.assertEqual(len(client.tables["mood_aggregates"].rows), 2)
+        
+        report = rebuild_aggregates(client, fix=True)
+        self.assertTrue(report["fixed"])
+        self.assertEqual(rebuild_aggregates(client)["mismatched"], {})
+        self.assertEqual(sorted(row["user_id"] for row in client.tables["mood_aggregates"].rows), ["user-1", "user-2"])
+    
+    def test_single_user(self):
+        """Test --user limits the check to one user"""
+        client = FakeClient(self.logs, [])
+        report = rebuild_aggregates(client, user_id="user-2")
+        self.assertEqual(report["mismatched"], {"user-2": ["missing"]})
+    
+    def test_differences(self):
+        """Test scores compare at two decimals and timestamps by instant"""
+        aggregate = build_aggregate("user-1", self.logs[:2])
+        stored = dict(aggregate, recent_scores=["0.50", "0.50"], last_entry_at="2024-01-02T09:00:00+01:00")
+        self.assertEqual(aggregate_differences(aggregate, stored), [])
+        self.assertEqual(aggregate_differences(None, None), [])
+
+if __name__ == '__main__':
+    unittest.main()
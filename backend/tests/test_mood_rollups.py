@@ -0,0 +1,249 @@
+"""
+Test suite for daily mood rollups and their catch-up job
+"""
+
+import unittest
+import sys
+import os
+from datetime import date, datetime, timezone
+from unittest.mock import MagicMock, patch
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mood_rollups import (
+    RollupRefresher, build_rollups, local_today, refresh_rollups, rollup_differences, summarize_rollups, user_today
+)
+
+def log(log_id, user_id, created_at, score=0.5, sentiment="positive"):
+    return {"id": log_id, "user_id": user_id, "created_at": created_at, "score": score, "sentiment": sentiment}
+
+def rollup(local_date, entries=1, score_sum=0.5, positive=1, negative=0, neutral=0):
+    return {"local_date": local_date, "entries": entries, "score_sum": score_sum,
+            "positive_count": positive, "negative_count": negative, "neutral_count": neutral}
+
+class FakeQuery:
+    """Minimal Supabase query builder over in-memory rows"""
+    
+    def __init__(self, table):
+        self.table = table
+        self.filters = []
+        self.slice = None
+    
+    def select(self, columns):
+        return self
+    
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+    
+    def gte(self, column, value):
+        self.filters.append(lambda row: str(row.get(column)) >= value)
+        return self
+    
+    def in_(self, column, values):
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+    
+    def order(self, column):
+        return self
+    
+    def range(self, start, end):
+        self.slice = (start, end + 1)
+        return self
+    
+    def execute(self):
+        rows = [row for row in self.table.rows if all(check(row) for check in self.filters)]
+        if self.slice is not None:
+            rows = rows[self.slice[0]:self.slice[1]]
+        return MagicMock(data=rows)
+
+class FakeTable:
+    def __init__(self, rows):
+        self.rows = rows
+
+class FakeClient:
+    def __init__(self, **tables):
+        self.tables = {name: FakeTable(rows) for name, rows in tables.items()}
+        self.calls = []
+    
+    def table(self, name):
+        return FakeQuery(self.tables[name])
+    
+    def rpc(self, name, params):
+        """rebuild_mood_daily_rollup: replace one user's rollup for one day with a fresh recompute"""
+        self.calls.append((name, params))
+        key = (params["target_user"], params["target_date"])
+        timezones = {row["id"]: row.get("timezone") for row in self.tables["users"].rows}
+        rebuilt = build_rollups(self.tables["mood_logs"].rows, timezones).get(key)
+        rollups = self.tables["mood_daily_rollups"]
+        rollups.rows = [row for row in rollups.rows if (row["user_id"], row["local_date"]) != key]
+        rollups.rows += [rebuilt] if rebuilt else []
+        return MagicMock(execute=MagicMock(return_value=MagicMock(data=None)))
+
+class TestBuildRollups(unittest.TestCase):
+    """Test cases for computing rollups from logs"""
+    
+    def test_days_follow_each_users_time_zone(self):
+        """Test logs are grouped by local date, with count, sum, min, max and sentiments"""
+        rollups = build_rollups([
+            log(1, "ny", "2024-03-10T03:00:00Z", 0.2, "negative"),
+            log(2, "ny", "2024-03-10T12:00:00Z", 0.8),
+            log(3, "ny", "2024-03-10T20:00:00Z", 0.6, "neutral"),
+            log(4, "utc", "2024-03-10T03:00:00Z", 0.4, "neutral")
+        ], {"ny": "America/New_York"})
+        
+        self.assertEqual(sorted(rollups), [("ny", "2024-03-09"), ("ny", "2024-03-10"), ("utc", "2024-03-10")])
+        self.assertEqual(rollups[("ny", "2024-03-10")], {
+            "user_id": "ny", "local_date": "2024-03-10", "entries": 2, "score_sum": 1.4, "score_min": 0.6,
+            "score_max": 0.8, "positive_count": 1, "negative_count": 0, "neutral_count": 1
+        })
+        self.assertEqual(rollups[("ny", "2024-03-09")]["negative_count"], 1)
+    
+    def test_differences(self):
+        """Test decimals from the database compare equal and missing rows are named"""
+        expected = build_rollups([log(1, "u", "2024-01-01T00:00:00Z", 0.5)])[("u", "2024-01-01")]
+        stored = dict(expected, score_sum="0.50", score_min="0.50", score_max="0.50")
+        self.assertEqual(rollup_differences(expected, stored), [])
+        self.assertEqual(rollup_differences(expected, dict(stored, entries=2)), ["entries"])
+        self.assertEqual(rollup_differences(expected, None), ["missing"])
+        self.assertEqual(rollup_differences(None, stored), ["orphaned"])
+
+class TestSummarizeRollups(unittest.TestCase):
+    """Test cases for reading summaries from rollups"""
+    
+    def test_summary(self):
+        """Test totals, streak and week-over-week averages"""
+        summary = summarize_rollups([
+            rollup("2024-01-10", 2, 1.6, positive=2),
+            rollup("2024-01-09", 1, 0.7),
+            rollup("2024-01-02", 1, 0.2, positive=0, negative=1),
+            rollup("2024-01-07", 1, 0.5, positive=0, neutral=1)
+        ], as_of=date(2024, 1, 10))
+        
+        self.assertEqual(
+            (summary["entries"], summary["days_logged"], summary["positive"], summary["negative"], summary["neutral"]),
+            (5, 4, 3, 1, 1)
+        )
+        self.assertEqual(summary["average_score"], 0.6)
+        self.assertEqual(summary["streak"], 2)
+        self.assertEqual((summary["this_week"], summary["last_week"], summary["week_delta"]), (0.7, 0.2, 0.5))
+    
+    def test_local_today(self):
+        """Test today follows the user's zone, so rollups dated ahead of UTC still count as this week"""
+        now = datetime(2026, 10, 17, 20, 0, tzinfo=timezone.utc)
+        client = FakeClient(users=[{"id": "syd", "timezone": "Australia/Sydney"}, {"id": "la", "timezone": "America/Los_Angeles"}])
+        
+        self.assertEqual(user_today(client, "syd", now), date(2026, 10, 18))
+        self.assertEqual(user_today(client, "la", now), date(2026, 10, 17))
+        self.assertEqual(user_today(client, "unknown", now), date(2026, 10, 17))
+        self.assertEqual(local_today("Not/AZone", now), date(2026, 10, 17))
+        
+        summary = summarize_rollups([rollup("2026-10-18"), rollup("2026-10-17")], as_of=user_today(client, "syd", now))
+        self.assertEqual((summary["this_week"], summary["streak"]), (0.5, 2))
+    
+    def test_stale_streak_and_empty(self):
+        """Test a streak that ended before yesterday is 0, and no rollups give zeros"""
+        self.assertEqual(summarize_rollups([rollup("2024-01-01")], as_of=date(2024, 1, 5))["streak"], 0)
+        self.assertEqual(summarize_rollups([rollup("2024-01-04")], as_of=date(2024, 1, 5))["streak"], 1)
+        empty = summarize_rollups([])
+        self.assertEqual((empty["entries"], empty["streak"], empty["week_delta"]), (0, 0, None))
+
+class TestRefreshRollups(unittest.TestCase):
+    """Test cases for the catch-up job"""
+    
+    def setUp(self):
+        self.now = datetime(2024, 1, 10, 12, 0, tzinfo=timezone.utc)
+        self.logs = [
+            log(1, "u1", "2024-01-01T08:00:00+00:00", 0.3),
+            log(2, "u1", "2024-01-09T08:00:00+00:00", 0.5),
+            log(3, "u1", "2024-01-10T08:00:00+00:00", 0.7),
+            log(4, "u1", "2024-01-10T09:00:00+00:00", 0.9)
+        ]
+    
+    def client(self, rollups):
+        return FakeClient(
+            mood_logs=self.logs,
+            mood_daily_rollups=rollups,
+            users=[{"id": "u1", "timezone": "UTC"}]
+        )
+    
+    def test_repairs_recent_days_only(self):
+        """Test wrong, missing and orphaned rollups in the window are repaired and older days are left alone"""
+        correct = build_rollups(self.logs)
+        stale_old_day = dict(correct[("u1", "2024-01-01")], entries=7)
+        undercounted = dict(correct[("u1", "2024-01-10")], entries=1, score_sum=0.7, score_max=0.7)
+        orphan = dict(correct[("u1", "2024-01-09")], local_date="2024-01-08")
+        client = self.client([stale_old_day, undercounted, orphan])
+        
+        report = refresh_rollups(client, days=2, now=self.now)
+        
+        self.assertEqual(report["mismatched"], {
+            "u1/2024-01-08": ["orphaned"],
+            "u1/2024-01-09": ["missing"],
+            "u1/2024-01-10": ["entries", "score_sum", "score_max"]
+        })
+        self.assertEqual(report["fixed"], 3)
+        self.assertEqual(client.calls, [
+            ("rebuild_mood_daily_rollup", {"target_user": "u1", "target_date": local_date})
+            for local_date in ("2024-01-08", "2024-01-09", "2024-01-10")
+        ])
+        rows = {row["local_date"]: row for row in client.tables["mood_daily_rollups"].rows}
+        self.assertEqual(sorted(rows), ["2024-01-01", "2024-01-09", "2024-01-10"])
+        self.assertEqual(rows["2024-01-01"]["entries"], 7)
+        self.assertEqual(rows["2024-01-10"]["entries"], 2)
+        self.assertEqual(refresh_rollups(client, days=2, now=self.now)["mismatched"], {})
+    
+    def test_log_written_during_the_check_is_kept(self):
+        """Test a rollup the trigger updated after the logs were read is rebuilt from current logs, not overwritten"""
+        client = self.client([])
+        late = log(5, "u1", "2024-01-10T10:00:00+00:00", 0.1, "negative")
+        read_logs = FakeQuery.execute
+        
+        def execute(query):
+            result = read_logs(query)
+            # The log and its trigger-maintained rollup land between reading mood_logs and the rollups
+            if query.table is client.tables["mood_logs"] and late not in self.logs:
+                self.logs.append(late)
+                client.tables["mood_daily_rollups"].rows = list(build_rollups(self.logs).values())
+            return result
+        
+        with patch.object(FakeQuery, "execute", execute):
+            report = refresh_rollups(client, days=2, now=self.now)
+        
+        self.assertEqual(report["mismatched"], {"u1/2024-01-10": ["entries", "score_sum", "score_min", "negative_count"]})
+        rows = {row["local_date"]: row for row in client.tables["mood_daily_rollups"].rows}
+        self.assertEqual((rows["2024-01-10"]["entries"], rows["2024-01-10"]["negative_count"]), (3, 1))
+    
+    def test_check_only_and_full_history(self):
+        """Test fix=False reports without writing, and days=0 covers every day"""
+        client = self.client([])
+        
+        report = refresh_rollups(client, days=0, fix=False, now=self.now)
+        
+        self.assertEqual(len(report["mismatched"]), 3)
+        self.assertEqual(report["fixed"], 0)
+        self.assertEqual(client.tables["mood_daily_rollups"].rows, [])
+
+class TestRollupRefresher(unittest.TestCase):
+    """Test cases for the background refresher"""
+    
+    def test_run_once_records_outcomes(self):
+        """Test runs, repairs and failures are counted"""
+        refresher = RollupRefresher(MagicMock(), interval=0)
+        with patch('mood_rollups.refresh_rollups', return_value={"checked": 3, "mismatched": {"u1/2024-01-01": ["missing"]}, "fixed": 1}):
+            refresher.run_once()
+        with patch('mood_rollups.refresh_rollups', side_effect=RuntimeError("down")):
+            self.assertIsNone(refresher.run_once())
+        
+        stats = refresher.stats()
+        self.assertEqual((stats["runs"], stats["fixed"], stats["failures"], stats["last_error"]), (1, 1, 1, "down"))
+    
+    def test_disabled_interval_does_not_start(self):
+        """Test a non-positive interval leaves the refresher off"""
+        refresher = RollupRefresher(MagicMock(), interval=0)
+        self.assertIsNone(refresher.start())
+        self.assertFalse(refresher.stats()["running"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Database tests for the mood_logs triggers in database_schema.sql
+They need a scratch PostgreSQL database: set MOODMATE_TEST_DATABASE_URL and install psycopg2
+"""
+
+import unittest
+import json
+import sys
+import os
+import uuid
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import psycopg2
+    from psycopg2.extras import RealDictCursor, execute_values
+except ImportError:
+    psycopg2 = None
+
+from bulk_import import MoodLogImport
+from mood_aggregates import aggregate_differences, build_aggregate
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database_schema.sql")
+DATABASE_URL = os.getenv("MOODMATE_TEST_DATABASE_URL")
+
+def fake_analyze_many(texts, batch_size=None):
+    return [{"sentiment": "positive", "score": 0.8} if "good" in text else {"sentiment": "negative", "score": 0.2} for text in texts]
+
+@unittest.skipUnless(psycopg2 is not None and DATABASE_URL, "set MOODMATE_TEST_DATABASE_URL to a scratch database and install psycopg2")
+class TestMoodAggregateTrigger(unittest.TestCase):
+    """Test the aggregate trigger in a throwaway schema; each test rolls back"""
+    
+    def setUp(self):
+        self.connection = psycopg2.connect(DATABASE_URL)
+        self.cursor = self.connection.cursor(cursor_factory=RealDictCursor)
+        schema = f"moodmate_test_{uuid.uuid4().hex[:8]}"
+        self.cursor.execute(f"CREATE SCHEMA {schema}")
+        self.cursor.execute(f"SET LOCAL search_path TO {schema}")
+        with open(SCHEMA_FILE) as f:
+            self.cursor.execute(f.read())
+        self.user_id = self.create_user()
+    
+    def tearDown(self):
+        self.connection.rollback()
+        self.connection.close()
+    
+    def create_user(self):
+        user_id = str(uuid.uuid4())
+        self.cursor.execute("INSERT INTO users (id, email, name) VALUES (%s, %s, %s)", (user_id, f"{user_id}@example.com", "Test"))
+        return user_id
+    
+    def insert_rows(self, rows):
+        """Insert mood_logs rows in one statement, as a PostgREST bulk insert does"""
+        execute_values(self.cursor, "INSERT INTO mood_logs (user_id, text, sentiment, score, created_at) VALUES %s", [
+            (row["user_id"], row["text"], row["sentiment"], row["score"], row["created_at"]) for row in rows
+        ])
+    
+    def aggregate_differences(self, user_id):
+        """Differences between the trigger-maintained aggregate and one recomputed from the user's logs"""
+        self.cursor.execute("SELECT id, user_id, created_at, sentiment, score FROM mood_logs WHERE user_id = %s", (user_id,))
+        logs = [dict(row, user_id=str(row["user_id"]), score=float(row["score"])) for row in self.cursor.fetchall()]
+        self.cursor.execute("SELECT * FROM mood_aggregates WHERE user_id = %s", (user_id,))
+        stored = self.cursor.fetchone()
+        if stored is not None:
+            stored = dict(stored, user_id=str(stored["user_id"]), last_entry_date=stored["last_entry_date"].isoformat())
+        return aggregate_differences(build_aggregate(user_id, logs), stored)
+    
+    def test_backdated_import_matches_a_recomputation(self):
+        """Test importing a newest-first journal older than the user's entries leaves a correct aggregate"""
+        for day in (8, 9, 10):
+            self.insert_rows([{"user_id": self.user_id, "text": "good day", "sentiment": "positive", "score": 0.8,
+                               "created_at": f"2024-03-{day:02d}T09:00:00Z"}])
+        self.assertEqual(self.aggregate_differences(self.user_id), [])
+        
+        entries = [{"text": f"{'good' if day % 3 else 'bad'} day {day}", "created_at": f"2023-12-{day:02d}T20:00:00Z"} for day in range(31, 0, -1)]
+        importer = MoodLogImport(self.user_id, fake_analyze_many, self.insert_rows, batch_size=8, insert_chunk_size=10)
+        events = list(importer.run((number, json.dumps(entry)) for number, entry in enumerate(entries, 1)))
+        
+        self.assertEqual(events[-1]["saved"], 31)
+        self.assertEqual(self.aggregate_differences(self.user_id), [])
+    
+    def test_trigger_runs_once_per_statement(self):
+        """Test the insert trigger is statement-level, and a statement covering several users updates each"""
+        self.cursor.execute("""
+            SELECT (tgtype & 1) = 0 AS per_statement FROM pg_trigger
+            WHERE tgname = 'mood_logs_apply_aggregate' AND tgrelid = 'mood_logs'::regclass
+        """)
+        self.assertTrue(self.cursor.fetchone()["per_statement"])
+        
+        other_user = self.create_user()
+        self.insert_rows([
+            {"user_id": self.user_id, "text": "good", "sentiment": "positive", "score": 0.9, "created_at": "2024-03-10T09:00:00Z"},
+            {"user_id": other_user, "text": "bad", "sentiment": "negative", "score": 0.1, "created_at": "2024-03-09T09:00:00Z"},
+            {"user_id": other_user, "text": "good", "sentiment": "positive", "score": 0.7, "created_at": "2024-03-10T09:00:00Z"}
+        ])
+        self.assertEqual(self.aggregate_differences(self.user_id), [])
+        self.assertEqual(self.aggregate_differences(other_user), [])
+
+if __name__ == '__main__':
+    unittest.main()
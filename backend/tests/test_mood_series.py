@@ -0,0 +1,138 @@
+"""
+Test suite for the columnar mood time series
+"""
+
+import unittest
+import sys
+import os
+from datetime import date
+import numpy as np
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mood_series import NEGATIVE, NEUTRAL, POSITIVE, MoodSeries, day_to_date, epoch_day, parse_timestamps
+
+def log(user_id, created_at, score=0.5, sentiment="positive", log_id=None):
+    row = {"user_id": user_id, "created_at": created_at, "score": score, "sentiment": sentiment}
+    if log_id is not None:
+        row["id"] = log_id
+    return row
+
+class TestTimestamps(unittest.TestCase):
+    """Test cases for parsing created_at values"""
+    
+    def test_formats_and_offsets(self):
+        """Test UTC suffixes, other offsets and date-only values all land on UTC"""
+        parsed = parse_timestamps([
+            "2024-01-01T08:00:00Z",
+            "2024-01-01T08:00:00.123456+00:00",
+            "2024-01-01T23:30:00-05:00",
+            "2024-01-01"
+        ])
+        self.assertEqual(parsed.astype(str).tolist(), [
+            "2024-01-01T08:00:00.000000",
+            "2024-01-01T08:00:00.123456",
+            "2024-01-02T04:30:00.000000",
+            "2024-01-01T00:00:00.000000"
+        ])
+    
+    def test_epoch_days(self):
+        """Test days since the epoch round trip through dates"""
+        self.assertEqual(epoch_day(date(1970, 1, 2)), 1)
+        self.assertEqual(day_to_date(epoch_day(date(2024, 2, 29))), date(2024, 2, 29))
+
+class TestMoodSeries(unittest.TestCase):
+    """Test cases for the per-user computations"""
+    
+    def setUp(self):
+        # Unsorted on purpose: bob logs Jan 1-3 and Jan 5-6, alice twice on Jan 6
+        self.series = MoodSeries.from_logs([
+            log("bob", "2024-01-06T09:00:00Z", 0.9),
+            log("alice", "2024-01-06T10:00:00Z", 0.2, "negative"),
+            log("bob", "2024-01-01T09:00:00Z", 0.1, "negative"),
+            log("bob", "2024-01-02T09:00:00Z", 0.3, "neutral"),
+            log("bob", "2024-01-03T09:00:00Z", 0.5),
+            log("alice", "2024-01-06T08:00:00Z", 0.6),
+            log("bob", "2024-01-05T09:00:00Z", 0.7)
+        ])
+    
+    def test_totals_and_distribution(self):
+        """Test per-user counts, sums, last entries and sentiment counts"""
+        self.assertEqual(self.series.users, ["alice", "bob"])
+        self.assertEqual(self.series.entries().tolist(), [2, 5])
+        np.testing.assert_allclose(self.series.score_sums(), [0.8, 2.5])
+        self.assertEqual(self.series.last_timestamps().astype(str).tolist(), ["2024-01-06T10:00:00.000000", "2024-01-06T09:00:00.000000"])
+        distribution = self.series.sentiment_distribution()
+        self.assertEqual(distribution[:, [POSITIVE, NEGATIVE, NEUTRAL]].tolist(), [[1, 1, 0], [3, 1, 1]])
+    
+    def test_recent_scores_in_time_order(self):
+        """Test the latest scores of each user come back oldest first"""
+        recent = self.series.recent_scores(3)
+        self.assertEqual([scores.tolist() for scores in recent], [[0.6, 0.2], [0.5, 0.7, 0.9]])
+    
+    def test_ties_are_broken_by_id(self):
+        """Test logs with the same created_at are ordered by numeric id"""
+        series = MoodSeries.from_logs([
+            log("bob", "2024-01-01T00:00:00Z", 0.3, log_id=10),
+            log("bob", "2024-01-01T00:00:00Z", 0.2, log_id=9)
+        ])
+        self.assertEqual(series.recent_scores(2)[0].tolist(), [0.2, 0.3])
+    
+    def test_daily(self):
+        """Test per-day counts, mean, min, max and sentiments"""
+        daily = self.series.daily()
+        alice = daily["user_index"] == 0
+        self.assertEqual([day_to_date(day) for day in daily["day"][alice]], [date(2024, 1, 6)])
+        self.assertEqual(daily["entries"][alice].tolist(), [2])
+        np.testing.assert_allclose(
+            [daily["mean"][alice][0], daily["min"][alice][0], daily["max"][alice][0]], [0.4, 0.2, 0.6]
+        )
+        self.assertEqual(daily["sentiments"][alice][0, [POSITIVE, NEGATIVE]].tolist(), [1, 1])
+        self.assertEqual(len(daily["day"]), 6)
+    
+    def test_streaks(self):
+        """Test streaks end on each user's latest day and break after a missed day"""
+        self.assertEqual(self.series.current_streaks().tolist(), [1, 2])
+        self.assertEqual(self.series.current_streaks(as_of=date(2024, 1, 7)).tolist(), [1, 2])
+        self.assertEqual(self.series.current_streaks(as_of=date(2024, 1, 8)).tolist(), [0, 0])
+    
+    def test_rolling_average(self):
+        """Test the trailing window averages every log in it and stays within one user"""
+        rolling = self.series.rolling_average(window=3)
+        bob = rolling["user_index"] == 1
+        # Jan 1, 2, 3, 5 (Jan 3 and 5), 6 (Jan 5 and 6)
+        np.testing.assert_allclose(rolling["average"][bob], [0.1, 0.2, 0.3, 0.6, 0.8])
+        np.testing.assert_allclose(rolling["average"][~bob], [0.4])
+    
+    def test_week_over_week(self):
+        """Test weekly means and their delta, with NaN for an empty week"""
+        this_week, last_week, delta = self.series.week_over_week(as_of=date(2024, 1, 9))
+        np.testing.assert_allclose(this_week, [0.4, 0.7])
+        np.testing.assert_allclose(last_week, [np.nan, 0.2])
+        np.testing.assert_allclose(delta, [np.nan, 0.5])
+    
+    def test_local_days(self):
+        """Test days follow each user's time zone across a DST change, with unknown zones as UTC"""
+        series = MoodSeries.from_logs([
+            log("ny", "2024-03-10T03:00:00Z"),
+            log("ny", "2024-03-11T03:30:00Z"),
+            log("kolkata", "2024-03-10T20:00:00Z"),
+            log("nowhere", "2024-03-10T23:00:00Z")
+        ], timezones={"ny": "America/New_York", "kolkata": "Asia/Kolkata", "nowhere": "Mars/Base"})
+        self.assertEqual(series.users, ["kolkata", "nowhere", "ny"])
+        self.assertEqual(
+            [day_to_date(day) for day in series.days],
+            [date(2024, 3, 11), date(2024, 3, 10), date(2024, 3, 9), date(2024, 3, 10)]
+        )
+    
+    def test_empty(self):
+        """Test a series without logs"""
+        series = MoodSeries.from_logs([])
+        self.assertEqual(len(series), 0)
+        self.assertEqual(series.current_streaks().tolist(), [])
+        self.assertEqual(series.recent_scores(7), [])
+        self.assertEqual(len(series.rolling_average()["average"]), 0)
+
+if __name__ == '__main__':
+    unittest.main()
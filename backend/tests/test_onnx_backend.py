@@ -0,0 +1,111 @@
+"""
+Parity tests for the ONNX Runtime sentiment backend against the PyTorch pipeline
+"""
+
+import unittest
+from unittest.mock import patch
+import tempfile
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from transformers import DistilBertConfig, DistilBertForSequenceClassification, DistilBertTokenizerFast
+from onnx_backend import ort
+from model import MoodAnalyzer
+
+CORPUS = [
+    "I am feeling good today",
+    "so tired and stressed about work",
+    "bad day",
+    "happy",
+    "it was not a great day but not a bad one either, just tired",
+    "i am sad " * 40
+]
+
+def build_tiny_model(path):
+    """Save a small random DistilBERT classifier so tests run without network access"""
+    words = "i am feeling good great bad sad happy tired stressed about work today not a day it was so but one either just".split()
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words + [",", "."]
+    with open(os.path.join(path, "vocab.txt"), "w") as vocab_file:
+        vocab_file.write("\n".join(vocab))
+    tokenizer = DistilBertTokenizerFast(os.path.join(path, "vocab.txt"), do_lower_case=True, model_max_length=512)
+    torch.manual_seed(0)
+    config = DistilBertConfig(
+        vocab_size=len(vocab), dim=32, hidden_dim=64, n_layers=2, n_heads=2,
+        id2label={0: "NEGATIVE", 1: "POSITIVE"}, label2id={"NEGATIVE": 0, "POSITIVE": 1}
+    )
+    DistilBertForSequenceClassification(config).save_pretrained(path)
+    tokenizer.save_pretrained(path)
+
+def build_analyzer(model_name, backend, onnx_dir, quantize=True):
+    """Load a MoodAnalyzer for model_name on the given backend"""
+    with patch('model.SENTIMENT_MODEL', model_name), \
+         patch('model.SENTIMENT_ONNX_DIR', onnx_dir), \
+         patch('model.SENTIMENT_ONNX_QUANTIZE', quantize):
+        analyzer = MoodAnalyzer(backend=backend)
+        # Resolve the version while the patched settings are active
+        analyzer.model_version = analyzer._resolve_model_version()
+    return analyzer
+
+@unittest.skipIf(ort is None, "onnxruntime is not installed")
+class TestOnnxBackendParity(unittest.TestCase):
+    """Compare ONNX Runtime output with the PyTorch pipeline"""
+    
+    @classmethod
+    def setUpClass(cls):
+        """Export a tiny model once for the whole class"""
+        cls.workdir = tempfile.TemporaryDirectory()
+        cls.model_dir = os.path.join(cls.workdir.name, "model")
+        os.makedirs(cls.model_dir)
+        build_tiny_model(cls.model_dir)
+        cls.onnx_dir = os.path.join(cls.workdir.name, "onnx")
+        cls.pytorch = build_analyzer(cls.model_dir, "pytorch", cls.onnx_dir)
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.workdir.cleanup()
+    
+    def test_fp32_export_matches_pytorch(self):
+        """Test the unquantized graph reproduces PyTorch labels and scores"""
+        onnx = build_analyzer(self.model_dir, "onnx", self.onnx_dir, quantize=False)
+        expected = self.pytorch.analyze_many(CORPUS)
+        actual = onnx.analyze_many(CORPUS)
+        
+        self.assertEqual(len(actual), len(expected))
+        for want, got in zip(expected, actual):
+            self.assertEqual(set(got), set(want))
+            self.assertEqual(got["sentiment"], want["sentiment"])
+            self.assertAlmostEqual(got["score"], want["score"], delta=0.01)
+    
+    def test_int8_output_has_same_shape_as_analyze(self):
+        """Test the quantized backend returns analyze()-shaped results close to PyTorch"""
+        onnx = build_analyzer(self.model_dir, "onnx", self.onnx_dir)
+        self.assertTrue(onnx.model_version.endswith("+onnx-int8"))
+        
+        for text in CORPUS:
+            want = self.pytorch.analyze(text)
+            got = onnx.analyze(text)
+            self.assertEqual(set(got), {"sentiment", "score"})
+            self.assertIsInstance(got["score"], float)
+            self.assertAlmostEqual(got["score"], want["score"], delta=0.05)
+    
+    @unittest.skipUnless(os.getenv("SENTIMENT_PARITY_MODEL"), "set SENTIMENT_PARITY_MODEL to a local SST-2 snapshot")
+    def test_int8_matches_real_model_labels(self):
+        """Test int8 quantization keeps the real SST-2 model's labels"""
+        model_name = os.getenv("SENTIMENT_PARITY_MODEL")
+        pytorch = build_analyzer(model_name, "pytorch", self.onnx_dir)
+        onnx = build_analyzer(model_name, "onnx", self.onnx_dir)
+        texts = CORPUS + ["Had a lovely walk with my dog", "I can't stop worrying about tomorrow"]
+        
+        expected = pytorch.analyze_many(texts)
+        actual = onnx.analyze_many(texts)
+        agreement = sum(e["sentiment"] == a["sentiment"] for e, a in zip(expected, actual)) / len(texts)
+        self.assertGreaterEqual(agreement, 0.95)
+        for want, got in zip(expected, actual):
+            self.assertAlmostEqual(got["score"], want["score"], delta=0.05)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+Test suite for keyset pagination and sparse fieldsets
+"""
+
+import unittest
+import sys
+import os
+from unittest.mock import MagicMock
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pagination import PaginationError, decode_cursor, encode_cursor, keyset_page, parse_fields, parse_limit
+
+def rows(count):
+    return [{"id": f"row-{index}", "created_at": f"2024-01-{31 - index:02d}T00:00:00+00:00"} for index in range(count)]
+
+def client_returning(*results):
+    """Supabase client mock whose query chains return results in order"""
+    client = MagicMock()
+    query = MagicMock()
+    client.table.return_value.select.return_value = query
+    for method in ("eq", "or_", "order", "limit"):
+        getattr(query, method).return_value = query
+    query.execute.side_effect = [MagicMock(data=data, count=count) for data, count in results]
+    return client, query
+
+class TestParameters(unittest.TestCase):
+    """Test cases for limit, fields and cursor parsing"""
+    
+    def test_limit(self):
+        """Test the default, the cap and invalid limits"""
+        self.assertEqual(parse_limit(None, 50, 200), 50)
+        self.assertEqual(parse_limit("20", 50, 200), 20)
+        self.assertEqual(parse_limit("5000", 50, 200), 200)
+        for value in ("0", "-1", "ten"):
+            with self.assertRaises(PaginationError):
+                parse_limit(value)
+    
+    def test_fields(self):
+        """Test fields map to a projection that always carries the keyset columns"""
+        allowed = ("id", "name", "email", "created_at")
+        self.assertEqual(parse_fields(None, allowed), "*")
+        self.assertEqual(parse_fields("name, email,name", allowed), "name,email,created_at,id")
+        for value in ("password", "name:email", "profiles(*)"):
+            with self.assertRaises(PaginationError):
+                parse_fields(value, allowed)
+    
+    def test_cursor_round_trip(self):
+        """Test a cursor decodes to the row it was made from and garbage is rejected"""
+        row = {"id": 42, "created_at": "2024-01-01T12:00:00.123456+00:00"}
+        self.assertEqual(decode_cursor(encode_cursor(row)), ("2024-01-01T12:00:00.123456+00:00", "42"))
+        bad = [
+            "not-a-cursor",
+            encode_cursor({"id": 'x",id.gt."', "created_at": "2024-01-01"}),
+            encode_cursor({"id": 1, "created_at": "yesterday"})
+        ]
+        for cursor in bad:
+            with self.assertRaises(PaginationError):
+                decode_cursor(cursor)
+
+class TestKeysetPage(unittest.TestCase):
+    """Test cases for fetching pages"""
+    
+    def test_first_page(self):
+        """Test the first page is ordered newest first, fetches one row extra and returns a cursor"""
+        client, query = client_returning((rows(3), 10))
+        
+        page = keyset_page(client, "users", "id,created_at", filters={"user_id": "u1"}, limit=2, include_total=True)
+        
+        self.assertEqual([row["id"] for row in page["rows"]], ["row-0", "row-1"])
+        self.assertEqual(decode_cursor(page["next_cursor"]), ("2024-01-30T00:00:00+00:00", "row-1"))
+        self.assertEqual(page["total"], 10)
+        client.table.return_value.select.assert_called_once_with("id,created_at", count="exact")
+        query.eq.assert_called_once_with("user_id", "u1")
+        query.or_.assert_not_called()
+        self.assertEqual([call.args for call in query.order.call_args_list], [("created_at",), ("id",)])
+        query.limit.assert_called_once_with(3)
+    
+    def test_next_page_seeks_past_cursor(self):
+        """Test a cursor becomes a (created_at, id) seek and the last page has no cursor"""
+        client, query = client_returning((rows(1), None))
+        cursor = encode_cursor({"id": "row-1", "created_at": "2024-01-30T00:00:00+00:00"})
+        
+        page = keyset_page(client, "users", cursor=cursor, limit=2)
+        
+        query.or_.assert_called_once_with(
+            'created_at.lt."2024-01-30T00:00:00+00:00",'
+            'and(created_at.eq."2024-01-30T00:00:00+00:00",id.lt."row-1")'
+        )
+        self.assertEqual(len(page["rows"]), 1)
+        self.assertIsNone(page["next_cursor"])
+        self.assertNotIn("total", page)
+    
+    def test_total_on_later_pages_ignores_cursor(self):
+        """Test the total of a later page counts every matching row, not just the remaining ones"""
+        client, query = client_returning((rows(1), None), ([], 7))
+        cursor = encode_cursor({"id": "row-1", "created_at": "2024-01-30T00:00:00+00:00"})
+        
+        page = keyset_page(client, "users", cursor=cursor, limit=2, include_total=True)
+        
+        self.assertEqual(page["total"], 7)
+        client.table.return_value.select.assert_any_call("id", count="exact", head=True)
+        self.assertEqual(query.or_.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
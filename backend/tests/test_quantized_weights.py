@@ -0,0 +1,167 @@
+"""
+Test suite for the int8 memory-mapped chat model loader
+"""
+
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+from unittest.mock import patch
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from safetensors.torch import load_file
+import chatbot as chatbot_module
+from chatbot import MentalHealthChatbot
+from quantized_weights import (
+    CHECKSUM_FILE, TENSOR_ALIGNMENT, VERIFIED_FILE, WEIGHTS_FILE, ChecksumError, Int8Linear,
+    load_quantized_model, mmap_safetensors, prepare_quantized_model, sha256_file, verify_checksums
+)
+from test_chatbot import build_tiny_chatbot
+
+class TestQuantizedWeights(unittest.TestCase):
+    """Test cases for preparing and loading int8 model directories"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.bot = build_tiny_chatbot(hidden_size=64)
+        cls.bot.scheduler.shutdown()
+        cls.root = tempfile.mkdtemp()
+        source_dir = os.path.join(cls.root, "source")
+        cls.bot.model.save_pretrained(source_dir)
+        cls.bot.tokenizer.save_pretrained(source_dir)
+        cls.model_dir = os.path.join(cls.root, "int8")
+        prepare_quantized_model(source_dir, cls.model_dir)
+    
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+    
+    def copy_model_dir(self):
+        """Copy the prepared directory so a test can damage it"""
+        target = os.path.join(tempfile.mkdtemp(dir=self.root), "int8")
+        shutil.copytree(self.model_dir, target)
+        return target
+    
+    def test_checksums_cover_every_file(self):
+        """Test the checksum file lists the weights, manifest, config and tokenizer"""
+        verified = verify_checksums(self.model_dir)
+        self.assertEqual(sorted(verified), sorted(name for name in os.listdir(self.model_dir) if name not in (CHECKSUM_FILE, VERIFIED_FILE)))
+        self.assertIn("config.json", verified)
+    
+    def test_tampered_weights_are_rejected(self):
+        """Test a changed byte in the weights fails verification"""
+        model_dir = self.copy_model_dir()
+        with open(os.path.join(model_dir, WEIGHTS_FILE), "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 0xFF]))
+        with self.assertRaises(ChecksumError):
+            load_quantized_model(model_dir)
+    
+    def test_unchanged_files_are_not_hashed_again(self):
+        """Test a second load skips hashing unchanged files, a rewritten or copied file is hashed and full hashes all"""
+        model_dir = self.copy_model_dir()
+        weights_path = os.path.join(model_dir, WEIGHTS_FILE)
+        with patch('quantized_weights.sha256_file', wraps=sha256_file) as hashed:
+            verify_checksums(model_dir)
+            first = [os.path.basename(call.args[0]) for call in hashed.call_args_list]
+            hashed.reset_mock()
+            verify_checksums(model_dir)
+            self.assertEqual([os.path.basename(call.args[0]) for call in hashed.call_args_list], [CHECKSUM_FILE])
+            
+            os.utime(weights_path, ns=(0, 0))
+            hashed.reset_mock()
+            verify_checksums(model_dir)
+            self.assertEqual([os.path.basename(call.args[0]) for call in hashed.call_args_list], [CHECKSUM_FILE, WEIGHTS_FILE])
+            
+            hashed.reset_mock()
+            verify_checksums(model_dir, full=True)
+            self.assertEqual(len(hashed.call_args_list), len(first))
+            
+            copied = os.path.join(self.root, "copied-int8")
+            shutil.copytree(model_dir, copied)
+            hashed.reset_mock()
+            verify_checksums(copied)
+            self.assertEqual(len(hashed.call_args_list), len(first))
+        self.assertIn(WEIGHTS_FILE, first)
+        
+        # Same size, new bytes and a new modification time
+        with open(weights_path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 0xFF]))
+        with self.assertRaises(ChecksumError):
+            verify_checksums(model_dir)
+    
+    def test_missing_checksum_file_is_rejected(self):
+        """Test a directory without SHA256SUMS is not loaded"""
+        model_dir = self.copy_model_dir()
+        os.remove(os.path.join(model_dir, CHECKSUM_FILE))
+        with self.assertRaises(ChecksumError):
+            verify_checksums(model_dir)
+    
+    def test_outputs_match_full_precision(self):
+        """Test the int8 model gives nearly the same logits and greedy tokens"""
+        model, tokenizer, manifest = load_quantized_model(self.model_dir)
+        inputs = tokenizer.encode(self.bot._build_prompt("I feel anxious about work"), return_tensors="pt")
+        with torch.no_grad():
+            expected = self.bot.model(inputs).logits
+            actual = model(inputs).logits.float()
+        
+        self.assertIsInstance(model.model.layers[0].mlp.down_proj, Int8Linear)
+        self.assertNotIsInstance(model.lm_head, Int8Linear)
+        self.assertLess((expected - actual).abs().max().item(), 0.05)
+        # A random model has near-ties, so allow the odd flipped position
+        agreement = (expected.argmax(-1) == actual.argmax(-1)).float().mean().item()
+        self.assertGreater(agreement, 0.9)
+    
+    def test_weights_are_memory_mapped(self):
+        """Test layer weights are aligned views of one mapping of the weights file"""
+        model, _, _ = load_quantized_model(self.model_dir, verify=False)
+        file_size = os.path.getsize(os.path.join(self.model_dir, WEIGHTS_FILE))
+        layer = model.model.layers[1].self_attn.o_proj
+        
+        self.assertEqual(layer.weight.dtype, torch.int8)
+        self.assertEqual(layer.weight.untyped_storage().nbytes(), file_size)
+        self.assertEqual(model.model.embed_tokens.weight.untyped_storage().data_ptr(), layer.weight.untyped_storage().data_ptr())
+        self.assertEqual(layer.weight.data_ptr() % TENSOR_ALIGNMENT, 0)
+    
+    def test_file_is_standard_safetensors(self):
+        """Test the aligned file still loads with the safetensors library"""
+        standard = {name: tensor for name, tensor in load_file(os.path.join(self.model_dir, WEIGHTS_FILE)).items() if not name.startswith("__padding")}
+        mapped = mmap_safetensors(os.path.join(self.model_dir, WEIGHTS_FILE))
+        
+        self.assertEqual(set(standard), set(mapped))
+        for name, tensor in standard.items():
+            self.assertTrue(torch.equal(tensor, mapped[name]), name)
+    
+    def test_chatbot_quantized_mode(self):
+        """Test the chatbot loads the prepared directory and answers through the scheduler"""
+        bot = MentalHealthChatbot(model_name="tiny-llama", load=False, load_mode="quantized")
+        with patch.object(chatbot_module, "CHATBOT_QUANTIZED_DIR", self.model_dir):
+            bot.load()
+        try:
+            self.assertTrue(bot.is_ready)
+            self.assertEqual(bot.readiness()["load_mode"], "quantized")
+            self.assertIsInstance(bot.generate_response("I cannot sleep"), str)
+        finally:
+            bot.scheduler.shutdown()
+    
+    def test_quantized_mode_does_not_fall_back(self):
+        """Test a missing local model fails instead of downloading the fallback model"""
+        bot = MentalHealthChatbot(load=False, load_mode="quantized")
+        with patch.object(chatbot_module, "CHATBOT_QUANTIZED_DIR", os.path.join(self.root, "missing")), \
+             patch.object(bot, "_load_fallback_model") as fallback:
+            bot.load()
+        
+        self.assertEqual(bot.status, "failed")
+        fallback.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
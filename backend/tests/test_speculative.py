@@ -0,0 +1,154 @@
+"""
+Test suite for speculative decoding with a draft model
+"""
+
+import unittest
+import threading
+import sys
+import os
+from unittest.mock import Mock
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+from speculative import SpeculativeScheduler, compatible_tokenizers, speculative_accept
+from test_chatbot import build_tiny_chatbot
+
+def build_draft_model(target, seed=1):
+    """A smaller random model sharing the target's vocabulary"""
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=target.config.vocab_size, hidden_size=16, intermediate_size=32,
+        num_hidden_layers=1, num_attention_heads=2, num_key_value_heads=2,
+        max_position_embeddings=1024, bos_token_id=0, eos_token_id=1
+    )
+    model = LlamaForCausalLM(config)
+    model.eval()
+    return model
+
+class TestSpeculativeAccept(unittest.TestCase):
+    """Test cases for the accept/resample rule"""
+    
+    def test_output_follows_target_distribution(self):
+        """Test the emitted token is distributed as the target whatever the draft proposes"""
+        torch.manual_seed(0)
+        target = torch.tensor([[0.5, 0.3, 0.2, 0.0], [0.25, 0.25, 0.25, 0.25]])
+        draft = torch.tensor([[0.1, 0.1, 0.4, 0.4]])
+        counts = torch.zeros(4)
+        accepted = 0
+        trials = 20000
+        for _ in range(trials):
+            proposal = int(torch.multinomial(draft[0], num_samples=1)[0])
+            kept, token = speculative_accept(target, draft, [proposal])
+            counts[proposal if kept else token] += 1
+            accepted += kept
+        
+        self.assertLess((counts / trials - target[0]).abs().max().item(), 0.02)
+        # Expected acceptance is the overlap sum(min(p, q)) = 0.1 + 0.1 + 0.2
+        self.assertAlmostEqual(accepted / trials, 0.4, delta=0.02)
+    
+    def test_one_hot_distributions_are_greedy(self):
+        """Test one-hot distributions keep drafts while they match the argmax and then take the argmax"""
+        target = torch.eye(5)[[2, 3, 4]]
+        draft = torch.eye(5)[[2, 0]]
+        for _ in range(20):
+            self.assertEqual(speculative_accept(target, draft, [2, 0]), (1, 3))
+        self.assertEqual(speculative_accept(target, torch.eye(5)[[2, 3]], [2, 3]), (2, 4))
+    
+    def test_compatible_tokenizers(self):
+        """Test tokenizers are compatible only with identical vocabularies"""
+        tokenizer = Mock(get_vocab=lambda: {"a": 0, "b": 1})
+        self.assertTrue(compatible_tokenizers(tokenizer, Mock(get_vocab=lambda: {"a": 0, "b": 1})))
+        self.assertFalse(compatible_tokenizers(tokenizer, Mock(get_vocab=lambda: {"a": 1, "b": 0})))
+
+class TestSpeculativeScheduler(unittest.TestCase):
+    """Test cases for SpeculativeScheduler"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.bot = build_tiny_chatbot()
+        cls.bot.scheduler.shutdown()
+        cls.inputs = cls.bot.tokenizer.encode(cls.bot._build_prompt("I feel anxious about work"), return_tensors="pt")
+    
+    def generate(self, scheduler, max_new_tokens=24, **kwargs):
+        try:
+            return scheduler.submit(self.inputs, max_new_tokens, **kwargs).result(timeout=60)
+        finally:
+            scheduler.shutdown()
+    
+    def plain_greedy(self, max_new_tokens=24):
+        """Greedy tokens from model.generate, cut before the end-of-sequence token"""
+        with torch.no_grad():
+            output = self.bot.model.generate(
+                self.inputs, do_sample=False, max_new_tokens=max_new_tokens,
+                eos_token_id=1, pad_token_id=1
+            )[0, self.inputs.shape[1]:].tolist()
+        return output[:output.index(1)] if 1 in output else output
+    
+    def test_greedy_matches_plain_decoding(self):
+        """Test greedy speculative decoding returns exactly the model's own greedy reply"""
+        for draft_tokens in [1, 3, 5]:
+            scheduler = SpeculativeScheduler(
+                self.bot.model, build_draft_model(self.bot.model), 1,
+                num_draft_tokens=draft_tokens, do_sample=False
+            )
+            result = self.generate(scheduler)
+            self.assertEqual(result["tokens"], self.plain_greedy(), draft_tokens)
+    
+    def test_prefix_cache_is_used(self):
+        """Test a request can start from the cached system prompt"""
+        scheduler = SpeculativeScheduler(self.bot.model, build_draft_model(self.bot.model), 1, do_sample=False)
+        result = self.generate(scheduler, past_key_values=self.bot._cached_prefix_for(self.inputs))
+        self.assertEqual(result["tokens"], self.plain_greedy())
+    
+    def test_identical_draft_is_always_accepted(self):
+        """Test a draft equal to the target has every proposal accepted"""
+        scheduler = SpeculativeScheduler(self.bot.model, self.bot.model, 1, num_draft_tokens=4, do_sample=False)
+        self.generate(scheduler, max_new_tokens=21)
+        stats = scheduler.stats()
+        
+        self.assertEqual(stats["acceptance_rate"], 1.0)
+        # Each verify pass returns the four drafts plus one token of the target's own
+        self.assertGreater(stats["tokens_per_target_forward"], 1.0)
+    
+    def test_sampling_and_stats(self):
+        """Test sampled replies respect max_new_tokens and stats report acceptance and speedup"""
+        scheduler = SpeculativeScheduler(self.bot.model, build_draft_model(self.bot.model), 1, num_draft_tokens=3)
+        self.assertGreater(scheduler.calibrate(self.inputs, steps=4), 0)
+        result = self.generate(scheduler, max_new_tokens=10)
+        stats = scheduler.stats()
+        
+        self.assertLessEqual(len(result["tokens"]), 10)
+        self.assertIn(result["finish_reason"], ["eos", "length"])
+        for key in ["acceptance_rate", "tokens_per_target_forward", "ms_per_token", "baseline_ms_per_token", "estimated_speedup"]:
+            self.assertIn(key, stats)
+        self.assertLessEqual(stats["accepted"], stats["proposed"])
+        self.assertEqual(stats["completed"], 1)
+    
+    def test_cancelled_before_start(self):
+        """Test a cancelled request finishes without decoding"""
+        cancel_event = threading.Event()
+        cancel_event.set()
+        scheduler = SpeculativeScheduler(self.bot.model, build_draft_model(self.bot.model), 1)
+        result = self.generate(scheduler, cancel_event=cancel_event)
+        self.assertEqual((result["tokens"], result["finish_reason"]), ([], "cancelled"))
+    
+    def test_chatbot_uses_draft_model(self):
+        """Test the chatbot switches to speculative decoding when a draft model is loaded"""
+        bot = build_tiny_chatbot()
+        bot.scheduler.shutdown()
+        bot.draft_model_name = "tiny-draft"
+        bot.draft_model = build_draft_model(bot.model)
+        bot.prepare_scheduler()
+        try:
+            self.assertIsInstance(bot.scheduler, SpeculativeScheduler)
+            self.assertIsNotNone(bot.scheduler.baseline_ms_per_token)
+            self.assertEqual(bot.readiness()["draft_model"], "tiny-draft")
+            self.assertIsInstance(bot.generate_response("I cannot sleep"), str)
+        finally:
+            bot.scheduler.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
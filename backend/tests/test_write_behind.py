@@ -0,0 +1,239 @@
+"""
+Test suite for write-behind persistence of chat messages
+"""
+
+import unittest
+import threading
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+from unittest.mock import MagicMock
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation import SupabaseChatStore
+from write_behind import WriteBehindBuffer
+
+def rows(*ids):
+    return [{"id": row_id, "message": f"message {row_id}"} for row_id in ids]
+
+class RecordingInsert:
+    """insert_fn that records batches and can fail, reject rows or block on request"""
+    
+    def __init__(self, failures=0, release=None, rejected=()):
+        self.batches = []
+        self.failures = failures
+        self.release = release
+        self.rejected = set(rejected)
+    
+    def __call__(self, batch):
+        if self.release is not None:
+            self.release.wait(5)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database unavailable")
+        if self.rejected & {row["id"] for row in batch}:
+            raise RuntimeError("violates foreign key constraint")
+        self.batches.append([row["id"] for row in batch])
+    
+    @property
+    def ids(self):
+        return [row_id for batch in self.batches for row_id in batch]
+
+class TestWriteBehindBuffer(unittest.TestCase):
+    """Test cases for WriteBehindBuffer"""
+    
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir)
+    
+    def spools(self):
+        return sorted(os.listdir(self.spool_dir))
+    
+    def test_flushes_full_batches(self):
+        """Test rows go out in bulk inserts of at most max_batch, in order"""
+        insert = RecordingInsert()
+        buffer = WriteBehindBuffer(insert, self.spool_dir, max_batch=3, flush_interval=10)
+        for start in range(0, 6, 2):
+            buffer.append(rows(start, start + 1))
+        
+        self.assertTrue(buffer.flush(timeout=5))
+        self.assertEqual(insert.ids, list(range(6)))
+        self.assertTrue(all(len(batch) <= 3 for batch in insert.batches))
+        self.assertEqual(buffer.stats()["flushed"], 6)
+        buffer.shutdown()
+    
+    def test_flushes_after_interval(self):
+        """Test a partial batch is inserted once its oldest row has waited flush_interval"""
+        insert = RecordingInsert()
+        buffer = WriteBehindBuffer(insert, self.spool_dir, max_batch=100, flush_interval=0.05)
+        buffer.append(rows("a"))
+        
+        deadline = time.monotonic() + 5
+        while not insert.batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(insert.batches, [["a"]])
+        buffer.shutdown()
+    
+    def test_append_does_not_wait_for_insert(self):
+        """Test append() returns while the insert is still blocked"""
+        release = threading.Event()
+        insert = RecordingInsert(release=release)
+        buffer = WriteBehindBuffer(insert, self.spool_dir, flush_interval=0)
+        
+        started = time.perf_counter()
+        self.assertTrue(buffer.append(rows("a", "b")))
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(insert.batches, [])
+        
+        release.set()
+        self.assertTrue(buffer.flush(timeout=5))
+        self.assertEqual(insert.ids, ["a", "b"])
+        buffer.shutdown()
+    
+    def test_failed_insert_is_retried(self):
+        """Test a failed batch is retried in order and counted"""
+        insert = RecordingInsert(failures=1)
+        buffer = WriteBehindBuffer(insert, self.spool_dir, flush_interval=0, retry_seconds=0.01)
+        buffer.append(rows("a", "b"))
+        
+        self.assertTrue(buffer.flush(timeout=5))
+        self.assertEqual(insert.ids, ["a", "b"])
+        self.assertEqual(buffer.stats()["failed_batches"], 1)
+        buffer.shutdown()
+    
+    def test_rejected_row_is_isolated_and_dead_lettered(self):
+        """Test a row that always fails is split out of its batch and set aside while the rest are stored"""
+        insert = RecordingInsert(rejected=["c"])
+        buffer = WriteBehindBuffer(insert, self.spool_dir, max_batch=8, flush_interval=10, retry_seconds=0.001, max_attempts=2)
+        buffer.append(rows("a", "b", "c", "d", "e", "f"))
+        
+        self.assertTrue(buffer.flush(timeout=5))
+        self.assertEqual(insert.ids, ["a", "b", "d", "e", "f"])
+        self.assertEqual(buffer.stats()["dead_lettered"], 1)
+        with open(os.path.join(self.spool_dir, "chat-writer.dead-letter.jsonl")) as f:
+            self.assertEqual([row["id"] for row in json.loads(f.readline())["rows"]], ["c"])
+        
+        # Later rows are not held up, and recovery does not bring the rejected row back
+        buffer.append(rows("g"))
+        self.assertTrue(buffer.flush(timeout=5))
+        self.assertEqual(insert.ids[-1], "g")
+        buffer.shutdown()
+        self.assertEqual(self.spools(), ["chat-writer.dead-letter.jsonl"])
+    
+    def test_shutdown_drains_and_removes_spool(self):
+        """Test shutdown inserts queued rows without waiting out the interval and deletes the spool"""
+        insert = RecordingInsert()
+        buffer = WriteBehindBuffer(insert, self.spool_dir, max_batch=100, flush_interval=60)
+        buffer.append(rows("a", "b", "c"))
+        self.assertEqual(len(self.spools()), 1)
+        
+        started = time.monotonic()
+        buffer.shutdown()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(insert.ids, ["a", "b", "c"])
+        self.assertEqual(self.spools(), [])
+        self.assertFalse(buffer.append(rows("d")))
+    
+    def test_spool_stays_small_under_steady_load(self):
+        """Test flushed rows are dropped from the spool even though the queue never empties"""
+        insert = RecordingInsert()
+        buffer = WriteBehindBuffer(insert, self.spool_dir, max_batch=2, flush_interval=0)
+        sizes = []
+        
+        def insert_and_keep_busy(batch):
+            insert(batch)
+            spool = buffer.stats()["spool"]
+            sizes.append(os.path.getsize(spool))
+            if len(insert.batches) < 200:
+                buffer.append(rows(*(f"{len(insert.batches)}-{n}" for n in range(2))))
+        
+        buffer.insert_fn = insert_and_keep_busy
+        buffer.append(rows("a", "b", "c", "d"))
+        self.assertTrue(buffer.flush(timeout=10))
+        
+        self.assertEqual(len(insert.ids), 4 + 2 * 199)
+        self.assertLess(max(sizes[100:]), 2 * max(sizes[:10]))
+        with open(buffer.stats()["spool"]) as f:
+            self.assertEqual(f.read(), "")
+        buffer.shutdown()
+        self.assertEqual(self.spools(), [])
+    
+    def test_unsaved_rows_stay_spooled_on_shutdown(self):
+        """Test rows that cannot be stored are left in the spool for the next process"""
+        buffer = WriteBehindBuffer(RecordingInsert(failures=100), self.spool_dir, flush_interval=0, retry_seconds=0.01)
+        buffer.append(rows("a"))
+        buffer.shutdown()
+        
+        self.assertEqual(len(self.spools()), 1)
+    
+    def test_recovers_spool_of_crashed_process(self):
+        """Test unflushed rows in an orphaned spool are inserted by the next buffer, and a torn line is skipped"""
+        orphan = os.path.join(self.spool_dir, "chat-writer-1234-deadbeef.jsonl")
+        with open(orphan, "w") as f:
+            f.write(json.dumps({"rows": rows("a", "b")}) + "\n")
+            f.write(json.dumps({"flushed": ["a"]}) + "\n")
+            f.write(json.dumps({"rows": rows("c")}) + "\n")
+            f.write('{"rows": [{"id": "d", "mess')
+        
+        insert = RecordingInsert()
+        buffer = WriteBehindBuffer(insert, self.spool_dir, flush_interval=0)
+        self.assertEqual(buffer.start(), 2)
+        self.assertTrue(buffer.flush(timeout=5))
+        
+        # Replayed at start, before any new row is appended
+        self.assertEqual(insert.ids, ["b", "c"])
+        self.assertEqual(buffer.stats()["recovered"], 2)
+        self.assertNotIn(os.path.basename(orphan), self.spools())
+        self.assertEqual(buffer.start(), 0)
+        buffer.shutdown()
+    
+    def test_live_spool_is_not_taken(self):
+        """Test a spool still locked by a running buffer is left alone"""
+        stuck = WriteBehindBuffer(RecordingInsert(failures=100), self.spool_dir, flush_interval=0, retry_seconds=0.01)
+        stuck.append(rows("a"))
+        
+        insert = RecordingInsert()
+        buffer = WriteBehindBuffer(insert, self.spool_dir, flush_interval=0)
+        buffer.append(rows("b"))
+        self.assertTrue(buffer.flush(timeout=5))
+        
+        self.assertEqual(insert.ids, ["b"])
+        buffer.shutdown()
+        stuck.shutdown()
+
+class TestChatStoreWriter(unittest.TestCase):
+    """Test cases for chat messages written through the buffer"""
+    
+    def test_messages_are_written_behind(self):
+        """Test messages get ids and ordered timestamps and reach the table as one upsert"""
+        client = MagicMock()
+        store = SupabaseChatStore(client)
+        store.writer = WriteBehindBuffer(store.insert_messages, max_batch=100, flush_interval=60)
+        
+        stored = store.append_messages("session-1", "user-1", [("user", "hi"), ("ai", "hello")])
+        client.table.return_value.upsert.assert_not_called()
+        store.writer.shutdown()
+        
+        self.assertLess(stored[0]["created_at"], stored[1]["created_at"])
+        self.assertEqual(len({row["id"] for row in stored}), 2)
+        client.table.return_value.upsert.assert_called_once_with(stored, on_conflict="id", ignore_duplicates=True)
+    
+    def test_full_writer_falls_back_to_direct_insert(self):
+        """Test messages are inserted inline when the buffer has no room"""
+        client = MagicMock()
+        store = SupabaseChatStore(client, writer=WriteBehindBuffer(lambda batch: None, max_pending=1))
+        
+        stored = store.append_messages("session-1", "user-1", [("user", "hi"), ("ai", "hello")])
+        
+        client.table.return_value.upsert.assert_called_once_with(stored, on_conflict="id", ignore_duplicates=True)
+        self.assertEqual(store.writer.stats()["rejected"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
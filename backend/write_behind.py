@@ -0,0 +1,337 @@
+"""
+Write-behind buffer for chat transcripts
+Queues rows in memory and a local spool file, and bulk-inserts them on a background thread
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class WriteBehindBuffer:
+    """
+    Batches row inserts off the request path
+    
+    append() writes the rows to this process's spool file and queues them,
+    then returns. A worker thread calls insert_fn with up to max_batch rows
+    once that many are queued or the oldest has waited flush_interval
+    seconds. Flushed row ids are marked in the spool, and once flushed rows
+    make up half of it the spool is rewritten with just the queued rows, so
+    under steady load it stays about the size of the backlog. A failed
+    insert is retried after retry_seconds and the rows stay spooled.
+    
+    A batch that fails max_attempts times is split in half and the halves
+    are retried, so rows the database keeps rejecting (a constraint
+    violation, say) end up alone. A single row that fails max_attempts
+    times is moved to the dead-letter file next to the spools and dropped
+    from the queue, so it cannot hold up the rows behind it.
+    
+    Every spool file is held under an exclusive lock while its process
+    lives. start() replays spools whose lock can be taken, which are the
+    ones left behind by crashed processes; call it when the process starts
+    serving, or the first append() does. Rows carry their
+    own ids, so insert_fn should ignore ids already stored; a row may then
+    be replayed twice without being duplicated.
+    """
+    
+    def __init__(self, insert_fn, spool_dir=None, max_batch=100, flush_interval=1.0, max_pending=10000,
+                 fsync=False, retry_seconds=1.0, max_attempts=5, name="chat-writer"):
+        self.insert_fn = insert_fn
+        self.spool_dir = spool_dir
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = max(0.0, flush_interval)
+        self.max_pending = max(1, max_pending)
+        self.fsync = fsync
+        self.retry_seconds = retry_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.name = name
+        
+        # (row, queued at, failed attempts) in insertion order
+        self._queue = deque()
+        self._batch_limit = self.max_batch
+        self._condition = threading.Condition()
+        self._worker = None
+        self._running = True
+        self._busy = False
+        self._flush_waiters = 0
+        self._spool = None
+        self._spool_path = None
+        # Rows written to the spool since it was last compacted
+        self._spooled_rows = 0
+        
+        self._stats = {
+            "appended": 0,
+            "flushed": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "rejected": 0,
+            "recovered": 0,
+            "dead_lettered": 0
+        }
+    
+    def start(self):
+        """
+        Open this process's spool, start the worker and replay orphaned spools
+        
+        Call it in the serving process, after any pre-fork, so the spool lock
+        and the worker belong to that process. Later calls do nothing.
+        
+        Returns:
+            int: Rows recovered from spools of crashed processes
+        """
+        with self._condition:
+            if self._worker is not None or not self._running:
+                return 0
+            self._open_spool()
+            self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._worker.start()
+        return self.recover()
+    
+    def append(self, rows):
+        """Spool and queue rows for insertion; returns False, storing nothing, if the buffer is full or stopped"""
+        if self._worker is None:
+            self.start()
+        with self._condition:
+            if not self._running or len(self._queue) + len(rows) > self.max_pending:
+                self._stats["rejected"] += len(rows)
+                return False
+            
+            self._write_spool({"rows": rows})
+            self._spooled_rows += len(rows)
+            now = time.monotonic()
+            self._queue.extend((row, now, 0) for row in rows)
+            self._stats["appended"] += len(rows)
+            self._condition.notify_all()
+        return True
+    
+    def _open_spool(self):
+        """Create and lock this process's spool file; the caller holds self._condition"""
+        if not self.spool_dir:
+            return
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._spool_path = os.path.join(self.spool_dir, f"{self.name}-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl")
+            self._spool = open(self._spool_path, "a", encoding="utf-8")
+            if fcntl is not None:
+                fcntl.flock(self._spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            print(f"{self.name} spool unavailable, rows are kept in memory only: {e}")
+            self._spool = None
+    
+    def _write_spool(self, entry):
+        """Append one JSON line to the spool; the caller holds self._condition"""
+        if self._spool is None:
+            return
+        try:
+            self._spool.write(json.dumps(entry, default=str) + "\n")
+            self._spool.flush()
+            if self.fsync:
+                os.fsync(self._spool.fileno())
+        except OSError as e:
+            print(f"Error writing {self.name} spool: {e}")
+    
+    def recover(self):
+        """Queue the unflushed rows of spools left by other processes, and return how many there were"""
+        if not self.spool_dir or fcntl is None:
+            return 0
+        
+        recovered = 0
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, f"{self.name}-*.jsonl"))):
+            if path == self._spool_path:
+                continue
+            try:
+                with open(path, "r+", encoding="utf-8") as spool:
+                    try:
+                        fcntl.flock(spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        # Still held by a live process
+                        continue
+                    if os.fstat(spool.fileno()).st_ino != os.stat(path).st_ino:
+                        # Compacted by its owner since we opened it
+                        continue
+                    rows = read_spool(spool)
+                    if rows and not self.append(rows):
+                        print(f"{self.name} could not take {len(rows)} recovered rows from {path}")
+                        continue
+                    os.remove(path)
+            except OSError as e:
+                print(f"Error recovering {path}: {e}")
+                continue
+            if rows:
+                print(f"Recovered {len(rows)} unsaved rows from {path}")
+            recovered += len(rows)
+        
+        with self._condition:
+            self._stats["recovered"] += recovered
+        return recovered
+    
+    def _run(self):
+        """Worker loop: insert batches until shutdown"""
+        while True:
+            with self._condition:
+                while self._running and not self._queue:
+                    self._condition.wait()
+                if not self._queue:
+                    break
+                
+                # Wait for a full batch or for the oldest row to reach flush_interval
+                deadline = self._queue[0][1] + self.flush_interval
+                while self._running and not self._flush_waiters and len(self._queue) < self._batch_limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                
+                entries = [self._queue.popleft() for _ in range(min(self._batch_limit, len(self._queue)))]
+                batch = [entry[0] for entry in entries]
+                self._busy = True
+            
+            try:
+                self.insert_fn(batch)
+                error = None
+            except Exception as e:
+                print(f"Error flushing {len(batch)} rows from {self.name}: {e}")
+                error = e
+            
+            with self._condition:
+                self._busy = False
+                if error is not None:
+                    self._stats["failed_batches"] += 1
+                    attempts = max(entry[2] for entry in entries) + 1
+                    if attempts >= self.max_attempts and len(batch) == 1:
+                        self._dead_letter(batch, error)
+                        self._condition.notify_all()
+                        continue
+                    if attempts >= self.max_attempts:
+                        # Retry the halves separately to isolate the rows that keep failing
+                        self._batch_limit = len(batch) // 2
+                        attempts = 0
+                    # Put the batch back in order and retry after a pause, unless shutting down
+                    self._queue.extendleft((row, time.monotonic(), attempts) for row in reversed(batch))
+                    self._condition.notify_all()
+                    if not self._running:
+                        break
+                    self._condition.wait(self.retry_seconds)
+                    continue
+                
+                self._batch_limit = min(self.max_batch, self._batch_limit * 2)
+                self._stats["batches"] += 1
+                self._stats["flushed"] += len(batch)
+                self._write_spool({"flushed": [row.get("id") for row in batch]})
+                self._compact_spool()
+                self._condition.notify_all()
+        
+        with self._condition:
+            self._close_spool()
+            self._condition.notify_all()
+    
+    def _dead_letter(self, rows, error):
+        """Set aside rows the database keeps rejecting; the caller holds self._condition"""
+        self._stats["dead_lettered"] += len(rows)
+        print(f"{self.name} gave up on {len(rows)} rows after {self.max_attempts} attempts: {error}")
+        if self.spool_dir:
+            entry = {"rows": rows, "error": str(error), "failed_at": time.time()}
+            try:
+                with open(os.path.join(self.spool_dir, f"{self.name}.dead-letter.jsonl"), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, default=str) + "\n")
+            except OSError as e:
+                print(f"Error writing {self.name} dead-letter file: {e}")
+        # Recovery must not replay them into the queue again
+        self._write_spool({"flushed": [row.get("id") for row in rows]})
+        self._compact_spool()
+    
+    def _compact_spool(self):
+        """Drop flushed rows from the spool once they make up half of it; the caller holds self._condition"""
+        if self._spool is None or self._spooled_rows < 2 * len(self._queue):
+            return
+        if not self._queue:
+            try:
+                self._spool.truncate(0)
+                self._spool.seek(0)
+                self._spooled_rows = 0
+            except OSError as e:
+                print(f"Error truncating {self.name} spool: {e}")
+            return
+        
+        # Write the queued rows to a new locked file and swap it in, so a crash keeps one whole spool
+        temp_path = self._spool_path + ".tmp"
+        spool = None
+        try:
+            spool = open(temp_path, "w", encoding="utf-8")
+            if fcntl is not None:
+                fcntl.flock(spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            spool.write(json.dumps({"rows": [entry[0] for entry in self._queue]}, default=str) + "\n")
+            spool.flush()
+            if self.fsync:
+                os.fsync(spool.fileno())
+            os.replace(temp_path, self._spool_path)
+        except OSError as e:
+            print(f"Error compacting {self.name} spool: {e}")
+            if spool is not None:
+                spool.close()
+            return
+        self._spool.close()
+        self._spool = spool
+        self._spooled_rows = len(self._queue)
+    
+    def _close_spool(self):
+        """Release the spool, deleting it if nothing is left unsaved; the caller holds self._condition"""
+        if self._spool is None:
+            return
+        self._spool.close()
+        self._spool = None
+        if not self._queue:
+            os.remove(self._spool_path)
+        else:
+            print(f"{self.name} stopped with {len(self._queue)} unsaved rows kept in {self._spool_path}")
+    
+    def flush(self, timeout=None):
+        """Wait until every queued row has been inserted; returns False on timeout"""
+        with self._condition:
+            # Waiters make the worker send partial batches without waiting out flush_interval
+            self._flush_waiters += 1
+            self._condition.notify_all()
+            try:
+                return self._condition.wait_for(lambda: not self._queue and not self._busy, timeout)
+            finally:
+                self._flush_waiters -= 1
+    
+    def stats(self):
+        """Return counters and queue depth for monitoring"""
+        with self._condition:
+            return dict(
+                self._stats,
+                pending=len(self._queue),
+                max_batch=self.max_batch,
+                flush_interval=self.flush_interval,
+                spool=self._spool_path if self._spool is not None else None
+            )
+    
+    def shutdown(self, timeout=10.0):
+        """Flush what is queued, then stop the worker; rows it could not store stay in the spool"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+def read_spool(spool):
+    """Rows in an open spool file that were never marked flushed, in the order they were appended"""
+    rows, flushed = [], set()
+    for line in spool:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # A torn last line from a crash mid-write
+            continue
+        rows.extend(entry.get("rows", []))
+        flushed.update(entry.get("flushed", []))
+    return [row for row in rows if row.get("id") not in flushed]